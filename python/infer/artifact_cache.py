@@ -0,0 +1,194 @@
+"""Content-addressed local cache for downloaded model artifacts.
+
+Every downloaded model file is stored once, named by its SHA-256, under
+``<root>/objects/<sha[:2]>/<sha>``. A model directory is installed from the
+cache by linking (or, across filesystems, copying) each object into place. Each
+file is staged next to its destination and moved over it with ``os.replace``,
+so a reader never sees a half-written file. An ``artifact-manifest.json``
+listing every file's size and SHA-256 is written into the directory last.
+
+On the next start the manifest tells which files are present and intact.
+Anything damaged is restored from the cache without touching the network, and
+files already in the cache are never downloaded again. Downloads are staged
+under ``<root>/staging`` and only added to the cache once verified. A staging
+directory survives a failed attempt, so a retry resumes from the files that
+completed.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import shutil
+import stat
+
+from svm_engine import file_sha256
+
+ARTIFACT_MANIFEST = 'artifact-manifest.json'
+# Threads used to hash files in parallel.
+ARTIFACT_WORKERS = int(os.environ.get('ARTIFACT_WORKERS', '4'))
+
+
+def build_manifest(directory: str, workers: int = ARTIFACT_WORKERS) -> dict:
+  """
+  Hash every regular file in ``directory`` (except an existing manifest) in parallel.
+
+  Returns:
+    ``{'files': {name: {'size': bytes, 'sha256': hex}}}``.
+  """
+  names = sorted(f for f in os.listdir(directory)
+                 if f != ARTIFACT_MANIFEST and os.path.isfile(os.path.join(directory, f)))
+  paths = [os.path.join(directory, name) for name in names]
+  with ThreadPoolExecutor(max(1, workers)) as pool:
+    digests = list(pool.map(file_sha256, paths))
+  return {'files': {name: {'size': os.path.getsize(path), 'sha256': digest}
+                    for name, path, digest in zip(names, paths, digests)}}
+
+
+def read_manifest(directory: str) -> dict | None:
+  """Return the artifact manifest installed in ``directory``, or None if there is none."""
+  path = os.path.join(directory, ARTIFACT_MANIFEST)
+  if not os.path.exists(path):
+    return None
+  with open(path, encoding='utf-8') as f:
+    return json.load(f)
+
+
+def write_manifest(directory: str, manifest: dict) -> None:
+  """Write ``manifest`` into ``directory`` atomically."""
+  path = os.path.join(directory, ARTIFACT_MANIFEST)
+  with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+  os.replace(f'{path}.tmp', path)
+
+
+def damaged_files(directory: str, manifest: dict, deep: bool = False) -> list[str]:
+  """
+  Return the manifest entries that are missing from ``directory`` or do not match it.
+
+  Sizes are always compared; ``deep`` also re-hashes every file.
+  """
+  damaged = []
+  for name, entry in manifest['files'].items():
+    path = os.path.join(directory, name)
+    try:
+      size = os.path.getsize(path)
+    except OSError:
+      damaged.append(name)
+      continue
+    if size != entry['size'] or (deep and file_sha256(path) != entry['sha256']):
+      damaged.append(name)
+  return damaged
+
+
+class ArtifactCache:
+  """
+  Content-addressed store of model files rooted at ``root``.
+
+  Raises:
+    OSError: If ``root`` cannot be created.
+  """
+
+  def __init__(self, root: str):
+    self.root = root
+    self.objects = os.path.join(root, 'objects')
+    os.makedirs(self.objects, exist_ok=True)
+
+  def path(self, sha256: str) -> str:
+    """Return where the object with digest ``sha256`` is stored."""
+    return os.path.join(self.objects, sha256[:2], sha256)
+
+  def has(self, sha256: str, size: int | None = None) -> bool:
+    """Return True if the object is cached (and, if ``size`` is given, has that size)."""
+    try:
+      actual = os.path.getsize(self.path(sha256))
+    except OSError:
+      return False
+    return size is None or actual == size
+
+  def staging_dir(self, name: str) -> str:
+    """Return a persistent staging directory for one download, kept until ``discard_staging``."""
+    path = os.path.join(self.root, 'staging', name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+  def discard_staging(self, name: str) -> None:
+    """Remove a staging directory once its download has been installed."""
+    shutil.rmtree(os.path.join(self.root, 'staging', name), ignore_errors=True)
+
+  def add(self, path: str, sha256: str | None = None) -> str:
+    """
+    Move the file at ``path`` into the cache and return its digest.
+
+    Raises:
+      ValueError: If ``sha256`` is given and the file does not match it.
+    """
+    digest = file_sha256(path)
+    if sha256 is not None and digest != sha256:
+      raise ValueError(f'{path} has SHA-256 {digest}, expected {sha256}')
+    target = self.path(digest)
+    if os.path.exists(target):
+      os.remove(path)
+      return digest
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+      os.replace(path, target)
+    except OSError:
+      shutil.copyfile(path, f'{target}.tmp')
+      os.replace(f'{target}.tmp', target)
+      os.remove(path)
+    # Objects are linked into model directories, so nothing may write into them in place.
+    os.chmod(target, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    return digest
+
+  def install(self, manifest: dict, directory: str, names: list[str] | None = None) -> None:
+    """
+    Place the cached objects listed in ``manifest`` into ``directory``, then write the manifest.
+
+    Each file is linked (or copied) to a temporary name beside its destination
+    and moved over it atomically. Files listed in the directory's previous
+    manifest but not in this one are removed. ``names`` limits the files
+    (re)placed, for repairs.
+
+    Raises:
+      FileNotFoundError: If a listed object is not in the cache.
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = read_manifest(directory)
+    for name in names if names is not None else manifest['files']:
+      source = self.path(manifest['files'][name]['sha256'])
+      if not os.path.exists(source):
+        raise FileNotFoundError(f'{name} ({manifest["files"][name]["sha256"][:12]}) '
+                                f'is not in the artifact cache')
+      target = os.path.join(directory, name)
+      tmp = os.path.join(directory, f'.{name}.tmp')
+      if os.path.exists(tmp):
+        os.remove(tmp)
+      try:
+        os.link(source, tmp)
+      except OSError:
+        shutil.copyfile(source, tmp)
+      os.replace(tmp, target)
+    if previous is not None:
+      for name in set(previous['files']) - set(manifest['files']):
+        if os.path.exists(os.path.join(directory, name)):
+          os.remove(os.path.join(directory, name))
+    write_manifest(directory, manifest)
+
+  def repair(self, directory: str, deep: bool = False) -> list[str]:
+    """
+    Restore damaged files of an installed directory from the cache.
+
+    Returns:
+      The damaged files that could not be restored because they are not cached;
+      empty if the directory is intact now or has no manifest.
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+      return []
+    damaged = damaged_files(directory, manifest, deep)
+    cached = [name for name in damaged
+              if self.has(manifest['files'][name]['sha256'], manifest['files'][name]['size'])]
+    if cached:
+      self.install(manifest, directory, names=cached)
+      print(f'Restored {len(cached)} damaged file(s) in {directory} from the artifact cache.')
+    return [name for name in damaged if name not in cached]
@@ -0,0 +1,118 @@
+"""Supabase table access through one async client, callable from worker threads.
+
+Scoring, report and result-writer threads build PostgREST requests exactly as
+they would on the sync client (``db.table('form_results').upsert(row).execute()``).
+``AsyncDatabase`` records the builder calls and replays them on the listener's
+event loop against the async Supabase client, so every database call shares
+that client's keep-alive connection pool instead of opening its own. At most
+``DB_MAX_CONCURRENCY`` calls are in flight at once, and each request is
+cancelled after ``DB_CALL_TIMEOUT_S`` seconds. The calling thread waits for the
+result; the event loop never does.
+"""
+
+import asyncio
+from collections import deque
+import os
+import time
+
+DB_MAX_CONCURRENCY = int(os.environ.get('DB_MAX_CONCURRENCY', '10'))
+DB_CALL_TIMEOUT_S = float(os.environ.get('DB_CALL_TIMEOUT_S', '10'))
+
+
+class _Request:
+  """A PostgREST request under construction; ``execute()`` runs it on the event loop."""
+
+  def __init__(self, db: 'AsyncDatabase', calls: tuple):
+    self._db = db
+    self._calls = calls
+
+  def __getattr__(self, name: str):
+    if name.startswith('__'):
+      raise AttributeError(name)
+    if name == 'execute':
+      return lambda: self._db.run(self._calls)
+    return lambda *args, **kwargs: _Request(self._db, self._calls + ((name, args, kwargs),))
+
+
+class AsyncDatabase:
+  """
+  Run table and RPC requests on an async Supabase client from any thread.
+
+  Args:
+    client: Async Supabase client.
+    loop: Event loop the client belongs to.
+    max_concurrency: Requests that may be in flight at once; further calls wait their turn.
+    timeout_s: Seconds a request may take once started before it is cancelled.
+  """
+
+  def __init__(self, client, loop: asyncio.AbstractEventLoop,
+               max_concurrency: int = DB_MAX_CONCURRENCY, timeout_s: float = DB_CALL_TIMEOUT_S):
+    self.client = client
+    self.loop = loop
+    self.max_concurrency = max_concurrency
+    self.timeout_s = timeout_s
+    self.calls = 0
+    self.failures = 0
+    self.timeouts = 0
+    self.in_flight = 0
+    self.peak_in_flight = 0
+    # Seconds spent waiting for a free slot, and in the request itself, for the most recent calls.
+    self.waits: deque = deque(maxlen=1000)
+    self.latencies: deque = deque(maxlen=1000)
+    self._semaphore = asyncio.Semaphore(max_concurrency)
+
+  def table(self, name: str) -> _Request:
+    """Start a request on table ``name``."""
+    return _Request(self, (('table', (name,), {}),))
+
+  def rpc(self, fn: str, params: dict | None = None) -> _Request:
+    """Start a call of the Postgres function ``fn``."""
+    return _Request(self, (('rpc', (fn, params or {}), {}),))
+
+  async def execute(self, calls: tuple):
+    """Build the request described by ``calls`` on the async client and await it."""
+    _t0 = time.monotonic()
+    async with self._semaphore:
+      self.waits.append(time.monotonic() - _t0)
+      self.calls += 1
+      self.in_flight += 1
+      self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+      _t_request = time.monotonic()
+      try:
+        request = self.client
+        for name, args, kwargs in calls:
+          request = getattr(request, name)(*args, **kwargs)
+        return await asyncio.wait_for(request.execute(), self.timeout_s)
+      except asyncio.TimeoutError:
+        self.timeouts += 1
+        raise TimeoutError(f'Supabase {calls[0][1][0]} request timed out '
+                           f'after {self.timeout_s:g}s') from None
+      except Exception:
+        self.failures += 1
+        raise
+      finally:
+        self.in_flight -= 1
+        self.latencies.append(time.monotonic() - _t_request)
+
+  def run(self, calls: tuple):
+    """Run the request described by ``calls`` on the event loop and wait for its response."""
+    try:
+      on_loop = asyncio.get_running_loop() is self.loop
+    except RuntimeError:
+      on_loop = False
+    if on_loop:
+      raise RuntimeError('AsyncDatabase requests must be awaited with execute() '
+                         'on the event loop thread.')
+    if not self.loop.is_running():
+      raise RuntimeError('The event loop that owns the Supabase client is not running.')
+    return asyncio.run_coroutine_threadsafe(self.execute(calls), self.loop).result()
+
+  def __str__(self) -> str:
+    latencies = sorted(self.latencies)
+    waits = sorted(self.waits)
+    pick = lambda xs, q: xs[min(len(xs) - 1, int(q * len(xs)))] if xs else 0.0
+    return (f'supabase: {self.calls} calls, {self.in_flight}/{self.max_concurrency} in flight '
+            f'(peak {self.peak_in_flight}), p50 {pick(latencies, 0.5) * 1000:.0f} / '
+            f'p95 {pick(latencies, 0.95) * 1000:.0f} ms, '
+            f'slot wait p95 {pick(waits, 0.95) * 1000:.0f} ms, '
+            f'{self.failures} failed, {self.timeouts} timed out')
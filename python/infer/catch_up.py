@@ -0,0 +1,182 @@
+"""Keyset scans for work the listener missed while it was not receiving events.
+
+``unscored_responses`` walks ``form_responses`` in ``response_id`` order, one
+page at a time, and returns the records that have no ``form_results`` row.
+``response_page`` walks the same order but returns every record, for offline
+re-scoring. ``stuck_reports`` walks the ``student_reports`` still showing the placeholder
+feedback. Each call takes the last key of the previous page and returns the
+cursor for the next one. Pages are keyset-paginated (``key > cursor ORDER BY
+key LIMIT n``) rather than offset-paginated, so every page costs the same
+however deep the scan is, and rows inserted mid-scan cannot shift a page.
+
+``catch_up`` runs the scans for the listener, together with a replay of the
+event journal, and queues whatever they find for scoring or regeneration.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+# The llm_feedback a student report shows while its feedback is being generated.
+GENERATING_PLACEHOLDER = 'Generating...'
+CATCH_UP_PAGE_SIZE = int(os.environ.get('CATCH_UP_PAGE_SIZE', '200'))
+# Form responses scored per batch while catching up.
+CATCH_UP_BATCH = int(os.environ.get('CATCH_UP_BATCH', '256'))
+
+app_log = logging.getLogger('app')
+error_log = logging.getLogger('error')
+
+
+def _page(query, key: str, after: str | None, limit: int):
+  query = query.order(key).limit(limit)
+  if after is not None:
+    query = query.gt(key, after)
+  return query.execute().data or []
+
+
+def unscored_responses(supabase, after: str | None = None,
+                       limit: int = CATCH_UP_PAGE_SIZE) -> tuple[list[dict], str | None]:
+  """
+  Return one page of form responses that have no results yet.
+
+  Only ids are listed at first. Full payloads are fetched just for the
+  responses that are missing results, so a scan over a fully scored table
+  transfers little more than its keys.
+
+  Args:
+    supabase: Supabase client.
+    after: The cursor returned for the previous page, or None to start at the beginning.
+    limit: Responses examined per page. Their ids go into one ``in`` filter, so keep the URL short.
+
+  Returns:
+    The unscored ``{'response_id', 'response'}`` records of this page, and the
+    cursor for the next page (None once the table is exhausted).
+  """
+  ids = [row['response_id'] for row in _page(supabase.table('form_responses').select('response_id'),
+                                             'response_id', after, limit)]
+  if not ids:
+    return [], None
+  scored = {row['response_id'] for row in
+            (supabase.table('form_results').select('response_id').in_('response_id', ids)
+             .execute().data or [])}
+  missing = [response_id for response_id in ids if response_id not in scored]
+  records = []
+  if missing:
+    records = (supabase.table('form_responses').select('response_id, response')
+               .in_('response_id', missing).execute().data or [])
+  return records, ids[-1] if len(ids) == limit else None
+
+
+def response_page(supabase, after: str | None = None,
+                  limit: int = CATCH_UP_PAGE_SIZE) -> tuple[list[dict], str | None]:
+  """
+  Return one page of form responses with their payloads, scored or not.
+
+  Args:
+    supabase: Supabase client.
+    after: The cursor returned for the previous page, or None to start at the beginning.
+    limit: Responses per page.
+
+  Returns:
+    The ``{'response_id', 'response'}`` records of this page, and the cursor for
+    the next page (None once the table is exhausted).
+  """
+  rows = _page(supabase.table('form_responses').select('response_id, response'),
+               'response_id', after, limit)
+  return rows, rows[-1]['response_id'] if len(rows) == limit else None
+
+
+def stuck_reports(supabase, placeholder: str, after: str | None = None,
+                  limit: int = CATCH_UP_PAGE_SIZE) -> tuple[list[dict], str | None]:
+  """
+  Return one page of student reports whose feedback is still ``placeholder``.
+
+  Args:
+    supabase: Supabase client.
+    placeholder: The llm_feedback value written while feedback is generated.
+    after: The cursor returned for the previous page, or None to start at the beginning.
+    limit: Reports per page.
+
+  Returns:
+    The ``{'id', 'kf_avg_data', 'llm_feedback'}`` records of this page, and the
+    cursor for the next page (None once there are no more).
+  """
+  query = (supabase.table('student_reports').select('id, kf_avg_data, llm_feedback')
+           .eq('llm_feedback', placeholder))
+  rows = _page(query, 'id', after, limit)
+  return rows, rows[-1]['id'] if len(rows) == limit else None
+
+
+async def catch_up(supabase, score, regenerate, journal=None,
+                   replay_before: float | None = None) -> None:
+  """
+  Queue the work missed while no realtime events were being received.
+
+  That is every journaled event received before ``replay_before`` and never
+  handled, every form response without a form_results row, and every report
+  whose feedback is still GENERATING_PLACEHOLDER. Rows with a journaled event
+  still pending are skipped by the scans, since that event is already queued or
+  replayed. Form responses are scored in batches of CATCH_UP_BATCH and
+  upserted, so a row written meanwhile is simply replaced. Failures are logged;
+  live event handling never waits on a broken catch-up.
+
+  Args:
+    supabase: Supabase client the scans read through.
+    score: Coroutine function that queues a list of ``(kind, payload)`` form response events.
+    regenerate: Coroutine function that queues a student_reports payload for feedback generation.
+    journal: The listener's ``EventJournal``, or None if it has none.
+    replay_before: Replay journaled events received before this Unix time; None replays none.
+  """
+  _t0 = time.time()
+  batch: list[tuple[str, dict]] = []
+  counts = {'journaled': 0, 'unscored': 0, 'stuck reports': 0}
+
+  async def add(payload):
+    batch.append(('update', payload))
+    if len(batch) >= CATCH_UP_BATCH:
+      await score(batch[:])
+      batch.clear()
+
+  try:
+    in_flight = {'form_responses': set(), 'student_reports': set()}
+    if journal is not None:
+      in_flight = {source: await asyncio.to_thread(journal.pending_keys, source)
+                   for source in in_flight}
+      if replay_before is not None:
+        for source, _, _, payload in await asyncio.to_thread(journal.pending, None, replay_before):
+          counts['journaled'] += 1
+          await (add(payload) if source == 'form_responses' else regenerate(payload))
+
+    after = None
+    while True:
+      records, after = await asyncio.to_thread(unscored_responses, supabase, after)
+      for record in records:
+        # A response saved without a body has nothing to score.
+        body = (record.get('response') or {}).get('response')
+        if record['response_id'] in in_flight['form_responses'] or not body:
+          continue
+        counts['unscored'] += 1
+        await add({'data': {'record': record}})
+      if after is None:
+        break
+    if batch:
+      await score(batch[:])
+      batch.clear()
+
+    after = None
+    while True:
+      records, after = await asyncio.to_thread(stuck_reports, supabase, GENERATING_PLACEHOLDER,
+                                               after)
+      for record in records:
+        if str(record['id']) not in in_flight['student_reports']:
+          counts['stuck reports'] += 1
+          await regenerate({'data': {'record': record}})
+      if after is None:
+        break
+  except Exception as e:
+    error_log.exception(f'Catch-up failed after {time.time()-_t0:.1f}s ({counts}): {e}')
+    return
+  app_log.info(f'[CATCH-UP] Queued {counts["journaled"]} journaled events, '
+               f'{counts["unscored"]} form responses without results and '
+               f'{counts["stuck reports"]} reports left generating in {time.time()-_t0:.1f}s.')
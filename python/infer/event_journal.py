@@ -0,0 +1,148 @@
+"""On-disk journal of accepted realtime events and whether they were handled.
+
+Realtime events are only delivered to a connected listener, so anything sent
+while it restarts, waits for models or is disconnected would be lost. The
+listener records each form_responses and student_reports event here as it
+arrives and marks it done once its result or feedback is written. Events still
+pending at startup are replayed. The journal is a SQLite database in WAL mode
+with ``synchronous=NORMAL``, so recording an event costs a local write without
+an fsync and survives a crash of the process.
+
+Each source keeps one entry per row: a newer event for the same row replaces
+the older one, since only the latest payload needs handling. A completion can
+carry the digest of the payload it handled, so finishing an older payload never
+marks a newer one done.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+EVENT_JOURNAL_RETENTION_DAYS = float(os.environ.get('EVENT_JOURNAL_RETENTION_DAYS', '7'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+  source TEXT NOT NULL,
+  key TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  payload TEXT NOT NULL,
+  digest TEXT,
+  received_at REAL NOT NULL,
+  done_at REAL,
+  PRIMARY KEY (source, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_pending ON events (done_at, received_at);
+"""
+
+
+class EventJournal:
+  """
+  SQLite-backed record of accepted events and their completion.
+
+  Args:
+    path: SQLite database file; created if missing.
+    retention_s: Seconds a handled event is kept before ``prune`` deletes it.
+  """
+
+  def __init__(self, path: str, retention_s: float = EVENT_JOURNAL_RETENTION_DAYS * 86400):
+    self.path = path
+    self.retention_s = retention_s
+    self.recorded = 0
+    self.completed = 0
+    self._lock = threading.Lock()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+    self._conn.execute('PRAGMA journal_mode=WAL')
+    self._conn.execute('PRAGMA synchronous=NORMAL')
+    self._conn.executescript(_SCHEMA)
+
+  def record(self, source: str, kind: str, key: str, payload: dict,
+             digest: str | None = None) -> None:
+    """
+    Record an accepted event, replacing any earlier one for the same row.
+
+    An ``insert`` still pending stays an ``insert`` when an update to the same
+    row replaces its payload.
+    """
+    with self._lock:
+      self._conn.execute(
+          'INSERT INTO events (source, key, kind, payload, digest, received_at) '
+          'VALUES (?, ?, ?, ?, ?, ?) '
+          'ON CONFLICT (source, key) DO UPDATE SET '
+          "kind = CASE WHEN events.done_at IS NULL AND events.kind = 'insert' "
+          "THEN 'insert' ELSE excluded.kind END, "
+          'payload = excluded.payload, digest = excluded.digest, '
+          'received_at = excluded.received_at, done_at = NULL',
+          (source, str(key), kind, json.dumps(payload, separators=(',', ':')), digest, time.time()))
+      self.recorded += 1
+
+  def complete(self, source: str, key: str, digest: str | None = None) -> bool:
+    """
+    Mark a row's pending event as handled.
+
+    Args:
+      source: The table the event came from.
+      key: The row's key.
+      digest: Digest of the payload that was handled. If given, a pending event
+        with a different digest (a newer payload) stays pending.
+
+    Returns:
+      True if a pending event was marked done.
+    """
+    sql = 'UPDATE events SET done_at = ? WHERE source = ? AND key = ? AND done_at IS NULL'
+    params = [time.time(), source, str(key)]
+    if digest is not None:
+      sql += ' AND digest IS ?'
+      params.append(digest)
+    with self._lock:
+      done = self._conn.execute(sql, params).rowcount > 0
+      self.completed += done
+    return done
+
+  def pending(self, source: str | None = None,
+              before: float | None = None) -> list[tuple[str, str, str, dict]]:
+    """
+    Return ``(source, kind, key, payload)`` for every event not yet handled, oldest first.
+
+    Args:
+      source: Only return events from this table.
+      before: Only return events received before this Unix time, such as the
+        start of the current process, whose own events are still queued.
+    """
+    sql = 'SELECT source, kind, key, payload FROM events WHERE done_at IS NULL'
+    params = []
+    if source is not None:
+      sql += ' AND source = ?'
+      params.append(source)
+    if before is not None:
+      sql += ' AND received_at < ?'
+      params.append(before)
+    with self._lock:
+      rows = self._conn.execute(sql + ' ORDER BY received_at', params).fetchall()
+    return [(src, kind, key, json.loads(payload)) for src, kind, key, payload in rows]
+
+  def pending_keys(self, source: str) -> set[str]:
+    """Return the keys of ``source`` rows whose latest event has not been handled."""
+    with self._lock:
+      return {key for (key,) in self._conn.execute(
+          'SELECT key FROM events WHERE source = ? AND done_at IS NULL', (source,))}
+
+  def prune(self) -> int:
+    """Delete handled events older than ``retention_s`` and return how many were deleted."""
+    with self._lock:
+      return self._conn.execute('DELETE FROM events WHERE done_at IS NOT NULL AND done_at < ?',
+                                (time.time() - self.retention_s,)).rowcount
+
+  def __len__(self) -> int:
+    with self._lock:
+      return self._conn.execute('SELECT COUNT(*) FROM events WHERE done_at IS NULL').fetchone()[0]
+
+  def close(self) -> None:
+    """Close the underlying database connection."""
+    with self._lock:
+      self._conn.close()
+
+  def __str__(self) -> str:
+    return f'event journal: {self.recorded} recorded, {self.completed} handled, {len(self)} pending'
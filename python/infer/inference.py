@@ -1,76 +1,472 @@
 """Inference helpers for the Clinical Competency Calculator.
 
 This module loads a trained DeBERTa-v3-small model, performs inference for incoming
-assessment data, downloads model artifacts from Supabase Storage, and generates
-AI-written report summaries from averaged key-function results.
+assessment data, and downloads model artifacts from Supabase Storage. AI-written
+report summaries are generated in ``report_summary``.
+
+PyTorch, transformers, scikit-learn, ONNX Runtime and the Supabase client are
+imported on first use (see ``lazy_imports``) rather than with this module, so
+callers that only need one backend (or only the SVMs) do not pay for the others
+at startup. The ONNX Runtime and int8 model variants live in ``onnx_backend``.
 """
 
-import json
+from __future__ import annotations
+
+from collections import OrderedDict
+from contextlib import nullcontext
+from dataclasses import dataclass
+import hashlib
 import os
 import pickle
-import re
 import shutil
 import subprocess
-import sys
-import tempfile
+import threading
 import time
+import unicodedata
+
+import numpy as np
+
+from artifact_cache import ARTIFACT_MANIFEST, ArtifactCache, build_manifest, read_manifest
+from lazy_imports import AutoModelForSequenceClassification, AutoTokenizer, spb, svm, torch
+from onnx_backend import OnnxSequenceClassifier, load_quantized_torch_model, onnx_model_file
+from svm_engine import LinearSvmEngine, kf_from_model_name, model_name_from_kf, read_bundle_manifest
+from svm_sync import SyncStats, sync_svm_models
+
+
+DEBERTA_MAX_LENGTH = 160
+# 'torch' (eager PyTorch) or 'onnx' (ONNX Runtime, CPU execution provider).
+DEBERTA_BACKEND = os.environ.get('DEBERTA_BACKEND', 'torch').lower()
+# Apply dynamic int8 quantization to the classifier's Linear layers (either backend).
+DEBERTA_QUANTIZE = os.environ.get('DEBERTA_QUANTIZE', '').lower() in ('1', 'true', 'int8')
+DEBERTA_MAX_BATCH_TOKENS = int(os.environ.get('DEBERTA_MAX_BATCH_TOKENS', '8192'))
+DEBERTA_LOGIT_CACHE_SIZE = int(os.environ.get('DEBERTA_LOGIT_CACHE_SIZE', '50000'))
+# Upper token-length edges of the batching buckets; texts never share a batch across an edge.
+DEBERTA_LENGTH_BUCKETS = tuple(
+    int(edge) for edge in os.environ.get('DEBERTA_LENGTH_BUCKETS', '16,32,64,96,128').split(',')
+    if edge
+)
+# Synthetic passes run over freshly loaded models (0 disables), and texts/responses per batch.
+MODEL_WARMUP_ROUNDS = int(os.environ.get('MODEL_WARMUP_ROUNDS', '2'))
+MODEL_WARMUP_BATCH = int(os.environ.get('MODEL_WARMUP_BATCH', '8'))
+
+
+def _logits_to_numpy(logits) -> np.ndarray:
+  """Return model logits as a float32 NumPy array regardless of the backend that produced them."""
+  if isinstance(logits, np.ndarray):
+    return logits.astype(np.float32, copy=False)
+  return logits.detach().cpu().float().numpy()
+
+
+def _bucket_of(length: int, edges: tuple[int, ...]) -> int:
+  """Return the index of the first bucket edge that ``length`` fits under."""
+  for i, edge in enumerate(edges):
+    if length <= edge:
+      return i
+  return len(edges)
+
+
+def _plan_batches(
+    lengths: list[int],
+    max_batch_tokens: int,
+    edges: tuple[int, ...] = DEBERTA_LENGTH_BUCKETS,
+) -> list[list[int]]:
+  """
+  Group text indices into length buckets whose padded size fits a token budget.
+
+  Indices are sorted by tokenized length and a new batch is started whenever a
+  text crosses one of the bucket ``edges`` or would push the batch past the
+  budget. A batch is padded to its longest member, so its cost is
+  ``len(batch) * max(lengths)``. A single text longer than the budget still gets
+  a batch of its own.
+
+  Args:
+    lengths: Tokenized length of each text.
+    max_batch_tokens: Upper bound on padded tokens per forward pass.
+    edges: Ascending upper token-length edges of the buckets.
+
+  Returns:
+    A list of batches, each a list of indices into ``lengths``.
+  """
+  batches: list[list[int]] = []
+  current: list[int] = []
+  current_bucket = -1
+  for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+    bucket = _bucket_of(lengths[i], edges)
+    # Sorted ascending, so the newest index is always the longest in its batch.
+    if current and (bucket != current_bucket or lengths[i] * (len(current) + 1) > max_batch_tokens):
+      batches.append(current)
+      current = []
+    current.append(i)
+    current_bucket = bucket
+  if current:
+    batches.append(current)
+  return batches
+
+
+def _padded_tokens(lengths: list[int], batches: list[list[int]]) -> int:
+  """Return the number of tokens the model sees once every batch is padded to its longest text."""
+  return sum(len(batch) * max(lengths[i] for i in batch) for batch in batches)
+
+
+@dataclass
+class BatchingStats:
+  """Token accounting for length-bucketed DeBERTa batching."""
+  texts: int = 0
+  batches: int = 0
+  real_tokens: int = 0
+  padded_tokens: int = 0
+  unbucketed_padded_tokens: int = 0
+
+  @property
+  def padding_avoided(self) -> int:
+    """Padding tokens saved compared to batching the same texts in input order."""
+    return self.unbucketed_padded_tokens - self.padded_tokens
+
+  def add(self, other: 'BatchingStats') -> None:
+    """Accumulate another set of counters into this one."""
+    self.texts += other.texts
+    self.batches += other.batches
+    self.real_tokens += other.real_tokens
+    self.padded_tokens += other.padded_tokens
+    self.unbucketed_padded_tokens += other.unbucketed_padded_tokens
+
+  def __str__(self) -> str:
+    return (f'{self.texts} texts in {self.batches} batches, '
+            f'{self.padded_tokens} padded tokens for {self.real_tokens} real, '
+            f'{self.padding_avoided} padding tokens avoided by length bucketing')
+
+
+# Running totals across every deberta_logits call in this process.
+DEBERTA_BATCHING_TOTALS = BatchingStats()
+
+
+def _unbucketed_padded_tokens(lengths: list[int], max_batch_tokens: int) -> int:
+  """Padded token count of the same budget applied to texts in input order, for comparison."""
+  total, count, longest = 0, 0, 0
+  for length in lengths:
+    if count and max(longest, length) * (count + 1) > max_batch_tokens:
+      total += count * longest
+      count, longest = 0, 0
+    count += 1
+    longest = max(longest, length)
+  return total + count * longest
+
+
+def normalize_text(text: str) -> str:
+  """Normalize a free-text response for cache keying (Unicode NFC, trimmed, single-spaced)."""
+  return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+# (model dir, file signatures) -> fingerprint, so unchanged directories are hashed once per process.
+_FINGERPRINTS: dict[tuple, str] = {}
+
+
+def model_fingerprint(model_path: str) -> str:
+  """
+  Return a short content hash of every file in a saved model directory.
+
+  The fingerprint changes whenever weights, config, or tokenizer files change,
+  so it can version anything derived from the model's outputs. Results are
+  memoized per process on each file's name, size, and modification time.
+
+  Args:
+    model_path: Filesystem path to the saved HuggingFace model directory.
+
+  Returns:
+    The first 16 hex characters of a SHA-256 over file names and contents.
+  """
+  # The artifact manifest only describes the other files, so it cannot change what the model does.
+  fnames = sorted(f for f in os.listdir(model_path)
+                  if f != ARTIFACT_MANIFEST and os.path.isfile(os.path.join(model_path, f)))
+  file_stats = [(f, os.stat(os.path.join(model_path, f))) for f in fnames]
+  signature = (os.path.abspath(model_path),
+               tuple((f, st.st_size, st.st_mtime_ns) for f, st in file_stats))
+  if signature in _FINGERPRINTS:
+    return _FINGERPRINTS[signature]
+
+  digest = hashlib.sha256()
+  for fname in fnames:
+    digest.update(fname.encode())
+    with open(os.path.join(model_path, fname), 'rb') as f:
+      for chunk in iter(lambda: f.read(1 << 20), b''):
+        digest.update(chunk)
+  _FINGERPRINTS[signature] = digest.hexdigest()[:16]
+  return _FINGERPRINTS[signature]
+
+
+def deberta_model_version(
+    model_path: str,
+    backend: str = DEBERTA_BACKEND,
+    quantize: bool = DEBERTA_QUANTIZE,
+) -> str:
+  """Return a version string for the loaded model variant: fingerprint, backend, and precision."""
+  return f'{model_fingerprint(model_path)}-{backend}{"-int8" if quantize else ""}'
+
+
+class LogitCache:
+  """
+  Bounded, thread-safe LRU of per-text DeBERTa logits.
+
+  Entries are keyed by a hash of the normalized text plus the model version, so
+  rows computed by a different checkpoint are never served. An optional
+  persistent ``store`` (see ``logit_store.LogitStore``) backs the in-memory tier:
+  memory misses are looked up there, and new rows are written through to it.
+  """
+
+  def __init__(self, model_version: str, maxsize: int = DEBERTA_LOGIT_CACHE_SIZE, store=None):
+    self.model_version = model_version
+    self.maxsize = maxsize
+    self.store = store
+    self.hits = 0
+    self.misses = 0
+    self._rows: OrderedDict[str, np.ndarray] = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._rows)
+
+  def key(self, text: str) -> str:
+    """Return the cache key for ``text`` under this cache's model version."""
+    return hashlib.sha256(f'{self.model_version}\0{normalize_text(text)}'.encode()).hexdigest()
+
+  def get_many(self, keys: list[str]) -> list[np.ndarray | None]:
+    """Look up logit rows for ``keys`` in memory, then in the store; misses are ``None``."""
+    with self._lock:
+      rows = []
+      for key in keys:
+        row = self._rows.get(key)
+        if row is None:
+          self.misses += 1
+        else:
+          self.hits += 1
+          self._rows.move_to_end(key)
+        rows.append(row)
+
+    missing = [key for key, row in zip(keys, rows) if row is None]
+    if self.store is not None and missing:
+      try:
+        stored = dict(zip(missing, self.store.get_many(missing)))
+      except Exception as e:
+        print(f'Logit store lookup failed, continuing without it: {e}', flush=True)
+        return rows
+      found = {key: row for key, row in stored.items() if row is not None}
+      self._remember(list(found), list(found.values()))
+      rows = [found.get(key) if row is None else row for key, row in zip(keys, rows)]
+    return rows
+
+  def put_many(self, keys: list[str], rows: np.ndarray) -> None:
+    """Store logit rows for ``keys`` in memory and write them through to the store."""
+    self._remember(keys, rows)
+    if self.store is not None:
+      try:
+        self.store.put_many(keys, rows)
+      except Exception as e:
+        print(f'Logit store write failed, continuing without it: {e}', flush=True)
+
+  def _remember(self, keys: list[str], rows) -> None:
+    """Add rows to the in-memory tier, evicting the least recently used entries past ``maxsize``."""
+    with self._lock:
+      for key, row in zip(keys, rows):
+        self._rows[key] = np.array(row, dtype=np.float32)
+        self._rows.move_to_end(key)
+      while len(self._rows) > self.maxsize:
+        self._rows.popitem(last=False)
+
+  def __str__(self) -> str:
+    text = f'{len(self)}/{self.maxsize} rows, {self.hits} hits, {self.misses} misses'
+    if self.store is not None:
+      text += f' (store: {self.store})'
+    return text
+
+
+def _forward_logits(
+    model_bundle: tuple,
+    texts: list[str],
+    max_batch_tokens: int = DEBERTA_MAX_BATCH_TOKENS,
+    stats: BatchingStats | None = None,
+) -> np.ndarray:
+  """
+  Run the model over ``texts`` with length-bucketed dynamic batching.
+
+  Texts are tokenized once without padding, sorted into length buckets that fit
+  ``max_batch_tokens``, padded per bucket, and the resulting logits are put back
+  in input order.
+
+  Args:
+    model_bundle: Tuple of (tokenizer, model) loaded from disk.
+    texts: Free-text responses to score.
+    max_batch_tokens: Upper bound on padded tokens per forward pass.
+    stats: Optional counters to accumulate this call's token accounting into.
+
+  Returns:
+    A ``(len(texts), n_classes)`` float32 array of logits in input order.
+  """
+  if not texts:
+    return np.zeros((0, 0), dtype=np.float32)
 
-import supabase as spb
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from google import genai
-from google.genai import types as genai_types
-from google.genai.types import GenerateContentResponse
-from sklearn import svm
+  tokenizer, model = model_bundle
+  enc = tokenizer(texts, truncation=True, max_length=DEBERTA_MAX_LENGTH)
+  lengths = [len(ids) for ids in enc['input_ids']]
+  batches = _plan_batches(lengths, max_batch_tokens)
+
+  tensor_type = getattr(model, 'tensor_type', 'pt')
+  logits = None
+  for batch in batches:
+    features = tokenizer.pad(
+        {name: [values[i] for i in batch] for name, values in enc.items()},
+        return_tensors=tensor_type,
+    )
+    # NumPy-fed backends (ONNX Runtime) never touch torch, so do not import it for them.
+    with torch.no_grad() if tensor_type == 'pt' else nullcontext():
+      rows = _logits_to_numpy(model(**features).logits)
+    if logits is None:
+      logits = np.empty((len(texts), rows.shape[1]), dtype=np.float32)
+    logits[batch] = rows
+
+  call_stats = BatchingStats(
+      texts=len(texts),
+      batches=len(batches),
+      real_tokens=sum(lengths),
+      padded_tokens=_padded_tokens(lengths, batches),
+      unbucketed_padded_tokens=_unbucketed_padded_tokens(lengths, max_batch_tokens),
+  )
+  DEBERTA_BATCHING_TOTALS.add(call_stats)
+  if stats is not None:
+    stats.add(call_stats)
+  return logits
+
+
+def deberta_logits(
+    model_bundle: tuple,
+    texts: list[str],
+    max_batch_tokens: int = DEBERTA_MAX_BATCH_TOKENS,
+    stats: BatchingStats | None = None,
+    cache: LogitCache | None = None,
+) -> np.ndarray:
+  """
+  Compute per-text DeBERTa logits, reusing cached rows where available.
+
+  Without a cache every text goes through the model. With one, only distinct
+  texts missing from the cache are scored, and their rows are added to it.
+
+  Args:
+    model_bundle: Tuple of (tokenizer, model) loaded from disk.
+    texts: Free-text responses to score.
+    max_batch_tokens: Upper bound on padded tokens per forward pass.
+    stats: Optional counters to accumulate this call's token accounting into.
+    cache: Optional per-text logit cache for the loaded model.
+
+  Returns:
+    A ``(len(texts), n_classes)`` float32 array of logits in input order.
+  """
+  if cache is None or not texts:
+    return _forward_logits(model_bundle, texts, max_batch_tokens, stats)
+
+  keys = [cache.key(text) for text in texts]
+  rows = cache.get_many(keys)
+  missing: dict[str, str] = {}
+  for key, text, row in zip(keys, texts, rows):
+    if row is None:
+      missing.setdefault(key, text)
+
+  if missing:
+    computed = _forward_logits(model_bundle, list(missing.values()), max_batch_tokens, stats)
+    cache.put_many(list(missing), computed)
+    by_key = dict(zip(missing, computed))
+    rows = [by_key[key] if row is None else row for key, row in zip(keys, rows)]
+  return np.stack(rows)
 
 
 def deberta_infer(
     model_bundle: tuple,
     data: dict[str, list[str]],
+    single_pass: bool = True,
+    max_batch_tokens: int = DEBERTA_MAX_BATCH_TOKENS,
+    cache: LogitCache | None = None,
 ) -> dict[str, int]:
   """
   Predict development levels for free-text responses with a loaded DeBERTa model.
 
+  By default every text from every key function goes through the model together,
+  bucketed by length into batches of at most ``max_batch_tokens`` padded tokens, and
+  the per-text logits are segment-summed back per key function. ``single_pass=False``
+  runs one batch per key function instead, which is the original behaviour and is
+  kept for parity checks.
+
   Args:
     model_bundle: Tuple of (tokenizer, model) loaded from disk.
     data: Mapping of key-function IDs to lists of free-text responses.
+    single_pass: Batch texts across key functions instead of one pass per key function.
+    max_batch_tokens: Upper bound on padded tokens per forward pass.
+    cache: Optional per-text logit cache; only texts it misses go through the model.
 
   Returns:
     A mapping of key-function IDs to predicted development levels.
   """
   print('Running inference on DeBERTa model...')
   _t0 = time.time()
-  tokenizer, model = model_bundle
 
-  def get_class(sentences: list[str]) -> int:
-    enc = tokenizer(
-        sentences,
-        return_tensors='pt',
-        truncation=True,
-        max_length=160,
-        padding=True,
-    )
-    with torch.no_grad():
-      logits = model(**enc).logits  # (n_texts, 4)
-    summed_logits = logits.sum(dim=0)  # aggregate across texts
-    return int(summed_logits.argmax())
-
-  result = {k: get_class(v) for k, v in data.items()}
+  stats = BatchingStats()
+  if single_pass:
+    texts = [text for texts in data.values() for text in texts]
+    logits = deberta_logits(model_bundle, texts, max_batch_tokens, stats, cache)
+  else:
+    per_kf = [deberta_logits(model_bundle, v, max_batch_tokens, stats, cache)
+              for v in data.values() if v]
+    logits = np.concatenate(per_kf) if per_kf else np.zeros((0, 0), dtype=np.float32)
+
+  segments = np.repeat(np.arange(len(data)), [len(v) for v in data.values()])
+  summed = np.zeros((len(data), max(logits.shape[1], 1)), dtype=np.float32)
+  # With no texts the (0, 0) logits cannot broadcast into ``summed``, and there is nothing to add.
+  if logits.size:
+    np.add.at(summed, segments, logits)
+
+  result = {k: int(np.argmax(summed[i])) for i, k in enumerate(data)}
   _elapsed = time.time() - _t0
   _total_texts = sum(len(v) for v in data.values())
-  print(f'[TIMING] DeBERTa inference: {_elapsed:.3f}s ({_total_texts} texts across {len(data)} key functions)', flush=True)
+  print(f'[TIMING] DeBERTa inference: {_elapsed:.3f}s ({_total_texts} texts across '
+        f'{len(data)} key functions; {stats}{f"; cache {cache}" if cache is not None else ""})',
+        flush=True)
   return result
 
 
+def deberta_infer_many(
+    model_bundle: tuple,
+    data: list[dict[str, list[str]]],
+    max_batch_tokens: int = DEBERTA_MAX_BATCH_TOKENS,
+    cache: LogitCache | None = None,
+) -> list[dict[str, int]]:
+  """
+  Predict development levels for several form responses with one combined DeBERTa batch.
+
+  Args:
+    model_bundle: Tuple of (tokenizer, model) loaded from disk.
+    data: One mapping of key-function IDs to free-text responses per form response.
+    max_batch_tokens: Upper bound on padded tokens per forward pass.
+    cache: Optional per-text logit cache; only texts it misses go through the model.
+
+  Returns:
+    One mapping of key-function IDs to predicted development levels per form response.
+  """
+  merged = {(i, kf): texts for i, response in enumerate(data) for kf, texts in response.items()}
+  levels = deberta_infer(model_bundle, merged, max_batch_tokens=max_batch_tokens, cache=cache)
+  results: list[dict[str, int]] = [{} for _ in data]
+  for (i, kf), level in levels.items():
+    results[i][kf] = level
+  return results
+
+
 # ==================================================================================================
 
 
-def svm_infer(models: dict[str, svm.SVC], data: dict[str, list[bool]]) -> dict[str, int]:
+def svm_infer(models: dict[str, svm.SVC] | LinearSvmEngine,
+              data: dict[str, list[bool]]) -> dict[str, int]:
   """
   Predict development levels for multiple-choice responses with SVM models.
 
   Args:
-    models: Mapping of model names to loaded scikit-learn SVM classifiers.
+    models: A compiled ``LinearSvmEngine``, or a mapping of model names to loaded
+      scikit-learn SVM classifiers.
     data: Mapping of key-function IDs to encoded feature lists.
 
   Returns:
@@ -79,152 +475,183 @@ def svm_infer(models: dict[str, svm.SVC], data: dict[str, list[bool]]) -> dict[s
   print('Running inference on SVM models...')
   _t0 = time.time()
 
-  def get_class(kf, response: list[bool]) -> int:
-    model_key = 'mcq_kf' + kf.replace('.', '_')
-    return models[model_key].predict([response])[0]
-
-  result = {k: get_class(k, v) for k, v in data.items()}
+  if isinstance(models, LinearSvmEngine):
+    result = models.predict(data)
+  else:
+    result = {k: models[model_name_from_kf(k)].predict([v])[0] for k, v in data.items()}
   _elapsed = time.time() - _t0
   print(f'[TIMING] SVM inference: {_elapsed:.3f}s ({len(data)} key functions)', flush=True)
   return result
 
 
-# ==================================================================================================
-
+def svm_infer_many(
+    models: dict[str, svm.SVC] | LinearSvmEngine,
+    data: list[dict[str, list[bool]]],
+) -> list[dict[str, int]]:
+  """
+  Predict development levels for several form responses in one pass.
 
-_GEMINI_MODELS = ('gemini-2.5-flash', 'gemini-2.0-flash')
-_RATE_LIMIT_SIGNALS = ('429', 'RESOURCE_EXHAUSTED')
-_UNAVAILABLE_SIGNALS = ('503', 'UNAVAILABLE')
+  A ``LinearSvmEngine`` scores every row at once; a plain model mapping makes one
+  ``predict`` call per key function.
 
+  Args:
+    models: A compiled ``LinearSvmEngine``, or a mapping of model names to loaded
+      scikit-learn SVM classifiers.
+    data: One mapping of key-function IDs to encoded feature lists per form response.
 
-def _build_report_query(datastr: str) -> str:
-  return f"""
-  You are a clinical clerkship evaluator. A student was assessed on AAMC Core EPAs (13 EPAs, each with key functions). Development levels: 0=remedial, 1=early-developing, 2=developing, 3=entrustable.
+  Returns:
+    One mapping of key-function IDs to predicted development levels per form response.
+  """
+  print('Running batched inference on SVM models...')
+  _t0 = time.time()
 
-  Student scores by key function (averages across rotation):
-  {datastr}
+  if isinstance(models, LinearSvmEngine):
+    results = models.predict_many(data)
+  else:
+    rows_by_kf: dict[str, list[tuple[int, list[bool]]]] = {}
+    for i, response in enumerate(data):
+      for kf, features in response.items():
+        rows_by_kf.setdefault(kf, []).append((i, features))
 
-  For each key function, write a structured response with exactly two sections:
-  1. **Performance:** 1-2 sentences explaining the student's performance level and how they have progressed throughout the rotation based on the score.
-  2. **Actionable Items:** 1-2 specific, practical steps the student can take to improve in this area, grounded in the score data.
+    results = [{} for _ in data]
+    for kf, rows in rows_by_kf.items():
+      predictions = models[model_name_from_kf(kf)].predict([features for _, features in rows])
+      for (i, _), level in zip(rows, predictions):
+        results[i][kf] = level
 
-  Return a JSON object where keys are the KF IDs (e.g. "1.1", "1.2") and values are Markdown strings using this exact format:
-  **Performance:** <text>
+  _elapsed = time.time() - _t0
+  print(f'[TIMING] SVM inference: {_elapsed:.3f}s ({len(data)} responses, '
+        f'{sum(len(r) for r in data)} key-function rows)', flush=True)
+  return results
 
-  **Actionable Items:** <text>
-  """
 
+def _warm_up_text(tokens: int) -> str:
+  """Return a synthetic free-text response that tokenizes to roughly ``tokens`` tokens."""
+  return ' '.join(['patient'] * max(tokens - 2, 1))
 
-def _parse_gemini_text(raw: str) -> str | None:
-  """Strip markdown fences, extract the outermost JSON object, and validate it."""
-  text = raw.strip()
-  if text.startswith('```'):
-    text = re.sub(r'^```[a-zA-Z]*\n?', '', text)
-    text = re.sub(r'\n?```$', '', text.strip()).strip()
-  match = re.search(r'\{.*\}', text, re.DOTALL)
-  if match:
-    text = match.group(0)
-  try:
-    return json.dumps(json.loads(text))
-  except json.JSONDecodeError:
-    return None
-
-
-def _handle_gemini_error(e: Exception, model: str, attempt: int) -> None:
-  """Sleep-and-retry for rate-limit / 503 errors; re-raise everything else."""
-  err = str(e)
-  if any(sig in err for sig in _RATE_LIMIT_SIGNALS):
-    wait = 15 * (attempt + 1)
-    print(f'Gemini rate limited ({model}), retrying in {wait}s... (attempt {attempt+1}/3)', flush=True)
-    time.sleep(wait)
-    return
-  if any(sig in err for sig in _UNAVAILABLE_SIGNALS) or 'high demand' in err.lower():
-    wait = 3 * (attempt + 1)
-    print(f'Gemini unavailable (503) on {model}, retrying in {wait}s... (attempt {attempt+1}/3)', flush=True)
-    time.sleep(wait)
-    return
-  raise e
 
+def warm_up_deberta(
+    model_bundle: tuple,
+    rounds: int = MODEL_WARMUP_ROUNDS,
+    batch_size: int = MODEL_WARMUP_BATCH,
+    edges: tuple[int, ...] = DEBERTA_LENGTH_BUCKETS,
+) -> float:
+  """
+  Run synthetic batches through a freshly loaded DeBERTa model, one per length bucket.
 
-def _try_gemini_model(
-  gemini: genai.Client,
-  model: str,
-  query: str,
-  config: genai_types.GenerateContentConfig,
-) -> str | None:
-  """Attempt up to 3 calls on a single model. Returns a JSON string or None on failure."""
-  for attempt in range(3):
-    try:
-      _t = time.time()
-      response: GenerateContentResponse = gemini.models.generate_content(
-        model=model, contents=query, config=config,
-      )
-      print(f'[TIMING] Gemini API call ({model}, attempt {attempt+1}): {time.time()-_t:.3f}s', flush=True)
-      if not response.text:
-        print(f'Gemini returned empty response on {model} attempt {attempt+1}, retrying...', flush=True)
-        continue
-      result = _parse_gemini_text(response.text)
-      if result is not None:
-        return result
-      print(f'Gemini returned invalid JSON on {model} attempt {attempt+1}, retrying...', flush=True)
-    except Exception as e:
-      _handle_gemini_error(e, model, attempt)
-  return None
-
-
-def generate_report_summary(data: dict[str, float], gemini: genai.Client) -> str:
-  """
-  Generate a JSON summary of student performance from key-function averages.
+  The first forward pass at each input shape pays one-off costs (allocator
+  growth, oneDNN kernel selection, tokenizer caches). Running ``batch_size``
+  texts at every bucket edge, plus one at ``DEBERTA_MAX_LENGTH``, moves that cost
+  from the first student submission to startup. Per-bucket timings are printed
+  for every round, so the last round shows the steady-state cost.
 
   Args:
-    data: Mapping of key-function IDs to average scores.
-    gemini: Authenticated Gemini client used to generate the summary.
+    model_bundle: Tuple of (tokenizer, model) loaded from disk.
+    rounds: Passes over all buckets; 0 skips the warm-up.
+    batch_size: Synthetic texts per bucket.
+    edges: Length bucket edges to cover.
 
   Returns:
-    A JSON-formatted string suitable for storage in PostgreSQL ``jsonb``.
+    Total seconds spent warming up.
+  """
+  _t0 = time.time()
+  lengths = sorted({*(e for e in edges if e < DEBERTA_MAX_LENGTH), DEBERTA_MAX_LENGTH})
+  for r in range(rounds):
+    timings = []
+    for tokens in lengths:
+      _t_bucket = time.time()
+      _forward_logits(model_bundle, [_warm_up_text(tokens)] * batch_size)
+      timings.append(f'{tokens}: {time.time() - _t_bucket:.3f}s')
+    print(f'[TIMING] DeBERTa warm-up round {r + 1}/{rounds} ({batch_size} texts per bucket) — '
+          f'{", ".join(timings)}', flush=True)
+  return time.time() - _t0
+
+
+def warm_up_svm(
+    svm_models: dict[str, svm.SVC] | LinearSvmEngine,
+    rounds: int = MODEL_WARMUP_ROUNDS,
+    batch_size: int = MODEL_WARMUP_BATCH,
+) -> float:
   """
-  query = _build_report_query('\n'.join(f'{k}: {v}' for k, v in data.items()))
-  config = genai_types.GenerateContentConfig(response_mime_type='application/json')
+  Score ``batch_size`` synthetic responses covering every key function through the SVM path.
+
+  Args:
+    svm_models: A compiled ``LinearSvmEngine``, or a mapping of model names to loaded
+      scikit-learn SVM classifiers.
+    rounds: Number of passes; 0 skips the warm-up.
+    batch_size: Synthetic responses per pass.
 
+  Returns:
+    Total seconds spent warming up.
+  """
+  if isinstance(svm_models, LinearSvmEngine):
+    features = {kf: [False] * int(n) for kf, n in zip(svm_models.kfs, svm_models.n_features)}
+  else:
+    features = {kf_from_model_name(name): [False] * model.n_features_in_
+                for name, model in svm_models.items()}
   _t0 = time.time()
-  for model in _GEMINI_MODELS:
-    print(f'Trying Gemini model: {model}', flush=True)
-    try:
-      result = _try_gemini_model(gemini, model, query, config)
-    except Exception as e:
-      print(f'Gemini model {model} failed with non-retryable error: {e}', flush=True)
-      continue
-    if result is not None:
-      print(f'[TIMING] Gemini total ({model} success): {time.time()-_t0:.3f}s', flush=True)
-      return result
-    print(f'{model} failed after 3 attempts, falling back to next model...', flush=True)
+  for _ in range(rounds):
+    svm_infer_many(svm_models, [features] * batch_size)
+  return time.time() - _t0
 
-  print(f'[TIMING] Gemini total (all attempts failed): {time.time()-_t0:.3f}s', flush=True)
-  return 'Error generating feedback: all models failed.'
+
+def warm_up_models(model_bundle: tuple | None,
+                   svm_models: dict[str, svm.SVC] | LinearSvmEngine | None) -> dict[str, float]:
+  """
+  Warm up both model paths before they serve real traffic.
+
+  Pass None for a model that should not be warmed up, e.g. one that is already serving.
+
+  Returns:
+    Seconds spent warming up each model path, keyed ``'deberta'`` and ``'svm'``.
+  """
+  return {'deberta': warm_up_deberta(model_bundle) if model_bundle is not None else 0.0,
+          'svm': warm_up_svm(svm_models) if svm_models is not None else 0.0}
 
 
 # ==================================================================================================
 
 
-def load_deberta_model(model_path: str) -> tuple:
+def load_deberta_model(
+    model_path: str,
+    backend: str = DEBERTA_BACKEND,
+    quantize: bool = DEBERTA_QUANTIZE,
+) -> tuple:
   """
   Load a DeBERTa-v3-small model and tokenizer from disk.
 
+  With the ``onnx`` backend the model is exported to ONNX on first use (cached
+  next to the model directory and keyed by the model fingerprint) and run with
+  ONNX Runtime's CPU execution provider. ``quantize`` applies dynamic int8
+  quantization to the Linear layers; the quantized weights are cached the same way.
+
   Args:
     model_path: Filesystem path to the saved HuggingFace model directory.
+    backend: ``'torch'`` for eager PyTorch or ``'onnx'`` for ONNX Runtime.
+    quantize: Use dynamic int8 quantization instead of fp32.
 
   Returns:
     A tuple of (tokenizer, model) ready for inference.
 
   Raises:
     FileNotFoundError: If the provided model path does not exist.
+    ValueError: If the backend is not recognized.
   """
   if not os.path.exists(model_path):
     raise FileNotFoundError(f"The model path '{model_path}' does not exist.")
+  if backend not in ('torch', 'onnx'):
+    raise ValueError(f"Unknown DeBERTa backend '{backend}'; expected 'torch' or 'onnx'.")
 
-  print(f'Loading DeBERTa model from {model_path}...', end=' ')
+  precision = 'int8' if quantize else 'fp32'
+  print(f'Loading DeBERTa model from {model_path} ({backend} backend, {precision})...', end=' ')
   tokenizer = AutoTokenizer.from_pretrained(model_path)
-  model = AutoModelForSequenceClassification.from_pretrained(model_path).float().eval()
+  if backend == 'onnx':
+    model = OnnxSequenceClassifier(
+      onnx_model_file(model_path, model_fingerprint(model_path), quantize))
+  elif quantize:
+    model = load_quantized_torch_model(model_path, model_fingerprint(model_path))
+  else:
+    model = AutoModelForSequenceClassification.from_pretrained(model_path).float().eval()
   print('DeBERTa model loaded successfully.')
   return tokenizer, model
 
@@ -232,60 +659,80 @@ def load_deberta_model(model_path: str) -> tuple:
 # ==================================================================================================
 
 
-def download_deberta_model(local_path: str = 'models/deberta') -> None:
+def default_artifact_cache(local_path: str) -> ArtifactCache:
+  """Return the artifact cache shared by models installed next to ``local_path``."""
+  return ArtifactCache(os.path.join(os.path.dirname(os.path.abspath(local_path)), 'artifact-cache'))
+
+
+def download_deberta_model(local_path: str = 'models/deberta',
+                           cache: ArtifactCache | None = None) -> None:
   """
   Download the DeBERTa model from the Kaggle kernel output to local disk.
 
-  Requires the KAGGLE_API_TOKEN environment variable to be set.
+  Requires the KAGGLE_API_TOKEN environment variable to be set. Nothing is
+  downloaded if ``local_path`` already holds a verified install, or if its
+  damaged files can be restored from the artifact cache. Otherwise the kernel
+  output goes into a persistent staging directory (the Kaggle CLI skips files
+  that are already complete there, so a retry resumes), is hashed into the
+  cache, and is installed atomically.
 
   Args:
     local_path: Local directory that will receive the model files.
+    cache: Artifact cache to use; defaults to ``artifact-cache`` next to ``local_path``.
   """
-  print('Downloading DeBERTa model from Kaggle...')
-
-  with tempfile.TemporaryDirectory() as tmp:
-    kaggle_cmd = shutil.which('kaggle') or 'kaggle'
-    subprocess.run(
-      [kaggle_cmd, 'kernels', 'output',
-       'cccalc/deberta-v3-small-refined', '-p', tmp],
-      check=True,
-      env=os.environ.copy(),
-    )
-    model_src = os.path.join(tmp, 'model')
-    os.makedirs(local_path, exist_ok=True)
-    for fname in os.listdir(model_src):
-      shutil.copy2(os.path.join(model_src, fname), local_path)
+  cache = cache or default_artifact_cache(local_path)
+  if read_manifest(local_path) is not None and not cache.repair(local_path):
+    print(f'DeBERTa model in {local_path} is already present and verified.')
+    return
 
-  print('DeBERTa model downloaded successfully.')
+  print('Downloading DeBERTa model from Kaggle...')
+  staging = cache.staging_dir('kaggle-deberta')
+  kaggle_cmd = shutil.which('kaggle') or 'kaggle'
+  subprocess.run(
+    [kaggle_cmd, 'kernels', 'output',
+     'cccalc/deberta-v3-small-refined', '-p', staging],
+    check=True,
+    env=os.environ.copy(),
+  )
+  model_src = os.path.join(staging, 'model')
+  manifest = build_manifest(model_src)
+  for name, entry in manifest['files'].items():
+    cache.add(os.path.join(model_src, name), entry['sha256'])
+  cache.install(manifest, local_path)
+  cache.discard_staging('kaggle-deberta')
+
+  print(f'DeBERTa model downloaded successfully ({len(manifest["files"])} files).')
 
 
 # ==================================================================================================
 
 
-def download_svm_models(supabase: spb.Client, local_dir: str = 'svm-models') -> None:
+def download_svm_models(supabase: spb.Client, local_dir: str = 'svm-models',
+                        cache: ArtifactCache | None = None) -> SyncStats:
   """
-  Download all serialized SVM model files from Supabase Storage.
+  Sync the SVM models from Supabase Storage into ``local_dir``.
+
+  Only objects whose size, ETag or ``updated_at`` changed since the last sync
+  are downloaded, concurrently; everything else is reinstalled from the
+  artifact cache, and local files the bucket no longer has are removed. When
+  the bucket holds an SVM bundle only the bundle and its manifest are synced.
+  See ``svm_sync.sync_svm_models``.
 
   Args:
     supabase: Authenticated Supabase client.
-  """
+    local_dir: Local directory that will receive the models.
+    cache: Artifact cache to use; defaults to ``artifact-cache`` next to ``local_dir``.
 
-  if not os.path.exists(local_dir):
-    os.makedirs(local_dir)
+  Returns:
+    What the sync transferred, reused, and removed.
 
-  print('Downloading SVM models from Supabase...')
-  bucket_name = 'svm-models'
-  bucket = supabase.storage.from_(bucket_name)
-  models = bucket.list()
-  for model in models:
-    model_name = model['name']
-    print(f'  Downloading {model_name}...', end=' ')
-    file_path = os.path.join(local_dir, model_name)
-    with open(file_path, 'wb') as f:
-      response = bucket.download(model_name)
-      f.write(response)
-    print('done.')
-  print('All SVM models downloaded successfully.')
+  Raises:
+    ValueError: If the downloaded bundle does not match the hash in its manifest.
+  """
+  print('Syncing SVM models from Supabase...')
+  stats = sync_svm_models(supabase, local_dir, cache or default_artifact_cache(local_dir))
+  print(f'SVM models synced: {stats}.')
+  return stats
 
 
 # ==================================================================================================
@@ -311,3 +758,63 @@ def load_svm_models(local_dir: str = 'svm-models') -> dict[str, svm.SVC]:
 
   print('All SVM models loaded successfully.')
   return svm_models
+
+
+def compile_svm_models(models: dict[str, svm.SVC]) -> LinearSvmEngine | dict[str, svm.SVC]:
+  """
+  Stack loaded linear SVMs into a ``LinearSvmEngine`` for vectorized scoring.
+
+  Returns:
+    The compiled engine, or ``models`` unchanged if any of them cannot be compiled
+    (for example a non-linear kernel), in which case inference falls back to
+    per-model ``predict`` calls.
+  """
+  try:
+    engine = LinearSvmEngine.from_models(models)
+  except ValueError as e:
+    print(f'Could not compile SVM models, using per-model predict: {e}')
+    return models
+  print(f'Compiled {len(engine)} SVM models into a vectorized engine.')
+  return engine
+
+
+def load_svm_scorer(local_dir: str = 'svm-models') -> LinearSvmEngine | dict[str, svm.SVC]:
+  """
+  Load the SVM models for inference, preferring the single-file bundle.
+
+  Falls back to unpickling the per-key-function ``.pkl`` files (compiled into an
+  engine where possible) when there is no bundle or it cannot be read.
+
+  Returns:
+    A ``LinearSvmEngine``, or a mapping of model names to SVM classifiers.
+
+  Raises:
+    FileNotFoundError: If neither a bundle nor any ``.pkl`` model could be loaded.
+  """
+  if read_bundle_manifest(local_dir) is not None:
+    _t0 = time.time()
+    try:
+      engine = LinearSvmEngine.from_bundle(local_dir)
+    except (OSError, KeyError, ValueError) as e:
+      print(f'Could not load SVM bundle from {local_dir}, falling back to pickles: {e}')
+    else:
+      print(f'[TIMING] SVM bundle load: {time.time() - _t0:.3f}s '
+            f'({len(engine)} models, {engine.version[:12]})')
+      return engine
+  models = load_svm_models(local_dir)
+  if not models:
+    raise FileNotFoundError(f'No loadable SVM bundle or .pkl models in {local_dir}')
+  return compile_svm_models(models)
+
+
+def svm_model_version(local_dir: str = 'svm-models') -> str:
+  """
+  Return a version string for the SVM models in ``local_dir``.
+
+  This is the bundle's SHA-256 from its manifest when there is a bundle, and
+  otherwise the content fingerprint of the directory's pickles.
+  """
+  manifest = read_bundle_manifest(local_dir)
+  if manifest is not None:
+    return manifest['sha256'][:16]
+  return model_fingerprint(local_dir)
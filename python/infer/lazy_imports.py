@@ -0,0 +1,70 @@
+"""Heavy dependencies, imported on first use rather than with the modules that name them.
+
+PyTorch, transformers, google-genai, scikit-learn, ONNX Runtime and the Supabase
+client each take a noticeable part of startup to import. The modules here are
+``LazyImport`` stand-ins shared by ``inference``, ``onnx_backend`` and
+``report_summary``, so callers that only need one backend (or only the SVMs) do
+not pay for the others, and patching one of them in a test patches it everywhere.
+"""
+
+import importlib
+import importlib.util
+import threading
+import time
+
+
+class LazyImport:
+  """Stand-in for a module, or an attribute of one, that is imported on first attribute access."""
+
+  def __init__(self, module: str, attr: str | None = None, after: tuple[str, ...] = ()):
+    self._module = module
+    self._attr = attr
+    self._after = after
+    self._target = None
+    self._lock = threading.Lock()
+
+  def _load(self):
+    if self._target is None:
+      with self._lock:
+        if self._target is None:
+          _t0 = time.time()
+          for module in self._after:
+            try:
+              importlib.import_module(module)
+            except ImportError:
+              pass
+          target = importlib.import_module(self._module)
+          self._target = getattr(target, self._attr) if self._attr else target
+          print(f'[TIMING] import {self._module}{"." + self._attr if self._attr else ""}: '
+                f'{time.time() - _t0:.3f}s', flush=True)
+    return self._target
+
+  def __getattr__(self, name: str):
+    if name.startswith('_'):
+      # Introspection (mock.patch, inspect, asyncio) probes private names; do not import for
+      # those.
+      raise AttributeError(name)
+    return getattr(self._load(), name)
+
+  def __call__(self, *args, **kwargs):
+    return self._load()(*args, **kwargs)
+
+
+torch = LazyImport('torch')
+# transformers goes in after torch, as with eager imports: pickling in torch.save scans sys.modules
+# in insertion order, and reaching transformers' lazy module first pulls in unrelated optional
+# submodules.
+AutoConfig = LazyImport('transformers', 'AutoConfig', after=('torch',))
+AutoTokenizer = LazyImport('transformers', 'AutoTokenizer', after=('torch',))
+AutoModelForSequenceClassification = LazyImport(
+  'transformers', 'AutoModelForSequenceClassification', after=('torch',))
+# Only annotations name the Supabase client, so the inference workers never import it.
+spb = LazyImport('supabase')
+genai = LazyImport('google.genai')
+genai_types = LazyImport('google.genai.types')
+svm = LazyImport('sklearn.svm')
+
+ONNXRUNTIME_AVAILABLE = importlib.util.find_spec('onnxruntime') is not None
+ort = LazyImport('onnxruntime')
+QuantType = LazyImport('onnxruntime.quantization', 'QuantType')
+ort_quantize_dynamic = LazyImport('onnxruntime.quantization', 'quantize_dynamic')
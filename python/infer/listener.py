@@ -3,6 +3,8 @@
 This service subscribes to inserts on ``form_responses`` and
 ``student_reports``. New form responses are scored with the DeBERTa and SVM
 models, and new student reports are enriched with Gemini-generated feedback.
+Realtime callbacks only enqueue events; scoring and report generation run on
+separate bounded worker pools off the event loop.
 
 Required environment variables:
   - ``SUPABASE_URL``
@@ -11,15 +13,22 @@ Required environment variables:
 """
 
 import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import hashlib
 import json
 import logging
 import os
 from pathlib import Path
+import threading
 import time
+from typing import Callable
 
-from dotenv import load_dotenv
-from google import genai
-import supabase as spb
+_STARTUP_T0 = time.time()
+
+from dotenv import load_dotenv  # pylint: disable=wrong-import-position
+import supabase as spb  # pylint: disable=wrong-import-position
 
 load_dotenv()
 
@@ -29,28 +38,70 @@ try:
 except ImportError:
   _LOGTAIL_AVAILABLE = False
 
-from inference import (deberta_infer, download_deberta_model, download_svm_models,
-                       generate_report_summary, load_deberta_model,
-                       load_svm_models, svm_infer)
-
-GENERATING_PLACEHOLDER = 'Generating...'
+from inference import deberta_infer, deberta_infer_many, svm_infer, svm_infer_many
+from async_db import DB_CALL_TIMEOUT_S, AsyncDatabase
+from catch_up import GENERATING_PLACEHOLDER, catch_up
+from event_journal import EventJournal
+from model_reload import (MODEL_HOT_RELOAD, SVM_SYNC_INTERVAL_S, LiveModels, ModelSet,
+                          load_startup_models, model_lock, sync_svm_periodically,
+                          watch_model_updates)
+from report_data import observe_report_update, wait_for_report_data
+from report_summary import generate_report_summary, report_error_message
+from response_scoring import (TWO_PHASE_SCORING, flatten_response, get_env, result_row,
+                              weighted_average)
+from result_writer import ResultWriter
+from scheduler import Debouncer, Lane, MicroBatcher, WorkQueue
+from startup import (DEBERTA_MODEL_PATH, StartupTimeline, create_gemini_client,
+                     start_model_loading)
+from worker_pool import INFERENCE_WORKERS
 
-DEBERTA_MODEL_PATH = Path(os.environ.get('DEBERTA_MODEL_PATH', Path(__file__).resolve().parent / 'models' / 'deberta'))
-SVM_MODELS_PATH = Path(os.environ.get('SVM_MODELS_PATH', Path(__file__).resolve().parent / 'svm-models'))
 LOGS_PATH = Path(os.environ.get('INFER_LOGS_PATH', Path(__file__).resolve().parent / 'logs'))
+SCORED_HASH_CACHE_SIZE = int(os.environ.get('SCORED_HASH_CACHE_SIZE', '10000'))
+# Form response events arriving within this window are scored together; SCORING_MAX_BATCH caps the
+# group.
+SCORING_BATCH_WINDOW_MS = int(os.environ.get('SCORING_BATCH_WINDOW_MS', '50'))
+SCORING_MAX_BATCH = int(os.environ.get('SCORING_MAX_BATCH', '32'))
+# UPDATEs to one form response (or report) are held until none has arrived for UPDATE_DEBOUNCE_MS,
+# then handled once with the latest payload; 0 disables this. A response that keeps changing is
+# handled every UPDATE_DEBOUNCE_MAX_MS.
+UPDATE_DEBOUNCE_MS = int(os.environ.get('UPDATE_DEBOUNCE_MS', '1000'))
+UPDATE_DEBOUNCE_MAX_MS = int(os.environ.get('UPDATE_DEBOUNCE_MAX_MS', '10000'))
+# Bounds on queued work; events past these limits are shed and logged rather than queued.
+SCORING_QUEUE_SIZE = int(os.environ.get('SCORING_QUEUE_SIZE', '1000'))
+SCORING_WORKERS = int(os.environ.get('SCORING_WORKERS', '2'))
+# In two-phase mode, once this many events wait for scoring the DeBERTa pass moves to the background
+# refine lane.
+DEBERTA_DEFER_DEPTH = int(os.environ.get('DEBERTA_DEFER_DEPTH', str(SCORING_MAX_BATCH)))
+REFINE_QUEUE_SIZE = int(os.environ.get('REFINE_QUEUE_SIZE', '1000'))
+# Scoring workers that deferred DeBERTa passes may occupy at once.
+REFINE_WORKERS = int(os.environ.get('REFINE_WORKERS', '1'))
+# Queue wait past which form response scoring counts as overloaded: queued updates to one response
+# are coalesced, and in two-phase mode DeBERTa is deferred.
+SCORING_LATENCY_BUDGET_S = float(os.environ.get('SCORING_LATENCY_BUDGET_S', '2'))
+# Set RESULT_WRITE_BEHIND=0 to write each form_results row as it is scored instead of buffering them
+# for bulk upserts.
+RESULT_WRITE_BEHIND = os.environ.get('RESULT_WRITE_BEHIND', '1').lower() not in ('0', 'false', '')
+# Buffered rows are spilled here until written; set RESULT_SPILL_PATH to an empty string to keep
+# them in memory only.
+RESULT_SPILL_PATH = os.environ.get('RESULT_SPILL_PATH',
+                                   str(DEBERTA_MODEL_PATH.parent / 'form-results-spill.jsonl'))
+# Accepted realtime events are journaled here until handled; set EVENT_JOURNAL_PATH to an empty
+# string to disable it.
+EVENT_JOURNAL_PATH = os.environ.get('EVENT_JOURNAL_PATH',
+                                    str(DEBERTA_MODEL_PATH.parent / 'event-journal.sqlite3'))
+# Set CATCH_UP=0 to skip the startup and reconnect scans for responses without results and reports
+# left generating.
+CATCH_UP = os.environ.get('CATCH_UP', '1').lower() not in ('0', 'false', '')
+REPORT_QUEUE_SIZE = int(os.environ.get('REPORT_QUEUE_SIZE', '100'))
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', '2'))
+# Report workers that regenerations may occupy at once, so new reports always find a free one.
+REPORT_REGENERATE_WORKERS = int(os.environ.get('REPORT_REGENERATE_WORKERS', '1'))
+QUEUE_STATS_INTERVAL_S = float(os.environ.get('QUEUE_STATS_INTERVAL_S', '60'))
 
 # ── Logging setup ──────────────────────────────────────────────────────────────
 LOGS_PATH.mkdir(parents=True, exist_ok=True)
 
 
-def get_env(*names: str) -> str:
-  """Return the first non-empty environment variable from the provided aliases."""
-  for name in names:
-    value = os.environ.get(name, '')
-    if value:
-      return value
-  return ''
-
 def make_logger(name: str, filename: str) -> logging.Logger:
   """Create a logger that writes to a file, stdout, and Better Stack (if configured)."""
   logger = logging.getLogger(name)
@@ -82,148 +133,464 @@ infer_log = make_logger('inference', 'inference.log')  # every inference run & s
 error_log = make_logger('error', 'error.log')     # errors and crashes only
 error_log.setLevel(logging.ERROR)
 
-# ── Model wait ─────────────────────────────────────────────────────────────────
+# ── Scored-response tracking ───────────────────────────────────────────────────
+
+# response_id -> hash of the last payload whose results were written, most recent last.
+_last_scored: OrderedDict[str, str] = OrderedDict()
+_last_scored_lock = threading.Lock()
+
+
+def response_hash(response: dict, model_version: str = '') -> str:
+  """Hash a form response payload together with the model version that would score it."""
+  blob = json.dumps(response, sort_keys=True, separators=(',', ':'))
+  return hashlib.sha256(f'{model_version}\0{blob}'.encode()).hexdigest()
+
+
+def remember_scored(response_id: str, digest: str) -> None:
+  """Record the payload hash written for a response, keeping at most SCORED_HASH_CACHE_SIZE."""
+  with _last_scored_lock:
+    _last_scored[response_id] = digest
+    _last_scored.move_to_end(response_id)
+    while len(_last_scored) > SCORED_HASH_CACHE_SIZE:
+      _last_scored.popitem(last=False)
+
+
+# ── Event journal ──────────────────────────────────────────────────────────────
+
+def open_event_journal() -> EventJournal | None:
+  """Open the event journal and prune old handled events; None if disabled or unavailable."""
+  if not EVENT_JOURNAL_PATH:
+    return None
+  try:
+    journal = EventJournal(EVENT_JOURNAL_PATH)
+    pruned = journal.prune()
+  except Exception as e:
+    error_log.error(f'Could not open event journal at {EVENT_JOURNAL_PATH}, '
+                    f'continuing without it: {e}')
+    return None
+  app_log.info(f'Event journal opened at {EVENT_JOURNAL_PATH} '
+               f'({len(journal)} pending, {pruned} old entries pruned).')
+  return journal
+
+
+def event_digest(payload) -> str:
+  """Hash a realtime payload's row, so a journal entry only completes on the payload it recorded."""
+  return response_hash(payload.get('data', {}).get('record') or {})
+
+
+def journal_event(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    journal: EventJournal | None, source: str, kind: str, key, payload,
+    digest: str | None = None) -> None:
+  """Record an accepted realtime event in ``journal``, if there is one. Never raises."""
+  if journal is None or key is None:
+    return
+  try:
+    journal.record(source, kind, key, payload, digest)
+  except Exception as e:
+    error_log.error(f'[{key}] Could not journal {source} {kind}: {e}')
+
+
+def journal_done(journal: EventJournal | None, source: str, key,
+                 digest: str | None = None) -> None:
+  """Mark a journaled event handled in ``journal``, if there is one. Never raises."""
+  if journal is None:
+    return
+  try:
+    journal.complete(source, key, digest)
+  except Exception as e:
+    error_log.error(f'[{key}] Could not mark {source} event handled in the journal: {e}')
+
+
+# ── Scoring helpers ────────────────────────────────────────────────────────────
+
+def write_result(supabase, response_id: str, row: dict, insert: bool) -> None:
+  """Insert a new response's form_results row, or upsert an edited one's."""
+  _t_db = time.time()
+  table = supabase.table('form_results')
+  if insert:
+    table.insert(row).execute()
+  else:
+    # UPSERT so the existing form_results row is replaced, not duplicated
+    table.upsert(row, on_conflict='response_id').execute()
+  infer_log.info(f'[{response_id}] Results written to form_results'
+                 f'{" (provisional)" if row.get("provisional") else ""}. '
+                 f'DB write: {time.time()-_t_db:.3f}s')
+
+
+def write_results(supabase, rows: list[tuple[dict, bool]],
+                  writer: ResultWriter | None = None) -> list[str]:
+  """
+  Write ``(row, insert)`` pairs to form_results, through the write-behind ``writer`` if any.
+
+  Buffered rows are upserted in bulk by the writer's flusher thread. Without a
+  writer, or if it cannot take the rows, each row is written on its own.
 
-def wait_for_models(timeout_minutes: int = 60) -> None:
+  Returns:
+    The response_ids whose rows were written or buffered.
   """
-  Waits until model files are present on disk.
-  This allows time to manually copy models into a Railway volume after deploy.
-  Checks every 30 seconds, times out after timeout_minutes.
+  if writer is not None:
+    try:
+      writer.add([row for row, _ in rows])
+      infer_log.info(f'{len(rows)} form_results rows buffered for the next bulk upsert.')
+      return [row['response_id'] for row, _ in rows]
+    except Exception as e:
+      error_log.exception(f'Could not buffer {len(rows)} form_results rows, '
+                          f'writing them directly: {e}')
+  written = []
+  for row, insert in rows:
+    try:
+      write_result(supabase, row['response_id'], row, insert)
+      written.append(row['response_id'])
+    except Exception as e:
+      error_log.exception(f'[{row["response_id"]}] Error writing results: {e}')
+  return written
+
+
+# response_id -> payload hash of the latest provisional row still awaiting DeBERTa refinement.
+_provisional: dict[str, str] = {}
+_provisional_lock = threading.Lock()
+
+
+# ── Event dispatch ─────────────────────────────────────────────────────────────
+
+def payload_response_id(payload) -> str | None:
+  """Return the response_id of a form_responses payload."""
+  return payload.get('data', {}).get('record', {}).get('response_id')
+
+
+def event_response_id(event: tuple) -> str | None:
+  """Return the response_id of a ``(kind, payload)`` form response event."""
+  return payload_response_id(event[1])
+
+
+def payload_report_id(payload):
+  """Return the id of a student_reports payload."""
+  return payload.get('data', {}).get('record', {}).get('id')
+
+
+def merge_report_updates(old, new):
   """
-  deadline = time.time() + timeout_minutes * 60
-  deberta_ready = False
-  svm_ready = False
-
-  app_log.info(f'Waiting for model files (timeout: {timeout_minutes} min)...')
-
-  while time.time() < deadline:
-    deberta_ready = (
-      DEBERTA_MODEL_PATH.exists() and
-      (DEBERTA_MODEL_PATH / 'model.safetensors').exists()
-    )
-    svm_ready = (
-      SVM_MODELS_PATH.exists() and
-      any(f.endswith('.pkl') for f in os.listdir(SVM_MODELS_PATH))
-    ) if SVM_MODELS_PATH.exists() else False
-
-    if deberta_ready and svm_ready:
-      app_log.info('Model files found!')
-      return
+  Combine two student_reports UPDATE payloads into one spanning both.
 
-    status = []
-    if not deberta_ready:
-      status.append('DeBERTa model missing')
-    if not svm_ready:
-      status.append('SVM models missing')
-    app_log.warning(f'Still waiting: {", ".join(status)} — retrying in 30s...')
-    time.sleep(30)
+  The newer record is kept with the older ``old_record``, so a reset to
+  GENERATING_PLACEHOLDER followed by another edit still reads as a reset.
+  """
+  old_record = old.get('data', {}).get('old_record', {})
+  return {**new, 'data': {**new.get('data', {}), 'old_record': old_record}}
 
-  msg = (
-    f'Model files not found after {timeout_minutes} minutes. '
-    f'Please copy models into the volume at {DEBERTA_MODEL_PATH} and {SVM_MODELS_PATH}.'
-  )
-  error_log.error(msg)
-  raise TimeoutError(msg)
 
+def submit_response_event(batcher: MicroBatcher, kind: str, payload) -> None:
+  """Queue a form_responses event for batched scoring, logging it if the full queue sheds it."""
+  # New submissions are scored ahead of edits to responses that already have results.
+  if not batcher.submit((kind, payload), lane='new' if kind == 'insert' else 'update'):
+    response_id = payload_response_id(payload)
+    error_log.error(f'[{response_id}] Scoring queue full ({batcher.pending()} waiting) — '
+                    f'form response {kind} shed.')
 
-# ── Main ───────────────────────────────────────────────────────────────────────
 
-async def main() -> None:
-  """Initialize clients, load models, subscribe to realtime events, and run forever."""
-  app_log.info('Starting inference engine...')
+def submit_report_event(reports: WorkQueue, handler, payload, *args) -> None:
+  """Queue ``handler(payload, *args)`` on a report worker, logging it if the full queue sheds it."""
+  lane = 'regenerate' if handler is handle_updated_report else 'new'
+  if not reports.submit(handler, payload, *args, lane=lane):
+    report_id = payload_report_id(payload)
+    error_log.error(f'[{report_id}] Report queue full ({reports.depth()} waiting) — '
+                    f'{handler.__name__} shed.')
+
+
+def submit_refinement(scoring: WorkQueue, fn, *args) -> None:
+  """Queue a deferred DeBERTa refinement in the scoring queue's refine lane, logging it if shed."""
+  if not scoring.submit(fn, *args, lane='refine'):
+    error_log.error(f'Refine lane full ({scoring.depth("refine")} waiting) — '
+                    f'{len(args[0])} responses keep provisional results.')
+
+
+async def log_queue_depths(batcher: MicroBatcher,
+                           *queues: (WorkQueue | Debouncer | AsyncDatabase | ResultWriter
+                                     | EventJournal),
+                           interval_s: float = QUEUE_STATS_INTERVAL_S,
+                           live: LiveModels | None = None) -> None:
+  """
+  Log queue depths, shed counts, debouncer coalescing, database calls and result writer flushes.
 
-  supabase_url: str = get_env('SUPABASE_URL')
-  if not supabase_url:
-    error_log.error('SUPABASE_URL environment variable is not set')
-    raise ValueError('SUPABASE_URL environment variable is not set')
+  Runs every ``interval_s`` seconds.
+  Inference worker memory is logged as well when there is a pool.
+  """
+  while True:
+    await asyncio.sleep(interval_s)
+    app_log.info(f'[QUEUES] form responses: {batcher} | ' + ' | '.join(str(q) for q in queues))
+    pool = live.current.pool if live is not None and live.current is not None else None
+    if pool is not None:
+      app_log.info(f'[POOL] {pool}')
+
+
+# ── Main ───────────────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class EventQueues:
+  """The queues and debouncers that realtime events wait in, as built by ``build_event_queues``."""
+  scoring: WorkQueue
+  reports: WorkQueue
+  batcher: MicroBatcher
+  response_updates: Debouncer
+  report_updates: Debouncer
+
+
+def required_env(*names: str) -> str:
+  """Return the first of ``names`` set in the environment; log and raise ValueError if none is."""
+  value = get_env(*names)
+  if not value:
+    message = f'{" or ".join(names)} environment variable is not set'
+    error_log.error(message)
+    raise ValueError(message)
+  return value
+
+
+async def first_completed(tasks) -> asyncio.Task:
+  """Wait for the first of ``tasks`` to finish and return it, re-raising if it failed."""
+  done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+  for task in done:
+    task.result()
+  return next(iter(done))
+
+
+def build_event_queues(live: LiveModels, db: AsyncDatabase, gemini,
+                       writer: ResultWriter | None,
+                       journal: EventJournal | None) -> EventQueues:
+  """
+  Build the scoring and report queues, the form response batcher and the UPDATE debouncers.
 
-  supabase_key: str = get_env('SUPABASE_SERVICE_ROLE_KEY', 'SUPABASE_KEY')
-  if not supabase_key:
-    error_log.error('SUPABASE_SERVICE_ROLE_KEY or SUPABASE_KEY environment variable is not set')
-    raise ValueError('SUPABASE_SERVICE_ROLE_KEY or SUPABASE_KEY environment variable is not set')
+  Realtime callbacks only enqueue; scoring and report generation run on their
+  own worker threads, so neither inference nor a slow Gemini retry ever blocks
+  the websocket or each other. Batches are scored with ``live.current``, which
+  is None until both models are loaded; events received before then wait in
+  the batcher's queue. Must be called on the event loop.
+  """
+  # With an inference pool each scoring thread waits on one worker process, so there must be enough
+  # to keep all busy.
+  scoring_workers = max(SCORING_WORKERS, INFERENCE_WORKERS)
+  # Deferred DeBERTa passes wait in a low-priority lane and hold at most REFINE_WORKERS of the
+  # scoring workers.
+  scoring = WorkQueue('scoring', ThreadPoolExecutor(scoring_workers, thread_name_prefix='scoring'),
+                      workers=scoring_workers,
+                      lanes=[Lane('score', scoring_workers),
+                             Lane('refine', REFINE_QUEUE_SIZE, limit=REFINE_WORKERS),
+                             Lane('backfill', scoring_workers)])
+  reports = WorkQueue('reports', ThreadPoolExecutor(REPORT_WORKERS, thread_name_prefix='reports'),
+                      workers=REPORT_WORKERS,
+                      lanes=[Lane('new', REPORT_QUEUE_SIZE),
+                             Lane('regenerate', REPORT_QUEUE_SIZE,
+                                  limit=REPORT_REGENERATE_WORKERS)])
+  loop = asyncio.get_running_loop()
+
+  def defer_refinement(fn, *args):
+    # Called from a scoring thread; the refine lane's queue belongs to the event loop.
+    infer_log.info(f'Scoring is behind; deferring DeBERTa for {len(args[0])} form responses.')
+    loop.call_soon_threadsafe(submit_refinement, scoring, fn, *args)
+
+  def dispatch_batch(events):
+    # Read the live model set once, so a hot reload never mixes two sets within a batch.
+    models = live.current
+    refine = None
+    if TWO_PHASE_SCORING:
+      overloaded = batcher.pending() >= DEBERTA_DEFER_DEPTH or batcher.overloaded()
+      refine = defer_refinement if overloaded else refine_now
+    # Waiting on scoring.put applies backpressure: batches keep growing in the bounded batcher queue
+    # while every scoring worker is busy, and only events beyond SCORING_QUEUE_SIZE are shed.
+    return scoring.put(handle_response_batch, events, models, db, writer, refine, journal)
+
+  batcher = MicroBatcher(dispatch_batch, window_s=SCORING_BATCH_WINDOW_MS / 1000,
+                         max_batch=SCORING_MAX_BATCH,
+                         lanes=[Lane('new', SCORING_QUEUE_SIZE,
+                                     latency_budget_s=SCORING_LATENCY_BUDGET_S),
+                                Lane('update', SCORING_QUEUE_SIZE,
+                                     latency_budget_s=SCORING_LATENCY_BUDGET_S,
+                                     key=event_response_id)])
+  # Autosaves and quick successive edits fire a burst of UPDATEs; each burst is handled once.
+  response_updates = Debouncer(lambda payload: submit_response_event(batcher, 'update', payload),
+                               key=payload_response_id, quiet_s=UPDATE_DEBOUNCE_MS / 1000,
+                               max_delay_s=UPDATE_DEBOUNCE_MAX_MS / 1000, name='response updates')
+  report_updates = Debouncer(lambda payload: submit_report_event(reports, handle_updated_report,
+                                                                 payload, gemini, db, journal),
+                             key=payload_report_id, quiet_s=UPDATE_DEBOUNCE_MS / 1000,
+                             max_delay_s=UPDATE_DEBOUNCE_MAX_MS / 1000, merge=merge_report_updates,
+                             name='report updates')
+  return EventQueues(scoring, reports, batcher, response_updates, report_updates)
+
+
+def realtime_subscriptions(queues: EventQueues, gemini, db: AsyncDatabase,
+                           journal: EventJournal | None) -> list[tuple[str, str, str, Callable]]:
+  """Return the ``(channel, event, table, callback)`` realtime subscriptions, journaling events."""
+
+  def on_response_insert(payload):
+    journal_event(journal, 'form_responses', 'insert', payload_response_id(payload), payload,
+                  event_digest(payload))
+    submit_response_event(queues.batcher, 'insert', payload)
+
+  def on_response_update(payload):
+    journal_event(journal, 'form_responses', 'update', payload_response_id(payload), payload,
+                  event_digest(payload))
+    queues.response_updates.submit(payload)
+
+  def on_report_insert(payload):
+    journal_event(journal, 'student_reports', 'insert', payload_report_id(payload), payload)
+    submit_report_event(queues.reports, handle_new_report, payload, gemini, db, journal)
+
+  def on_report_update(payload):
+    # Report workers waiting for kf_avg_data get it at once; only regenerations are debounced.
+    observe_report_update(payload)
+    if is_regeneration(payload):
+      journal_event(journal, 'student_reports', 'update', payload_report_id(payload), payload)
+    queues.report_updates.submit(payload)
+
+  return [('form_responses_insert', 'INSERT', 'form_responses', on_response_insert),
+          ('form_responses_update', 'UPDATE', 'form_responses', on_response_update),
+          ('student_reports_insert', 'INSERT', 'student_reports', on_report_insert),
+          ('student_reports_update', 'UPDATE', 'student_reports', on_report_update)]
+
+
+def subscription_state_callback(channel: str,
+                                on_rejoin: Callable[[], None] | None = None) -> Callable:
+  """Return a subscribe callback that logs failed joins and calls ``on_rejoin`` on every rejoin."""
+  joins = 0
+
+  def callback(state, error=None):
+    nonlocal joins
+    state = getattr(state, 'value', state)
+    if state != 'SUBSCRIBED':
+      error_log.error(f'Realtime channel {channel}: {state}{f" ({error})" if error else ""}')
+      return
+    joins += 1
+    # A second join means the socket reconnected, and events sent while it was down were never
+    # delivered.
+    if joins > 1 and on_rejoin is not None:
+      on_rejoin()
+  return callback
+
+
+async def subscribe_channels(asupabase, subscriptions: list[tuple[str, str, str, Callable]],
+                             on_rejoin: Callable[[], None]) -> None:
+  """Subscribe to each realtime channel in turn; ``on_rejoin`` runs when form_responses rejoins."""
+  for channel, event, table, callback in subscriptions:
+    app_log.info(f'Subscribing to "{channel}" channel...')
+    rejoined = on_rejoin if channel == 'form_responses_insert' else None
+    await (asupabase.realtime
+           .channel(channel)
+           .on_postgres_changes(event, schema='public', table=table, callback=callback)
+           .subscribe(subscription_state_callback(channel, rejoined)))
+    app_log.info(f'Subscribed to {channel}.')
+
+
+def start_model_updates(live: LiveModels, supabase) -> list[asyncio.Task]:
+  """With MODEL_HOT_RELOAD on, watch the model files and re-sync the SVMs periodically."""
+  if not MODEL_HOT_RELOAD:
+    return []
+  # A plain daemon thread, not asyncio.to_thread: it blocks forever and must not hold up
+  # interpreter exit.
+  threading.Thread(target=watch_model_updates, args=(live,), name='model-reload',
+                   daemon=True).start()
+  if SVM_SYNC_INTERVAL_S > 0:
+    return [asyncio.create_task(sync_svm_periodically(supabase))]
+  return []
 
-  gemini_key: str = get_env('GOOGLE_GENAI_API_KEY', 'GEMINI_API_KEY')
-  if not gemini_key:
-    error_log.error('GOOGLE_GENAI_API_KEY or GEMINI_API_KEY environment variable is not set')
-    raise ValueError('GOOGLE_GENAI_API_KEY or GEMINI_API_KEY environment variable is not set')
 
+async def main() -> None:
+  """Initialize clients, load models, subscribe to realtime events, and run forever."""
+  app_log.info('Starting inference engine...')
+  started_at = time.time()
+  supabase_url = required_env('SUPABASE_URL')
+  supabase_key = required_env('SUPABASE_SERVICE_ROLE_KEY', 'SUPABASE_KEY')
+  gemini_key = required_env('GOOGLE_GENAI_API_KEY', 'GEMINI_API_KEY')
   app_log.info('Environment variables loaded.')
+  timeline = StartupTimeline(_STARTUP_T0)
+  timeline.mark('imports and environment')
 
-  gemini = genai.Client(api_key=gemini_key)
+  # The sync client only serves Storage downloads, which run on their own threads. Every table read
+  # and write goes through one async client, so they share its connection pool and never block the
+  # event loop.
   supabase: spb.Client = spb.create_client(supabase_url, supabase_key)
-  asupabase: spb.AClient = await spb.acreate_client(supabase_url, supabase_key)
-
-  if not (DEBERTA_MODEL_PATH / 'model.safetensors').exists():
-    app_log.info('DeBERTa model not found locally. Downloading from Kaggle...')
-    download_deberta_model(str(DEBERTA_MODEL_PATH))
-
-  if not SVM_MODELS_PATH.exists() or not any(f.endswith('.pkl') for f in os.listdir(SVM_MODELS_PATH)):
-    app_log.info('SVM models not found locally. Downloading from Supabase Storage...')
-    download_svm_models(supabase, str(SVM_MODELS_PATH))
-
-  wait_for_models(timeout_minutes=60)
-
-  app_log.info('Loading SVM models...')
-  svm_models = load_svm_models(str(SVM_MODELS_PATH))
-  app_log.info('All SVM models loaded successfully.')
-
-  app_log.info('Loading DeBERTa model...')
-  deberta_model = load_deberta_model(str(DEBERTA_MODEL_PATH))
-  app_log.info('DeBERTa model loaded successfully.')
-
-  app_log.info('Connecting to Supabase Realtime server...')
-  await asupabase.realtime.connect()
-  app_log.info('Connected to Supabase Realtime.')
-
-  app_log.info('Subscribing to "form_responses_insert" channel...')
-  await (asupabase.realtime
-         .channel('form_responses_insert')
-         .on_postgres_changes('INSERT',
-                              schema='public', table='form_responses',
-                              callback=lambda payload:
-                              handle_new_response(payload, deberta_model, svm_models, supabase))
-         .subscribe())
-  app_log.info('Subscribed to form_responses_insert.')
-
-  app_log.info('Subscribing to "form_responses_update" channel...')
-  await (asupabase.realtime
-         .channel('form_responses_update')
-         .on_postgres_changes('UPDATE',
-                              schema='public', table='form_responses',
-                              callback=lambda payload:
-                              handle_updated_response(payload, deberta_model, svm_models, supabase))
-         .subscribe())
-  app_log.info('Subscribed to form_responses_update.')
-
-  app_log.info('Subscribing to "student_reports_insert" channel...')
-  await (asupabase.realtime
-         .channel('student_reports_insert')
-         .on_postgres_changes('INSERT',
-                              schema='public', table='student_reports',
-                              callback=lambda payload:
-                              handle_new_report(payload, gemini, supabase))
-         .subscribe())
-  app_log.info('Subscribed to student_reports_insert.')
-
-  app_log.info('Subscribing to "student_reports_update" channel...')
-  await (asupabase.realtime
-         .channel('student_reports_update')
-         .on_postgres_changes('UPDATE',
-                              schema='public', table='student_reports',
-                              callback=lambda payload:
-                              handle_updated_report(payload, gemini, supabase))
-         .subscribe())
-  app_log.info('Subscribed to student_reports_update.')
+  asupabase: spb.AClient = await spb.acreate_client(
+    supabase_url, supabase_key,
+    options=spb.AClientOptions(postgrest_client_timeout=DB_CALL_TIMEOUT_S))
+  db = AsyncDatabase(asupabase, asyncio.get_running_loop())
+
+  # DeBERTa and the SVMs load on their own threads while the Gemini client is created and the
+  # realtime socket connects; whichever model finishes first lets the subscriptions go ahead.
+  deberta_task, svm_task = start_model_loading(supabase, timeline)
+  with timeline.phase('Gemini client'):
+    gemini = await asyncio.to_thread(create_gemini_client, gemini_key)
+
+  # Every accepted event is journaled until handled, so unfinished events are replayed on restart.
+  journal = open_event_journal()
+  # Scoring threads buffer their form_results rows here; a flusher thread upserts them in bulk.
+  writer = ResultWriter(db, spill_path=RESULT_SPILL_PATH) if RESULT_WRITE_BEHIND else None
+  # Set once both models are loaded; events received before then wait in the batcher's queue.
+  live = LiveModels()
+  queues = build_event_queues(live, db, gemini, writer, journal)
+  catch_ups: set[asyncio.Task] = set()
+
+  async def score_backlog(events):
+    await queues.scoring.put(handle_response_batch, events, live.current, db, writer, None,
+                             journal, lane='backfill')
+
+  async def regenerate_backlog(payload):
+    await queues.reports.put(handle_new_report, payload, gemini, db, journal, lane='regenerate')
+
+  def catch_up_after_rejoin():
+    if CATCH_UP and live.current and not catch_ups:
+      app_log.info('Realtime rejoined — catching up on events missed while disconnected.')
+      task = asyncio.create_task(catch_up(db, score_backlog, regenerate_backlog, journal))
+      catch_ups.add(task)
+      task.add_done_callback(catch_ups.discard)
+
+  # Keep references so the background tasks are not garbage-collected while main runs.
+  background = [*queues.reports.start(),
+                asyncio.create_task(log_queue_depths(queues.batcher, queues.scoring,
+                                                     queues.reports, queues.response_updates,
+                                                     queues.report_updates, db,
+                                                     *([writer] if writer else []),
+                                                     *([journal] if journal else []),
+                                                     live=live))]
+
+  with timeline.phase('Realtime connect'):
+    app_log.info('Connecting to Supabase Realtime server...')
+    await asupabase.realtime.connect()
+    app_log.info('Connected to Supabase Realtime.')
+
+  first_model = await first_completed({deberta_task, svm_task})
+  timeline.mark(f'first model ready ({first_model.get_name()})')
+  with timeline.phase('Realtime subscribe'):
+    await subscribe_channels(asupabase, realtime_subscriptions(queues, gemini, db, journal),
+                             catch_up_after_rejoin)
+
+  live.swap(await load_startup_models(deberta_task, svm_task, timeline))
+  background += queues.scoring.start()
+  if CATCH_UP:
+    # The backlog is scored in large batches before live events, which wait in the batcher
+    # meanwhile.
+    with timeline.phase('Catch-up'):
+      await catch_up(db, score_backlog, regenerate_backlog, journal, replay_before=started_at)
+      await queues.scoring.join()
+  background.append(asyncio.create_task(queues.batcher.run()))
+  timeline.mark('scoring started')
+  app_log.info(f'Scoring with model version {live.current.version}.')
+  background += start_model_updates(live, supabase)
+  app_log.info(f'Form responses are scored in batches of up to {SCORING_MAX_BATCH} collected over '
+               f'{SCORING_BATCH_WINDOW_MS} ms by {queues.scoring.workers} workers'
+               f'{" in two phases" if TWO_PHASE_SCORING else ""}; '
+               f'reports use {REPORT_WORKERS} workers. '
+               f'{queues.batcher.pending()} form response events were queued during startup.')
+  app_log.info(f'Startup timeline:\n{timeline}')
 
   app_log.info('Listening for events...')
-  while True:
-    await asyncio.sleep(1)
+  await first_completed(background)
 
 
 # ── Event handlers ─────────────────────────────────────────────────────────────
 
-def handle_new_response(payload, deberta_model, svm_models, supabase) -> None:
+def handle_new_response(payload, models: ModelSet, supabase, writer: ResultWriter | None = None,
+                        journal: EventJournal | None = None) -> None:
   """Process a new form response and persist weighted model predictions."""
+  model_version = models.version
   try:
     record = payload['data']['record']
     response_id = record['response_id']
@@ -231,83 +598,323 @@ def handle_new_response(payload, deberta_model, svm_models, supabase) -> None:
 
     response = record['response']['response']
 
-    ds = [kf for kf in response.values()]
-    deberta_inputs = {k: v['text'] for d in ds for k, v in d.items()}
-    svm_inputs = {k: [vv for kk, vv in v.items() if kk != 'text'] for d in ds for k, v in d.items()}
+    deberta_inputs, svm_inputs = flatten_response(response)
 
     _t_pipeline = time.time()
 
     infer_log.info(f'[{response_id}] Running DeBERTa inference...')
     _t_deberta = time.time()
-    deberta_res = deberta_infer(deberta_model, deberta_inputs)
-    infer_log.info(f'[{response_id}] DeBERTa results: {deberta_res} [{time.time()-_t_deberta:.3f}s]')
+    with model_lock:
+      deberta_res = deberta_infer(models.deberta, deberta_inputs, cache=models.logit_cache)
+    infer_log.info(f'[{response_id}] DeBERTa results: {deberta_res} '
+                   f'[{time.time()-_t_deberta:.3f}s]')
 
     infer_log.info(f'[{response_id}] Running SVM inference...')
     _t_svm = time.time()
-    svms_res = svm_infer(svm_models, svm_inputs)
+    with model_lock:
+      svms_res = svm_infer(models.svm, svm_inputs)
     infer_log.info(f'[{response_id}] SVM results: {svms_res} [{time.time()-_t_svm:.3f}s]')
 
-    def weighted_average(deberta: float, svm: float) -> float:
-      """Combine DeBERTa and SVM outputs using the project weighting rule."""
-      return deberta * 0.25 + svm * 0.75
-
     res = {k: weighted_average(deberta=v, svm=svms_res[k]) for k, v in deberta_res.items()}
     infer_log.info(f'[{response_id}] Final weighted results: {res}')
 
-    _t_db = time.time()
-    (supabase.table('form_results')
-     .insert({'response_id': response_id, 'results': res})
-     .execute())
-    infer_log.info(f'[{response_id}] Results written to form_results. DB write: {time.time()-_t_db:.3f}s | Total pipeline: {time.time()-_t_pipeline:.3f}s')
+    if writer is not None:
+      writer.add([result_row(response_id, res, model_version)])
+      infer_log.info(f'[{response_id}] Results buffered for form_results. '
+                     f'Total pipeline: {time.time()-_t_pipeline:.3f}s')
+    else:
+      _t_db = time.time()
+      (supabase.table('form_results')
+       .insert(result_row(response_id, res, model_version))
+       .execute())
+      infer_log.info(f'[{response_id}] Results written to form_results. '
+                     f'DB write: {time.time()-_t_db:.3f}s '
+                     f'| Total pipeline: {time.time()-_t_pipeline:.3f}s')
+    remember_scored(response_id, response_hash(response, model_version))
+    journal_done(journal, 'form_responses', response_id, event_digest(payload))
 
   except Exception as e:
     error_log.exception(f'Error in handle_new_response: {e}')
 
 
-def handle_updated_response(payload, deberta_model, svm_models, supabase) -> None:
-  """Re-score an edited form response and upsert the result into form_results."""
+def handle_updated_response(payload, models: ModelSet, supabase,
+                            writer: ResultWriter | None = None,
+                            journal: EventJournal | None = None) -> None:
+  """
+  Re-score an edited form response and upsert the result into form_results.
+
+  Saves that leave the response payload unchanged since it was last scored skip
+  inference and the database write entirely.
+  """
+  model_version = models.version
   try:
     record = payload['data']['record']
     response_id = record['response_id']
     infer_log.info(f'Form response updated: {response_id}')
 
     response = record['response']['response']
+    digest = response_hash(response, model_version)
+    if _last_scored.get(response_id) == digest:
+      infer_log.info(f'[{response_id}] Response unchanged since last scoring '
+                     '— skipping inference and write.')
+      journal_done(journal, 'form_responses', response_id, event_digest(payload))
+      return
 
-    ds = [kf for kf in response.values()]
-    deberta_inputs = {k: v['text'] for d in ds for k, v in d.items()}
-    svm_inputs = {k: [vv for kk, vv in v.items() if kk != 'text'] for d in ds for k, v in d.items()}
+    deberta_inputs, svm_inputs = flatten_response(response)
 
     _t_pipeline = time.time()
 
     infer_log.info(f'[{response_id}] Running DeBERTa inference (update)...')
     _t_deberta = time.time()
-    deberta_res = deberta_infer(deberta_model, deberta_inputs)
-    infer_log.info(f'[{response_id}] DeBERTa results: {deberta_res} [{time.time()-_t_deberta:.3f}s]')
+    with model_lock:
+      deberta_res = deberta_infer(models.deberta, deberta_inputs, cache=models.logit_cache)
+    infer_log.info(f'[{response_id}] DeBERTa results: {deberta_res} '
+                   f'[{time.time()-_t_deberta:.3f}s]')
 
     infer_log.info(f'[{response_id}] Running SVM inference (update)...')
     _t_svm = time.time()
-    svms_res = svm_infer(svm_models, svm_inputs)
+    with model_lock:
+      svms_res = svm_infer(models.svm, svm_inputs)
     infer_log.info(f'[{response_id}] SVM results: {svms_res} [{time.time()-_t_svm:.3f}s]')
 
-    def weighted_average(deberta: float, svm: float) -> float:
-      return deberta * 0.25 + svm * 0.75
-
     res = {k: weighted_average(deberta=v, svm=svms_res[k]) for k, v in deberta_res.items()}
     infer_log.info(f'[{response_id}] Updated weighted results: {res}')
 
-    # UPSERT so the existing form_results row is replaced, not duplicated
-    _t_db = time.time()
-    (supabase.table('form_results')
-     .upsert({'response_id': response_id, 'results': res}, on_conflict='response_id')
-     .execute())
-    infer_log.info(f'[{response_id}] form_results upserted. DB write: {time.time()-_t_db:.3f}s | Total pipeline: {time.time()-_t_pipeline:.3f}s')
+    if writer is not None:
+      writer.add([result_row(response_id, res, model_version)])
+      infer_log.info(f'[{response_id}] Results buffered for form_results. '
+                     f'Total pipeline: {time.time()-_t_pipeline:.3f}s')
+    else:
+      # UPSERT so the existing form_results row is replaced, not duplicated
+      _t_db = time.time()
+      (supabase.table('form_results')
+       .upsert(result_row(response_id, res, model_version), on_conflict='response_id')
+       .execute())
+      infer_log.info(f'[{response_id}] form_results upserted. DB write: {time.time()-_t_db:.3f}s '
+                     f'| Total pipeline: {time.time()-_t_pipeline:.3f}s')
+    remember_scored(response_id, digest)
+    journal_done(journal, 'form_responses', response_id, event_digest(payload))
 
   except Exception as e:
     error_log.exception(f'Error in handle_updated_response: {e}')
 
 
-def handle_updated_report(payload, gemini, supabase) -> None:
-  """Regenerate AI feedback when a report's llm_feedback is reset to GENERATING_PLACEHOLDER."""
+def refine_now(fn, *args) -> None:
+  """Run a two-phase refinement straight away, on the calling scoring thread."""
+  fn(*args)
+
+
+def handle_response_batch(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    events, models: ModelSet, supabase, writer: ResultWriter | None = None, refine=None,
+    journal: EventJournal | None = None) -> None:
+  """
+  Score a group of form response events together and write each response's results.
+
+  ``events`` are ``('insert' | 'update', payload)`` pairs from the realtime
+  callbacks. When a response appears more than once only its latest payload is
+  scored. All texts go through one DeBERTa pass and all SVM features through one
+  ``predict`` call per key function; the results are then written per response,
+  inserting new responses and upserting edited ones. If batched scoring fails,
+  each event is retried through its single-response handler. Rows carry
+  ``models.version``. When ``models`` has an inference pool the batch is scored
+  in a worker process; if that fails, the single-response retries run in this
+  process. With a ``writer`` the rows are buffered and upserted in bulk instead
+  of written one request at a time.
+
+  With a ``refine`` callable the batch is scored in two phases: the SVM results
+  are written at once as provisional rows (``write_provisional_results``), and
+  ``dispatch_refinement`` hands them to ``refine``, whose
+  ``refine_response_batch`` then replaces them with the weighted results.
+  ``refine_now`` runs it right away; the listener hands it to the refine lane
+  instead when scoring is behind.
+  """
+  model_version = models.version
+  pending: dict[str, dict] = {}
+  for kind, payload in events:
+    try:
+      record = payload['data']['record']
+      response_id = record['response_id']
+      response = record['response']['response']
+    except Exception as e:
+      error_log.exception(f'Error reading form response event: {e}')
+      continue
+    infer_log.info(f'Form response {"received" if kind == "insert" else "updated"}: {response_id}')
+    entry = pending.setdefault(response_id, {'insert': False})
+    entry['insert'] = entry['insert'] or kind == 'insert'
+    entry.update(kind=kind, payload=payload, response=response,
+                 digest=response_hash(response, model_version), event=event_digest(payload))
+
+  for response_id, entry in list(pending.items()):
+    if not entry['insert'] and _last_scored.get(response_id) == entry['digest']:
+      infer_log.info(f'[{response_id}] Response unchanged since last scoring '
+                     '— skipping inference and write.')
+      journal_done(journal, 'form_responses', response_id, entry['event'])
+      del pending[response_id]
+  if not pending:
+    return
+
+  _t_pipeline = time.time()
+  try:
+    inputs = [flatten_response(entry['response']) for entry in pending.values()]
+    if refine is not None:
+      # The SVMs take microseconds, so the provisional rows never wait for DeBERTa or a pool worker.
+      deberta_results = None  # Scored later, in refine_response_batch.
+      with model_lock:
+        svm_results = svm_infer_many(models.svm, [s for _, s in inputs])
+    elif models.pool is not None:
+      deberta_results, svm_results = models.pool.infer_many([d for d, _ in inputs],
+                                                            [s for _, s in inputs])
+    else:
+      with model_lock:
+        deberta_results = deberta_infer_many(models.deberta, [d for d, _ in inputs],
+                                             cache=models.logit_cache)
+        svm_results = svm_infer_many(models.svm, [s for _, s in inputs])
+  except Exception as e:
+    error_log.exception(f'Error scoring batch of {len(pending)} form responses, '
+                        f'retrying one by one: {e}')
+    for entry in pending.values():
+      handler = handle_new_response if entry['insert'] else handle_updated_response
+      handler(entry['payload'], models, supabase, writer, journal)
+    return
+
+  if refine is not None:
+    infer_log.info(f'Scored SVMs for {len(pending)} form responses '
+                   f'[{time.time()-_t_pipeline:.3f}s]')
+    refinements = write_provisional_results(pending, inputs, svm_results, model_version,
+                                            supabase, writer)
+    dispatch_refinement(refine, refinements, models, supabase, writer, journal)
+    return
+
+  infer_log.info(f'Scored {len(pending)} form responses in one batch '
+                 f'[{time.time()-_t_pipeline:.3f}s]')
+  rows = []
+  for (response_id, entry), deberta_res, svms_res in zip(pending.items(), deberta_results,
+                                                         svm_results):
+    res = {k: weighted_average(deberta=v, svm=svms_res[k]) for k, v in deberta_res.items()}
+    infer_log.info(f'[{response_id}] DeBERTa results: {deberta_res} | SVM results: {svms_res} | '
+                   f'Final weighted results: {res}')
+    rows.append((result_row(response_id, res, model_version), entry['insert']))
+  for response_id in write_results(supabase, rows, writer):
+    remember_scored(response_id, pending[response_id]['digest'])
+    journal_done(journal, 'form_responses', response_id, pending[response_id]['event'])
+
+
+def write_provisional_results(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    pending: dict[str, dict], inputs: list[tuple[dict, dict]], svm_results: list[dict],
+    model_version: str, supabase, writer: ResultWriter | None = None) -> list[dict]:
+  """
+  Write the SVM-only provisional rows of a two-phase batch and return its refinements.
+
+  ``pending`` maps each response id to its entry in ``handle_response_batch``,
+  in the order of ``inputs`` and ``svm_results``. Each refinement carries what
+  ``refine_response_batch`` needs for the final row, and every response is
+  registered as provisional under its payload digest. A refinement only inserts
+  its final row when the provisional row could not be written.
+  """
+  refinements, rows = [], []
+  for (response_id, entry), (deberta_inputs, _), svms_res in zip(pending.items(), inputs,
+                                                                 svm_results):
+    res = {k: float(v) for k, v in svms_res.items()}
+    infer_log.info(f'[{response_id}] SVM results: {svms_res} | Provisional results: {res}')
+    rows.append((result_row(response_id, res, model_version, provisional=True), entry['insert']))
+    refinements.append({'response_id': response_id, 'digest': entry['digest'],
+                        'insert': entry['insert'], 'event': entry['event'],
+                        'deberta_inputs': deberta_inputs, 'svm': svms_res, 'since': time.time()})
+  written = set(write_results(supabase, rows, writer))
+  with _provisional_lock:
+    for r in refinements:
+      _provisional[r['response_id']] = r['digest']
+      # Once the provisional row exists, the final one replaces it.
+      r['insert'] = r['insert'] and r['response_id'] not in written
+  return refinements
+
+
+def dispatch_refinement(refine, refinements: list[dict], *args) -> None:
+  """
+  Hand provisional results to ``refine`` for their DeBERTa pass.
+
+  ``refine`` is ``refine_now`` or the listener's deferral to the refine lane,
+  and ``args`` are the rest of ``refine_response_batch``'s arguments.
+  If it fails, the provisional rows are already written, so the failure is
+  logged and the responses stay provisional until they are scored again.
+  """
+  try:
+    refine(refine_response_batch, refinements, *args)
+  except Exception as e:
+    error_log.exception(f'Error refining {len(refinements)} provisional form results; '
+                        f'they stay provisional: {e}')
+    with _provisional_lock:
+      for r in refinements:
+        if _provisional.get(r['response_id']) == r['digest']:
+          del _provisional[r['response_id']]
+
+
+def refine_response_batch(refinements: list[dict], models: ModelSet, supabase,
+                          writer: ResultWriter | None = None,
+                          journal: EventJournal | None = None) -> None:
+  """
+  Run DeBERTa for responses that have provisional results and upsert their final weighted results.
+
+  ``refinements`` come from ``handle_response_batch`` in two-phase mode. A
+  response edited again since its provisional row was written is skipped, since
+  the newer payload has a refinement of its own. If the DeBERTa pass fails, the
+  provisional rows stay and are replaced the next time the response is scored.
+  """
+  with _provisional_lock:
+    current = [r for r in refinements if _provisional.get(r['response_id']) == r['digest']]
+  if not current:
+    return
+  _t_deberta = time.time()
+  try:
+    deberta_inputs = [r['deberta_inputs'] for r in current]
+    deberta_results = None
+    if models.pool is not None:
+      try:
+        deberta_results, _ = models.pool.infer_many(deberta_inputs, [{} for _ in current])
+      except Exception as e:
+        # A deferred refinement can outlive its pool across a hot reload; the models are still
+        # loaded here.
+        error_log.error(f'Inference pool could not refine {len(current)} form responses, '
+                        f'scoring in-process: {e}')
+    if deberta_results is None:
+      with model_lock:
+        deberta_results = deberta_infer_many(models.deberta, deberta_inputs,
+                                             cache=models.logit_cache)
+  except Exception as e:
+    error_log.exception(f'Error refining {len(current)} provisional form results; '
+                        f'they stay provisional: {e}')
+    with _provisional_lock:
+      for r in current:
+        if _provisional.get(r['response_id']) == r['digest']:
+          del _provisional[r['response_id']]
+    return
+  infer_log.info(f'Refined {len(current)} form responses with DeBERTa '
+                 f'[{time.time()-_t_deberta:.3f}s]')
+
+  rows = []
+  with _provisional_lock:
+    current = [(r, d) for r, d in zip(current, deberta_results)
+               if _provisional.get(r['response_id']) == r['digest']]
+  for r, deberta_res in current:
+    response_id = r['response_id']
+    res = {k: weighted_average(deberta=v, svm=r['svm'][k]) for k, v in deberta_res.items()}
+    infer_log.info(f'[{response_id}] DeBERTa results: {deberta_res} | '
+                   f'Final weighted results: {res} | '
+                   f'provisional for {time.time()-r["since"]:.3f}s')
+    rows.append((result_row(response_id, res, models.version, provisional=False), r['insert']))
+  written = set(write_results(supabase, rows, writer))
+  for r, _ in current:
+    if r['response_id'] not in written:
+      continue
+    remember_scored(r['response_id'], r['digest'])
+    journal_done(journal, 'form_responses', r['response_id'], r['event'])
+    with _provisional_lock:
+      if _provisional.get(r['response_id']) == r['digest']:
+        del _provisional[r['response_id']]
+
+
+def is_regeneration(payload) -> bool:
+  """Return True if a student_reports UPDATE resets existing feedback to GENERATING_PLACEHOLDER."""
   record = payload['data']['record']
   old_record = payload['data'].get('old_record', {})
 
@@ -315,17 +922,22 @@ def handle_updated_report(payload, gemini, supabase) -> None:
   # Skip if new value is not GENERATING_PLACEHOLDER, old was already GENERATING_PLACEHOLDER, or
   # old was null/empty (meaning this UPDATE came from handle_new_report's own status step)
   if record.get('llm_feedback') != GENERATING_PLACEHOLDER:
-    return
+    return False
   old_feedback = old_record.get('llm_feedback')
-  if not old_feedback or old_feedback == GENERATING_PLACEHOLDER:
+  return bool(old_feedback) and old_feedback != GENERATING_PLACEHOLDER
+
+
+def handle_updated_report(payload, gemini, supabase, journal: EventJournal | None = None) -> None:
+  """Regenerate AI feedback when a report's llm_feedback is reset to GENERATING_PLACEHOLDER."""
+  if not is_regeneration(payload):
     return
 
-  report_id = record['id']
+  report_id = payload['data']['record']['id']
   app_log.info(f'Report updated with Generating... — regenerating feedback: {report_id}')
-  handle_new_report(payload, gemini, supabase)
+  handle_new_report(payload, gemini, supabase, journal)
 
 
-def handle_new_report(payload, gemini, supabase) -> None:
+def handle_new_report(payload, gemini, supabase, journal: EventJournal | None = None) -> None:
   """Generate and persist AI feedback for a newly created student report."""
   record = payload['data']['record']
   report_id = record['id']
@@ -337,14 +949,10 @@ def handle_new_report(payload, gemini, supabase) -> None:
      .eq('id', report_id)
      .execute())
 
-    time.sleep(2)
-    full_row = (supabase.table('student_reports')
-     .select('kf_avg_data')
-     .eq('id', report_id)
-     .single()
-     .execute())
-
-    data = full_row.data.get('kf_avg_data') if full_row.data else None
+    # generate_report may have filled kf_avg_data before the event was sent; otherwise wait for it.
+    data = record.get('kf_avg_data')
+    if data is None:
+      data = wait_for_report_data(supabase, report_id)
     app_log.info(f'[{report_id}] kf_avg_data: {data}')
 
     if not data:
@@ -353,6 +961,7 @@ def handle_new_report(payload, gemini, supabase) -> None:
        .update({'llm_feedback': 'No assessment data found for this time range.'})
        .eq('id', report_id)
        .execute())
+      journal_done(journal, 'student_reports', report_id)
       return
 
     app_log.info(f'[{report_id}] Calling Gemini...')
@@ -361,7 +970,8 @@ def handle_new_report(payload, gemini, supabase) -> None:
     app_log.info(f'[{report_id}] Gemini total: {time.time()-_t_gemini:.3f}s')
     if summary.startswith('Error generating feedback:'):
       error_log.error(f'[{report_id}] {summary}')
-      stored = json.dumps({'_error': 'AI feedback could not be generated. Please regenerate the report.'})
+      stored = json.dumps(
+        {'_error': 'AI feedback could not be generated. Please regenerate the report.'})
     else:
       app_log.info(f'[{report_id}] Gemini response received.')
       stored = summary
@@ -370,6 +980,7 @@ def handle_new_report(payload, gemini, supabase) -> None:
      .update({'llm_feedback': stored})
      .eq('id', report_id)
      .execute())
+    journal_done(journal, 'student_reports', report_id)
     if summary.startswith('Error generating feedback:'):
       error_log.error(f'[{report_id}] Error feedback written to student_reports.')
     else:
@@ -377,19 +988,12 @@ def handle_new_report(payload, gemini, supabase) -> None:
 
   except Exception as e:
     error_log.exception(f'[{report_id}] Error in handle_new_report: {e}')
-    err_str = str(e)
-    if '503' in err_str or 'UNAVAILABLE' in err_str or 'high demand' in err_str.lower():
-      friendly = 'AI feedback is temporarily unavailable due to high demand. Please regenerate the report in a few minutes.'
-    elif '429' in err_str or 'RESOURCE_EXHAUSTED' in err_str:
-      friendly = 'AI feedback could not be generated because the usage limit was reached. Please try again later.'
-    elif '401' in err_str or 'API_KEY' in err_str or 'UNAUTHENTICATED' in err_str:
-      friendly = 'AI feedback could not be generated due to an authentication error. Please contact support.'
-    else:
-      friendly = 'AI feedback could not be generated. Please regenerate the report or contact support if the problem persists.'
+    friendly = report_error_message(e)
     (supabase.table('student_reports')
      .update({'llm_feedback': json.dumps({'_error': friendly})})
      .eq('id', report_id)
      .execute())
+    journal_done(journal, 'student_reports', report_id)
 
 
 if __name__ == '__main__':
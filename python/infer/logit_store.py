@@ -0,0 +1,167 @@
+"""Persistent text-to-logits store for the DeBERTa classifier.
+
+Clinical comments repeat a lot across students and raters, so per-text logits
+are worth keeping across restarts. This module keeps them in a SQLite database
+(WAL mode, so several listener processes can read it at once while one writes)
+keyed by the model fingerprint, with least-recently-used eviction once the
+store grows past a row limit. ``LogitStore`` is used as the second tier behind
+``inference.LogitCache``.
+
+Lookups never write. The recency of hits is collected in memory and written in
+one transaction with the next batch of inserted rows, or on its own once
+``DEBERTA_LOGIT_STORE_TOUCH_ROWS`` hits or ``DEBERTA_LOGIT_STORE_TOUCH_S``
+seconds have gone by. Inserts only count the table when a running estimate
+(the count at the last check plus the rows inserted since) passes the row
+limit. Eviction then goes 1% below the limit, so the next count is that many
+inserts away.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+DEBERTA_LOGIT_STORE_MAX_ROWS = int(os.environ.get('DEBERTA_LOGIT_STORE_MAX_ROWS', '1000000'))
+# Hits whose recency is buffered before it is written, and the longest it stays buffered.
+DEBERTA_LOGIT_STORE_TOUCH_ROWS = int(os.environ.get('DEBERTA_LOGIT_STORE_TOUCH_ROWS', '1000'))
+DEBERTA_LOGIT_STORE_TOUCH_S = float(os.environ.get('DEBERTA_LOGIT_STORE_TOUCH_S', '60'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS logits (
+  key TEXT PRIMARY KEY,
+  model_version TEXT NOT NULL,
+  row BLOB NOT NULL,
+  last_used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS logits_last_used ON logits (last_used);
+"""
+
+
+class LogitStore:
+  """
+  SQLite-backed per-text logit store shared by listener replicas.
+
+  Keys are the hashes produced by ``LogitCache.key``, which already include the
+  model version; the version is stored alongside each row as well so a store
+  can be inspected or pruned per checkpoint.
+  """
+
+  def __init__(self, path: str, model_version: str, max_rows: int = DEBERTA_LOGIT_STORE_MAX_ROWS,
+               touch_rows: int = DEBERTA_LOGIT_STORE_TOUCH_ROWS,
+               touch_s: float = DEBERTA_LOGIT_STORE_TOUCH_S):
+    self.path = path
+    self.model_version = model_version
+    self.max_rows = max_rows
+    self.touch_rows = touch_rows
+    self.touch_s = touch_s
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._lock = threading.Lock()
+    # key -> time of its latest hit not yet written to last_used.
+    self._touched: dict[str, float] = {}
+    self._touched_at = time.monotonic()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+    self._conn.execute('PRAGMA journal_mode=WAL')
+    self._conn.execute('PRAGMA synchronous=NORMAL')
+    self._conn.executescript(_SCHEMA)
+    # Upper bound on the table's rows: replaced rows and other processes' evictions are not counted.
+    self._estimate = self._count()
+
+  def _count(self) -> int:
+    return self._conn.execute('SELECT COUNT(*) FROM logits').fetchone()[0]
+
+  def _write_touches(self) -> None:
+    """Write the buffered recency updates. Called with ``_lock`` held, inside a transaction."""
+    if self._touched:
+      self._conn.executemany('UPDATE logits SET last_used = ? WHERE key = ?',
+                             [(used, key) for key, used in self._touched.items()])
+      self._touched.clear()
+    self._touched_at = time.monotonic()
+
+  def _flush_touches(self) -> None:
+    """Write buffered recency updates in their own transaction; they are kept if the db is busy."""
+    try:
+      self._conn.execute('BEGIN IMMEDIATE')
+    except sqlite3.OperationalError:
+      return
+    try:
+      self._write_touches()
+      self._conn.execute('COMMIT')
+    except BaseException:
+      self._conn.execute('ROLLBACK')
+      raise
+
+  def get_many(self, keys: list[str]) -> list[np.ndarray | None]:
+    """Look up logit rows for ``keys``; misses are ``None`` and the hits' recency is buffered."""
+    if not keys:
+      return []
+    found: dict[str, np.ndarray] = {}
+    with self._lock:
+      for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        for key, blob in self._conn.execute(
+            f'SELECT key, row FROM logits WHERE key IN ({placeholders})', chunk):
+          found[key] = np.frombuffer(blob, dtype='<f4').copy()
+      now = time.time()
+      self._touched.update((key, now) for key in found)
+      if self._touched and (len(self._touched) >= self.touch_rows
+                            or time.monotonic() - self._touched_at >= self.touch_s):
+        self._flush_touches()
+      self.hits += sum(1 for key in keys if key in found)
+      self.misses += sum(1 for key in keys if key not in found)
+    return [found.get(key) for key in keys]
+
+  def put_many(self, keys: list[str], rows: np.ndarray) -> None:
+    """
+    Insert or refresh logit rows, then evict the least recently used if maybe past ``max_rows``.
+
+    Buffered recency updates are written in the same transaction, before any
+    eviction, so rows read since the last write are not evicted as stale.
+    """
+    if not len(keys):
+      return
+    now = time.time()
+    values = [(key, self.model_version, np.asarray(row, dtype='<f4').tobytes(), now)
+              for key, row in zip(keys, rows)]
+    with self._lock:
+      self._conn.execute('BEGIN IMMEDIATE')
+      try:
+        self._write_touches()
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO logits (key, model_version, row, last_used) '
+            'VALUES (?, ?, ?, ?)',
+            values)
+        estimate = self._estimate + len(values)
+        if estimate > self.max_rows:
+          estimate = self._count()
+          excess = estimate - (self.max_rows - self.max_rows // 100)
+          if estimate > self.max_rows and excess > 0:
+            self._conn.execute(
+                'DELETE FROM logits WHERE key IN '
+                '(SELECT key FROM logits ORDER BY last_used LIMIT ?)',
+                (excess,))
+            self.evictions += excess
+            estimate -= excess
+        self._conn.execute('COMMIT')
+      except BaseException:
+        self._conn.execute('ROLLBACK')
+        raise
+      self._estimate = estimate
+
+  def __len__(self) -> int:
+    with self._lock:
+      return self._count()
+
+  def close(self) -> None:
+    """Write the buffered recency updates and close the underlying database connection."""
+    with self._lock:
+      self._flush_touches()
+      self._conn.close()
+
+  def __str__(self) -> str:
+    return f'{self.hits} hits, {self.misses} misses, {self.evictions} evictions'
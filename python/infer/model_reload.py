@@ -0,0 +1,227 @@
+"""Model sets and their hot reload while the listener runs.
+
+A ``ModelSet`` is one consistent DeBERTa + SVM pair and the version its rows
+are recorded under. ``LiveModels`` holds the set new batches are scored with;
+``watch_model_updates`` loads and warms up the models that change on disk and
+swaps the new set in, while batches already running finish on the old one.
+``sync_svm_periodically`` re-syncs the SVM bucket so that retrained models
+reach the disk in the first place.
+"""
+
+import asyncio
+from dataclasses import dataclass, replace
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+
+from artifact_cache import ArtifactCache
+from inference import (LogitCache, deberta_model_version, load_deberta_model, load_svm_scorer,
+                       svm_model_version, warm_up_models)
+from model_watch import file_signature, wait_for_files
+from startup import (ARTIFACT_CACHE_PATH, DEBERTA_MODEL_PATH, LOGIT_STORE_PATH, SVM_MODELS_PATH,
+                     StartupTimeline, deberta_files_ready, open_logit_store, svm_files_ready)
+from svm_sync import sync_svm_models
+from worker_pool import INFERENCE_WORKERS, InferencePool
+
+# Set MODEL_HOT_RELOAD=0 to load models only at startup instead of swapping in new ones as they
+# land on disk.
+MODEL_HOT_RELOAD = os.environ.get('MODEL_HOT_RELOAD', '1').lower() not in ('0', 'false', '')
+# After a hot reload, the old inference pool keeps serving batches dispatched before the swap for
+# this long.
+POOL_RETIRE_GRACE_S = 30.0
+# With hot reload on, the SVM bucket is re-synced this often so retrained models are picked up;
+# 0 disables it.
+SVM_SYNC_INTERVAL_S = float(os.environ.get('SVM_SYNC_INTERVAL_S', '600'))
+
+app_log = logging.getLogger('app')
+error_log = logging.getLogger('error')
+
+# Scoring runs on several worker threads so one batch's database writes overlap the next batch's
+# inference, but the models themselves are only ever used by one thread at a time.
+model_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ModelSet:
+  """One consistent set of loaded models, and the version recorded on the rows they score."""
+  deberta: tuple
+  logit_cache: LogitCache
+  svm: object
+  svm_version: str
+  # Worker processes started with these models when INFERENCE_WORKERS > 0; batches are scored
+  # in-process otherwise.
+  pool: InferencePool | None = None
+
+  @property
+  def version(self) -> str:
+    return model_set_version(self.logit_cache.model_version, self.svm_version)
+
+
+def model_set_version(deberta_version: str, svm_version: str) -> str:
+  """Combine the DeBERTa and SVM versions into the string stored in form_results.model_version."""
+  return f'deberta-{deberta_version}+svm-{svm_version}'
+
+
+class LiveModels:
+  """
+  The model set new batches are scored with.
+
+  Each batch reads ``current`` once when it is dispatched and keeps that
+  reference, so ``swap`` only affects batches formed afterwards; batches already
+  queued or running finish on the models they started with.
+  """
+
+  def __init__(self, models: ModelSet | None = None):
+    self.current = models
+    self.swaps = 0
+    self._lock = threading.Lock()
+
+  def swap(self, models: ModelSet) -> ModelSet | None:
+    """Make ``models`` the current set and return the one it replaces."""
+    with self._lock:
+      previous, self.current = self.current, models
+      self.swaps += 1
+    return previous
+
+
+def load_model_set(previous: ModelSet | None = None) -> ModelSet:
+  """
+  Load the models now on disk, reusing any of ``previous``'s models whose version is unchanged.
+
+  Versions are read before the files are loaded, so a copy that lands mid-load
+  shows up as a newer version on the next check rather than being mislabelled.
+  """
+  deberta_version = deberta_model_version(str(DEBERTA_MODEL_PATH))
+  svm_version = svm_model_version(str(SVM_MODELS_PATH))
+  if previous is not None and previous.logit_cache.model_version == deberta_version:
+    deberta_model, logit_cache = previous.deberta, previous.logit_cache
+  else:
+    deberta_model = load_deberta_model(str(DEBERTA_MODEL_PATH))
+    logit_cache = LogitCache(deberta_version, store=open_logit_store(deberta_version))
+  if previous is not None and previous.svm_version == svm_version:
+    svm_models = previous.svm
+  else:
+    svm_models = load_svm_scorer(str(SVM_MODELS_PATH))
+  return ModelSet(deberta_model, logit_cache, svm_models, svm_version)
+
+
+def start_inference_pool(models: ModelSet) -> InferencePool:
+  """Start INFERENCE_WORKERS processes sharing ``models``' weights, and wait for their warm-up."""
+  # The weights are moved into shared memory while holding the model lock, so no thread in this
+  # process is in the middle of inference on them.
+  with model_lock:
+    pool = InferencePool(models.deberta, models.svm, models.logit_cache.model_version,
+                         store_path=LOGIT_STORE_PATH)
+  pool.wait_ready(timeout_s=600)
+  app_log.info(f'[POOL] Inference pool ready for {models.version}: {pool}')
+  return pool
+
+
+async def load_startup_models(deberta_task: asyncio.Task, svm_task: asyncio.Task,
+                              timeline: StartupTimeline) -> ModelSet:
+  """
+  Build the first model set from ``startup.start_model_loading``'s tasks.
+
+  The inference pool is started on it when INFERENCE_WORKERS is set.
+  """
+  deberta_model, logit_cache = await deberta_task
+  models = ModelSet(deberta_model, logit_cache, *await svm_task)
+  if INFERENCE_WORKERS > 0:
+    with timeline.phase('Inference pool'):
+      models = replace(models, pool=await asyncio.to_thread(start_inference_pool, models))
+  return models
+
+
+def reload_models(live: LiveModels) -> bool:
+  """
+  Load and warm up the models on disk, then swap them in if their version differs from the live set.
+
+  Returns:
+    True if a new model set was swapped in.
+  """
+  current = live.current
+  version = model_set_version(deberta_model_version(str(DEBERTA_MODEL_PATH)),
+                              svm_model_version(str(SVM_MODELS_PATH)))
+  if current is not None and version == current.version:
+    return False
+
+  app_log.info(f'[RELOAD] New models on disk ({version}); loading in the background...')
+  _t0 = time.time()
+  models = load_model_set(current)
+  # Only the newly loaded models are warmed up. The reused ones are already warm and serving, and
+  # warming them here would run them outside model_lock, concurrently with live batches.
+  reused_deberta = current is not None and models.deberta is current.deberta
+  reused_svm = current is not None and models.svm is current.svm
+  timings = warm_up_models(None if reused_deberta else models.deberta,
+                           None if reused_svm else models.svm)
+  if INFERENCE_WORKERS > 0:
+    models = replace(models, pool=start_inference_pool(models))
+  previous = live.swap(models)
+  if previous is not None and previous.pool is not None:
+    # Batches dispatched just before the swap may still be on their way to the old workers.
+    timer = threading.Timer(POOL_RETIRE_GRACE_S, previous.pool.close)
+    timer.daemon = True
+    timer.start()
+  app_log.info(f'[RELOAD] Now scoring with {models.version} '
+               f'(was {previous.version if previous else None}). '
+               f'Load {time.time() - _t0:.3f}s, warm-up DeBERTa {timings["deberta"]:.3f}s '
+               f'/ SVM {timings["svm"]:.3f}s.')
+  return True
+
+
+def watch_model_updates(live: LiveModels) -> None:
+  """
+  Reload the models whenever the files in the model volume change.
+
+  Runs forever; start it on a daemon thread. Changes are picked up through
+  ``wait_for_files``, so a checkpoint that is still being copied is only loaded
+  once its files have stopped changing. A model set that fails to load is logged
+  and the current one keeps serving.
+  """
+  seen = None
+
+  def model_files() -> list[Path]:
+    svm_files = (sorted(f for f in SVM_MODELS_PATH.iterdir() if f.is_file())
+                 if SVM_MODELS_PATH.exists() else [])
+    return (deberta_files_ready() or []) + svm_files
+
+  def changed() -> list[Path] | None:
+    if file_signature(model_files()) == seen:
+      return None
+    deberta_files, svm_files = deberta_files_ready(), svm_files_ready()
+    if deberta_files is None or svm_files is None:
+      return None
+    return deberta_files + svm_files
+
+  while True:
+    try:
+      wait_for_files(changed, [DEBERTA_MODEL_PATH, SVM_MODELS_PATH], timeout_s=24 * 60 * 60)
+    except TimeoutError:
+      continue
+    seen = file_signature(model_files())
+    try:
+      reload_models(live)
+    except Exception as e:
+      current = live.current.version if live.current else None
+      error_log.exception(f'[RELOAD] Could not load new models; still scoring with {current}: {e}')
+
+
+async def sync_svm_periodically(supabase, interval_s: float = SVM_SYNC_INTERVAL_S) -> None:
+  """
+  Re-sync the SVM models from Supabase Storage every ``interval_s`` seconds.
+
+  A sync that changes the files on disk is picked up by ``watch_model_updates``.
+  A failed sync is logged and retried at the next interval.
+  """
+  cache = ArtifactCache(str(ARTIFACT_CACHE_PATH))
+  while True:
+    await asyncio.sleep(interval_s)
+    try:
+      stats = await asyncio.to_thread(sync_svm_models, supabase, str(SVM_MODELS_PATH), cache)
+    except Exception as e:
+      error_log.error(f'[SYNC] SVM sync failed: {e}')
+      continue
+    if stats.changed:
+      app_log.info(f'[SYNC] SVM models updated: {stats}.')
@@ -0,0 +1,173 @@
+"""Wait for model files to appear on disk and finish being written.
+
+On Railway the models are often copied into the volume by hand after a deploy.
+Rather than checking on a fixed timer, ``wait_for_files`` blocks on Linux
+inotify events for the model directories (falling back to short polling where
+inotify is unavailable) and re-checks as soon as anything changes. Files only
+count as ready once their size and modification time have stayed the same for
+``stable_s`` seconds, so a model that is still being copied is never loaded.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+from pathlib import Path
+import select
+import sys
+import threading
+import time
+from typing import Callable
+
+MODEL_STABLE_SECONDS = float(os.environ.get('MODEL_STABLE_SECONDS', '1.0'))
+MODEL_POLL_SECONDS = float(os.environ.get('MODEL_POLL_SECONDS', '2.0'))
+
+app_log = logging.getLogger('app')
+
+# inotify(7) event masks.
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+
+class Inotify:
+  """
+  Minimal ctypes binding to Linux inotify, used only to wake up when a watched directory changes.
+
+  Raises:
+    OSError: If inotify is not available on this platform.
+  """
+
+  def __init__(self):
+    if not sys.platform.startswith('linux'):
+      raise OSError('inotify is only available on Linux')
+    self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+    self._watched: set[str] = set()
+
+  def watch(self, directory: Path) -> None:
+    """Watch ``directory``, or its nearest existing ancestor, so that its creation wakes us."""
+    path = directory
+    while not path.is_dir() and path != path.parent:
+      path = path.parent
+    key = str(path)
+    if key in self._watched:
+      return
+    if self._libc.inotify_add_watch(self.fd, key.encode(), _WATCH_MASK) < 0:
+      raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {key}')
+    self._watched.add(key)
+
+  def wait(self, timeout_s: float) -> bool:
+    """Block until an event arrives or ``timeout_s`` passes. Returns True if there were events."""
+    readable, _, _ = select.select([self.fd], [], [], max(timeout_s, 0))
+    if not readable:
+      return False
+    try:
+      while os.read(self.fd, 64 * 1024):
+        pass
+    except BlockingIOError:
+      pass
+    return True
+
+  def close(self) -> None:
+    """Release the inotify file descriptor."""
+    os.close(self.fd)
+
+
+def file_signature(files: list[Path]) -> tuple | None:
+  """Return each file's (path, size, mtime), or None if any of them has disappeared."""
+  snapshot = []
+  for f in files:
+    try:
+      st = f.stat()
+    except OSError:
+      return None
+    snapshot.append((str(f), st.st_size, st.st_mtime_ns))
+  return tuple(snapshot)
+
+
+def wait_for_files(  # pylint: disable=too-many-arguments
+    ready: Callable[[], list[Path] | None],
+    watch: list[Path],
+    *,
+    timeout_s: float,
+    stable_s: float = MODEL_STABLE_SECONDS,
+    poll_interval_s: float = MODEL_POLL_SECONDS,
+    use_inotify: bool = True,
+    stop: threading.Event | None = None,
+) -> list[Path]:
+  """
+  Block until ``ready()`` reports a complete set of files that has stopped changing.
+
+  Args:
+    ready: Returns the files that must be fully written, or None while some are still missing.
+      Returning an empty list (e.g. once a manifest has been verified) means ready with no quiet
+      period.
+    watch: Directories whose changes should trigger a re-check; they need not exist yet.
+    timeout_s: Give up after this many seconds.
+    stable_s: How long the files' sizes and modification times must stay unchanged.
+    poll_interval_s: Re-check interval when inotify is unavailable.
+    use_inotify: Set False to force polling.
+    stop: Once set, give up waiting; checked at least every ``poll_interval_s``.
+
+  Returns:
+    The files ``ready()`` returned.
+
+  Raises:
+    TimeoutError: If the files are not ready within ``timeout_s``.
+    InterruptedError: If ``stop`` is set before the files are ready.
+  """
+  notifier = None
+  if use_inotify:
+    try:
+      notifier = Inotify()
+    except OSError as e:
+      app_log.info(f'inotify unavailable ({e}); polling every {poll_interval_s:g}s instead.')
+
+  deadline = time.monotonic() + timeout_s
+  last_snapshot = None
+  stable_since = 0.0
+  try:
+    while True:
+      if notifier is not None:
+        for directory in watch:
+          notifier.watch(directory)
+
+      now = time.monotonic()
+      files = ready()
+      snapshot = file_signature(files) if files is not None else None
+      if files is not None and not files:
+        return files
+      if snapshot is not None:
+        if snapshot != last_snapshot:
+          last_snapshot, stable_since = snapshot, now
+        elif now - stable_since >= stable_s:
+          return files
+      else:
+        last_snapshot = None
+
+      if stop is not None and stop.is_set():
+        raise InterruptedError(f'Stopped waiting for files in {", ".join(map(str, watch))}')
+      if now >= deadline:
+        raise TimeoutError(f'Files in {", ".join(map(str, watch))} were not ready '
+                           f'after {timeout_s:.0f}s')
+      # Wake for the next filesystem event, or when a pending quiet period would end.
+      wait_s = deadline - now
+      if last_snapshot is not None:
+        wait_s = min(wait_s, stable_since + stable_s - now)
+      if notifier is not None:
+        # inotify cannot wake on ``stop``, so a stoppable wait re-checks it every poll interval.
+        notifier.wait(wait_s if stop is None else min(wait_s, poll_interval_s))
+      elif stop is not None:
+        stop.wait(min(wait_s, poll_interval_s))
+      else:
+        time.sleep(min(wait_s, poll_interval_s))
+  finally:
+    if notifier is not None:
+      notifier.close()
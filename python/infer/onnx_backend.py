@@ -0,0 +1,146 @@
+"""ONNX Runtime and int8 variants of the DeBERTa classifier.
+
+``inference.load_deberta_model`` uses these for ``DEBERTA_BACKEND=onnx`` and
+``DEBERTA_QUANTIZE``. The ONNX graph and the int8 PyTorch weights are derived
+from the saved checkpoint on first use and cached in sibling ``<name>-onnx`` and
+``<name>-int8`` directories, keyed by the model fingerprint, so later starts
+skip the export.
+"""
+
+import os
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from lazy_imports import (ONNXRUNTIME_AVAILABLE, AutoConfig, AutoModelForSequenceClassification,
+                          AutoTokenizer, QuantType, ort, ort_quantize_dynamic, torch)
+
+# ONNX Runtime intra-op threads; 0 lets ONNX Runtime decide.
+DEBERTA_ONNX_THREADS = int(os.environ.get('DEBERTA_ONNX_THREADS', '0'))
+
+
+class OnnxSequenceClassifier:
+  """
+  ONNX Runtime session with the call surface of a HuggingFace sequence classifier.
+
+  Calling it with tokenizer features returns an object with a ``logits`` array,
+  so it can stand in for the PyTorch model in a ``(tokenizer, model)`` bundle.
+  """
+
+  tensor_type = 'np'
+
+  def __init__(self, onnx_path: str, intra_op_threads: int = DEBERTA_ONNX_THREADS):
+    if not ONNXRUNTIME_AVAILABLE:
+      raise ImportError('onnxruntime is required for DEBERTA_BACKEND=onnx.')
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads:
+      options.intra_op_num_threads = intra_op_threads
+    self.onnx_path = onnx_path
+    self.session = ort.InferenceSession(onnx_path, sess_options=options,
+                                        providers=['CPUExecutionProvider'])
+    self.input_names = [i.name for i in self.session.get_inputs()]
+
+  def __call__(self, **features) -> SimpleNamespace:
+    feeds = {name: np.asarray(features[name], dtype=np.int64) for name in self.input_names}
+    return SimpleNamespace(logits=self.session.run(['logits'], feeds)[0])
+
+
+def onnx_export_path(model_path: str, fingerprint: str, quantized: bool = False) -> str:
+  """Return where the ONNX export of ``model_path`` is cached, in ``<name>-onnx``."""
+  model_dir = os.path.abspath(model_path)
+  suffix = '-int8' if quantized else ''
+  return os.path.join(f'{model_dir}-onnx', f'model-{fingerprint}{suffix}.onnx')
+
+
+def quantized_weights_path(model_path: str, fingerprint: str) -> str:
+  """Return where the int8 PyTorch weights for ``model_path`` are cached, in ``<name>-int8``."""
+  return os.path.join(f'{os.path.abspath(model_path)}-int8', f'model-{fingerprint}.pt')
+
+
+def remove_stale_artifacts(directory: str, fingerprint: str) -> None:
+  """Delete derived model files in ``directory`` that belong to a different fingerprint."""
+  for fname in os.listdir(directory):
+    if fname.startswith('model-') and not fname.startswith(f'model-{fingerprint}'):
+      os.remove(os.path.join(directory, fname))
+
+
+def export_deberta_onnx(model_path: str, onnx_path: str) -> None:
+  """
+  Export a saved DeBERTa classifier to ONNX with dynamic batch and sequence axes.
+
+  The graph is written to a temporary file and moved into place, so a crash
+  mid-export never leaves a truncated model behind.
+
+  Args:
+    model_path: Filesystem path to the saved HuggingFace model directory.
+    onnx_path: Destination ``.onnx`` file.
+  """
+  print(f'Exporting DeBERTa model to ONNX at {onnx_path}...', end=' ')
+  _t0 = time.time()
+  tokenizer = AutoTokenizer.from_pretrained(model_path)
+  model = AutoModelForSequenceClassification.from_pretrained(model_path).float().eval()
+  sample = tokenizer(['Export sample.', 'A slightly longer export sample sentence.'],
+                     return_tensors='pt', padding=True)
+  input_names = [n for n in ('input_ids', 'attention_mask', 'token_type_ids') if n in sample]
+  dynamic_axes = {n: {0: 'batch', 1: 'sequence'} for n in input_names}
+  dynamic_axes['logits'] = {0: 'batch'}
+
+  os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+  tmp_path = f'{onnx_path}.tmp'
+  with torch.no_grad():
+    torch.onnx.export(
+        model, (), tmp_path,
+        kwargs={n: sample[n] for n in input_names},
+        input_names=input_names,
+        output_names=['logits'],
+        dynamic_axes=dynamic_axes,
+        opset_version=17,
+        dynamo=False,
+    )
+  os.replace(tmp_path, onnx_path)
+  print(f'done in {time.time()-_t0:.1f}s.')
+
+
+def onnx_model_file(model_path: str, fingerprint: str, quantize: bool) -> str:
+  """Return the cached ONNX graph for a model variant, exporting and quantizing it on first use."""
+  fp32_path = onnx_export_path(model_path, fingerprint)
+  if not os.path.exists(fp32_path):
+    export_deberta_onnx(model_path, fp32_path)
+    remove_stale_artifacts(os.path.dirname(fp32_path), fingerprint)
+  if not quantize:
+    return fp32_path
+
+  int8_path = onnx_export_path(model_path, fingerprint, quantized=True)
+  if not os.path.exists(int8_path):
+    print(f'Quantizing ONNX model to int8 at {int8_path}...', end=' ')
+    ort_quantize_dynamic(fp32_path, f'{int8_path}.tmp', weight_type=QuantType.QInt8)
+    os.replace(f'{int8_path}.tmp', int8_path)
+    print('done.')
+  return int8_path
+
+
+def load_quantized_torch_model(model_path: str, fingerprint: str):
+  """
+  Return the classifier with dynamic int8 quantization applied to its Linear layers.
+
+  Quantized weights are cached on disk. When the cache exists the fp32
+  checkpoint is never read: the architecture is built from the config,
+  quantized, and the int8 state dict is loaded into it.
+  """
+  cache_path = quantized_weights_path(model_path, fingerprint)
+  if os.path.exists(cache_path):
+    model = AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(model_path))
+    model = torch.ao.quantization.quantize_dynamic(model.float().eval(), {torch.nn.Linear},
+                                                   dtype=torch.qint8)
+    model.load_state_dict(torch.load(cache_path, weights_only=False))
+    return model.eval()
+
+  model = AutoModelForSequenceClassification.from_pretrained(model_path).float().eval()
+  model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+  os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+  torch.save(model.state_dict(), f'{cache_path}.tmp')
+  os.replace(f'{cache_path}.tmp', cache_path)
+  remove_stale_artifacts(os.path.dirname(cache_path), fingerprint)
+  return model
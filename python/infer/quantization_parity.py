@@ -0,0 +1,165 @@
+"""Accuracy and performance parity check for the int8-quantized DeBERTa classifier.
+
+Usage:
+    python quantization_parity.py --csv ../bert/data/raw/<dataset>.csv
+                                  [--model-path models/deberta] [--backend torch] [--limit 2000]
+                                  [--batch-size 32] [--min-agreement 0.99]
+
+The CSV must have ``text`` and ``label`` columns, as written by
+``python/bert/supabase_to_csv.py``. The fp32 and dynamic-int8 variants each run
+in a fresh process, so load time and resident memory are measured in isolation.
+The script reports prediction agreement, accuracy of both variants and their
+delta, batch latency, throughput, and RSS, and exits non-zero when agreement
+falls below ``--min-agreement``.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+
+
+def read_labeled_csv(path: str, limit: int | None = None) -> tuple[list[str], list[int]]:
+  """Read ``text`` and ``label`` columns from a CSV, skipping rows with an empty text or label."""
+  texts: list[str] = []
+  labels: list[int] = []
+  with open(path, newline='', encoding='utf-8') as f:
+    for row in csv.DictReader(f):
+      if not row.get('text') or row.get('label') in (None, ''):
+        continue
+      texts.append(row['text'])
+      labels.append(int(float(row['label'])))
+      if limit is not None and len(texts) >= limit:
+        break
+  return texts, labels
+
+
+def rss_mb() -> tuple[float, float]:
+  """Return (current, peak) resident set size of this process in MiB."""
+  current = peak = 0.0
+  try:
+    with open('/proc/self/status', encoding='utf-8') as f:
+      for line in f:
+        if line.startswith('VmRSS:'):
+          current = int(line.split()[1]) / 1024
+        elif line.startswith('VmHWM:'):
+          peak = int(line.split()[1]) / 1024
+  except OSError:
+    # ru_maxrss is KiB on Linux and bytes on macOS; this fallback is only approximate.
+    unit = 1024 if sys.platform != 'darwin' else 1024 ** 2
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+    current = peak
+  return current, peak
+
+
+def evaluate_variant(model_path: str, backend: str, quantize: bool,
+                     texts: list[str], batch_size: int) -> dict:
+  """
+  Load one model variant and score ``texts`` with it. Meant to run in a child process.
+
+  Returns:
+    A dict with predictions, load time, per-batch latencies, and RSS figures.
+  """
+  from inference import deberta_logits, load_deberta_model  # pylint: disable=import-outside-toplevel
+
+  t_load = time.time()
+  bundle = load_deberta_model(model_path, backend=backend, quantize=quantize)
+  load_s = time.time() - t_load
+  rss_loaded, _ = rss_mb()
+
+  predictions: list[int] = []
+  latencies: list[float] = []
+  for start in range(0, len(texts), batch_size):
+    t = time.time()
+    logits = deberta_logits(bundle, texts[start:start + batch_size])
+    latencies.append(time.time() - t)
+    predictions.extend(int(i) for i in logits.argmax(axis=1))
+
+  _, rss_peak = rss_mb()
+  return {
+      'predictions': predictions,
+      'load_s': load_s,
+      'latencies': latencies,
+      'rss_loaded_mb': rss_loaded,
+      'rss_peak_mb': rss_peak,
+  }
+
+
+def compare(labels: list[int], fp32: list[int], int8: list[int]) -> dict[str, float]:
+  """Return agreement between the two variants, each variant's accuracy, and the accuracy delta."""
+  n = len(labels)
+  fp32_acc = sum(p == y for p, y in zip(fp32, labels)) / n
+  int8_acc = sum(p == y for p, y in zip(int8, labels)) / n
+  return {
+      'agreement': sum(a == b for a, b in zip(fp32, int8)) / n,
+      'fp32_accuracy': fp32_acc,
+      'int8_accuracy': int8_acc,
+      'accuracy_delta': int8_acc - fp32_acc,
+  }
+
+
+def print_variant(label: str, result: dict, n_texts: int) -> None:
+  """Print latency, throughput, and memory for one evaluated variant."""
+  latencies_ms = sorted(t * 1000 for t in result['latencies'])
+  p95 = latencies_ms[min(int(len(latencies_ms) * 0.95), len(latencies_ms) - 1)]
+  total_s = sum(result['latencies'])
+  print(f'  {label:<5} load={result["load_s"]:6.2f}s  '
+        f'batch mean={statistics.mean(latencies_ms):7.1f}ms  p95={p95:7.1f}ms  '
+        f'throughput={n_texts / total_s:7.1f} texts/s  '
+        f'RSS loaded={result["rss_loaded_mb"]:7.1f}MiB  peak={result["rss_peak_mb"]:7.1f}MiB')
+
+
+def run(args: argparse.Namespace) -> int:
+  """Evaluate both variants and print the parity report. Returns the process exit code."""
+  texts, labels = read_labeled_csv(args.csv, args.limit)
+  if not texts:
+    print(f'No labeled rows found in {args.csv}.')
+    return 1
+  print(f'Scoring {len(texts)} texts from {args.csv} ({args.backend} backend)...')
+
+  results = {}
+  for label, quantize in (('fp32', False), ('int8', True)):
+    # A fresh spawned process per variant keeps one model's memory out of the other's figures.
+    with ProcessPoolExecutor(max_workers=1,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+      results[label] = pool.submit(evaluate_variant, args.model_path, args.backend, quantize,
+                                   texts, args.batch_size).result()
+
+  summary = compare(labels, results['fp32']['predictions'], results['int8']['predictions'])
+  print(f'\n{"=" * 75}')
+  print(f'  QUANTIZATION PARITY  (N={len(texts)}, batch size={args.batch_size})')
+  print(f'{"=" * 75}')
+  print_variant('fp32', results['fp32'], len(texts))
+  print_variant('int8', results['int8'], len(texts))
+  print(f'  agreement={summary["agreement"] * 100:.2f}%  '
+        f'accuracy fp32={summary["fp32_accuracy"] * 100:.2f}%  '
+        f'int8={summary["int8_accuracy"] * 100:.2f}%  '
+        f'delta={summary["accuracy_delta"] * 100:+.2f} pts')
+  print(f'{"=" * 75}\n')
+
+  if summary['agreement'] < args.min_agreement:
+    print(f'Agreement below {args.min_agreement * 100:.2f}% — keep DEBERTA_QUANTIZE off.')
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(
+    description='Compare fp32 and int8-quantized DeBERTa on a labeled CSV')
+  parser.add_argument('--csv', required=True,
+                      help='CSV with text,label columns (from bert/supabase_to_csv.py)')
+  parser.add_argument('--model-path', default='models/deberta',
+                      help='Path to the DeBERTa model directory')
+  parser.add_argument('--backend', default='torch', choices=('torch', 'onnx'),
+                      help='Inference backend to compare on')
+  parser.add_argument('--limit', type=int, default=None, help='Score at most this many rows')
+  parser.add_argument('--batch-size', type=int, default=32,
+                      help='Texts per timed batch (default: 32)')
+  parser.add_argument('--min-agreement', type=float, default=0.99,
+                      help='Exit non-zero when fp32/int8 agreement is below this fraction '
+                           '(default: 0.99)')
+  sys.exit(run(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""Waiting for a new student report's key-function averages to be filled in.
+
+The ``generate_report`` RPC fills in ``student_reports.kf_avg_data`` after the
+row is created, so a report worker may get the INSERT before the data it needs.
+``wait_for_report_data`` reads the row with exponential backoff, and the
+listener passes each realtime UPDATE to ``observe_report_update``, which ends
+the wait as soon as an UPDATE carries the data.
+"""
+
+import os
+import threading
+import time
+
+# A new report whose kf_avg_data is not in its realtime payload waits up to REPORT_DATA_TIMEOUT_S
+# for generate_report to fill it in. The row is re-read after REPORT_DATA_POLL_MS, doubling up to
+# REPORT_DATA_MAX_POLL_MS, unless a realtime UPDATE carries the data first.
+REPORT_DATA_TIMEOUT_S = float(os.environ.get('REPORT_DATA_TIMEOUT_S', '10'))
+REPORT_DATA_POLL_MS = int(os.environ.get('REPORT_DATA_POLL_MS', '100'))
+REPORT_DATA_MAX_POLL_MS = int(os.environ.get('REPORT_DATA_MAX_POLL_MS', '1000'))
+
+# report_id -> [Event, kf_avg_data] for report workers waiting on generate_report to fill in the
+# row.
+_report_waiters: dict = {}
+_report_waiters_lock = threading.Lock()
+
+
+def observe_report_update(payload) -> None:
+  """Hand kf_avg_data from a student_reports UPDATE to the worker waiting for it. Never blocks."""
+  record = payload.get('data', {}).get('record') or {}
+  if record.get('kf_avg_data') is None:
+    return
+  with _report_waiters_lock:
+    waiter = _report_waiters.get(record.get('id'))
+    if waiter is not None:
+      waiter[1] = record['kf_avg_data']
+      waiter[0].set()
+
+
+def wait_for_report_data(supabase, report_id, timeout_s: float | None = None) -> dict | None:
+  """
+  Wait for a report's kf_avg_data to be filled in, without a fixed delay.
+
+  The row is read at once, then again with exponential backoff. A realtime
+  UPDATE that carries the data (see ``observe_report_update``) ends the wait
+  early.
+
+  Args:
+    supabase: Supabase client used to read the row.
+    report_id: The student_reports row to wait for.
+    timeout_s: Longest to wait before giving up; REPORT_DATA_TIMEOUT_S by default.
+
+  Returns:
+    The report's kf_avg_data, or None if it was not filled in within ``timeout_s``.
+  """
+  waiter = [threading.Event(), None]
+  with _report_waiters_lock:
+    _report_waiters[report_id] = waiter
+  _t0 = time.time()
+  deadline = time.monotonic() + (REPORT_DATA_TIMEOUT_S if timeout_s is None else timeout_s)
+  poll_s = REPORT_DATA_POLL_MS / 1000
+  reads = 0
+  try:
+    while True:
+      row = (supabase.table('student_reports')
+             .select('kf_avg_data')
+             .eq('id', report_id)
+             .single()
+             .execute())
+      reads += 1
+      data = row.data.get('kf_avg_data') if row.data else None
+      if data is not None:
+        break
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        break
+      if waiter[0].wait(min(poll_s, remaining)):
+        data = waiter[1]
+        break
+      poll_s = min(poll_s * 2, REPORT_DATA_MAX_POLL_MS / 1000)
+  finally:
+    with _report_waiters_lock:
+      if _report_waiters.get(report_id) is waiter:
+        del _report_waiters[report_id]
+  print(f'[TIMING] [{report_id}] kf_avg_data wait: {time.time()-_t0:.3f}s, {reads} reads'
+        f'{", pushed by realtime" if waiter[0].is_set() else ""}')
+  return data
@@ -0,0 +1,146 @@
+"""AI-written report summaries from a student's averaged key-function scores.
+
+``generate_report_summary`` asks Gemini for per-key-function feedback as JSON,
+retrying rate-limited and unavailable calls and falling back to an older model
+when one keeps failing.
+"""
+
+import json
+import re
+import time
+
+from lazy_imports import genai, genai_types
+
+
+_GEMINI_MODELS = ('gemini-2.5-flash', 'gemini-2.0-flash')
+_RATE_LIMIT_SIGNALS = ('429', 'RESOURCE_EXHAUSTED')
+_UNAVAILABLE_SIGNALS = ('503', 'UNAVAILABLE')
+_AUTH_SIGNALS = ('401', 'API_KEY', 'UNAUTHENTICATED')
+
+
+def _build_report_query(datastr: str) -> str:
+  # The prompt is sent exactly as written, so its long lines are not wrapped.
+  # pylint: disable=line-too-long
+  return f"""
+  You are a clinical clerkship evaluator. A student was assessed on AAMC Core EPAs (13 EPAs, each with key functions). Development levels: 0=remedial, 1=early-developing, 2=developing, 3=entrustable.
+
+  Student scores by key function (averages across rotation):
+  {datastr}
+
+  For each key function, write a structured response with exactly two sections:
+  1. **Performance:** 1-2 sentences explaining the student's performance level and how they have progressed throughout the rotation based on the score.
+  2. **Actionable Items:** 1-2 specific, practical steps the student can take to improve in this area, grounded in the score data.
+
+  Return a JSON object where keys are the KF IDs (e.g. "1.1", "1.2") and values are Markdown strings using this exact format:
+  **Performance:** <text>
+
+  **Actionable Items:** <text>
+  """
+
+
+def _parse_gemini_text(raw: str) -> str | None:
+  """Strip markdown fences, extract the outermost JSON object, and validate it."""
+  text = raw.strip()
+  if text.startswith('```'):
+    text = re.sub(r'^```[a-zA-Z]*\n?', '', text)
+    text = re.sub(r'\n?```$', '', text.strip()).strip()
+  match = re.search(r'\{.*\}', text, re.DOTALL)
+  if match:
+    text = match.group(0)
+  try:
+    return json.dumps(json.loads(text))
+  except json.JSONDecodeError:
+    return None
+
+
+def _handle_gemini_error(e: Exception, model: str, attempt: int) -> None:
+  """Sleep-and-retry for rate-limit / 503 errors; re-raise everything else."""
+  err = str(e)
+  if any(sig in err for sig in _RATE_LIMIT_SIGNALS):
+    wait = 15 * (attempt + 1)
+    print(f'Gemini rate limited ({model}), retrying in {wait}s... (attempt {attempt+1}/3)',
+          flush=True)
+    time.sleep(wait)
+    return
+  if any(sig in err for sig in _UNAVAILABLE_SIGNALS) or 'high demand' in err.lower():
+    wait = 3 * (attempt + 1)
+    print(f'Gemini unavailable (503) on {model}, retrying in {wait}s... '
+          f'(attempt {attempt+1}/3)', flush=True)
+    time.sleep(wait)
+    return
+  raise e
+
+
+def _try_gemini_model(
+  gemini: genai.Client,
+  model: str,
+  query: str,
+  config: genai_types.GenerateContentConfig,
+) -> str | None:
+  """Attempt up to 3 calls on a single model. Returns a JSON string or None on failure."""
+  for attempt in range(3):
+    try:
+      _t = time.time()
+      response: genai_types.GenerateContentResponse = gemini.models.generate_content(
+        model=model, contents=query, config=config,
+      )
+      print(f'[TIMING] Gemini API call ({model}, attempt {attempt+1}): {time.time()-_t:.3f}s',
+            flush=True)
+      if not response.text:
+        print(f'Gemini returned empty response on {model} attempt {attempt+1}, retrying...',
+              flush=True)
+        continue
+      result = _parse_gemini_text(response.text)
+      if result is not None:
+        return result
+      print(f'Gemini returned invalid JSON on {model} attempt {attempt+1}, retrying...', flush=True)
+    except Exception as e:
+      _handle_gemini_error(e, model, attempt)
+  return None
+
+
+def generate_report_summary(data: dict[str, float], gemini: genai.Client) -> str:
+  """
+  Generate a JSON summary of student performance from key-function averages.
+
+  Args:
+    data: Mapping of key-function IDs to average scores.
+    gemini: Authenticated Gemini client used to generate the summary.
+
+  Returns:
+    A JSON-formatted string suitable for storage in PostgreSQL ``jsonb``.
+  """
+  query = _build_report_query('\n'.join(f'{k}: {v}' for k, v in data.items()))
+  config = genai_types.GenerateContentConfig(response_mime_type='application/json')
+
+  _t0 = time.time()
+  for model in _GEMINI_MODELS:
+    print(f'Trying Gemini model: {model}', flush=True)
+    try:
+      result = _try_gemini_model(gemini, model, query, config)
+    except Exception as e:
+      print(f'Gemini model {model} failed with non-retryable error: {e}', flush=True)
+      continue
+    if result is not None:
+      print(f'[TIMING] Gemini total ({model} success): {time.time()-_t0:.3f}s', flush=True)
+      return result
+    print(f'{model} failed after 3 attempts, falling back to next model...', flush=True)
+
+  print(f'[TIMING] Gemini total (all attempts failed): {time.time()-_t0:.3f}s', flush=True)
+  return 'Error generating feedback: all models failed.'
+
+
+def report_error_message(e: Exception) -> str:
+  """Return the message shown on a report whose summary failed with ``e``."""
+  err = str(e)
+  if any(sig in err for sig in _UNAVAILABLE_SIGNALS) or 'high demand' in err.lower():
+    return ('AI feedback is temporarily unavailable due to high demand. '
+            'Please regenerate the report in a few minutes.')
+  if any(sig in err for sig in _RATE_LIMIT_SIGNALS):
+    return ('AI feedback could not be generated because the usage limit was reached. '
+            'Please try again later.')
+  if any(sig in err for sig in _AUTH_SIGNALS):
+    return ('AI feedback could not be generated due to an authentication error. '
+            'Please contact support.')
+  return ('AI feedback could not be generated. '
+          'Please regenerate the report or contact support if the problem persists.')
@@ -0,0 +1,357 @@
+"""Offline re-scoring of historical form responses with the models on disk.
+
+Usage:
+    python rescore.py [--page-size 500] [--batch-size 64] [--workers 4] [--limit 10000]
+                      [--resume] [--force] [--dry-run] [--show 10] [--checkpoint PATH]
+
+Run it after the SVMs are retrained or the DeBERTa checkpoint is replaced. The
+models are synced and loaded exactly as the listener loads them, and
+``form_responses`` is streamed in ``response_id`` order with keyset pages
+(``catch_up.response_page``); the next page is fetched while the current one is
+scored. Each page is flattened with ``response_scoring.flatten_response`` and cut
+into batches that go through one DeBERTa pass and one vectorized SVM pass each.
+With ``--workers N`` the batches are scored in parallel by an ``InferencePool``
+of N worker processes sharing the model weights. DeBERTa logits go through the
+persistent logit store, so a run after an SVM-only retrain reuses the logits
+already computed for every unchanged text.
+
+Rows are upserted to ``form_results`` in bulk by a ``ResultWriter``, while the
+next page is scored. Once a page's rows are written, its last ``response_id``
+and the model version are saved to the checkpoint file; ``--resume`` continues
+from there, unless the checkpoint was written for other models. Responses whose
+result already carries the current model version are skipped unless
+``--force`` is given, so an interrupted run can also simply be started again.
+That needs the ``model_version`` column, so it only applies with
+RECORD_MODEL_VERSION on; otherwise every response is re-scored.
+``--dry-run`` writes nothing and instead reports how many responses would change
+result and which key functions move, with ``--show`` examples. Progress lines
+give responses scanned and written and the rows/second rate.
+"""
+
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+import supabase as spb
+
+# Before the local imports, whose flags are read from the environment.
+load_dotenv()
+
+# pylint: disable=wrong-import-position
+from catch_up import response_page
+from inference import deberta_infer_many, svm_infer_many
+from model_reload import ModelSet
+from response_scoring import (RECORD_MODEL_VERSION, TWO_PHASE_SCORING, flatten_response, get_env,
+                              result_row, weighted_average)
+from result_writer import RESULT_WRITE_ATTEMPTS, ResultWriter
+from startup import (DEBERTA_MODEL_PATH, LOGIT_STORE_PATH, StartupTimeline, prepare_deberta,
+                     prepare_svm)
+from worker_pool import InferencePool
+# pylint: enable=wrong-import-position
+
+DEFAULT_CHECKPOINT_PATH = str(DEBERTA_MODEL_PATH.parent / 'rescore-checkpoint.json')
+# Response ids per ``in`` filter when existing results are looked up, keeping request URLs short.
+LOOKUP_CHUNK = 200
+
+
+class RescoreStats:
+  """Counters for one re-scoring run, and the rows/second rate since it started."""
+
+  def __init__(self):
+    self.started = time.time()
+    self.scanned = 0
+    self.scored = 0
+    self.current = 0
+    self.unreadable = 0
+    self.written = 0
+    # Dry run only: responses with no result yet, with a different result, and with the same one.
+    self.new = 0
+    self.changed = 0
+    self.unchanged = 0
+    self.kf_changes: Counter = Counter()
+    self.examples: list[tuple[str, dict]] = []
+
+  def rate(self) -> float:
+    """Return responses scanned per second so far."""
+    return self.scanned / max(time.time() - self.started, 1e-9)
+
+  def __str__(self) -> str:
+    return (f'{self.scanned} scanned, {self.scored} scored, {self.current} already current, '
+            f'{self.unreadable} unreadable, {self.written} written | {self.rate():.1f} rows/s '
+            f'over {time.time() - self.started:.1f}s')
+
+
+def read_checkpoint(path: str) -> dict | None:
+  """Return the saved checkpoint, or None if there is none or it cannot be read."""
+  try:
+    with open(path, encoding='utf-8') as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return None
+
+
+def write_checkpoint(path: str, state: dict) -> None:
+  """Replace the checkpoint file with ``state`` atomically."""
+  os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+  tmp = f'{path}.tmp'
+  with open(tmp, 'w', encoding='utf-8') as f:
+    json.dump(state, f)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp, path)
+
+
+def existing_results(supabase, response_ids: list[str],
+                     chunk: int = LOOKUP_CHUNK) -> dict[str, dict]:
+  """Return the current form_results rows of ``response_ids``, keyed by response_id."""
+  columns = 'response_id, results' + (', model_version' if RECORD_MODEL_VERSION else '')
+  found = {}
+  for start in range(0, len(response_ids), chunk):
+    rows = (supabase.table('form_results').select(columns)
+            .in_('response_id', response_ids[start:start + chunk]).execute().data or [])
+    found.update((row['response_id'], row) for row in rows)
+  return found
+
+
+def diff_results(old: dict | None, new: dict, tolerance: float = 1e-9) -> dict[str, tuple]:
+  """Return ``{kf: (old, new)}`` for every key function whose result differs between two dicts."""
+  old = old or {}
+  return {kf: (old.get(kf), new.get(kf)) for kf in sorted(set(old) | set(new))
+          if old.get(kf) is None or new.get(kf) is None or abs(old[kf] - new[kf]) > tolerance}
+
+
+def score_records(records: list[dict], infer, batch_size: int, executor: ThreadPoolExecutor,
+                  stats: RescoreStats) -> list[tuple[str, dict]]:
+  """
+  Score form response records in batches, returning ``(response_id, results)`` in record order.
+
+  Args:
+    records: ``{'response_id', 'response'}`` rows from form_responses.
+    infer: Called with a batch's DeBERTa and SVM inputs; returns the
+      ``deberta_infer_many`` and ``svm_infer_many`` results.
+    batch_size: Responses per ``infer`` call.
+    executor: Runs the batches; with more than one thread they are scored in parallel.
+    stats: Counts records whose payload cannot be read; they are skipped.
+  """
+  ids, inputs = [], []
+  for record in records:
+    try:
+      inputs.append(flatten_response(record['response']['response']))
+      ids.append(record['response_id'])
+    except Exception as e:
+      stats.unreadable += 1
+      print(f'[{record.get("response_id")}] Skipping unreadable form response: {e}')
+  batches = [inputs[start:start + batch_size] for start in range(0, len(inputs), batch_size)]
+  scored = []
+  for deberta_results, svm_results in executor.map(
+      lambda batch: infer([d for d, _ in batch], [s for _, s in batch]), batches):
+    scored += [{k: weighted_average(deberta=v, svm=svms_res[k]) for k, v in deberta_res.items()}
+               for deberta_res, svms_res in zip(deberta_results, svm_results)]
+  return list(zip(ids, scored))
+
+
+def record_diff(stats: RescoreStats, response_id: str, old: dict | None, res: dict,
+                show: int) -> None:
+  """Count how a dry-run result compares with the stored one, keeping up to ``show`` examples."""
+  if old is None:
+    stats.new += 1
+    return
+  changes = diff_results(old.get('results'), res)
+  if not changes:
+    stats.unchanged += 1
+    return
+  stats.changed += 1
+  stats.kf_changes.update(changes.keys())
+  if len(stats.examples) < show:
+    stats.examples.append((response_id, changes))
+
+
+def drain(writer: ResultWriter, attempts: int = RESULT_WRITE_ATTEMPTS) -> bool:
+  """Flush ``writer`` until nothing is buffered, backing off between tries; False if rows remain."""
+  for attempt in range(attempts):
+    writer.flush()
+    if not writer.pending():
+      return True
+    time.sleep(min(60.0, 2.0 ** attempt))
+  return False
+
+
+def rescore(supabase, infer, model_version: str, args: argparse.Namespace,
+            writer: ResultWriter | None = None) -> RescoreStats:
+  """
+  Stream form_responses from the checkpoint on, score them, and write or diff their results.
+
+  Args:
+    supabase: Supabase client.
+    infer: Batch scorer, as for ``score_records``.
+    model_version: With RECORD_MODEL_VERSION on, recorded on every row written, and rows
+      already at this version are skipped unless ``args.force``.
+    args: The parsed command line. Batches are scored on ``max(1, args.workers)`` threads.
+    writer: Upserts the rows; required unless ``args.dry_run``.
+
+  Returns:
+    The run's counters.
+
+  Raises:
+    RuntimeError: If a page's rows could not be written. The checkpoint still
+      points at the last page that was.
+  """
+  stats = RescoreStats()
+  cursor = None
+  checkpoint = read_checkpoint(args.checkpoint) if args.resume else None
+  if checkpoint is not None and checkpoint.get('model_version') != model_version:
+    print(f'Checkpoint {args.checkpoint} was written for {checkpoint.get("model_version")}, '
+          f'not {model_version}; starting from the beginning.')
+  elif checkpoint is not None:
+    cursor = checkpoint['cursor']
+    print(f'Resuming after response {cursor} '
+          f'({checkpoint.get("scanned", 0)} responses done before).')
+  done_before = checkpoint.get('scanned', 0) if cursor is not None else 0
+
+  def commit(rows: list[dict], state: dict) -> None:
+    writer.add(rows)
+    if not drain(writer):
+      raise RuntimeError(f'{writer.pending()} form_results rows could not be written; '
+                         f'rerun with --resume to continue after response {state["cursor"]}.')
+    stats.written += len(rows)
+    write_checkpoint(args.checkpoint, state)
+
+  # One thread fetches the next page while this one scores; another writes the previous page.
+  with ThreadPoolExecutor(max(1, args.workers), thread_name_prefix='rescore') as executor, \
+       ThreadPoolExecutor(1, thread_name_prefix='rescore-fetch') as fetch, \
+       ThreadPoolExecutor(1, thread_name_prefix='rescore-write') as write:
+    page = fetch.submit(response_page, supabase, cursor, args.page_size)
+    committed = None
+    while page is not None:
+      records, next_cursor = page.result()
+      if args.limit is not None and stats.scanned + len(records) >= args.limit:
+        records, next_cursor = records[:args.limit - stats.scanned], None
+      page = (fetch.submit(response_page, supabase, next_cursor, args.page_size)
+              if next_cursor else None)
+      if not records:
+        break
+      stats.scanned += len(records)
+      last_id = records[-1]['response_id']
+
+      # Without the model_version column nothing is known to be current, so all are re-scored.
+      skip_current = RECORD_MODEL_VERSION and not args.force
+      existing = {}
+      if args.dry_run or skip_current:
+        existing = existing_results(supabase, [r['response_id'] for r in records])
+      if skip_current:
+        fresh = [r for r in records
+                 if existing.get(r['response_id'], {}).get('model_version') != model_version]
+        stats.current += len(records) - len(fresh)
+        records = fresh
+
+      scored = score_records(records, infer, args.batch_size, executor, stats)
+      stats.scored += len(scored)
+      if args.dry_run:
+        for response_id, res in scored:
+          record_diff(stats, response_id, existing.get(response_id), res, args.show)
+      else:
+        provisional = False if TWO_PHASE_SCORING else None
+        rows = [result_row(response_id, res, model_version, provisional=provisional)
+                for response_id, res in scored]
+        state = {'cursor': last_id, 'model_version': model_version,
+                 'scanned': done_before + stats.scanned, 'updated_at': time.time()}
+        if committed is not None:
+          committed.result()
+        committed = write.submit(commit, rows, state)
+      print(f'[RESCORE] {stats} | through {last_id}')
+    if committed is not None:
+      committed.result()
+  return stats
+
+
+def _format_score(value: float | None) -> str:
+  """Format a key-function result for the dry-run summary, or '-' if there is none."""
+  return '-' if value is None else f'{value:.2f}'
+
+
+def run(args: argparse.Namespace) -> int:
+  """Load the models, re-score form_responses, and print the summary; returns the exit code."""
+  supabase_url = get_env('SUPABASE_URL')
+  supabase_key = get_env('SUPABASE_SERVICE_ROLE_KEY', 'SUPABASE_KEY')
+  if not supabase_url or not supabase_key:
+    print('SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY (or SUPABASE_KEY) must be set.')
+    return 1
+  supabase = spb.create_client(supabase_url, supabase_key)
+
+  timeline = StartupTimeline(time.time())
+  deberta_model, logit_cache = prepare_deberta(timeline)
+  svm_models, svm_version = prepare_svm(supabase, timeline)
+  models = ModelSet(deberta_model, logit_cache, svm_models, svm_version)
+  pool = None
+  if args.workers > 0:
+    pool = InferencePool(models.deberta, models.svm, logit_cache.model_version,
+                         workers=args.workers, store_path=LOGIT_STORE_PATH, warm_up=False)
+    pool.wait_ready(timeout_s=600)
+    infer = pool.infer_many
+  else:
+    infer = lambda d, s: (deberta_infer_many(models.deberta, d, cache=models.logit_cache),
+                          svm_infer_many(models.svm, s))
+  print(f'Re-scoring form_responses with {models.version} '
+        f'({f"{args.workers} inference workers" if pool else "in this process"}'
+        f'{", dry run" if args.dry_run else ""}).')
+
+  # Rows are only flushed by drain(), so the checkpoint never runs ahead of what was written.
+  writer = (None if args.dry_run
+            else ResultWriter(supabase, max_rows=sys.maxsize, max_delay_s=3600.0))
+  try:
+    stats = rescore(supabase, infer, models.version, args, writer)
+  except RuntimeError as e:
+    print(e)
+    return 1
+  finally:
+    if writer is not None:
+      writer.close()
+    if pool is not None:
+      pool.close()
+
+  print(f'\n{"=" * 75}')
+  print(f'  RE-SCORE {"DRY RUN " if args.dry_run else ""}({models.version})')
+  print(f'{"=" * 75}')
+  print(f'  {stats}')
+  if args.dry_run:
+    print(f'  {stats.changed} would change, {stats.unchanged} unchanged, '
+          f'{stats.new} without results yet')
+    for kf, n in stats.kf_changes.most_common():
+      print(f'    {kf:<12} {n} responses')
+    for response_id, changes in stats.examples:
+      moves = ', '.join(f'{kf} {_format_score(old)} → {_format_score(new)}'
+                        for kf, (old, new) in changes.items())
+      print(f'  [{response_id}] {moves}')
+  else:
+    print(f'  {writer}')
+  print(f'{"=" * 75}\n')
+  return 1 if writer is not None and writer.dropped else 0
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(
+    description='Re-score historical form responses with the current models')
+  parser.add_argument('--page-size', type=int, default=500,
+                      help='Responses fetched per keyset page (default: 500)')
+  parser.add_argument('--batch-size', type=int, default=64,
+                      help='Responses per inference batch (default: 64)')
+  parser.add_argument('--workers', type=int, default=(os.cpu_count() or 1) // 2,
+                      help='Inference worker processes; 0 scores in this process '
+                           '(default: half the cores)')
+  parser.add_argument('--limit', type=int, default=None, help='Stop after this many responses')
+  parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT_PATH,
+                      help='File recording the last response written (default: next to the models)')
+  parser.add_argument('--resume', action='store_true',
+                      help='Continue after the response in the checkpoint')
+  parser.add_argument('--force', action='store_true',
+                      help='Also re-score responses already at the current version')
+  parser.add_argument('--dry-run', action='store_true',
+                      help='Write nothing; report how results would change')
+  parser.add_argument('--show', type=int, default=10,
+                      help='Changed responses listed by a dry run (default: 10)')
+  sys.exit(run(parser.parse_args()))
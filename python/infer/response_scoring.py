@@ -0,0 +1,56 @@
+"""Form response scoring helpers shared by the listener and the offline re-scorer.
+
+Importing this module has no side effects: it reads its flags from the
+environment and nothing else, so ``rescore.py`` can use it without pulling in
+the listener's logging and Realtime setup.
+"""
+
+import os
+
+# Set RECORD_MODEL_VERSION=1 to store the model version on every form_results row. It needs the
+# nullable text column form_results.model_version (see the README), so it stays off until that
+# column has been added.
+RECORD_MODEL_VERSION = os.environ.get('RECORD_MODEL_VERSION', '0').lower() not in ('0', 'false', '')
+# Set TWO_PHASE_SCORING=1 to write an SVM-only provisional result first and the weighted DeBERTa
+# result after it. The rows then carry ``provisional``, so form_results needs that nullable boolean
+# column first (see the README).
+TWO_PHASE_SCORING = os.environ.get('TWO_PHASE_SCORING', '0').lower() not in ('0', 'false', '')
+
+
+def get_env(*names: str) -> str:
+  """Return the first non-empty environment variable from the provided aliases."""
+  for name in names:
+    value = os.environ.get(name, '')
+    if value:
+      return value
+  return ''
+
+
+def flatten_response(response: dict) -> tuple[dict[str, list[str]], dict[str, list]]:
+  """Split a form response into DeBERTa text and SVM feature inputs, both keyed by key function."""
+  ds = [kf for kf in response.values()]
+  deberta_inputs = {k: v['text'] for d in ds for k, v in d.items()}
+  svm_inputs = {k: [vv for kk, vv in v.items() if kk != 'text'] for d in ds for k, v in d.items()}
+  return deberta_inputs, svm_inputs
+
+
+def weighted_average(deberta: float, svm: float) -> float:
+  """Combine DeBERTa and SVM outputs using the project weighting rule."""
+  return deberta * 0.25 + svm * 0.75
+
+
+def result_row(response_id: str, res: dict, model_version: str,
+               provisional: bool | None = None) -> dict:
+  """
+  Build a form_results row.
+
+  ``model_version`` is only recorded with RECORD_MODEL_VERSION on, and
+  ``provisional`` only in two-phase mode: True on the SVM-only row, False on the
+  final weighted row that replaces it. Each needs its own column in form_results.
+  """
+  row = {'response_id': response_id, 'results': res}
+  if RECORD_MODEL_VERSION:
+    row['model_version'] = model_version or None
+  if provisional is not None:
+    row['provisional'] = provisional
+  return row
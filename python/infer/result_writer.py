@@ -0,0 +1,240 @@
+"""Write-behind buffer for form_results rows.
+
+Scoring threads hand their result rows to ``ResultWriter.add`` and go straight
+back to inference. A flusher thread writes the buffered rows to Supabase as one
+bulk upsert once ``RESULT_FLUSH_ROWS`` rows have collected or the oldest has
+waited ``RESULT_FLUSH_MS``. If a bulk upsert fails, its rows are retried one by
+one, so one bad row cannot hold back the others. Rows that still fail are kept
+for the next flush, up to ``RESULT_WRITE_ATTEMPTS`` tries. If no row in a flush
+could be written, Supabase is treated as unavailable. No row is charged an
+attempt, and flushes back off exponentially up to a minute.
+
+Every buffered row is first appended to a JSON-lines spill file and fsynced.
+After each flush the file is rewritten to hold only the rows still pending. A
+writer opened on an existing spill file re-queues its rows, so results scored
+just before a crash are written after the restart.
+"""
+
+from collections import deque
+import json
+import logging
+import os
+import threading
+import time
+
+RESULT_FLUSH_ROWS = int(os.environ.get('RESULT_FLUSH_ROWS', '50'))
+RESULT_FLUSH_MS = int(os.environ.get('RESULT_FLUSH_MS', '200'))
+RESULT_WRITE_ATTEMPTS = int(os.environ.get('RESULT_WRITE_ATTEMPTS', '5'))
+
+app_log = logging.getLogger('app')
+error_log = logging.getLogger('error')
+
+
+class ResultWriter:
+  """
+  Buffer form_results rows and upsert them in bulk from a background thread.
+
+  Args:
+    supabase: Authenticated Supabase client.
+    max_rows: Buffered rows that trigger a flush.
+    max_delay_s: Longest a row waits before it is flushed.
+    spill_path: JSON-lines file that holds unwritten rows across crashes; empty disables it.
+    max_attempts: Flushes a row may fail, while other rows succeed, before it is dropped and
+      logged.
+  """
+
+  def __init__(
+      self,
+      supabase,
+      max_rows: int = RESULT_FLUSH_ROWS,
+      max_delay_s: float = RESULT_FLUSH_MS / 1000,
+      spill_path: str = '',
+      max_attempts: int = RESULT_WRITE_ATTEMPTS,
+  ):
+    self.supabase = supabase
+    self.max_rows = max_rows
+    self.max_delay_s = max_delay_s
+    self.spill_path = spill_path
+    self.max_attempts = max_attempts
+    self.flushes = 0
+    self.rows_written = 0
+    self.retried = 0
+    self.dropped = 0
+    self.largest_flush = 0
+    # Rows and seconds of the most recent flushes.
+    self.batch_sizes: deque = deque(maxlen=1000)
+    self.latencies: deque = deque(maxlen=1000)
+    # Pending [row, failed attempts] pairs, oldest first.
+    self._pending: list[list] = []
+    self._first_at: float | None = None
+    # After a flush in which nothing could be written, no flush starts before _retry_at.
+    self._backoff_s = 0.0
+    self._retry_at = 0.0
+    self._cond = threading.Condition()
+    self._flush_lock = threading.Lock()
+    self._closed = False
+    self._spill = None
+    if spill_path:
+      self._recover()
+    self._thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+    self._thread.start()
+
+  def _recover(self) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+    if os.path.exists(self.spill_path):
+      with open(self.spill_path, encoding='utf-8') as f:
+        for line in f:
+          try:
+            self._pending.append([json.loads(line), 0])
+          except ValueError:
+            # A crash can leave the last line half-written; that row was never acknowledged.
+            continue
+      if self._pending:
+        self._first_at = time.monotonic()
+        app_log.info(f'Recovered {len(self._pending)} unwritten form_results rows '
+                     f'from {self.spill_path}.')
+    self._spill = open(self.spill_path, 'a', encoding='utf-8')
+
+  def add(self, rows: list[dict]) -> None:
+    """Buffer ``rows`` for the next flush, spilling them to disk first. Safe from any thread."""
+    if not rows:
+      return
+    with self._cond:
+      if self._closed:
+        raise RuntimeError('Result writer is closed.')
+      if self._spill is not None:
+        self._spill.write(''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows))
+        self._spill.flush()
+        os.fsync(self._spill.fileno())
+      self._pending.extend([row, 0] for row in rows)
+      if self._first_at is None:
+        self._first_at = time.monotonic()
+      if len(self._pending) >= self.max_rows:
+        self._cond.notify()
+
+  def pending(self) -> int:
+    """Return the number of rows waiting to be written."""
+    with self._cond:
+      return len(self._pending)
+
+  def _run(self) -> None:
+    while True:
+      with self._cond:
+        while not self._closed:
+          if self._pending:
+            now = time.monotonic()
+            wait = max(self._first_at + self.max_delay_s, self._retry_at) - now
+            if wait <= 0 or (len(self._pending) >= self.max_rows and now >= self._retry_at):
+              break
+          else:
+            wait = None
+          self._cond.wait(wait)
+        closed = self._closed
+      self.flush()
+      if closed:
+        # Rows that failed this last flush stay in the spill file and are retried after the restart.
+        return
+
+  def flush(self) -> None:
+    """Write every buffered row now, on the calling thread."""
+    with self._flush_lock:
+      with self._cond:
+        batch, self._pending, self._first_at = self._pending, [], None
+      if not batch:
+        return
+      _t0 = time.time()
+      # A provisional then a final row for one response in the same flush collapse to the latest.
+      latest: dict = {}
+      for entry in batch:
+        latest.pop(entry[0]['response_id'], None)
+        latest[entry[0]['response_id']] = entry
+      # PostgREST bulk writes need every row to have the same columns.
+      groups: dict[tuple, list[list]] = {}
+      for entry in latest.values():
+        groups.setdefault(tuple(sorted(entry[0])), []).append(entry)
+      failed = []
+      for entries in groups.values():
+        failed += self._upsert(entries)
+
+      elapsed = time.time() - _t0
+      written = len(latest) - len(failed)
+      self.flushes += 1
+      self.rows_written += written
+      self.largest_flush = max(self.largest_flush, len(latest))
+      self.batch_sizes.append(len(latest))
+      self.latencies.append(elapsed)
+      print(f'[TIMING] form_results flush: {written}/{len(latest)} rows in {elapsed:.3f}s')
+
+      # If nothing was written Supabase is likely down, so no row is blamed and flushes back off.
+      outage = bool(failed) and not written
+      self._backoff_s = min(60.0, max(1.0, self._backoff_s * 2)) if outage else 0.0
+      self._retry_at = time.monotonic() + self._backoff_s
+      retry = []
+      for entry in failed:
+        entry[1] += 0 if outage else 1
+        if entry[1] >= self.max_attempts:
+          self.dropped += 1
+          error_log.error(f'[{entry[0]["response_id"]}] Giving up on form_results row after '
+                          f'{entry[1]} attempts: {json.dumps(entry[0])}')
+        else:
+          retry.append(entry)
+      with self._cond:
+        self._pending[:0] = retry
+        if self._pending and self._first_at is None:
+          self._first_at = time.monotonic()
+        self._rewrite_spill()
+
+  def _upsert(self, entries: list[list]) -> list[list]:
+    """Upsert rows in one request, falling back to one request per row; returns the failed ones."""
+    table = self.supabase.table('form_results')
+    try:
+      table.upsert([entry[0] for entry in entries], on_conflict='response_id').execute()
+      return []
+    except Exception as e:
+      error_log.error(f'Bulk upsert of {len(entries)} form_results rows failed, '
+                      f'retrying one by one: {e}')
+    failed = []
+    for entry in entries:
+      self.retried += 1
+      try:
+        table.upsert(entry[0], on_conflict='response_id').execute()
+      except Exception as e:
+        error_log.error(f'[{entry[0]["response_id"]}] form_results upsert failed: {e}')
+        failed.append(entry)
+    return failed
+
+  def _rewrite_spill(self) -> None:
+    """Replace the spill file with the rows still pending. Called with ``_cond`` held."""
+    if self._spill is None:
+      return
+    tmp = f'{self.spill_path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+      f.write(''.join(json.dumps(entry[0], separators=(',', ':')) + '\n'
+                      for entry in self._pending))
+      f.flush()
+      os.fsync(f.fileno())
+    self._spill.close()
+    os.replace(tmp, self.spill_path)
+    self._spill = open(self.spill_path, 'a', encoding='utf-8')
+
+  def close(self, timeout_s: float | None = None) -> None:
+    """Flush the remaining rows and stop the flusher thread."""
+    with self._cond:
+      self._closed = True
+      self._cond.notify()
+    self._thread.join(timeout_s)
+    with self._cond:
+      if self._spill is not None:
+        self._spill.close()
+        self._spill = None
+
+  def __str__(self) -> str:
+    sizes = self.batch_sizes
+    latencies = sorted(self.latencies)
+    pick = lambda q: (latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+                      if latencies else 0.0)
+    mean = sum(sizes) / len(sizes) if sizes else 0.0
+    return (f'form_results writer: {self.flushes} flushes, {self.rows_written} rows '
+            f'(mean {mean:.1f}, largest {self.largest_flush}), '
+            f'flush p50 {pick(0.5) * 1000:.0f} / p95 {pick(0.95) * 1000:.0f} ms, '
+            f'{self.pending()} buffered, {self.retried} retried one by one, {self.dropped} dropped')
@@ -0,0 +1,432 @@
+"""Asyncio scheduling primitives for the Supabase Realtime listener.
+
+Realtime callbacks are plain functions invoked on the event loop that owns the
+websocket, so they must return quickly. The classes here let a callback hand
+its payload off and have the expensive work happen later, grouped or queued.
+
+Both take their work from one or more ``Lane``s, listed highest priority
+first. Each lane has its own size bound, and in a ``WorkQueue`` its own
+concurrency limit. Each lane also records how long its items waited, so queue
+latency is visible per lane. A lane whose oldest item has waited past its
+latency budget counts as overloaded. While it is overloaded, items with the same
+key are coalesced into the latest one.
+
+``Debouncer`` sits in front of them. It holds bursts of items with the same key,
+such as the UPDATEs an autosave fires, until the key goes quiet. Only the merged
+result is passed on.
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import Executor
+from dataclasses import dataclass
+import inspect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Hashable, Sequence
+
+error_log = logging.getLogger('error')
+
+
+@dataclass
+class Lane:
+  """
+  One priority class of queued work.
+
+  Args:
+    name: Lane name, used to submit to it and in stats.
+    maxsize: Items that may wait in the lane; 0 means unbounded.
+    limit: ``WorkQueue`` jobs from this lane that may run at once; 0 means any free worker.
+    latency_budget_s: Queue wait past which the lane is overloaded; 0 means never.
+    key: Returns an item's coalescing key; while overloaded, a new item replaces a queued one with
+      the same key.
+  """
+  name: str
+  maxsize: int = 0
+  limit: int = 0
+  latency_budget_s: float = 0.0
+  key: Callable[[Any], Hashable] | None = None
+
+
+class _LaneState:
+  """A lane's queued items and counters."""
+
+  def __init__(self, lane: Lane):
+    self.lane = lane
+    # (enqueue time, item) pairs, oldest first.
+    self.items: deque = deque()
+    # Queue waits of the most recently taken items, in seconds.
+    self.waits: deque = deque(maxlen=1000)
+    self.running = 0
+    self.dropped = 0
+    self.coalesced = 0
+
+  def full(self) -> bool:
+    return bool(self.lane.maxsize) and len(self.items) >= self.lane.maxsize
+
+  def oldest_wait(self) -> float:
+    return time.monotonic() - self.items[0][0] if self.items else 0.0
+
+  def overloaded(self) -> bool:
+    return bool(self.lane.latency_budget_s) and self.oldest_wait() > self.lane.latency_budget_s
+
+  def add(self, item: Any) -> bool:
+    """Queue ``item``, coalescing it into a queued item with the same key while overloaded."""
+    if self.lane.key is not None and self.overloaded():
+      key = self.lane.key(item)
+      for i, (queued_at, queued) in enumerate(self.items):
+        if self.lane.key(queued) == key:
+          # The newer item takes the older one's place rather than the back of a long queue.
+          self.items[i] = (queued_at, item)
+          self.coalesced += 1
+          return True
+    if self.full():
+      self.dropped += 1
+      return False
+    self.items.append((time.monotonic(), item))
+    return True
+
+  def take(self) -> Any:
+    queued_at, item = self.items.popleft()
+    self.waits.append(time.monotonic() - queued_at)
+    return item
+
+  def latency(self) -> dict[str, float]:
+    """Return the p50/p95 wait of recently taken items and the oldest queued item's, in seconds."""
+    waits = sorted(self.waits)
+    pick = lambda q: waits[min(len(waits) - 1, int(q * len(waits)))] if waits else 0.0
+    return {'p50': pick(0.5), 'p95': pick(0.95), 'oldest': self.oldest_wait()}
+
+  def __str__(self) -> str:
+    latency = self.latency()
+    text = (f'{self.lane.name} {len(self.items)} queued, wait p50 {latency["p50"] * 1000:.0f} / '
+            f'p95 {latency["p95"] * 1000:.0f} / oldest {latency["oldest"] * 1000:.0f} ms')
+    if self.coalesced:
+      text += f', {self.coalesced} coalesced'
+    if self.dropped:
+      text += f', {self.dropped} shed'
+    return text
+
+
+def _lane_states(lanes: Sequence[Lane] | None, maxsize: int) -> dict[str, _LaneState]:
+  lanes = lanes or [Lane('default', maxsize)]
+  return {lane.name: _LaneState(lane) for lane in lanes}
+
+
+class MicroBatcher:
+  """
+  Collect submitted items into small batches and hand each batch to one handler call.
+
+  A batch closes when ``max_batch`` items have arrived or ``window_s`` seconds
+  have passed since its first item, whichever comes first. Items submitted while
+  a batch is being handled wait for the next one. Batches are filled from the
+  highest-priority ``lanes`` first; without lanes there is one lane holding at
+  most ``maxsize`` items (0 means unbounded). Submissions to a full lane are
+  shed and counted.
+  """
+
+  def __init__(
+      self,
+      handle_batch: Callable[[list], Awaitable[None] | None],
+      window_s: float = 0.05,
+      max_batch: int = 32,
+      maxsize: int = 0,
+      lanes: Sequence[Lane] | None = None,
+  ):
+    self.handle_batch = handle_batch
+    self.window_s = window_s
+    self.max_batch = max_batch
+    self.batches = 0
+    self.items = 0
+    self.largest_batch = 0
+    self._lanes = _lane_states(lanes, maxsize)
+    self._arrived = asyncio.Event()
+
+  @property
+  def dropped(self) -> int:
+    """Items shed because their lane was full."""
+    return sum(state.dropped for state in self._lanes.values())
+
+  @property
+  def coalesced(self) -> int:
+    """Items merged into a queued item with the same key."""
+    return sum(state.coalesced for state in self._lanes.values())
+
+  def submit(self, item: Any, lane: str | None = None) -> bool:
+    """
+    Queue an item for the next batch. Safe to call from a synchronous callback on the loop.
+
+    Args:
+      item: The item to queue.
+      lane: Lane to queue it in; defaults to the highest-priority lane.
+
+    Returns:
+      True if the item was queued or coalesced, False if its lane was full and the item was shed.
+    """
+    state = self._lanes[lane] if lane is not None else next(iter(self._lanes.values()))
+    if not state.add(item):
+      return False
+    self._arrived.set()
+    return True
+
+  def pending(self, lane: str | None = None) -> int:
+    """Return the number of items waiting for a batch, in one lane or in all of them."""
+    if lane is not None:
+      return len(self._lanes[lane].items)
+    return sum(len(state.items) for state in self._lanes.values())
+
+  def overloaded(self) -> bool:
+    """Return True if any lane's oldest item has waited past that lane's latency budget."""
+    return any(state.overloaded() for state in self._lanes.values())
+
+  def latency(self) -> dict[str, dict[str, float]]:
+    """Return each lane's recent p50/p95 and oldest queue wait, in seconds."""
+    return {name: state.latency() for name, state in self._lanes.items()}
+
+  async def next_batch(self) -> list:
+    """Wait for the first item, then gather more until the window closes or the batch is full."""
+    while not self.pending():
+      self._arrived.clear()
+      await self._arrived.wait()
+    deadline = time.monotonic() + self.window_s
+    while self.pending() < self.max_batch:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        break
+      self._arrived.clear()
+      try:
+        await asyncio.wait_for(self._arrived.wait(), remaining)
+      except asyncio.TimeoutError:
+        break
+    batch = []
+    for state in self._lanes.values():
+      while state.items and len(batch) < self.max_batch:
+        batch.append(state.take())
+    return batch
+
+  async def run(self) -> None:
+    """Form and handle batches forever. Handler errors are logged and never stop the loop."""
+    while True:
+      batch = await self.next_batch()
+      self.batches += 1
+      self.items += len(batch)
+      self.largest_batch = max(self.largest_batch, len(batch))
+      try:
+        result = self.handle_batch(batch)
+        if inspect.isawaitable(result):
+          await result
+      except Exception as e:
+        error_log.exception(f'Error handling batch of {len(batch)} items: {e}')
+
+  def __str__(self) -> str:
+    mean = self.items / self.batches if self.batches else 0.0
+    text = (f'{self.batches} batches, {self.items} items '
+            f'(mean {mean:.1f}, largest {self.largest_batch}), {self.pending()} pending, '
+            f'{self.dropped} shed')
+    return f'{text}; ' + ', '.join(str(state) for state in self._lanes.values())
+
+
+class WorkQueue:
+  """
+  Bounded job queue drained by a fixed number of asyncio workers.
+
+  Each job is a plain function call run on ``executor``, so blocking work
+  (model inference, HTTP calls, sleeps between retries) never runs on the event
+  loop. Separate queues with separate executors keep one kind of slow job from
+  delaying another. Jobs are added with ``submit`` (sheds when full, for
+  synchronous callers) or ``put`` (waits for room, for asyncio producers).
+
+  A free worker takes the next job from the highest-priority lane that is below
+  its concurrency limit. Without ``lanes`` there is one lane of at most
+  ``maxsize`` jobs.
+  """
+
+  def __init__(self, name: str, executor: Executor | None = None, workers: int = 1,
+               maxsize: int = 100, lanes: Sequence[Lane] | None = None):
+    self.name = name
+    self.executor = executor
+    self.workers = workers
+    self.processed = 0
+    self.failed = 0
+    self._lanes = _lane_states(lanes, maxsize)
+    self._unfinished = 0
+    self._runnable = asyncio.Event()
+    self._room = asyncio.Event()
+    self._idle = asyncio.Event()
+    self._idle.set()
+    self._tasks: list[asyncio.Task] = []
+
+  @property
+  def dropped(self) -> int:
+    """Jobs shed because their lane was full."""
+    return sum(state.dropped for state in self._lanes.values())
+
+  def _lane(self, lane: str | None) -> _LaneState:
+    return self._lanes[lane] if lane is not None else next(iter(self._lanes.values()))
+
+  def _queued(self) -> None:
+    self._unfinished += 1
+    self._idle.clear()
+    self._runnable.set()
+
+  def submit(self, fn: Callable, *args, lane: str | None = None) -> bool:
+    """
+    Queue ``fn(*args)`` without waiting. Safe to call from a synchronous callback on the loop.
+
+    Args:
+      fn: The function to run on the executor.
+      *args: Its arguments.
+      lane: Lane to queue it in; defaults to the highest-priority lane.
+
+    Returns:
+      True if the job was queued, False if its lane was full and the job was shed.
+    """
+    if not self._lane(lane).add((fn, args)):
+      return False
+    self._queued()
+    return True
+
+  async def put(self, fn: Callable, *args, lane: str | None = None) -> None:
+    """Queue ``fn(*args)``, waiting for room so the producer slows down to the workers' pace."""
+    state = self._lane(lane)
+    while state.full():
+      self._room.clear()
+      await self._room.wait()
+    state.items.append((time.monotonic(), (fn, args)))
+    self._queued()
+
+  def depth(self, lane: str | None = None) -> int:
+    """Return the number of queued jobs no worker has picked up yet, in one lane or in all."""
+    if lane is not None:
+      return len(self._lanes[lane].items)
+    return sum(len(state.items) for state in self._lanes.values())
+
+  def latency(self) -> dict[str, dict[str, float]]:
+    """Return each lane's recent p50/p95 and oldest queue wait, in seconds."""
+    return {name: state.latency() for name, state in self._lanes.items()}
+
+  def start(self) -> list[asyncio.Task]:
+    """Start the worker tasks on the running loop and return them."""
+    self._tasks = [asyncio.create_task(self._worker(), name=f'{self.name}-{i}')
+                   for i in range(self.workers)]
+    return self._tasks
+
+  async def join(self) -> None:
+    """Wait until every queued job has finished."""
+    await self._idle.wait()
+
+  def _next(self) -> tuple[_LaneState, Callable, tuple] | None:
+    for state in self._lanes.values():
+      if state.items and (not state.lane.limit or state.running < state.lane.limit):
+        fn, args = state.take()
+        self._room.set()
+        return state, fn, args
+    return None
+
+  async def _worker(self) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+      job = self._next()
+      if job is None:
+        self._runnable.clear()
+        await self._runnable.wait()
+        continue
+      state, fn, args = job
+      state.running += 1
+      try:
+        await loop.run_in_executor(self.executor, fn, *args)
+        self.processed += 1
+      except Exception as e:
+        self.failed += 1
+        error_log.exception(f'Error in {self.name} job {getattr(fn, "__name__", fn)}: {e}')
+      finally:
+        state.running -= 1
+        self._unfinished -= 1
+        if not self._unfinished:
+          self._idle.set()
+        # A lane that was at its concurrency limit may have a runnable job again.
+        self._runnable.set()
+
+  def __str__(self) -> str:
+    maxsize = sum(state.lane.maxsize for state in self._lanes.values())
+    text = (f'{self.name}: depth {self.depth()}/{maxsize or "inf"}, {self.processed} done, '
+            f'{self.failed} failed, {self.dropped} shed')
+    return f'{text}; ' + ', '.join(str(state) for state in self._lanes.values())
+
+
+class Debouncer:
+  """
+  Hold each key's items until the key has been quiet for ``quiet_s``, then pass on one merged item.
+
+  Every item submitted for a key that is already waiting is merged into the
+  waiting one with ``merge(old, new)`` (by default the newer item replaces it),
+  and the quiet window restarts. A key that never goes quiet is still flushed
+  ``max_delay_s`` after its first item. ``quiet_s`` of 0 passes every item on at
+  once. Must be used from the event loop thread.
+
+  Args:
+    forward: Receives each merged item; returns False if it was shed downstream.
+    key: Returns an item's key.
+    quiet_s: Quiet window per key, in seconds.
+    max_delay_s: Longest an item may be held, in seconds.
+    merge: Combines a waiting item with a newer one for the same key.
+  """
+
+  def __init__(  # pylint: disable=too-many-arguments
+      self,
+      forward: Callable[[Any], bool | None],
+      *,
+      key: Callable[[Any], Hashable],
+      quiet_s: float,
+      max_delay_s: float,
+      merge: Callable[[Any, Any], Any] | None = None,
+      name: str = 'debouncer',
+  ):
+    self.forward = forward
+    self.key = key
+    self.quiet_s = quiet_s
+    self.max_delay_s = max_delay_s
+    self.merge = merge or (lambda old, new: new)
+    self.name = name
+    self.received = 0
+    self.forwarded = 0
+    self.coalesced = 0
+    # key -> [merged item, monotonic time of its first item, pending timer]
+    self._waiting: dict[Hashable, list] = {}
+
+  def submit(self, item: Any) -> None:
+    """Hold ``item`` until its key goes quiet, merging it into an item already held for that key."""
+    self.received += 1
+    if self.quiet_s <= 0:
+      self._forward(item)
+      return
+    key = self.key(item)
+    now = time.monotonic()
+    waiting = self._waiting.get(key)
+    if waiting is None:
+      waiting = self._waiting[key] = [item, now, None]
+    else:
+      waiting[0] = self.merge(waiting[0], item)
+      waiting[2].cancel()
+      self.coalesced += 1
+    delay = max(0.0, min(self.quiet_s, waiting[1] + self.max_delay_s - now))
+    waiting[2] = asyncio.get_running_loop().call_later(delay, self._flush, key)
+
+  def pending(self) -> int:
+    """Return the number of keys with an item being held."""
+    return len(self._waiting)
+
+  def _flush(self, key: Hashable) -> None:
+    item, _, _ = self._waiting.pop(key)
+    self._forward(item)
+
+  def _forward(self, item: Any) -> None:
+    self.forwarded += 1
+    try:
+      self.forward(item)
+    except Exception as e:
+      error_log.exception(f'Error forwarding a debounced item from {self.name}: {e}')
+
+  def __str__(self) -> str:
+    return (f'{self.name}: {self.received} received, {self.forwarded} passed on, '
+            f'{self.coalesced} coalesced, {self.pending()} held')
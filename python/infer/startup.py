@@ -0,0 +1,244 @@
+"""Model startup for the listener: finding, waiting for, and loading the models.
+
+``prepare_deberta`` and ``prepare_svm`` each take one model from the artifact
+cache, Kaggle or Supabase Storage to loaded and warmed up. The listener runs
+them side by side on their own threads, and ``StartupTimeline`` records how
+long each phase took. ``wait_for_models`` holds a model back until its files
+have been completely copied into the volume.
+"""
+
+import asyncio
+from contextlib import contextmanager
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+
+from artifact_cache import ArtifactCache, damaged_files, read_manifest
+from inference import (LogitCache, deberta_model_version, download_deberta_model,
+                       download_svm_models, load_deberta_model, load_svm_scorer, svm_model_version,
+                       warm_up_deberta, warm_up_svm)
+from logit_store import LogitStore
+from model_watch import wait_for_files
+from svm_engine import SVM_BUNDLE_FILE, SVM_BUNDLE_MANIFEST, file_sha256, read_bundle_manifest
+
+DEBERTA_MODEL_PATH = Path(os.environ.get(
+  'DEBERTA_MODEL_PATH', Path(__file__).resolve().parent / 'models' / 'deberta'))
+SVM_MODELS_PATH = Path(os.environ.get(
+  'SVM_MODELS_PATH', Path(__file__).resolve().parent / 'svm-models'))
+# Content-addressed store of downloaded model files, shared by the DeBERTa and SVM downloads.
+ARTIFACT_CACHE_PATH = Path(os.environ.get(
+  'ARTIFACT_CACHE_PATH', DEBERTA_MODEL_PATH.parent / 'artifact-cache'))
+# Set DEBERTA_LOGIT_STORE_PATH to an empty string to disable the persistent logit store.
+LOGIT_STORE_PATH = os.environ.get(
+  'DEBERTA_LOGIT_STORE_PATH', str(DEBERTA_MODEL_PATH.parent / 'deberta-logits.sqlite3'))
+
+app_log = logging.getLogger('app')
+error_log = logging.getLogger('error')
+
+
+def open_logit_store(model_version: str) -> LogitStore | None:
+  """Open the persistent logit store for ``model_version``; None if disabled or unavailable."""
+  if not LOGIT_STORE_PATH:
+    return None
+  try:
+    store = LogitStore(LOGIT_STORE_PATH, model_version)
+  except Exception as e:
+    error_log.error(f'Could not open logit store at {LOGIT_STORE_PATH}, continuing without it: {e}')
+    return None
+  app_log.info(f'Logit store opened at {LOGIT_STORE_PATH} ({len(store)} rows).')
+  return store
+
+
+# ── Model wait ─────────────────────────────────────────────────────────────────
+
+def svm_models_present() -> bool:
+  """Return True if SVM_MODELS_PATH holds an SVM bundle manifest or at least one pickled model."""
+  if not SVM_MODELS_PATH.exists():
+    return False
+  return any(f == SVM_BUNDLE_MANIFEST or f.endswith('.pkl') for f in os.listdir(SVM_MODELS_PATH))
+
+
+def deberta_files_ready() -> list[Path] | None:
+  """Return the files in DEBERTA_MODEL_PATH once its weights file exists, else None."""
+  if not (DEBERTA_MODEL_PATH / 'model.safetensors').exists():
+    return None
+  return sorted(f for f in DEBERTA_MODEL_PATH.iterdir() if f.is_file())
+
+
+def svm_files_ready() -> list[Path] | None:
+  """
+  Return the SVM files that still need a quiet period, or None while none are usable.
+
+  A bundle whose manifest hash matches is complete by construction, so it needs
+  no quiet period and an empty list is returned.
+  """
+  if not SVM_MODELS_PATH.exists():
+    return None
+  manifest = read_bundle_manifest(str(SVM_MODELS_PATH))
+  if manifest is not None:
+    bundle = SVM_MODELS_PATH / manifest.get('file', SVM_BUNDLE_FILE)
+    if bundle.exists() and file_sha256(str(bundle)) == manifest.get('sha256'):
+      return []
+  pickles = sorted(SVM_MODELS_PATH.glob('*.pkl'))
+  return pickles or None
+
+
+def wait_for_models(timeout_minutes: int = 60, deberta: bool = True, svm: bool = True,
+                    stop: threading.Event | None = None) -> None:
+  """
+  Waits until model files are present on disk and fully written.
+  This allows time to manually copy models into a Railway volume after deploy.
+  The model directories are watched with inotify (or polled where that is unavailable), so a
+  model is picked up as soon as it has been completely copied. Times out after timeout_minutes.
+  Pass deberta=False or svm=False to wait for only one kind of model. Setting stop (e.g. because
+  the other model failed to load) ends the wait with InterruptedError.
+  """
+  checks = ([deberta_files_ready] if deberta else []) + ([svm_files_ready] if svm else [])
+
+  def ready() -> list[Path] | None:
+    files: list[Path] = []
+    for check in checks:
+      found = check()
+      if found is None:
+        return None
+      files += found
+    return files
+
+  watch = ([DEBERTA_MODEL_PATH] if deberta else []) + ([SVM_MODELS_PATH] if svm else [])
+  app_log.info(f'Waiting for model files in {", ".join(map(str, watch))} '
+               f'(timeout: {timeout_minutes} min)...')
+  _t0 = time.time()
+  try:
+    wait_for_files(ready, watch, timeout_s=timeout_minutes * 60, stop=stop)
+  except TimeoutError:
+    msg = (
+      f'Model files not found after {timeout_minutes} minutes. '
+      f'Please copy models into the volume at {DEBERTA_MODEL_PATH} and {SVM_MODELS_PATH}.'
+    )
+    error_log.error(msg)
+    raise TimeoutError(msg) from None
+  app_log.info(f'Model files found in {", ".join(map(str, watch))} after {time.time() - _t0:.1f}s.')
+
+
+# ── Startup ────────────────────────────────────────────────────────────────────
+
+class StartupTimeline:
+  """Record when each startup phase started and finished, relative to ``t0`` (default: now)."""
+
+  def __init__(self, t0: float | None = None):
+    self.t0 = time.time() if t0 is None else t0
+    self.phases: list[tuple[str, float, float]] = []
+    self._lock = threading.Lock()
+
+  @contextmanager
+  def phase(self, name: str):
+    """Time the enclosed block as one phase. Safe to use from several threads at once."""
+    start = time.time()
+    try:
+      yield
+    finally:
+      end = time.time()
+      with self._lock:
+        self.phases.append((name, start - self.t0, end - self.t0))
+      app_log.info(f'[STARTUP] {name}: {end - start:.3f}s (done at +{end - self.t0:.3f}s)')
+
+  def mark(self, name: str) -> None:
+    """Record an instant, such as a milestone reached, as a zero-length phase."""
+    with self.phase(name):
+      pass
+
+  def __str__(self) -> str:
+    rows = sorted(self.phases, key=lambda p: (p[1], p[2]))
+    return '\n'.join(f'  {name:<30} +{start:7.3f}s → +{end:7.3f}s  ({end - start:.3f}s)'
+                     for name, start, end in rows)
+
+
+def create_gemini_client(api_key: str):
+  """Create the Gemini client, importing google-genai only when it is needed."""
+  from google import genai  # pylint: disable=import-outside-toplevel
+  return genai.Client(api_key=api_key)
+
+
+def deberta_install_intact() -> bool:
+  """
+  Return False if DEBERTA_MODEL_PATH was installed from the artifact cache and a
+  file has since gone missing or changed size.
+  """
+  manifest = read_manifest(str(DEBERTA_MODEL_PATH))
+  return manifest is None or not damaged_files(str(DEBERTA_MODEL_PATH), manifest)
+
+
+def prepare_deberta(timeline: StartupTimeline,
+                    stop: threading.Event | None = None) -> tuple[tuple, LogitCache]:
+  """
+  Download (if needed), wait for, load, and warm up the DeBERTa model.
+  Returns the model bundle and its logit cache. Waiting for the model files
+  ends early once ``stop`` is set.
+  """
+  if not (DEBERTA_MODEL_PATH / 'model.safetensors').exists() or not deberta_install_intact():
+    with timeline.phase('DeBERTa download'):
+      app_log.info('DeBERTa model missing or damaged locally. '
+                   'Restoring from the artifact cache or Kaggle...')
+      download_deberta_model(str(DEBERTA_MODEL_PATH),
+                             cache=ArtifactCache(str(ARTIFACT_CACHE_PATH)))
+  with timeline.phase('DeBERTa files ready'):
+    wait_for_models(timeout_minutes=60, svm=False, stop=stop)
+  with timeline.phase('DeBERTa load'):
+    deberta_model = load_deberta_model(str(DEBERTA_MODEL_PATH))
+    deberta_version = deberta_model_version(str(DEBERTA_MODEL_PATH))
+    logit_cache = LogitCache(deberta_version, store=open_logit_store(deberta_version))
+  app_log.info(f'DeBERTa model loaded successfully (version {logit_cache.model_version}).')
+  with timeline.phase('DeBERTa warm-up'):
+    warm_up_deberta(deberta_model)
+  return deberta_model, logit_cache
+
+
+def prepare_svm(supabase, timeline: StartupTimeline, stop: threading.Event | None = None) -> tuple:
+  """
+  Sync, wait for, load, and warm up the SVM models. Returns the scorer and its version.
+  Waiting for the model files ends early once ``stop`` is set.
+  """
+  # The sync only downloads what changed in the bucket, so it runs on every start, not only on a
+  # cold one.
+  with timeline.phase('SVM sync'):
+    try:
+      download_svm_models(supabase, str(SVM_MODELS_PATH),
+                          cache=ArtifactCache(str(ARTIFACT_CACHE_PATH)))
+    except Exception as e:
+      if not svm_models_present():
+        raise
+      error_log.error(f'SVM sync failed; starting with the local models: {e}')
+  with timeline.phase('SVM files ready'):
+    wait_for_models(timeout_minutes=60, deberta=False, stop=stop)
+  with timeline.phase('SVM load'):
+    svm_version = svm_model_version(str(SVM_MODELS_PATH))
+    svm_models = load_svm_scorer(str(SVM_MODELS_PATH))
+  app_log.info(f'All SVM models loaded successfully (version {svm_version}).')
+  with timeline.phase('SVM warm-up'):
+    warm_up_svm(svm_models)
+  return svm_models, svm_version
+
+
+def start_model_loading(supabase, timeline: StartupTimeline) -> tuple[asyncio.Task, asyncio.Task]:
+  """
+  Start ``prepare_deberta`` and ``prepare_svm`` on their own threads and return their tasks.
+
+  If one model fails to load (or startup is cancelled), the other thread stops
+  waiting for its files rather than keep the process, and asyncio.run's executor
+  shutdown, alive for up to an hour. Must be called on the event loop.
+  """
+  startup_failed = threading.Event()
+
+  def stop_on_failure(task: asyncio.Task) -> None:
+    if task.cancelled() or task.exception() is not None:
+      startup_failed.set()
+
+  deberta_task = asyncio.create_task(
+    asyncio.to_thread(prepare_deberta, timeline, startup_failed), name='deberta')
+  svm_task = asyncio.create_task(
+    asyncio.to_thread(prepare_svm, supabase, timeline, startup_failed), name='svm')
+  for task in (deberta_task, svm_task):
+    task.add_done_callback(stop_on_failure)
+  return deberta_task, svm_task
@@ -0,0 +1,226 @@
+"""Vectorized scorer for the per-key-function linear SVMs.
+
+``svm/train.py`` fits one ``SVC(kernel='linear')`` per key function. Calling
+``predict`` on each of them separately costs scikit-learn's input validation
+and a libsvm round trip per key function. ``LinearSvmEngine`` instead stacks
+every model's one-vs-one hyperplanes into padded NumPy arrays once at load
+time, so any number of (response, key function) rows are scored with a
+gather, one ``einsum`` and a vote count. Votes follow libsvm's rule, so the
+predictions match ``SVC.predict``.
+
+The engine can also be loaded from an SVM bundle, a single uncompressed
+``.npz`` holding every model's ``coef_``, ``intercept_``, ``classes_`` and
+feature names, next to a JSON manifest with the bundle's format version and
+SHA-256. ``python/svm/util.export_upload_bundle`` writes it at training time.
+"""
+
+import hashlib
+from itertools import combinations
+import json
+import os
+
+import numpy as np
+
+SVM_MODEL_PREFIX = 'mcq_kf'
+SVM_BUNDLE_FORMAT = 'svm-linear-ovo'
+SVM_BUNDLE_VERSION = 1
+SVM_BUNDLE_FILE = 'svm-models.npz'
+SVM_BUNDLE_MANIFEST = 'svm-models.json'
+
+
+def kf_from_model_name(name: str) -> str:
+  """Map a model file stem such as ``mcq_kf1_1`` to its key-function ID ``1.1``."""
+  return name.removeprefix(SVM_MODEL_PREFIX).replace('_', '.')
+
+
+def model_name_from_kf(kf: str) -> str:
+  """Map a key-function ID such as ``1.1`` to its model file stem ``mcq_kf1_1``."""
+  return SVM_MODEL_PREFIX + kf.replace('.', '_')
+
+
+def file_sha256(path: str) -> str:
+  """Return the hex SHA-256 of a file's contents."""
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def read_bundle_manifest(directory: str) -> dict | None:
+  """Return the SVM bundle manifest in ``directory``, or None if there is none."""
+  path = os.path.join(directory, SVM_BUNDLE_MANIFEST)
+  if not os.path.exists(path):
+    return None
+  with open(path, encoding='utf-8') as f:
+    return json.load(f)
+
+
+class LinearSvmEngine:
+  """
+  All key functions' linear one-vs-one SVMs as padded arrays.
+
+  For key function ``k`` and class pair ``p``, ``weights[k, p]`` and
+  ``intercepts[k, p]`` hold libsvm's decision function for the pair
+  ``(pair_first[k, p], pair_second[k, p])``: a positive value is a vote for
+  the first class, anything else a vote for the second. Pairs past a key
+  function's ``n_pairs`` and features past its ``n_features`` are zero padding.
+  """
+
+  def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+      self,
+      kfs: list[str],
+      weights: np.ndarray,
+      intercepts: np.ndarray,
+      pair_first: np.ndarray,
+      pair_second: np.ndarray,
+      classes: np.ndarray,
+      n_features: np.ndarray,
+      n_classes: np.ndarray,
+  ):
+    self.kfs = list(kfs)
+    self.index = {kf: i for i, kf in enumerate(self.kfs)}
+    self.weights = weights
+    self.intercepts = intercepts
+    self.pair_first = pair_first
+    self.pair_second = pair_second
+    self.classes = classes
+    self.n_features = n_features
+    self.n_classes = n_classes
+    n_pairs = n_classes * (n_classes - 1) // 2
+    self._pair_valid = np.arange(weights.shape[1])[None, :] < n_pairs[:, None]
+    self._class_slots = np.arange(classes.shape[1])
+    # Set when loaded from a bundle: per-KF MCQ option names, and the bundle's content hash.
+    self.feature_names: dict[str, list[str]] = {}
+    self.version = ''
+
+  @classmethod
+  def from_models(cls, models: dict) -> 'LinearSvmEngine':
+    """
+    Stack fitted ``SVC(kernel='linear')`` models keyed by model file stem (``mcq_kf1_1``).
+
+    Raises:
+      ValueError: If any model is not a fitted linear-kernel SVC.
+    """
+    for name, model in models.items():
+      if getattr(model, 'kernel', None) != 'linear' or not hasattr(model, 'coef_'):
+        raise ValueError(f'SVM model {name} is not a fitted linear-kernel SVC.')
+    return cls.from_arrays({
+        name: (model.coef_.toarray() if hasattr(model.coef_, 'toarray') else model.coef_,
+               model.intercept_, model.classes_)
+        for name, model in models.items()
+    })
+
+  @classmethod
+  def from_bundle(cls, directory: str, verify: bool = True) -> 'LinearSvmEngine':
+    """
+    Load the SVM bundle in ``directory``.
+
+    Raises:
+      FileNotFoundError: If the directory has no bundle manifest.
+      ValueError: If the manifest's format is unsupported or, with ``verify``, the bundle's hash
+        does not match.
+    """
+    manifest = read_bundle_manifest(directory)
+    if manifest is None:
+      raise FileNotFoundError(f'No {SVM_BUNDLE_MANIFEST} in {directory}')
+    bundle_format, bundle_version = manifest.get('format'), manifest.get('format_version')
+    if bundle_format != SVM_BUNDLE_FORMAT or bundle_version != SVM_BUNDLE_VERSION:
+      raise ValueError(f'Unsupported SVM bundle format {bundle_format} v{bundle_version}')
+    path = os.path.join(directory, manifest.get('file', SVM_BUNDLE_FILE))
+    if verify and file_sha256(path) != manifest['sha256']:
+      raise ValueError(f'SVM bundle {path} does not match the hash in its manifest')
+
+    with np.load(path, allow_pickle=False) as bundle:
+      arrays = {name: (bundle[f'{name}.coef'], bundle[f'{name}.intercept'],
+                       bundle[f'{name}.classes'])
+                for name in manifest['models']}
+      feature_names = {name: bundle[f'{name}.features'].tolist() for name in manifest['models']}
+    engine = cls.from_arrays(arrays)
+    engine.feature_names = {kf_from_model_name(name): names
+                            for name, names in feature_names.items()}
+    engine.version = manifest['sha256']
+    return engine
+
+  @classmethod
+  def from_arrays(cls, arrays: dict[str, tuple]) -> 'LinearSvmEngine':
+    """
+    Stack ``(coef_, intercept_, classes_)`` triples keyed by model file stem.
+
+    The arrays are scikit-learn's public ``SVC`` attributes, so binary models
+    carry scikit-learn's sign convention.
+
+    Raises:
+      ValueError: If there are no models.
+    """
+    if not arrays:
+      raise ValueError('No SVM models to compile.')
+    names = sorted(arrays)
+    n_classes = np.array([len(arrays[n][2]) for n in names])
+    n_features = np.array([np.shape(arrays[n][0])[1] for n in names])
+    max_pairs = int((n_classes * (n_classes - 1) // 2).max())
+    weights = np.zeros((len(names), max_pairs, int(n_features.max())))
+    intercepts = np.zeros((len(names), max_pairs))
+    pair_first = np.zeros((len(names), max_pairs), dtype=np.intp)
+    pair_second = np.zeros((len(names), max_pairs), dtype=np.intp)
+    classes = np.zeros((len(names), int(n_classes.max())),
+                       dtype=np.asarray(arrays[names[0]][2]).dtype)
+
+    for k, name in enumerate(names):
+      coef, intercept, model_classes = arrays[name]
+      coef = np.asarray(coef, dtype=np.float64)
+      intercept = np.asarray(intercept, dtype=np.float64)
+      if n_classes[k] == 2:
+        # scikit-learn flips the sign of a binary SVC's public coef_/intercept_ relative to libsvm.
+        coef, intercept = -coef, -intercept
+      pairs = list(combinations(range(n_classes[k]), 2))
+      weights[k, :len(pairs), :n_features[k]] = coef
+      intercepts[k, :len(pairs)] = intercept
+      pair_first[k, :len(pairs)] = [i for i, _ in pairs]
+      pair_second[k, :len(pairs)] = [j for _, j in pairs]
+      classes[k, :n_classes[k]] = model_classes
+
+    return cls([kf_from_model_name(n) for n in names], weights, intercepts, pair_first, pair_second,
+               classes, n_features, n_classes)
+
+  def predict_rows(self, kfs: list[str], features: list[list]) -> list:
+    """
+    Predict one development level per (key function, feature row) pair.
+
+    Raises:
+      KeyError: If a key function has no model.
+      ValueError: If a feature row's length does not match its key function's model.
+    """
+    if not kfs:
+      return []
+    k = np.array([self.index[kf] for kf in kfs], dtype=np.intp)
+    x = np.zeros((len(kfs), self.weights.shape[2]))
+    for r, row in enumerate(features):
+      if len(row) != self.n_features[k[r]]:
+        raise ValueError(f'Key function {kfs[r]} expects {self.n_features[k[r]]} features, '
+                         f'got {len(row)}.')
+      x[r, :len(row)] = row
+
+    decision = np.einsum('rf,rpf->rp', x, self.weights[k]) + self.intercepts[k]
+    winners = np.where(decision > 0, self.pair_first[k], self.pair_second[k])
+    votes = ((winners[:, :, None] == self._class_slots)
+             & self._pair_valid[k][:, :, None]).sum(axis=1)
+    # argmax takes the lowest class index on ties, as libsvm does.
+    return self.classes[k, votes.argmax(axis=1)].tolist()
+
+  def predict(self, data: dict[str, list]) -> dict:
+    """Predict a development level for every key function in one response."""
+    kfs = list(data)
+    return dict(zip(kfs, self.predict_rows(kfs, [data[kf] for kf in kfs])))
+
+  def predict_many(self, data: list[dict[str, list]]) -> list[dict]:
+    """Predict development levels for several responses with one vectorized pass."""
+    owners = [(i, kf) for i, response in enumerate(data) for kf in response]
+    levels = self.predict_rows([kf for _, kf in owners], [data[i][kf] for i, kf in owners])
+    results: list[dict] = [{} for _ in data]
+    for (i, kf), level in zip(owners, levels):
+      results[i][kf] = level
+    return results
+
+  def __len__(self) -> int:
+    return len(self.kfs)
@@ -0,0 +1,209 @@
+"""Change-aware sync of the SVM models from Supabase Storage.
+
+``sync_svm_models`` lists the ``svm-models`` bucket and compares each object's
+size, ETag and ``updated_at`` with a local index kept in the artifact cache.
+Only objects that changed, or whose cached copy is gone, are downloaded. The
+downloads run concurrently on a bounded thread pool, so at most
+``SVM_SYNC_WORKERS`` connections are open at once. Everything else is
+reinstalled from the artifact cache, and files in the local directory that the
+bucket no longer provides are deleted. The result reports what was transferred
+and roughly how much time the skipped downloads saved.
+
+When the bucket holds an SVM bundle, only the bundle and its manifest are
+synced, and the manifest is installed last so that a half-synced bundle is never
+picked up. The bundle is loaded from the cache before anything is installed or
+removed. Only a bundle that loads replaces the per-key-function pickles; if it
+does not load, the pickles are synced instead and the bundle is left out.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import json
+import os
+import shutil
+import time
+
+from artifact_cache import ARTIFACT_MANIFEST, ArtifactCache, read_manifest
+from svm_engine import SVM_BUNDLE_FILE, SVM_BUNDLE_MANIFEST, LinearSvmEngine
+
+SVM_BUCKET = 'svm-models'
+# Concurrent downloads, and so open Storage connections, per sync.
+SVM_SYNC_WORKERS = int(os.environ.get('SVM_SYNC_WORKERS', '8'))
+_LIST_LIMIT = 1000
+
+
+@dataclass
+class SyncStats:
+  """What one sync transferred, reused, and removed."""
+  downloaded: int = 0
+  downloaded_bytes: int = 0
+  unchanged: int = 0
+  unchanged_bytes: int = 0
+  installed: int = 0
+  removed: int = 0
+  seconds: float = 0.0
+  # Estimated time the unchanged objects would have taken to download, at the measured or last
+  # known throughput.
+  seconds_saved: float = 0.0
+
+  @property
+  def changed(self) -> bool:
+    """True if the local directory's contents changed."""
+    return bool(self.installed or self.removed)
+
+  def __str__(self) -> str:
+    return (f'{self.downloaded} downloaded ({self.downloaded_bytes / 1e6:.2f} MB), '
+            f'{self.unchanged} unchanged ({self.unchanged_bytes / 1e6:.2f} MB not transferred, '
+            f'~{self.seconds_saved:.1f}s saved), {self.removed} stale removed, '
+            f'in {self.seconds:.2f}s')
+
+
+def _remote_signature(obj: dict) -> dict:
+  """Return the listing fields that change whenever an object's content does."""
+  metadata = obj.get('metadata') or {}
+  return {'etag': metadata.get('eTag'), 'size': metadata.get('size'),
+          'updated_at': obj.get('updated_at')}
+
+
+def _index_path(cache: ArtifactCache) -> str:
+  return os.path.join(cache.root, 'index', f'{SVM_BUCKET}.json')
+
+
+def _read_index(cache: ArtifactCache) -> dict:
+  try:
+    with open(_index_path(cache), encoding='utf-8') as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {'objects': {}}
+
+
+def _write_index(cache: ArtifactCache, index: dict) -> None:
+  path = _index_path(cache)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+    json.dump(index, f, indent=2, sort_keys=True)
+  os.replace(f'{path}.tmp', path)
+
+
+def _bundle_error(cache: ArtifactCache, files: dict, staging: str) -> str | None:
+  """Load the bundle in ``files`` from the cache. Returns why it failed, or None if it loaded."""
+  check = os.path.join(staging, 'verify')
+  try:
+    cache.install({'files': files}, check)
+    LinearSvmEngine.from_bundle(check)
+  except (OSError, KeyError, ValueError) as e:
+    return f'{type(e).__name__}: {e}'
+  finally:
+    shutil.rmtree(check, ignore_errors=True)
+  return None
+
+
+def sync_svm_models(supabase, local_dir: str, cache: ArtifactCache,
+                    workers: int = SVM_SYNC_WORKERS) -> SyncStats:
+  """
+  Bring ``local_dir`` in line with the ``svm-models`` bucket, downloading only what changed.
+
+  Args:
+    supabase: Authenticated Supabase client.
+    local_dir: Local directory holding the SVM models.
+    cache: Artifact cache holding downloaded objects and the sync index.
+    workers: Maximum concurrent downloads.
+
+  Returns:
+    What the sync transferred, reused, and removed.
+
+  Raises:
+    ValueError: If a downloaded bundle does not match the hash in its manifest.
+  """
+  _t0 = time.time()
+  stats = SyncStats()
+  os.makedirs(local_dir, exist_ok=True)
+  bucket = supabase.storage.from_(SVM_BUCKET)
+  listing = bucket.list(options={'limit': _LIST_LIMIT})
+  remote = {obj['name']: _remote_signature(obj) for obj in listing if obj.get('id') is not None}
+  if not remote:
+    # An empty listing is far more likely a misconfigured bucket than a request to delete them all.
+    raise RuntimeError(f'The {SVM_BUCKET} bucket lists no models; keeping the local copies.')
+  index = _read_index(cache)
+  known = index['objects']
+  staging = cache.staging_dir(SVM_BUCKET)
+
+  def is_current(name: str) -> bool:
+    entry = known.get(name)
+    return (entry is not None and all(entry.get(k) == v for k, v in remote[name].items())
+            and cache.has(entry['sha256'], entry.get('size')))
+
+  def fetch(name: str, sha256: str | None = None) -> str:
+    path = os.path.join(staging, name)
+    data = bucket.download(name)
+    with open(f'{path}.part', 'wb') as f:
+      f.write(data)
+    os.replace(f'{path}.part', path)
+    digest = cache.add(path, sha256)
+    known[name] = {**remote[name], 'sha256': digest, 'size': len(data)}
+    return name
+
+  def sync(names: list[str], expected: dict[str, str] | None = None) -> None:
+    stale = [n for n in names
+             if not is_current(n) or (expected and known[n]['sha256'] != expected.get(n))]
+    for name in names:
+      if name not in stale:
+        stats.unchanged += 1
+        stats.unchanged_bytes += known[name]['size']
+    if not stale:
+      return
+    _t_fetch = time.time()
+    with ThreadPoolExecutor(max(1, min(workers, len(stale)))) as pool:
+      for name in pool.map(lambda n: fetch(n, (expected or {}).get(n)), stale):
+        stats.downloaded += 1
+        stats.downloaded_bytes += known[name]['size']
+    stale_bytes = sum(known[n]['size'] for n in stale)
+    index['seconds_per_byte'] = (time.time() - _t_fetch) / max(stale_bytes, 1)
+
+  if SVM_BUNDLE_MANIFEST in remote:
+    sync([SVM_BUNDLE_MANIFEST])
+    # The manifest is small and always read from the cache, so an unchanged one costs no download.
+    with open(cache.path(known[SVM_BUNDLE_MANIFEST]['sha256']), encoding='utf-8') as f:
+      manifest = json.load(f)
+    bundle_name = manifest.get('file', SVM_BUNDLE_FILE)
+    try:
+      sync([bundle_name], expected={bundle_name: manifest['sha256']})
+    except ValueError as e:
+      raise ValueError(f'Downloaded {bundle_name} does not match the hash in '
+                       f'{SVM_BUNDLE_MANIFEST}') from e
+    # The manifest goes down last, so a bundle is only ever picked up once it is complete.
+    wanted = [bundle_name, SVM_BUNDLE_MANIFEST]
+    error = _bundle_error(cache, {name: known[name] for name in wanted}, staging)
+    if error is not None:
+      # The pickles stay the models in use until a bundle that loads replaces them.
+      wanted = sorted(name for name in remote if name not in (bundle_name, SVM_BUNDLE_MANIFEST))
+      if not wanted:
+        raise ValueError(f'{bundle_name} does not load ({error}) and the {SVM_BUCKET} bucket '
+                         'has no pickles; keeping the local copies.')
+      print(f'{bundle_name} does not load ({error}); syncing the per-key-function pickles instead.')
+      sync(wanted)
+  else:
+    wanted = sorted(remote)
+    sync(wanted)
+
+  files = {name: {'size': known[name]['size'], 'sha256': known[name]['sha256']} for name in wanted}
+  previous = (read_manifest(local_dir) or {'files': {}})['files']
+  for name in os.listdir(local_dir):
+    path = os.path.join(local_dir, name)
+    if name not in files and name != ARTIFACT_MANIFEST and os.path.isfile(path):
+      os.remove(path)
+      stats.removed += 1
+  # Files already installed with the same content are left alone, so unchanged models keep mtimes.
+  changed = [name for name in wanted if previous.get(name) != files[name]
+             or not os.path.exists(os.path.join(local_dir, name))
+             or os.path.getsize(os.path.join(local_dir, name)) != files[name]['size']]
+  stats.installed = len(changed)
+  for name in changed:
+    cache.install({'files': files}, local_dir, names=[name])
+  if changed or previous.keys() != files.keys():
+    cache.install({'files': files}, local_dir, names=[])
+  _write_index(cache, index)
+  cache.discard_staging(SVM_BUCKET)
+  stats.seconds = time.time() - _t0
+  stats.seconds_saved = stats.unchanged_bytes * index.get('seconds_per_byte', 0.0)
+  return stats
@@ -1,14 +1,20 @@
 # pylint: disable=unused-argument
 
-'''12 unit tests for inference.py and listener.py'''
+'''Unit tests for inference.py'''
 
+import collections
+import hashlib
+import io
 import json
 import os
 import sys
+import tempfile
 import types
 import unittest
 from unittest.mock import MagicMock, patch, mock_open
 
+import numpy as np
+
 # Lightweight dependency stubs so tests can import inference/listener in CI
 # without installing full ML runtime packages.
 if 'supabase' not in sys.modules:
@@ -36,6 +42,11 @@ if 'torch' not in sys.modules:
 if 'transformers' not in sys.modules:
   transformers_stub = types.ModuleType('transformers')
 
+  class _AutoConfig:
+    @staticmethod
+    def from_pretrained(*args, **kwargs):
+      return MagicMock()
+
   class _AutoTokenizer:
     @staticmethod
     def from_pretrained(*args, **kwargs):
@@ -46,6 +57,7 @@ if 'transformers' not in sys.modules:
     def from_pretrained(*args, **kwargs):
       return MagicMock()
 
+  transformers_stub.AutoConfig = _AutoConfig
   transformers_stub.AutoTokenizer = _AutoTokenizer
   transformers_stub.AutoModelForSequenceClassification = _AutoModelForSequenceClassification
   sys.modules['transformers'] = transformers_stub
@@ -95,36 +107,42 @@ if 'dotenv' not in sys.modules:
 
 # test_benchmark.py injects a lightweight 'inference' stub into sys.modules.
 # When running this file in the same pytest invocation, drop that stub so we
-# import the real inference.py module for listener/inference tests.
+# import the real inference.py module for the tests below.
 existing_inference = sys.modules.get('inference')
 if existing_inference is not None and not getattr(existing_inference, '__file__', None):
   sys.modules.pop('inference', None)
 
 import inference  # pylint: disable=import-error
-import listener   # pylint: disable=import-error
 
 
 # ---------------------------------------------------------------------------
-# inference.deberta_infer  (2 tests)
+# inference.deberta_infer / deberta_logits  (11 tests)
 # ---------------------------------------------------------------------------
 
-class _FakeLogits:
-  def __init__(self, rows):
-    self.rows = rows
+class _FakeTokenizer:
+  '''Whitespace tokenizer exposing the __call__/pad surface deberta_logits relies on.'''
+
+  def __call__(self, texts, **kwargs):
+    input_ids = [[1] * len(text.split()) for text in texts]
+    return {'input_ids': input_ids, 'attention_mask': [list(ids) for ids in input_ids]}
 
-  def sum(self, dim=0):
-    if dim != 0:
-      raise ValueError('Only dim=0 is supported in this fake tensor')
-    cols = [sum(row[i] for row in self.rows) for i in range(len(self.rows[0]))]
-    return _FakeVector(cols)
+  def pad(self, features, **kwargs):
+    width = max(len(ids) for ids in features['input_ids'])
+    return {name: [row + [0] * (width - len(row)) for row in rows]
+            for name, rows in features.items()}
 
 
-class _FakeVector:
-  def __init__(self, values):
-    self.values = values
+class _FakeModel:
+  '''Returns a fixed logit row per text and records the batch sizes it was called with.'''
 
-  def argmax(self):
-    return max(range(len(self.values)), key=lambda i: self.values[i])
+  def __init__(self, rows_by_text):
+    self.rows_by_text = rows_by_text
+    self.batches = []
+
+  def __call__(self, input_ids, attention_mask):
+    self.batches.append(len(input_ids))
+    rows = [self.rows_by_text[len(ids) - ids.count(0)] for ids in input_ids]
+    return types.SimpleNamespace(logits=np.array(rows, dtype=np.float32))
 
 
 class TestDebertaInfer(unittest.TestCase):
@@ -132,25 +150,169 @@ class TestDebertaInfer(unittest.TestCase):
 
   def test_output_keys_match_input_keys(self):
     '''deberta_infer should return a dict whose keys are identical to the input keys.'''
-    mock_tokenizer = MagicMock(return_value={})
-    mock_model = MagicMock()
-    mock_model.return_value = types.SimpleNamespace(logits=_FakeLogits([[0.1, 0.9]]))
+    model = _FakeModel({2: [0.1, 0.9]})
     data = {'1.1': ['sentence a'], '1.2': ['sentence b']}
-    result = inference.deberta_infer((mock_tokenizer, mock_model), data)
+    result = inference.deberta_infer((_FakeTokenizer(), model), data)
     self.assertEqual(set(result.keys()), set(data.keys()))
 
   def test_picks_class_with_highest_summed_score(self):
     '''deberta_infer should return the index of the column with the highest summed prediction.'''
-    mock_tokenizer = MagicMock(return_value={})
-    mock_model = MagicMock()
     # Two rows summed → [0.3, 1.7] → class 1
-    mock_model.return_value = types.SimpleNamespace(logits=_FakeLogits([[0.1, 0.9], [0.2, 0.8]]))
-    result = inference.deberta_infer((mock_tokenizer, mock_model), {'kf': ['s1', 's2']})
+    model = _FakeModel({1: [0.1, 0.9], 2: [0.2, 0.8]})
+    result = inference.deberta_infer((_FakeTokenizer(), model), {'kf': ['s1', 's2 s2']})
     self.assertEqual(result['kf'], 1)
 
+  def test_single_pass_runs_one_forward_pass_for_all_key_functions(self):
+    '''All texts from all key functions should share one forward pass when they fit the budget.'''
+    model = _FakeModel({1: [1.0, 0.0], 2: [0.0, 1.0]})
+    data = {'1.1': ['a'], '1.2': ['b b', 'c c'], '2.1': ['d']}
+    result = inference.deberta_infer((_FakeTokenizer(), model), data)
+    self.assertEqual(model.batches, [4])
+    self.assertEqual(result, {'1.1': 0, '1.2': 1, '2.1': 0})
+
+  def test_single_pass_matches_per_key_function_mode(self):
+    '''Segment-summed logits should reproduce the per-key-function argmax.'''
+    rows = {1: [0.5, 0.1, 0.0], 2: [0.0, 0.4, 0.1], 3: [0.0, 0.0, 0.9]}
+    data = {'1.1': ['a', 'b b'], '1.2': ['c c c', 'd'], '1.3': ['e e', 'f f f', 'g g']}
+    single = inference.deberta_infer((_FakeTokenizer(), _FakeModel(rows)), data)
+    per_kf_model = _FakeModel(rows)
+    per_kf = inference.deberta_infer((_FakeTokenizer(), per_kf_model), data, single_pass=False)
+    self.assertEqual(single, per_kf)
+    self.assertEqual(per_kf_model.batches, [2, 2, 3])
+
+  def test_token_budget_splits_batches(self):
+    '''Texts should be split into several passes when the padded batch exceeds the budget.'''
+    model = _FakeModel({2: [0.0, 1.0]})
+    data = {'1.1': ['a a', 'b b'], '1.2': ['c c', 'd d', 'e e']}
+    inference.deberta_infer((_FakeTokenizer(), model), data, max_batch_tokens=4)
+    self.assertEqual(model.batches, [2, 2, 1])
+
+  def test_key_function_without_text_defaults_to_class_zero(self):
+    '''A key function with no texts contributes no logits and falls back to class 0.'''
+    model = _FakeModel({1: [0.0, 1.0]})
+    result = inference.deberta_infer((_FakeTokenizer(), model), {'1.1': [], '1.2': ['a']})
+    self.assertEqual(result, {'1.1': 0, '1.2': 1})
+
+  def test_no_texts_at_all_skips_the_model(self):
+    '''An empty mapping, or key functions that all lack texts, score without a forward pass.'''
+    model = _FakeModel({})
+    for single_pass in (True, False):
+      bundle = (_FakeTokenizer(), model)
+      self.assertEqual(inference.deberta_infer(bundle, {}, single_pass=single_pass), {})
+      self.assertEqual(
+        inference.deberta_infer(bundle, {'1.1': [], '1.2': []}, single_pass=single_pass),
+        {'1.1': 0, '1.2': 0})
+    self.assertEqual(model.batches, [])
+
+
+class TestPlanBatches(unittest.TestCase):
+  '''Unit tests for the length-bucketed batch planner in inference.py'''
+
+  def test_oversized_text_gets_its_own_batch(self):
+    self.assertEqual(inference._plan_batches([3, 50, 3], 10, edges=()), [[0, 2], [1]])  # pylint: disable=protected-access
+
+  def test_batches_cover_every_index_once_within_budget(self):
+    lengths = [5, 1, 8, 2, 2, 7, 3]
+    batches = inference._plan_batches(lengths, 16)  # pylint: disable=protected-access
+    self.assertEqual(sorted(i for batch in batches for i in batch), list(range(len(lengths))))
+    for batch in batches:
+      self.assertLessEqual(len(batch) * max(lengths[i] for i in batch), 16)
+
+  def test_texts_never_share_a_batch_across_bucket_edges(self):
+    lengths = [4, 40, 5, 120, 38]
+    batches = inference._plan_batches(lengths, 10_000, edges=(16, 64))  # pylint: disable=protected-access
+    self.assertEqual(batches, [[0, 2], [4, 1], [3]])
+
+
+class TestDebertaLogits(unittest.TestCase):
+  '''Unit tests for deberta_logits() in inference.py'''
+
+  def test_logits_are_returned_in_input_order(self):
+    '''Length sorting must not leak into the order of the returned rows.'''
+    rows = {1: [1.0, 0.0], 3: [0.0, 3.0], 20: [20.0, 0.0]}
+    texts = ['x ' * 20, 'a', 'b b b', 'c']
+    logits = inference.deberta_logits((_FakeTokenizer(), _FakeModel(rows)), texts)
+    np.testing.assert_array_equal(logits, np.array([rows[20], rows[1], rows[3], rows[1]]))
+
+  def test_stats_report_padding_avoided_by_bucketing(self):
+    '''Stats should compare bucketed padding with batching the texts in input order.'''
+    rows = {1: [1.0, 0.0], 20: [0.0, 1.0]}
+    texts = ['x ' * 20, 'a', 'x ' * 20, 'b']
+    stats = inference.BatchingStats()
+    inference.deberta_logits((_FakeTokenizer(), _FakeModel(rows)), texts, stats=stats)
+    self.assertEqual((stats.texts, stats.batches, stats.real_tokens), (4, 2, 42))
+    self.assertEqual(stats.padded_tokens, 42)
+    self.assertEqual(stats.unbucketed_padded_tokens, 80)
+    self.assertEqual(stats.padding_avoided, 38)
+
+  def test_deberta_logits_pads_to_numpy_for_onnx_models(self):
+    tokenizer = MagicMock(wraps=_FakeTokenizer())
+    model = _FakeModel({1: [1.0, 0.0]})
+    model.tensor_type = 'np'
+    inference.deberta_logits((tokenizer, model), ['a'])
+    self.assertEqual(tokenizer.pad.call_args.kwargs['return_tensors'], 'np')
+
+
+class TestLogitCache(unittest.TestCase):
+  '''Unit tests for LogitCache and cache-aware deberta_logits() in inference.py'''
+
+  def test_only_cache_misses_go_through_the_model(self):
+    model = _FakeModel({1: [1.0, 0.0], 2: [0.0, 1.0]})
+    cache = inference.LogitCache('v1')
+    bundle = (_FakeTokenizer(), model)
+    inference.deberta_logits(bundle, ['a', 'b b'], cache=cache)
+    logits = inference.deberta_logits(bundle, ['b b', 'c', '  a '], cache=cache)
+
+    self.assertEqual(model.batches, [2, 1])  # 'a' + 'b b', then only 'c'
+    np.testing.assert_array_equal(logits, np.array([[0.0, 1.0], [1.0, 0.0], [1.0, 0.0]]))
+    self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+  def test_duplicate_texts_in_one_call_are_scored_once(self):
+    model = _FakeModel({1: [1.0, 0.0]})
+    inference.deberta_logits((_FakeTokenizer(), model), ['a', 'a', 'a'],
+                             cache=inference.LogitCache('v1'))
+    self.assertEqual(model.batches, [1])
+
+  def test_keys_depend_on_model_version_and_normalized_text(self):
+    v1, v2 = inference.LogitCache('v1'), inference.LogitCache('v2')
+    self.assertEqual(v1.key('Good  job\n'), v1.key('Good job'))
+    self.assertNotEqual(v1.key('Good job'), v2.key('Good job'))
+
+  def test_memory_misses_fall_back_to_the_persistent_store(self):
+    store = MagicMock()
+    store.get_many.return_value = [np.array([0.0, 1.0])]
+    model = _FakeModel({})
+    cache = inference.LogitCache('v1', store=store)
+
+    logits = inference.deberta_logits((_FakeTokenizer(), model), ['a'], cache=cache)
+
+    np.testing.assert_array_equal(logits, [[0.0, 1.0]])
+    self.assertEqual(model.batches, [])
+    self.assertEqual(len(cache), 1)
+
+  def test_new_rows_are_written_through_and_store_errors_are_ignored(self):
+    store = MagicMock()
+    store.get_many.side_effect = RuntimeError('database is locked')
+    store.put_many.side_effect = RuntimeError('disk full')
+    cache = inference.LogitCache('v1', store=store)
+
+    logits = inference.deberta_logits((_FakeTokenizer(), _FakeModel({1: [1.0, 0.0]})), ['a'],
+                                      cache=cache)
+
+    np.testing.assert_array_equal(logits, [[1.0, 0.0]])
+    store.put_many.assert_called_once()
+
+  def test_least_recently_used_rows_are_evicted(self):
+    cache = inference.LogitCache('v1', maxsize=2)
+    cache.put_many(['a', 'b'], np.zeros((2, 2)))
+    cache.get_many(['a'])
+    cache.put_many(['c'], np.zeros((1, 2)))
+    self.assertEqual([row is not None for row in cache.get_many(['a', 'b', 'c'])],
+                     [True, False, True])
+
 
 # ---------------------------------------------------------------------------
-# inference.svm_infer  (1 test)
+# inference.svm_infer / svm_infer_many / deberta_infer_many  (6 tests)
 # ---------------------------------------------------------------------------
 
 class TestSvmInfer(unittest.TestCase):
@@ -165,6 +327,93 @@ class TestSvmInfer(unittest.TestCase):
     self.assertEqual(result['1.1'], 2)
     mock_model.predict.assert_called_once_with([[True, False]])
 
+  def test_svm_infer_many_makes_one_predict_call_per_key_function(self):
+    '''svm_infer_many stacks every response's features for a key function into one predict call.'''
+    mock_model = MagicMock()
+    mock_model.predict.return_value = [1, 3]
+    models = {'mcq_kf1_1': mock_model}
+    result = inference.svm_infer_many(models, [{'1.1': [True]}, {'1.1': [False]}])
+    self.assertEqual(result, [{'1.1': 1}, {'1.1': 3}])
+    mock_model.predict.assert_called_once_with([[True], [False]])
+
+  def test_compiled_engine_is_used_when_available(self):
+    '''svm_infer and svm_infer_many score through a LinearSvmEngine without per-model predicts.'''
+    model = types.SimpleNamespace(kernel='linear', coef_=np.array([[1.0, -1.0]]),
+                                  intercept_=np.array([0.0]), classes_=np.array([0, 2]))
+    engine = inference.compile_svm_models({'mcq_kf1_1': model})
+    self.assertIsInstance(engine, inference.LinearSvmEngine)
+    self.assertEqual(inference.svm_infer(engine, {'1.1': [True, False]}), {'1.1': 2})
+    self.assertEqual(inference.svm_infer_many(engine, [{'1.1': [False, True]}, {}]),
+                     [{'1.1': 0}, {}])
+
+  def test_warm_up_svm_scores_every_key_function(self):
+    '''warm_up_svm should score a batch of all-False rows of each model's width, once per round.'''
+    model = types.SimpleNamespace(kernel='linear', coef_=np.array([[1.0, -1.0, 0.5]]),
+                                  intercept_=np.array([0.0]), classes_=np.array([0, 2]))
+    engine = inference.compile_svm_models({'mcq_kf1_1': model})
+    with patch('inference.svm_infer_many', wraps=inference.svm_infer_many) as mock_svm:
+      inference.warm_up_svm(engine, rounds=2, batch_size=3)
+    self.assertEqual(mock_svm.call_count, 2)
+    mock_svm.assert_called_with(engine, [{'1.1': [False, False, False]}] * 3)
+
+  def test_compile_falls_back_to_model_mapping(self):
+    '''Models that cannot be stacked should be returned unchanged.'''
+    models = {'mcq_kf1_1': MagicMock(kernel='rbf')}
+    self.assertIs(inference.compile_svm_models(models), models)
+
+  def test_load_svm_scorer_prefers_the_bundle_and_falls_back_to_pickles(self):
+    '''load_svm_scorer should read the bundle when there is one and unpickle models otherwise.'''
+    with tempfile.TemporaryDirectory() as local_dir:
+      with patch('inference.load_svm_models',
+                 return_value={'mcq_kf1_1': MagicMock(kernel='rbf')}) as mock_pickles:
+        self.assertIn('mcq_kf1_1', inference.load_svm_scorer(local_dir))
+        mock_pickles.assert_called_once_with(local_dir)
+
+      with open(os.path.join(local_dir, 'svm-models.json'), 'w', encoding='utf-8') as f:
+        f.write('{}')
+      with patch('inference.LinearSvmEngine.from_bundle',
+                 return_value=MagicMock(version='abc')) as mock_bundle, \
+           patch('inference.load_svm_models') as mock_pickles:
+        self.assertIs(inference.load_svm_scorer(local_dir), mock_bundle.return_value)
+        mock_pickles.assert_not_called()
+
+  def test_load_svm_scorer_raises_when_nothing_loads(self):
+    '''A broken bundle with no pickle fallback fails the load rather than yield an empty scorer.'''
+    with tempfile.TemporaryDirectory() as local_dir:
+      with open(os.path.join(local_dir, 'svm-models.json'), 'w', encoding='utf-8') as f:
+        f.write('{}')
+      with self.assertRaises(FileNotFoundError):
+        inference.load_svm_scorer(local_dir)
+
+
+class TestWarmUpDeberta(unittest.TestCase):
+  '''Unit tests for warm_up_deberta() in inference.py'''
+
+  def test_runs_one_batch_per_length_bucket_each_round(self):
+    '''Every bucket edge below the max length, and the max length itself, gets its own batch.'''
+    model = _FakeModel(collections.defaultdict(lambda: [0.0, 1.0]))
+    inference.warm_up_deberta((_FakeTokenizer(), model), rounds=2, batch_size=3,
+                              edges=(16, 32, 999))
+    self.assertEqual(model.batches, [3, 3, 3] * 2)
+
+  def test_zero_rounds_skips_the_model(self):
+    '''MODEL_WARMUP_ROUNDS=0 should disable the warm-up.'''
+    model = _FakeModel({})
+    inference.warm_up_deberta((_FakeTokenizer(), model), rounds=0)
+    self.assertEqual(model.batches, [])
+
+
+class TestDebertaInferMany(unittest.TestCase):
+  '''Unit tests for deberta_infer_many() in inference.py'''
+
+  def test_scores_all_responses_in_one_forward_pass(self):
+    '''Texts from several responses should share a forward pass and come back per response.'''
+    model = _FakeModel({1: [1.0, 0.0], 2: [0.0, 1.0]})
+    data = [{'1.1': ['a'], '1.2': ['b b']}, {'1.1': ['c c']}]
+    result = inference.deberta_infer_many((_FakeTokenizer(), model), data)
+    self.assertEqual(model.batches, [3])
+    self.assertEqual(result, [{'1.1': 0, '1.2': 1}, {'1.1': 1}])
+
 
 # ---------------------------------------------------------------------------
 # inference.load_deberta_model  (1 test)
@@ -198,6 +447,43 @@ class TestLoadDebertaModel(unittest.TestCase):
     mock_tokenizer_from_pretrained.assert_called_once_with('models/deberta')
     mock_model_from_pretrained.assert_called_once_with('models/deberta')
 
+  @patch('inference.OnnxSequenceClassifier')
+  @patch('inference.onnx_model_file', return_value='graph.onnx')
+  @patch('inference.model_fingerprint', return_value='abc123')
+  @patch('inference.AutoTokenizer.from_pretrained')
+  @patch('inference.os.path.exists', return_value=True)
+  def test_onnx_backend_wraps_the_cached_graph(self, mock_exists, mock_tokenizer_from_pretrained,
+                                               mock_fingerprint, mock_model_file, mock_onnx_model):
+    '''The onnx backend should return an ONNX model over the graph cached for the fingerprint.'''
+    tokenizer, model = inference.load_deberta_model('models/deberta', backend='onnx')
+
+    mock_model_file.assert_called_once_with('models/deberta', 'abc123', False)
+    mock_onnx_model.assert_called_once_with('graph.onnx')
+    self.assertIs(tokenizer, mock_tokenizer_from_pretrained.return_value)
+    self.assertIs(model, mock_onnx_model.return_value)
+
+  @patch('inference.load_quantized_torch_model', return_value='int8-model')
+  @patch('inference.model_fingerprint', return_value='abc123')
+  @patch('inference.AutoTokenizer.from_pretrained')
+  @patch('inference.os.path.exists', return_value=True)
+  def test_torch_int8_uses_quantized_loader(self, mock_exists, mock_tokenizer, mock_fingerprint,
+                                            mock_quantized):
+    _, model = inference.load_deberta_model('models/deberta', backend='torch', quantize=True)
+    self.assertEqual(model, 'int8-model')
+    mock_quantized.assert_called_once_with('models/deberta', 'abc123')
+
+  @patch('inference.model_fingerprint', return_value='abc123')
+  def test_model_version_distinguishes_backend_and_precision(self, mock_fingerprint):
+    versions = {inference.deberta_model_version('m', backend, quantize)
+                for backend in ('torch', 'onnx') for quantize in (False, True)}
+    self.assertEqual(versions,
+                     {'abc123-torch', 'abc123-torch-int8', 'abc123-onnx', 'abc123-onnx-int8'})
+
+  @patch('inference.os.path.exists', return_value=True)
+  def test_unknown_backend_raises_value_error(self, mock_exists):
+    with self.assertRaises(ValueError):
+      inference.load_deberta_model('models/deberta', backend='tensorrt')
+
 
 # ---------------------------------------------------------------------------
 # inference.load_svm_models  (1 test)
@@ -220,354 +506,101 @@ class TestLoadSvmModels(unittest.TestCase):
 class TestDownloadModelHelpers(unittest.TestCase):
   '''Unit tests for inference download helper functions.'''
 
-  @patch('inference.shutil.copy2')
-  @patch('inference.os.listdir', return_value=['config.json', 'weights.bin'])
-  @patch('inference.os.makedirs')
-  @patch('inference.subprocess.run')
-  @patch('inference.shutil.which', return_value=None)
-  @patch('inference.tempfile.TemporaryDirectory')
-  def test_download_deberta_model_runs_kaggle_and_copies_files(self, mock_tempdir, mock_which,
-                                                               mock_run, mock_makedirs,
-                                                               mock_listdir, mock_copy2):
-    '''download_deberta_model should invoke Kaggle output download and copy artifacts locally.'''
-    tmp_context = MagicMock()
-    tmp_context.__enter__.return_value = 'tmpdir'
-    tmp_context.__exit__.return_value = False
-    mock_tempdir.return_value = tmp_context
-
-    inference.download_deberta_model('local-model-dir')
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.tmp = tmp.name
+    self.cache = inference.ArtifactCache(os.path.join(self.tmp, 'cache'))
+
+  def _fake_kaggle(self, files):
+    def run(cmd, **kwargs):
+      model_dir = os.path.join(cmd[cmd.index('-p') + 1], 'model')
+      os.makedirs(model_dir, exist_ok=True)
+      for name, data in files.items():
+        with open(os.path.join(model_dir, name), 'wb') as f:
+          f.write(data)
+    return run
+
+  def _bucket(self, objects):
+    '''A fake svm-models bucket listing ``objects`` (name -> bytes) with Storage-style metadata.'''
+    bucket = MagicMock()
+    bucket.list.return_value = [
+        {'name': name, 'id': name, 'updated_at': '2026-01-01T00:00:00Z',
+         'metadata': {'eTag': f'"{hashlib.md5(data).hexdigest()}"', 'size': len(data)}}
+        for name, data in objects.items()]
+    bucket.download.side_effect = lambda name: objects[name]
+    return bucket
 
+  @patch('inference.shutil.which', return_value=None)
+  def test_download_deberta_model_runs_kaggle_and_installs_from_the_cache(self, mock_which):
+    '''download_deberta_model runs Kaggle once, then serves a damaged install from the cache.'''
+    local = os.path.join(self.tmp, 'deberta')
+    files = {'config.json': b'{}', 'model.safetensors': b'weights'}
+    with patch('inference.subprocess.run', side_effect=self._fake_kaggle(files)) as mock_run:
+      inference.download_deberta_model(local, cache=self.cache)
+      self.assertEqual(mock_run.call_args[0][0][:2], ['kaggle', 'kernels'])
+      self.assertEqual(sorted(os.listdir(local)),
+                       ['artifact-manifest.json', 'config.json', 'model.safetensors'])
+      with open(os.path.join(local, 'model.safetensors'), 'rb') as f:
+        self.assertEqual(f.read(), b'weights')
+
+      os.remove(os.path.join(local, 'model.safetensors'))
+      inference.download_deberta_model(local, cache=self.cache)
+      inference.download_deberta_model(local, cache=self.cache)
     mock_run.assert_called_once()
-    self.assertEqual(mock_run.call_args[0][0][:2], ['kaggle', 'kernels'])
-    mock_makedirs.assert_called_once_with('local-model-dir', exist_ok=True)
-    copied_sources = [call.args[0] for call in mock_copy2.call_args_list]
-    self.assertIn(os.path.join('tmpdir', 'model', 'config.json'), copied_sources)
-    self.assertIn(os.path.join('tmpdir', 'model', 'weights.bin'), copied_sources)
+    self.assertTrue(os.path.exists(os.path.join(local, 'model.safetensors')))
 
-  @patch('builtins.open', new_callable=mock_open)
-  @patch('inference.os.makedirs')
-  @patch('inference.os.path.exists', return_value=False)
-  def test_download_svm_models_creates_dir_and_writes_downloaded_files(self, mock_exists,
-                                                                       mock_makedirs,
-                                                                       mock_file):
+  def test_download_svm_models_creates_dir_and_writes_downloaded_files(self):
     '''download_svm_models should create the target dir and write each downloaded model blob.'''
-    bucket = MagicMock()
-    bucket.list.return_value = [{'name': 'kf1.pkl'}, {'name': 'kf2.pkl'}]
-    bucket.download.side_effect = [b'model-one', b'model-two']
-
+    bucket = self._bucket({'kf1.pkl': b'model-one', 'kf2.pkl': b'model-two'})
     supabase = MagicMock()
     supabase.storage.from_.return_value = bucket
+    local_dir = os.path.join(self.tmp, 'svm')
 
-    inference.download_svm_models(supabase, local_dir='local-svm-dir')
+    inference.download_svm_models(supabase, local_dir=local_dir, cache=self.cache)
 
     supabase.storage.from_.assert_called_once_with('svm-models')
-    mock_makedirs.assert_called_once_with('local-svm-dir')
-    bucket.download.assert_any_call('kf1.pkl')
-    bucket.download.assert_any_call('kf2.pkl')
-    handle = mock_file()
-    handle.write.assert_any_call(b'model-one')
-    handle.write.assert_any_call(b'model-two')
-
-
-# ---------------------------------------------------------------------------
-# inference.generate_report_summary  (2 tests)
-# ---------------------------------------------------------------------------
-
-class TestGenerateReportSummary(unittest.TestCase):
-  '''Unit tests for generate_report_summary() in inference.py'''
-
-  def test_strips_markdown_codeblock_before_parsing(self):
-    '''generate_report_summary should strip ```json...``` fences and return valid JSON.'''
-    mock_gemini = MagicMock()
-    mock_response = MagicMock()
-    mock_response.text = '```json\n{"1.1": "good performance"}\n```'
-    mock_gemini.models.generate_content.return_value = mock_response
-
-    result = inference.generate_report_summary({'1.1': 2.0}, mock_gemini)
-    parsed = json.loads(result)
-    self.assertIn('1.1', parsed)
-
-  def test_retries_three_times_on_invalid_json_then_returns_error(self):
-    '''generate_report_summary should retry 3 times on bad JSON and return an error string.'''
-    mock_gemini = MagicMock()
-    mock_response = MagicMock()
-    mock_response.text = 'not valid json {{{'
-    mock_gemini.models.generate_content.return_value = mock_response
-
-    result = inference.generate_report_summary({'1.1': 1.0}, mock_gemini)
-    self.assertIn('Error', result)
-    self.assertEqual(
-      mock_gemini.models.generate_content.call_count,
-      3 * len(inference._GEMINI_MODELS),  # pylint: disable=protected-access
-    )
-
-  @patch('inference._try_gemini_model', side_effect=[None, '{"1.1": "fallback ok"}'])
-  def test_falls_back_to_next_model_when_first_model_fails(self, mock_try_model):
-    '''generate_report_summary should try the next Gemini model after a failed model.'''
-    result = inference.generate_report_summary({'1.1': 1.0}, MagicMock())
-    self.assertEqual(json.loads(result), {'1.1': 'fallback ok'})
-    self.assertEqual(mock_try_model.call_count, 2)
-
-
-class TestGeminiHelpers(unittest.TestCase):
-  '''Unit tests for private Gemini helper functions in inference.py.'''
-
-  def test_parse_gemini_text_extracts_outer_json_from_wrapped_text(self):
-    raw = 'intro text\n```json\n{"1.1": "good"}\n```\noutro'
-    self.assertEqual(inference._parse_gemini_text(raw), '{"1.1": "good"}')  # pylint: disable=protected-access
-
-  @patch('inference.time.sleep')
-  def test_handle_gemini_error_sleeps_for_rate_limit(self, mock_sleep):
-    inference._handle_gemini_error(RuntimeError('429 RESOURCE_EXHAUSTED'), 'gemini-2.5-flash', 1)  # pylint: disable=protected-access
-    mock_sleep.assert_called_once_with(30)
-
-  @patch('inference.time.sleep')
-  def test_handle_gemini_error_sleeps_for_unavailable_signal(self, mock_sleep):
-    inference._handle_gemini_error(RuntimeError('503 high demand'), 'gemini-2.5-flash', 1)  # pylint: disable=protected-access
-    mock_sleep.assert_called_once_with(6)
-
-  def test_handle_gemini_error_reraises_unknown_errors(self):
-    with self.assertRaises(RuntimeError):
-      inference._handle_gemini_error(RuntimeError('unexpected boom'), 'gemini-2.5-flash', 0)  # pylint: disable=protected-access
-
-  def test_try_gemini_model_retries_empty_and_invalid_before_success(self):
-    gemini = MagicMock()
-    gemini.models.generate_content.side_effect = [
-      MagicMock(text=''),
-      MagicMock(text='not-json'),
-      MagicMock(text='{"1.1": "ok"}'),
-    ]
-
-    result = inference._try_gemini_model(gemini, 'gemini-2.5-flash', 'query', MagicMock())  # pylint: disable=protected-access
-
-    self.assertEqual(json.loads(result), {'1.1': 'ok'})
-    self.assertEqual(gemini.models.generate_content.call_count, 3)
-
-  def test_try_gemini_model_returns_none_after_three_empty_responses(self):
-    gemini = MagicMock()
-    gemini.models.generate_content.side_effect = [
-      MagicMock(text=''),
-      MagicMock(text=''),
-      MagicMock(text=''),
-    ]
-
-    result = inference._try_gemini_model(gemini, 'gemini-2.5-flash', 'query', MagicMock())  # pylint: disable=protected-access
-
-    self.assertIsNone(result)
-    self.assertEqual(gemini.models.generate_content.call_count, 3)
-
-  @patch('inference._handle_gemini_error')
-  def test_try_gemini_model_routes_exceptions_to_error_handler(self, mock_handle_error):
-    gemini = MagicMock()
-    gemini.models.generate_content.side_effect = RuntimeError('temporary failure')
-
-    result = inference._try_gemini_model(gemini, 'gemini-2.5-flash', 'query', MagicMock())  # pylint: disable=protected-access
-
-    self.assertIsNone(result)
-    self.assertEqual(mock_handle_error.call_count, 3)
-
-
-# ---------------------------------------------------------------------------
-# listener.wait_for_models  (2 tests)
-# ---------------------------------------------------------------------------
-
-class TestWaitForModels(unittest.TestCase):
-  '''Unit tests for wait_for_models() in listener.py'''
-
-  @patch('listener.time.sleep')
-  @patch('listener.Path.exists', return_value=False)
-  def test_raises_timeout_error_when_models_never_appear(self, mock_exists, mock_sleep):
-    '''wait_for_models should raise TimeoutError once the deadline passes with no models found.'''
-    import itertools
-    # Supply enough values for logging internals, then deadline-exceeded
-    time_values = itertools.chain([0] * 10, itertools.repeat(999999))
-    with patch('listener.time.time', side_effect=time_values):
-      with self.assertRaises(TimeoutError):
-        listener.wait_for_models(timeout_minutes=1)
-
-  @patch('listener.time.sleep')
-  @patch('listener.time.time', return_value=0)
-  @patch('listener.os.listdir', return_value=['model.pkl'])
-  @patch('listener.Path.exists', return_value=True)
-  def test_returns_without_sleeping_when_both_models_present(self, mock_exists, mock_listdir,
-                                                              mock_time, mock_sleep):
-    '''wait_for_models should return immediately without sleeping when models are already on disk.'''
-    listener.wait_for_models(timeout_minutes=1)
-    mock_sleep.assert_not_called()
-
-
-# ---------------------------------------------------------------------------
-# listener small helpers / guards  (5 tests)
-# ---------------------------------------------------------------------------
-
-class TestListenerHelpers(unittest.TestCase):
-  '''Unit tests for listener helper functions and update guards.'''
-
-  def test_get_env_returns_first_non_empty_alias(self):
-    with patch.dict('listener.os.environ', {'SECOND': 'value'}, clear=True):
-      self.assertEqual(listener.get_env('FIRST', 'SECOND'), 'value')
-
-  def test_get_env_returns_empty_string_when_missing(self):
-    with patch.dict('listener.os.environ', {}, clear=True):
-      self.assertEqual(listener.get_env('A', 'B'), '')
-
-  def test_handle_updated_report_ignores_non_generating_feedback(self):
-    payload = {'data': {'record': {'llm_feedback': 'done'}, 'old_record': {'llm_feedback': 'old'}}}
-    with patch('listener.handle_new_report') as mock_handle:
-      listener.handle_updated_report(payload, MagicMock(), MagicMock())
-    mock_handle.assert_not_called()
-
-  def test_handle_updated_report_ignores_null_or_existing_generating_old_feedback(self):
-    payloads = [
-      {'data': {'record': {'llm_feedback': listener.GENERATING_PLACEHOLDER}, 'old_record': {'llm_feedback': None}}},
-      {'data': {'record': {'llm_feedback': listener.GENERATING_PLACEHOLDER}, 'old_record': {'llm_feedback': listener.GENERATING_PLACEHOLDER}}},
-    ]
-    for payload in payloads:
-      with patch('listener.handle_new_report') as mock_handle:
-        listener.handle_updated_report(payload, MagicMock(), MagicMock())
-      mock_handle.assert_not_called()
-
-  def test_handle_updated_report_calls_handle_new_report_on_manual_regeneration(self):
-    payload = {'data': {'record': {'llm_feedback': listener.GENERATING_PLACEHOLDER, 'id': 'r1'}, 'old_record': {'llm_feedback': 'old text'}}}
-    with patch('listener.handle_new_report') as mock_handle:
-      listener.handle_updated_report(payload, MagicMock(), MagicMock())
-    mock_handle.assert_called_once()
-
-
-# ---------------------------------------------------------------------------
-# listener.handle_new_response  (2 tests)
-# ---------------------------------------------------------------------------
-
-class TestHandleNewResponse(unittest.TestCase):
-  '''Unit tests for handle_new_response() in listener.py'''
-
-  def _make_payload(self):
-    return {'data': {'record': {
-      'response_id': 'test-id-123',
-      'response': {'response': {'kf1': {'1.1': {'text': ['good'], '1.1.1': True}}}},
-    }}}
-
-  @patch('listener.svm_infer', return_value={'1.1': 2})
-  @patch('listener.deberta_infer', return_value={'1.1': 0})
-  def test_weighted_average_is_deberta_025_plus_svm_075(self, mock_deberta, mock_svm):
-    '''handle_new_response result should equal deberta*0.25 + svm*0.75 for each key.'''
-    mock_supabase = MagicMock()
-    listener.handle_new_response(self._make_payload(), MagicMock(), {}, mock_supabase)
-
-    inserted = mock_supabase.table().insert.call_args[0][0]
-    # deberta=0, svm=2 → 0*0.25 + 2*0.75 = 1.5
-    self.assertAlmostEqual(inserted['results']['1.1'], 1.5)
-
-  @patch('listener.svm_infer', return_value={'1.1': 1})
-  @patch('listener.deberta_infer', return_value={'1.1': 1})
-  def test_inserts_row_with_correct_response_id(self, mock_deberta, mock_svm):
-    '''handle_new_response should insert into form_results with the payload response_id.'''
-    mock_supabase = MagicMock()
-    listener.handle_new_response(self._make_payload(), MagicMock(), {}, mock_supabase)
-
-    mock_supabase.table.assert_called_with('form_results')
-    inserted = mock_supabase.table().insert.call_args[0][0]
-    self.assertEqual(inserted['response_id'], 'test-id-123')
-
-  @patch('listener.svm_infer', return_value={'1.1': 2})
-  @patch('listener.deberta_infer', return_value={'1.1': 2})
-  def test_handle_updated_response_uses_upsert(self, mock_deberta, mock_svm):
-    '''handle_updated_response should upsert into form_results instead of insert.'''
-    mock_supabase = MagicMock()
-    listener.handle_updated_response(self._make_payload(), MagicMock(), {}, mock_supabase)
-
-    mock_supabase.table.assert_called_with('form_results')
-    upserted = mock_supabase.table().upsert.call_args[0][0]
-    self.assertEqual(upserted['response_id'], 'test-id-123')
-
-  @patch('listener.deberta_infer', side_effect=RuntimeError('boom'))
-  def test_handle_new_response_logs_exception(self, mock_deberta):
-    '''handle_new_response should swallow exceptions and log them.'''
-    with patch.object(listener.error_log, 'exception') as mock_error:
-      listener.handle_new_response(self._make_payload(), MagicMock(), {}, MagicMock())
-    mock_error.assert_called_once()
-
-  @patch('listener.deberta_infer', side_effect=RuntimeError('boom'))
-  def test_handle_updated_response_logs_exception(self, mock_deberta):
-    '''handle_updated_response should swallow exceptions and log them.'''
-    with patch.object(listener.error_log, 'exception') as mock_error:
-      listener.handle_updated_response(self._make_payload(), MagicMock(), {}, MagicMock())
-    mock_error.assert_called_once()
-
-
-# ---------------------------------------------------------------------------
-# listener.handle_new_report  (2 tests)
-# ---------------------------------------------------------------------------
-
-class TestHandleNewReport(unittest.TestCase):
-  '''Unit tests for handle_new_report() in listener.py'''
-
-  def _make_supabase_with_data(self, kf_avg_data):
-    mock_supabase = MagicMock()
-    mock_row = MagicMock()
-    mock_row.data = {'kf_avg_data': kf_avg_data}
-    (mock_supabase.table.return_value
-     .select.return_value
-     .eq.return_value
-     .single.return_value
-     .execute.return_value) = mock_row
-    return mock_supabase
-
-  def test_empty_kf_avg_data_writes_no_assessment_message(self):
-    '''handle_new_report should update llm_feedback with a "no data" message when kf_avg_data is None.'''
-    mock_supabase = self._make_supabase_with_data(kf_avg_data=None)
-    listener.handle_new_report({'data': {'record': {'id': 'rpt-1'}}}, MagicMock(), mock_supabase)
-
-    update_calls = [str(c) for c in mock_supabase.table().update.call_args_list]
-    self.assertTrue(any('No assessment' in c for c in update_calls))
-
-  @patch('listener.generate_report_summary', side_effect=RuntimeError('API down'))
-  def test_exception_writes_error_message_to_llm_feedback(self, mock_summary):
-    '''handle_new_report should catch exceptions and write an error string to llm_feedback.'''
-    mock_supabase = self._make_supabase_with_data(kf_avg_data={'1.1': 2.0})
-    listener.handle_new_report({'data': {'record': {'id': 'rpt-2'}}}, MagicMock(), mock_supabase)
-
-    update_calls = [str(c) for c in mock_supabase.table().update.call_args_list]
-    self.assertTrue(any('_error' in c for c in update_calls))
-
-  @patch('listener.generate_report_summary', return_value='{"1.1": "good"}')
-  def test_successful_summary_written_to_llm_feedback(self, mock_summary):
-    '''handle_new_report should persist successful Gemini feedback as-is.'''
-    mock_supabase = self._make_supabase_with_data(kf_avg_data={'1.1': 2.0})
-    listener.handle_new_report({'data': {'record': {'id': 'rpt-ok'}}}, MagicMock(), mock_supabase)
-
-    update_calls = mock_supabase.table().update.call_args_list
-    self.assertTrue(any('{"1.1": "good"}' in str(call) for call in update_calls))
-
-  @patch('listener.generate_report_summary', return_value='Error generating feedback: timeout')
-  def test_summary_error_string_is_mapped_to_error_json(self, mock_summary):
-    '''handle_new_report should wrap generator error strings in stored _error JSON.'''
-    mock_supabase = self._make_supabase_with_data(kf_avg_data={'1.1': 2.0})
-    listener.handle_new_report({'data': {'record': {'id': 'rpt-err'}}}, MagicMock(), mock_supabase)
-
-    update_calls = mock_supabase.table().update.call_args_list
-    self.assertTrue(any('_error' in str(call) for call in update_calls))
-
-  def test_exception_maps_503_to_friendly_message(self):
-    '''503-like exceptions should be converted to the temporary-unavailable message.'''
-    mock_supabase = self._make_supabase_with_data(kf_avg_data={'1.1': 2.0})
-    with patch('listener.generate_report_summary', side_effect=RuntimeError('503 high demand')):
-      listener.handle_new_report({'data': {'record': {'id': 'rpt-503'}}}, MagicMock(), mock_supabase)
-
-    update_calls = mock_supabase.table().update.call_args_list
-    self.assertTrue(any('temporarily unavailable' in str(call) for call in update_calls))
-
-  def test_exception_maps_429_to_friendly_message(self):
-    mock_supabase = self._make_supabase_with_data(kf_avg_data={'1.1': 2.0})
-    with patch('listener.generate_report_summary', side_effect=RuntimeError('429 RESOURCE_EXHAUSTED')):
-      listener.handle_new_report({'data': {'record': {'id': 'rpt-429'}}}, MagicMock(), mock_supabase)
-    self.assertTrue(any('usage limit was reached' in str(call) for call in mock_supabase.table().update.call_args_list))
-
-  def test_exception_maps_401_to_friendly_message(self):
-    mock_supabase = self._make_supabase_with_data(kf_avg_data={'1.1': 2.0})
-    with patch('listener.generate_report_summary', side_effect=RuntimeError('401 API_KEY invalid')):
-      listener.handle_new_report({'data': {'record': {'id': 'rpt-401'}}}, MagicMock(), mock_supabase)
-    self.assertTrue(any('authentication error' in str(call) for call in mock_supabase.table().update.call_args_list))
+    self.assertEqual(sorted(os.listdir(local_dir)),
+                     ['artifact-manifest.json', 'kf1.pkl', 'kf2.pkl'])
+    with open(os.path.join(local_dir, 'kf2.pkl'), 'rb') as f:
+      self.assertEqual(f.read(), b'model-two')
+
+  def test_download_svm_models_fetches_only_the_bundle_when_present(self):
+    '''With a bundle manifest in the bucket only the bundle and manifest should be downloaded.'''
+    buffer = io.BytesIO()
+    np.savez(buffer, **{'mcq_kf1_1.coef': np.ones((1, 2)), 'mcq_kf1_1.intercept': np.zeros(1),
+                        'mcq_kf1_1.classes': np.array([0, 1]),
+                        'mcq_kf1_1.features': np.array(['a', 'b'])})
+    blob = buffer.getvalue()
+    manifest = {'format': 'svm-linear-ovo', 'format_version': 1, 'file': 'svm-models.npz',
+                'sha256': hashlib.sha256(blob).hexdigest(), 'models': ['mcq_kf1_1']}
+    bucket = self._bucket({'mcq_kf1_1.pkl': b'pickle', 'svm-models.npz': blob,
+                           'svm-models.json': json.dumps(manifest).encode()})
+    supabase = MagicMock()
+    supabase.storage.from_.return_value = bucket
+    local_dir = os.path.join(self.tmp, 'svm')
+
+    inference.download_svm_models(supabase, local_dir=local_dir, cache=self.cache)
+    self.assertEqual(sorted(os.listdir(local_dir)),
+                     ['artifact-manifest.json', 'svm-models.json', 'svm-models.npz'])
+    self.assertEqual(bucket.download.call_count, 2)
+
+    # A second cold start finds both unchanged objects in the cache and downloads nothing.
+    inference.download_svm_models(supabase, local_dir=os.path.join(self.tmp, 'svm2'),
+                                  cache=self.cache)
+    self.assertEqual(bucket.download.call_count, 2)
+
+  def test_download_svm_models_rejects_a_corrupt_bundle(self):
+    '''A bundle that does not match its manifest hash should not be installed.'''
+    manifest = {'file': 'svm-models.npz', 'sha256': '0' * 64, 'models': []}
+    bucket = self._bucket({'svm-models.npz': b'truncated',
+                           'svm-models.json': json.dumps(manifest).encode()})
+    supabase = MagicMock()
+    supabase.storage.from_.return_value = bucket
+    local_dir = os.path.join(self.tmp, 'svm')
+    with self.assertRaises(ValueError):
+      inference.download_svm_models(supabase, local_dir=local_dir, cache=self.cache)
+    self.assertEqual(os.listdir(local_dir), [])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,107 @@
+"""Unit tests for artifact_cache.py."""
+
+import hashlib
+import os
+import tempfile
+import unittest
+
+import artifact_cache
+from artifact_cache import ArtifactCache
+
+
+class TestArtifactCache(unittest.TestCase):
+  """Tests for artifact_cache.ArtifactCache and the manifest helpers."""
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.tmp = tmp.name
+    self.cache = ArtifactCache(os.path.join(self.tmp, 'cache'))
+    self.src = os.path.join(self.tmp, 'src')
+    self.dest = os.path.join(self.tmp, 'dest')
+    os.makedirs(self.src)
+
+  def write(self, directory, name, data):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), 'wb') as f:
+      f.write(data)
+
+  def read(self, directory, name):
+    with open(os.path.join(directory, name), 'rb') as f:
+      return f.read()
+
+  def stage(self, files):
+    for name, data in files.items():
+      self.write(self.src, name, data)
+    manifest = artifact_cache.build_manifest(self.src)
+    for name, entry in manifest['files'].items():
+      self.cache.add(os.path.join(self.src, name), entry['sha256'])
+    return manifest
+
+  def test_manifest_lists_size_and_digest(self):
+    """build_manifest should record every file's size and SHA-256, but not an existing manifest."""
+    self.write(self.src, 'a.bin', b'abc')
+    self.write(self.src, artifact_cache.ARTIFACT_MANIFEST, b'{}')
+    manifest = artifact_cache.build_manifest(self.src)
+    self.assertEqual(manifest, {'files': {'a.bin': {'size': 3,
+                                                    'sha256': hashlib.sha256(b'abc').hexdigest()}}})
+
+  def test_add_rejects_a_file_that_does_not_match_its_digest(self):
+    """A download that does not hash to the expected digest must not enter the cache."""
+    self.write(self.src, 'a.bin', b'abc')
+    with self.assertRaises(ValueError):
+      self.cache.add(os.path.join(self.src, 'a.bin'), '0' * 64)
+    self.assertFalse(self.cache.has('0' * 64))
+
+  def test_identical_content_is_stored_once(self):
+    """Two files with the same content share one cached object."""
+    manifest = self.stage({'a.bin': b'same', 'b.bin': b'same'})
+    digest = manifest['files']['a.bin']['sha256']
+    self.assertTrue(self.cache.has(digest, 4))
+    self.assertEqual(os.listdir(os.path.dirname(self.cache.path(digest))), [digest])
+
+  def test_install_writes_files_and_manifest_and_drops_stale_files(self):
+    """Installing a new manifest replaces files and removes ones the previous install owned."""
+    self.cache.install(self.stage({'a.bin': b'v1', 'old.bin': b'gone'}), self.dest)
+    self.write(self.dest, 'notes.txt', b'mine')
+    self.cache.install(self.stage({'a.bin': b'v2'}), self.dest)
+    self.assertEqual(sorted(os.listdir(self.dest)),
+                     ['a.bin', artifact_cache.ARTIFACT_MANIFEST, 'notes.txt'])
+    self.assertEqual(self.read(self.dest, 'a.bin'), b'v2')
+
+  def test_repair_restores_damaged_files_from_the_cache(self):
+    """Missing or resized files come back without a download; deep checks catch same-size edits."""
+    self.cache.install(self.stage({'a.bin': b'aaaa', 'b.bin': b'bbbb'}), self.dest)
+    os.remove(os.path.join(self.dest, 'a.bin'))
+    os.remove(os.path.join(self.dest, 'b.bin'))
+    self.write(self.dest, 'b.bin', b'XXXX')
+    manifest = artifact_cache.read_manifest(self.dest)
+    self.assertEqual(artifact_cache.damaged_files(self.dest, manifest), ['a.bin'])
+    self.assertEqual(artifact_cache.damaged_files(self.dest, manifest, deep=True),
+                     ['a.bin', 'b.bin'])
+
+    self.assertEqual(self.cache.repair(self.dest, deep=True), [])
+    self.assertEqual((self.read(self.dest, 'a.bin'), self.read(self.dest, 'b.bin')),
+                     (b'aaaa', b'bbbb'))
+
+  def test_repair_reports_files_missing_from_the_cache(self):
+    """Damaged files whose objects are gone too must be downloaded again."""
+    manifest = self.stage({'a.bin': b'aaaa'})
+    self.cache.install(manifest, self.dest)
+    os.remove(os.path.join(self.dest, 'a.bin'))
+    os.chmod(self.cache.path(manifest['files']['a.bin']['sha256']), 0o644)
+    os.remove(self.cache.path(manifest['files']['a.bin']['sha256']))
+    self.assertEqual(self.cache.repair(self.dest), ['a.bin'])
+
+  def test_staging_survives_until_discarded(self):
+    """A staging directory is reused across attempts so a retried download can resume."""
+    staging = self.cache.staging_dir('dl')
+    self.write(staging, 'part.bin', b'x')
+    self.assertEqual(self.cache.staging_dir('dl'), staging)
+    self.assertTrue(os.path.exists(os.path.join(staging, 'part.bin')))
+    self.cache.discard_staging('dl')
+    self.assertFalse(os.path.exists(staging))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,104 @@
+"""Unit tests for async_db.py."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import unittest
+
+from async_db import AsyncDatabase
+
+
+class _Builder:
+  """Async PostgREST builder stand-in that records its chain and answers after ``delay_s``."""
+
+  def __init__(self, client, chain):
+    self.client = client
+    self.chain = chain
+
+  def __getattr__(self, name):
+    return lambda *args, **kwargs: _Builder(self.client, self.chain + [(name, args)])
+
+  async def execute(self):
+    self.client.active += 1
+    self.client.peak = max(self.client.peak, self.client.active)
+    self.client.threads.add(threading.current_thread().name)
+    try:
+      await asyncio.sleep(self.client.delay_s)
+      return self.chain
+    finally:
+      self.client.active -= 1
+
+
+class _AsyncClient:
+
+  def __init__(self, delay_s=0.0):
+    self.delay_s = delay_s
+    self.active = 0
+    self.peak = 0
+    self.threads = set()
+
+  def table(self, name):
+    return _Builder(self, [('table', (name,))])
+
+  def rpc(self, fn, params):
+    return _Builder(self, [('rpc', (fn, params))])
+
+
+class TestAsyncDatabase(unittest.TestCase):
+  """Tests for async_db.AsyncDatabase."""
+
+  def setUp(self):
+    self.loop = asyncio.new_event_loop()
+    self.thread = threading.Thread(target=self.loop.run_forever, name='loop', daemon=True)
+    self.thread.start()
+    self.addCleanup(self.thread.join, 5)
+    self.addCleanup(self.loop.call_soon_threadsafe, self.loop.stop)
+
+  def database(self, client, **kwargs):
+    return asyncio.run_coroutine_threadsafe(self._make(client, **kwargs), self.loop).result()
+
+  async def _make(self, client, **kwargs):
+    return AsyncDatabase(client, self.loop, **kwargs)
+
+  def test_requests_from_threads_run_on_the_loop(self):
+    """A request built on a worker thread should be replayed and awaited on the event loop."""
+    client = _AsyncClient()
+    db = self.database(client)
+    chain = db.table('student_reports').update({'llm_feedback': 'x'}).eq('id', 7).execute()
+    self.assertEqual(chain, [('table', ('student_reports',)), ('update', ({'llm_feedback': 'x'},)),
+                             ('eq', ('id', 7))])
+    self.assertEqual(db.rpc('generate_report', {'id': 7}).execute(),
+                     [('rpc', ('generate_report', {'id': 7}))])
+    self.assertEqual(client.threads, {'loop'})
+    self.assertIn('2 calls', str(db))
+
+  def test_concurrent_calls_are_bounded(self):
+    """No more than max_concurrency requests are in flight, however many threads call at once."""
+    client = _AsyncClient(delay_s=0.02)
+    db = self.database(client, max_concurrency=3)
+    with ThreadPoolExecutor(12) as pool:
+      list(pool.map(lambda i: db.table('form_results').select('*').eq('response_id', i).execute(),
+                    range(24)))
+    self.assertEqual(client.peak, 3)
+    self.assertEqual((db.calls, db.peak_in_flight, db.in_flight), (24, 3, 0))
+
+  def test_slow_request_times_out(self):
+    """A request that outlives timeout_s should raise TimeoutError and free its slot."""
+    db = self.database(_AsyncClient(delay_s=1), max_concurrency=1, timeout_s=0.05)
+    with self.assertRaises(TimeoutError):
+      db.table('form_results').select('*').execute()
+    self.assertEqual((db.timeouts, db.in_flight), (1, 0))
+
+  def test_blocking_call_on_the_loop_thread_is_refused(self):
+    """Waiting on the loop from the loop's own thread would deadlock, so it must raise instead."""
+    db = self.database(_AsyncClient())
+
+    async def call():
+      return db.table('form_results').select('*').execute()
+
+    with self.assertRaises(RuntimeError):
+      asyncio.run_coroutine_threadsafe(call(), self.loop).result()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,166 @@
+"""Unit tests for catch_up.py."""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from catch_up import catch_up, response_page, stuck_reports, unscored_responses
+from event_journal import EventJournal
+
+
+class _Query:
+  """PostgREST query stand-in over an in-memory table supporting the filters the scans use."""
+
+  def __init__(self, db, table):
+    self.db = db
+    self.rows = list(db.tables[table])
+    self.columns = None
+    self.limit_n = None
+
+  def select(self, columns):
+    self.columns = [c.strip() for c in columns.split(',')]
+    return self
+
+  def eq(self, column, value):
+    self.rows = [r for r in self.rows if r.get(column) == value]
+    return self
+
+  def gt(self, column, value):
+    self.rows = [r for r in self.rows if r[column] > value]
+    return self
+
+  def in_(self, column, values):
+    self.db.in_sizes.append(len(values))
+    self.rows = [r for r in self.rows if r[column] in values]
+    return self
+
+  def order(self, column):
+    self.rows.sort(key=lambda r: r[column])
+    return self
+
+  def limit(self, n):
+    self.limit_n = n
+    return self
+
+  def execute(self):
+    self.db.requests += 1
+    rows = self.rows[:self.limit_n] if self.limit_n is not None else self.rows
+    return type('Response', (), {'data': [{c: r.get(c) for c in self.columns} for r in rows]})()
+
+
+class _Supabase:
+
+  def __init__(self, **tables):
+    self.tables = tables
+    self.requests = 0
+    self.in_sizes = []
+
+  def table(self, name):
+    return _Query(self, name)
+
+
+class TestUnscoredResponses(unittest.TestCase):
+  """Tests for catch_up.unscored_responses."""
+
+  def setUp(self):
+    self.db = _Supabase(
+        form_responses=[{'response_id': f'r{i:02d}', 'response': {'response': {'i': i}}}
+                        for i in range(10)],
+        form_results=[{'response_id': f'r{i:02d}'} for i in range(10) if i % 3])
+
+  def test_pages_through_the_table_and_returns_only_unscored_records(self):
+    """Keyset pages should together cover every response once, yielding those without results."""
+    found, cursor, pages = [], None, 0
+    while True:
+      records, cursor = unscored_responses(self.db, cursor, limit=4)
+      found += records
+      pages += 1
+      if cursor is None:
+        break
+    self.assertEqual([r['response_id'] for r in found], ['r00', 'r03', 'r06', 'r09'])
+    self.assertEqual(found[1]['response'], {'response': {'i': 3}})
+    self.assertEqual(pages, 3)
+    self.assertLessEqual(max(self.db.in_sizes), 4)
+
+  def test_fully_scored_page_fetches_no_payloads(self):
+    """A page with no missing results should cost the id listing and the results lookup only."""
+    self.db.tables['form_results'] = [{'response_id': f'r{i:02d}'} for i in range(10)]
+    records, cursor = unscored_responses(self.db, None, limit=5)
+    self.assertEqual((records, cursor, self.db.requests), ([], 'r04', 2))
+
+
+class TestResponsePage(unittest.TestCase):
+  """Tests for catch_up.response_page."""
+
+  def test_returns_every_record_in_keyset_pages(self):
+    """Scored and unscored responses alike are returned, one page per request."""
+    db = _Supabase(form_responses=[{'response_id': f'r{i}', 'response': {'response': {'i': i}}}
+                                   for i in range(5)])
+    first, cursor = response_page(db, None, limit=3)
+    rest, end = response_page(db, cursor, limit=3)
+    self.assertEqual(([r['response_id'] for r in first], cursor), (['r0', 'r1', 'r2'], 'r2'))
+    self.assertEqual(([r['response_id'] for r in rest], end), (['r3', 'r4'], None))
+    self.assertEqual((rest[0]['response'], db.requests), ({'response': {'i': 3}}, 2))
+
+
+class TestStuckReports(unittest.TestCase):
+  """Tests for catch_up.stuck_reports."""
+
+  def test_returns_placeholder_reports_in_pages(self):
+    """Only reports still showing the placeholder are returned, continuing from the cursor."""
+    db = _Supabase(student_reports=[{'id': i, 'llm_feedback': 'Generating...' if i % 2 else 'done',
+                                     'kf_avg_data': {}} for i in range(6)])
+    first, cursor = stuck_reports(db, 'Generating...', limit=2)
+    rest, end = stuck_reports(db, 'Generating...', cursor, limit=2)
+    self.assertEqual(([r['id'] for r in first], cursor), ([1, 3], 3))
+    self.assertEqual(([r['id'] for r in rest], end), ([5], None))
+
+
+
+class TestCatchUp(unittest.IsolatedAsyncioTestCase):
+  """Tests for catch_up.catch_up."""
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.journal = EventJournal(os.path.join(tmp.name, 'events.sqlite3'))
+    self.addCleanup(self.journal.close)
+
+  async def test_replays_the_journal_and_scans_for_missed_work(self):
+    """Journaled events and unscored rows are queued in batches, each row at most once."""
+    payload = {'data': {'record': {'response_id': 'j', 'response': {'response': {'x': 1}}}}}
+    self.journal.record('form_responses', 'insert', 'j', payload, 'd')
+    self.journal.record('student_reports', 'insert', '9', {'data': {'record': {'id': 9}}})
+    pages = [([{'response_id': 'j', 'response': {'response': {'x': 1}}},
+               {'response_id': 'u1', 'response': {'response': {'x': 1}}},
+               {'response_id': 'empty', 'response': None}], 'cursor'),
+             ([{'response_id': 'u2', 'response': {'response': {'x': 1}}}], None)]
+    reports = [([{'id': 9}, {'id': 10}], None)]
+    scored, regenerated = [], []
+
+    async def score(events):
+      scored.append([payload['data']['record']['response_id'] for _, payload in events])
+
+    async def regenerate(payload):
+      regenerated.append(payload['data']['record']['id'])
+
+    with patch('catch_up.unscored_responses', side_effect=pages) as mock_scan, \
+         patch('catch_up.stuck_reports', side_effect=reports), \
+         patch('catch_up.CATCH_UP_BATCH', 2):
+      await catch_up(MagicMock(), score, regenerate, self.journal, replay_before=time.time() + 1)
+    self.assertEqual(scored, [['j', 'u1'], ['u2']])
+    self.assertEqual(regenerated, [9, 10])
+    self.assertEqual(mock_scan.call_args_list[1][0][1], 'cursor')
+
+  async def test_failed_scan_is_logged_not_raised(self):
+    """A catch-up that cannot reach Supabase must not take the listener down."""
+    with patch('catch_up.unscored_responses', side_effect=RuntimeError('down')), \
+         patch('catch_up.error_log.exception') as mock_log:
+      await catch_up(MagicMock(), AsyncMock(), AsyncMock())
+    mock_log.assert_called_once()
+
+
+if __name__ == '__main__':
+  unittest.main()
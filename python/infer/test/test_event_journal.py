@@ -0,0 +1,72 @@
+"""Unit tests for event_journal.py."""
+
+import os
+import tempfile
+import time
+import unittest
+
+from event_journal import EventJournal
+
+
+class TestEventJournal(unittest.TestCase):
+  """Tests for event_journal.EventJournal."""
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.path = os.path.join(tmp.name, 'journal', 'events.sqlite3')
+    self.journal = self.open()
+
+  def open(self):
+    journal = EventJournal(self.path)
+    self.addCleanup(journal.close)
+    return journal
+
+  def test_pending_events_survive_a_restart(self):
+    """Events recorded but never completed are pending in a journal reopened on the same file."""
+    self.journal.record('form_responses', 'insert', 'a', {'n': 1}, 'd1')
+    self.journal.record('student_reports', 'insert', 7, {'n': 2})
+    self.journal.complete('student_reports', 7)
+    self.journal.close()
+
+    reopened = self.open()
+    self.assertEqual(reopened.pending(), [('form_responses', 'insert', 'a', {'n': 1})])
+    self.assertEqual(reopened.pending_keys('form_responses'), {'a'})
+    self.assertEqual(len(reopened), 1)
+
+  def test_newer_payload_replaces_the_pending_one_and_keeps_insert(self):
+    """An update to a row with a pending insert keeps the insert kind and takes the new payload."""
+    self.journal.record('form_responses', 'insert', 'a', {'n': 1}, 'd1')
+    self.journal.record('form_responses', 'update', 'a', {'n': 2}, 'd2')
+    self.assertEqual(self.journal.pending(), [('form_responses', 'insert', 'a', {'n': 2})])
+
+  def test_completing_an_older_payload_leaves_the_newer_one_pending(self):
+    """A handler finishing a superseded payload must not mark the newer event done."""
+    self.journal.record('form_responses', 'update', 'a', {'n': 1}, 'd1')
+    self.journal.record('form_responses', 'update', 'a', {'n': 2}, 'd2')
+    self.assertFalse(self.journal.complete('form_responses', 'a', 'd1'))
+    self.assertTrue(self.journal.complete('form_responses', 'a', 'd2'))
+    self.assertEqual(self.journal.pending(), [])
+    self.assertIn('1 handled', str(self.journal))
+
+  def test_pending_before_excludes_events_received_later(self):
+    """Replay at startup should only pick up events from before the current process started."""
+    self.journal.record('form_responses', 'insert', 'old', {}, 'd')
+    started = time.time()
+    self.journal.record('form_responses', 'insert', 'new', {}, 'd')
+    self.assertEqual([key for _, _, key, _ in self.journal.pending(before=started)], ['old'])
+
+  def test_prune_removes_only_old_handled_events(self):
+    """Handled events past the retention window are deleted; pending ones are kept."""
+    journal = EventJournal(self.path, retention_s=0)
+    self.addCleanup(journal.close)
+    journal.record('form_responses', 'insert', 'a', {}, 'd')
+    journal.record('form_responses', 'insert', 'b', {}, 'd')
+    journal.complete('form_responses', 'a')
+    time.sleep(0.01)
+    self.assertEqual(journal.prune(), 1)
+    self.assertEqual(journal.pending_keys('form_responses'), {'b'})
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,638 @@
+# pylint: disable=unused-argument
+
+"""Unit tests for listener.py.
+
+The models, Supabase and Gemini are replaced by mocks, so no model files or
+network access are needed.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# test_benchmark.py stubs ``inference`` when it is collected first; listener needs the real module.
+if 'inference' in sys.modules and not hasattr(sys.modules['inference'], 'LogitCache'):
+  del sys.modules['inference']
+
+from inference import LogitCache  # noqa: E402
+import listener  # noqa: E402
+
+
+def _models(pool=None) -> listener.ModelSet:
+  """A model set whose DeBERTa and SVM calls are patched out by the tests."""
+  return listener.ModelSet(MagicMock(), LogitCache('d1'), {}, 's1', pool)
+
+
+class TestStartup(unittest.IsolatedAsyncioTestCase):
+  """Unit tests for the concurrent startup in listener.main()"""
+
+  def setUp(self):
+    self.env = patch.dict('listener.os.environ', {
+      'SUPABASE_URL': 'u', 'SUPABASE_SERVICE_ROLE_KEY': 'k', 'GOOGLE_GENAI_API_KEY': 'g'})
+    self.env.start()
+    self.addCleanup(self.env.stop)
+
+  async def test_subscribes_once_the_first_model_is_ready(self):
+    """Channels are subscribed while the slower model still loads, and events queued meanwhile."""
+    svm_loaded = threading.Event()
+    subscribed_before_svm = []
+    asupabase = MagicMock()
+    asupabase.realtime.connect = AsyncMock()
+
+    async def subscribe(callback=None):
+      subscribed_before_svm.append(not svm_loaded.is_set())
+
+    asupabase.realtime.channel.return_value.on_postgres_changes.return_value.subscribe = subscribe
+
+    def slow_svm(*args):
+      svm_loaded.wait(5)
+      return 'svm', 'svm-v1'
+
+    with patch('listener.spb.create_client', create=True), \
+         patch('listener.spb.acreate_client', AsyncMock(return_value=asupabase), create=True), \
+         patch('listener.spb.AClientOptions', create=True), \
+         patch('listener.create_gemini_client'), \
+         patch('startup.prepare_deberta', return_value=('deberta', MagicMock())), \
+         patch('startup.prepare_svm', side_effect=slow_svm), \
+         patch('listener.MODEL_HOT_RELOAD', False), \
+         patch('listener.RESULT_SPILL_PATH', ''), \
+         patch('listener.EVENT_JOURNAL_PATH', ''), \
+         patch('listener.CATCH_UP', False), \
+         patch('listener.handle_response_batch') as mock_batch:
+      main = asyncio.create_task(listener.main())
+      while len(subscribed_before_svm) < 4:
+        await asyncio.sleep(0.01)
+      on_changes = asupabase.realtime.channel.return_value.on_postgres_changes
+      callback = on_changes.call_args_list[0].kwargs['callback']
+      callback({'data': {'record': {'response_id': 'early'}}})
+      svm_loaded.set()
+      for _ in range(200):
+        if mock_batch.called:
+          break
+        await asyncio.sleep(0.01)
+      main.cancel()
+
+    self.assertEqual(subscribed_before_svm, [True] * 4)
+    events = mock_batch.call_args[0][0]
+    self.assertEqual(events, [('insert', {'data': {'record': {'response_id': 'early'}}})])
+    models = mock_batch.call_args[0][1]
+    self.assertEqual((models.deberta, models.svm), ('deberta', 'svm'))
+
+  async def test_a_failed_model_stops_the_other_waiting_for_its_files(self):
+    """When one model fails to load, main re-raises and the other thread stops waiting."""
+    stopped = threading.Event()
+
+    def waiting_svm(supabase, timeline, stop):
+      if stop.wait(5):
+        stopped.set()
+      raise InterruptedError('stopped')
+
+    with patch('listener.spb.create_client', create=True), \
+         patch('listener.spb.acreate_client',
+               AsyncMock(return_value=MagicMock(realtime=AsyncMock())), create=True), \
+         patch('listener.spb.AClientOptions', create=True), \
+         patch('listener.create_gemini_client'), \
+         patch('startup.prepare_deberta', side_effect=RuntimeError('no weights')), \
+         patch('startup.prepare_svm', side_effect=waiting_svm), \
+         patch('listener.RESULT_SPILL_PATH', ''), \
+         patch('listener.EVENT_JOURNAL_PATH', ''):
+      with self.assertRaisesRegex(RuntimeError, 'no weights'):
+        await asyncio.wait_for(listener.main(), 5)
+      await asyncio.to_thread(stopped.wait, 5)
+    self.assertTrue(stopped.is_set())
+
+
+class TestListenerHelpers(unittest.TestCase):
+  """Unit tests for listener helper functions and update guards."""
+
+  def test_handle_updated_report_ignores_non_generating_feedback(self):
+    payload = {'data': {'record': {'llm_feedback': 'done'}, 'old_record': {'llm_feedback': 'old'}}}
+    with patch('listener.handle_new_report') as mock_handle:
+      listener.handle_updated_report(payload, MagicMock(), MagicMock())
+    mock_handle.assert_not_called()
+
+  def test_handle_updated_report_ignores_null_or_existing_generating_old_feedback(self):
+    generating = {'llm_feedback': listener.GENERATING_PLACEHOLDER}
+    payloads = [
+      {'data': {'record': generating, 'old_record': {'llm_feedback': None}}},
+      {'data': {'record': generating, 'old_record': generating}},
+    ]
+    for payload in payloads:
+      with patch('listener.handle_new_report') as mock_handle:
+        listener.handle_updated_report(payload, MagicMock(), MagicMock())
+      mock_handle.assert_not_called()
+
+  def test_handle_updated_report_calls_handle_new_report_on_manual_regeneration(self):
+    payload = {'data': {'record': {'llm_feedback': listener.GENERATING_PLACEHOLDER, 'id': 'r1'},
+                        'old_record': {'llm_feedback': 'old text'}}}
+    with patch('listener.handle_new_report') as mock_handle:
+      listener.handle_updated_report(payload, MagicMock(), MagicMock())
+    mock_handle.assert_called_once()
+
+
+class TestHandleNewResponse(unittest.TestCase):
+  """Unit tests for handle_new_response() in listener.py"""
+
+  def setUp(self):
+    listener._last_scored.clear()  # pylint: disable=protected-access
+    self.models = _models()
+
+  def _make_payload(self):
+    return {'data': {'record': {
+      'response_id': 'test-id-123',
+      'response': {'response': {'kf1': {'1.1': {'text': ['good'], '1.1.1': True}}}},
+    }}}
+
+  @patch('listener.svm_infer', return_value={'1.1': 2})
+  @patch('listener.deberta_infer', return_value={'1.1': 0})
+  def test_weighted_average_is_deberta_025_plus_svm_075(self, mock_deberta, mock_svm):
+    """handle_new_response result should equal deberta*0.25 + svm*0.75 for each key."""
+    mock_supabase = MagicMock()
+    listener.handle_new_response(self._make_payload(), self.models, mock_supabase)
+
+    inserted = mock_supabase.table().insert.call_args[0][0]
+    # deberta=0, svm=2 → 0*0.25 + 2*0.75 = 1.5
+    self.assertAlmostEqual(inserted['results']['1.1'], 1.5)
+
+  @patch('listener.svm_infer', return_value={'1.1': 1})
+  @patch('listener.deberta_infer', return_value={'1.1': 1})
+  def test_inserts_row_with_correct_response_id(self, mock_deberta, mock_svm):
+    """handle_new_response should insert into form_results with the payload response_id."""
+    mock_supabase = MagicMock()
+    listener.handle_new_response(self._make_payload(), self.models, mock_supabase)
+
+    mock_supabase.table.assert_called_with('form_results')
+    inserted = mock_supabase.table().insert.call_args[0][0]
+    self.assertEqual(inserted['response_id'], 'test-id-123')
+
+  @patch('listener.svm_infer', return_value={'1.1': 2})
+  @patch('listener.deberta_infer', return_value={'1.1': 2})
+  def test_handle_updated_response_uses_upsert(self, mock_deberta, mock_svm):
+    """handle_updated_response should upsert into form_results instead of insert."""
+    mock_supabase = MagicMock()
+    listener.handle_updated_response(self._make_payload(), self.models, mock_supabase)
+
+    mock_supabase.table.assert_called_with('form_results')
+    upserted = mock_supabase.table().upsert.call_args[0][0]
+    self.assertEqual(upserted['response_id'], 'test-id-123')
+
+  @patch('listener.deberta_infer', side_effect=RuntimeError('boom'))
+  def test_handle_new_response_logs_exception(self, mock_deberta):
+    """handle_new_response should swallow exceptions and log them."""
+    with patch.object(listener.error_log, 'exception') as mock_error:
+      listener.handle_new_response(self._make_payload(), self.models, MagicMock())
+    mock_error.assert_called_once()
+
+  @patch('listener.deberta_infer', side_effect=RuntimeError('boom'))
+  def test_handle_updated_response_logs_exception(self, mock_deberta):
+    """handle_updated_response should swallow exceptions and log them."""
+    with patch.object(listener.error_log, 'exception') as mock_error:
+      listener.handle_updated_response(self._make_payload(), self.models, MagicMock())
+    mock_error.assert_called_once()
+
+  @patch('listener.svm_infer', return_value={'1.1': 2})
+  @patch('listener.deberta_infer', return_value={'1.1': 2})
+  def test_unchanged_update_skips_inference_and_write(self, mock_deberta, mock_svm):
+    """An UPDATE whose response matches the last scored payload should not re-score or write."""
+    listener.handle_new_response(self._make_payload(), self.models, MagicMock())
+    mock_supabase = MagicMock()
+    listener.handle_updated_response(self._make_payload(), self.models, mock_supabase)
+
+    self.assertEqual(mock_deberta.call_count, 1)
+    mock_supabase.table.assert_not_called()
+
+  @patch('listener.svm_infer', return_value={'1.1': 2})
+  @patch('listener.deberta_infer', return_value={'1.1': 2})
+  def test_changed_update_is_rescored(self, mock_deberta, mock_svm):
+    """An UPDATE with a different response payload should be scored and upserted."""
+    listener.handle_new_response(self._make_payload(), self.models, MagicMock())
+    payload = self._make_payload()
+    payload['data']['record']['response']['response']['kf1']['1.1']['1.1.1'] = False
+    mock_supabase = MagicMock()
+    listener.handle_updated_response(payload, self.models, mock_supabase)
+
+    self.assertEqual(mock_deberta.call_count, 2)
+    mock_supabase.table().upsert.assert_called_once()
+
+
+class TestHandleResponseBatch(unittest.TestCase):
+  """Unit tests for handle_response_batch() in listener.py"""
+
+  def setUp(self):
+    listener._last_scored.clear()  # pylint: disable=protected-access
+    listener._provisional.clear()  # pylint: disable=protected-access
+    self.models = _models()
+
+  def _make_payload(self, response_id, checked=True):
+    return {'data': {'record': {
+      'response_id': response_id,
+      'response': {'response': {'kf1': {'1.1': {'text': ['good'], '1.1.1': checked}}}},
+    }}}
+
+  @patch('listener.svm_infer_many', return_value=[{'1.1': 2}, {'1.1': 0}])
+  @patch('listener.deberta_infer_many', return_value=[{'1.1': 0}, {'1.1': 2}])
+  def test_scores_once_and_writes_each_response(self, mock_deberta, mock_svm):
+    """One batched scoring call should fan out to an insert or upsert per response."""
+    mock_supabase = MagicMock()
+    events = [('insert', self._make_payload('a')), ('update', self._make_payload('b'))]
+    listener.handle_response_batch(events, self.models, mock_supabase)
+
+    mock_deberta.assert_called_once()
+    self.assertEqual(len(mock_deberta.call_args[0][1]), 2)
+    inserted = mock_supabase.table().insert.call_args[0][0]
+    upserted = mock_supabase.table().upsert.call_args[0][0]
+    self.assertEqual(inserted, {'response_id': 'a', 'results': {'1.1': 1.5}})
+    self.assertEqual(upserted, {'response_id': 'b', 'results': {'1.1': 0.5}})
+
+  @patch('listener.svm_infer_many', return_value=[{'1.1': 1}])
+  @patch('listener.deberta_infer_many', return_value=[{'1.1': 1}])
+  def test_rows_record_the_model_version(self, mock_deberta, mock_svm):
+    """With RECORD_MODEL_VERSION on, each row carries the version of the set that scored it."""
+    mock_supabase = MagicMock()
+    with patch('response_scoring.RECORD_MODEL_VERSION', True):
+      listener.handle_response_batch([('insert', self._make_payload('a'))], self.models,
+                                     mock_supabase)
+    inserted = mock_supabase.table().insert.call_args[0][0]
+    self.assertEqual(inserted['model_version'], 'deberta-d1+svm-s1')
+
+  @patch('listener.svm_infer_many', return_value=[{'1.1': 1}])
+  @patch('listener.deberta_infer_many', return_value=[{'1.1': 1}])
+  def test_repeated_response_is_scored_once_with_latest_payload(self, mock_deberta, mock_svm):
+    """An insert followed by an update of the same response inserts the latest payload once."""
+    mock_supabase = MagicMock()
+    events = [('insert', self._make_payload('a')),
+              ('update', self._make_payload('a', checked=False))]
+    listener.handle_response_batch(events, self.models, mock_supabase)
+
+    self.assertEqual(mock_svm.call_args[0][1], [{'1.1': [False]}])
+    mock_supabase.table().insert.assert_called_once()
+    mock_supabase.table().upsert.assert_not_called()
+
+  @patch('listener.svm_infer_many')
+  @patch('listener.deberta_infer_many')
+  def test_unchanged_update_is_skipped(self, mock_deberta, mock_svm):
+    """Updates whose payload was already scored should not reach the models."""
+    response = self._make_payload('a')['data']['record']['response']['response']
+    listener.remember_scored('a', listener.response_hash(response, self.models.version))
+    listener.handle_response_batch([('update', self._make_payload('a'))], self.models, MagicMock())
+    mock_deberta.assert_not_called()
+
+  @patch('listener.svm_infer_many')
+  @patch('listener.deberta_infer_many')
+  def test_pool_scores_the_batch_out_of_process(self, mock_deberta, mock_svm):
+    """With an inference pool the batch should be scored by the pool, not the in-process models."""
+    pool = MagicMock()
+    pool.infer_many.return_value = ([{'1.1': 2}], [{'1.1': 2}])
+    mock_supabase = MagicMock()
+    listener.handle_response_batch([('insert', self._make_payload('a'))], _models(pool),
+                                   mock_supabase)
+    pool.infer_many.assert_called_once_with([{'1.1': ['good']}], [{'1.1': [True]}])
+    mock_deberta.assert_not_called()
+    self.assertEqual(mock_supabase.table().insert.call_args[0][0]['results'], {'1.1': 2.0})
+
+  @patch('listener.svm_infer_many', return_value=[{'1.1': 2}])
+  @patch('listener.deberta_infer_many', return_value=[{'1.1': 0}])
+  def test_two_phase_writes_provisional_then_final(self, mock_deberta, mock_svm):
+    """Two-phase scoring inserts the SVM-only row first, then upserts the weighted row over it."""
+    mock_supabase = MagicMock()
+    listener.handle_response_batch([('insert', self._make_payload('a'))], self.models,
+                                   mock_supabase, refine=listener.refine_now)
+    inserted = mock_supabase.table().insert.call_args[0][0]
+    upserted = mock_supabase.table().upsert.call_args[0][0]
+    self.assertEqual(inserted, {'response_id': 'a', 'results': {'1.1': 2.0}, 'provisional': True})
+    self.assertEqual(upserted, {'response_id': 'a', 'results': {'1.1': 1.5}, 'provisional': False})
+    self.assertNotIn('a', listener._provisional)  # pylint: disable=protected-access
+    self.assertIn('a', listener._last_scored)  # pylint: disable=protected-access
+
+  @patch('listener.svm_infer_many', side_effect=[[{'1.1': 2}], [{'1.1': 0}]])
+  @patch('listener.deberta_infer_many', return_value=[{'1.1': 2}])
+  def test_deferred_refinement_skips_superseded_payloads(self, mock_deberta, mock_svm):
+    """Under overload DeBERTa is deferred; a since-edited response's refinement is not written."""
+    mock_supabase = MagicMock()
+    deferred = []
+    defer = lambda fn, *args: deferred.append((fn, args))
+    listener.handle_response_batch([('insert', self._make_payload('a'))], self.models,
+                                   mock_supabase, refine=defer)
+    listener.handle_response_batch([('update', self._make_payload('a', checked=False))],
+                                   self.models, mock_supabase, refine=defer)
+    mock_deberta.assert_not_called()
+    self.assertEqual(len(deferred), 2)
+
+    for fn, args in deferred:
+      fn(*args)
+    mock_deberta.assert_called_once()
+    final = mock_supabase.table().upsert.call_args_list[-1][0][0]
+    self.assertEqual((final['results'], final['provisional']), ({'1.1': 0.5}, False))
+
+  @patch('listener.svm_infer_many', return_value=[{'1.1': 2}, {'1.1': 0}])
+  @patch('listener.deberta_infer_many', return_value=[{'1.1': 0}, {'1.1': 2}])
+  def test_writer_buffers_the_batch_rows(self, mock_deberta, mock_svm):
+    """With a result writer the batch's rows are buffered together, not written one by one."""
+    mock_supabase = MagicMock()
+    writer = MagicMock()
+    events = [('insert', self._make_payload('a')), ('update', self._make_payload('b'))]
+    listener.handle_response_batch(events, self.models, mock_supabase, writer=writer)
+
+    writer.add.assert_called_once()
+    self.assertEqual([row['response_id'] for row in writer.add.call_args[0][0]], ['a', 'b'])
+    mock_supabase.table().insert.assert_not_called()
+    mock_supabase.table().upsert.assert_not_called()
+    self.assertIn('b', listener._last_scored)  # pylint: disable=protected-access
+
+  @patch('listener.svm_infer_many', return_value=[{'1.1': 1}])
+  @patch('listener.deberta_infer_many', return_value=[{'1.1': 1}])
+  def test_writer_failure_falls_back_to_direct_writes(self, mock_deberta, mock_svm):
+    """Rows the writer cannot take should still be written straight to form_results."""
+    mock_supabase = MagicMock()
+    writer = MagicMock()
+    writer.add.side_effect = RuntimeError('Result writer is closed.')
+    with patch.object(listener.error_log, 'exception'):
+      listener.handle_response_batch([('insert', self._make_payload('a'))], self.models,
+                                     mock_supabase, writer=writer)
+    mock_supabase.table().insert.assert_called_once()
+
+  @patch('listener.handle_updated_response')
+  @patch('listener.handle_new_response')
+  @patch('listener.deberta_infer_many', side_effect=RuntimeError('boom'))
+  def test_batch_failure_falls_back_to_single_handlers(self, mock_deberta, mock_new, mock_updated):
+    """If batched scoring fails each event should be retried through its own handler."""
+    events = [('insert', self._make_payload('a')), ('update', self._make_payload('b'))]
+    with patch.object(listener.error_log, 'exception'):
+      listener.handle_response_batch(events, self.models, MagicMock())
+    mock_new.assert_called_once()
+    mock_updated.assert_called_once()
+
+
+class TestTwoPhaseSteps(unittest.TestCase):
+  """Unit tests for write_provisional_results() and dispatch_refinement() in listener.py"""
+
+  def setUp(self):
+    listener._provisional.clear()  # pylint: disable=protected-access
+    self.models = _models()
+
+  def _pending(self):
+    return {'a': {'insert': True, 'digest': 'da', 'event': 'ea'},
+            'b': {'insert': False, 'digest': 'db', 'event': 'eb'}}
+
+  def test_provisional_rows_are_written_and_registered(self):
+    """Each response gets an SVM-only row, and a refinement that upserts over it once written."""
+    mock_supabase = MagicMock()
+    inputs = [({'1.1': ['good']}, {'1.1': [True]}), ({'1.1': ['fine']}, {'1.1': [False]})]
+    refinements = listener.write_provisional_results(self._pending(), inputs,
+                                                     [{'1.1': 2}, {'1.1': 0}], 'v1',
+                                                     mock_supabase)
+    self.assertEqual(mock_supabase.table().insert.call_args[0][0],
+                     {'response_id': 'a', 'results': {'1.1': 2.0}, 'provisional': True})
+    self.assertEqual(mock_supabase.table().upsert.call_args[0][0],
+                     {'response_id': 'b', 'results': {'1.1': 0.0}, 'provisional': True})
+    self.assertEqual([(r['response_id'], r['insert'], r['deberta_inputs']) for r in refinements],
+                     [('a', False, {'1.1': ['good']}), ('b', False, {'1.1': ['fine']})])
+    provisional = listener._provisional  # pylint: disable=protected-access
+    self.assertEqual(provisional, {'a': 'da', 'b': 'db'})
+
+  def test_unwritten_provisional_row_leaves_the_final_row_to_insert(self):
+    """If a provisional insert fails, the refinement inserts the final row instead of upserting."""
+    mock_supabase = MagicMock()
+    mock_supabase.table().insert.side_effect = RuntimeError('down')
+    with patch.object(listener.error_log, 'exception'):
+      refinements = listener.write_provisional_results({'a': self._pending()['a']},
+                                                       [({'1.1': ['good']}, {'1.1': [True]})],
+                                                       [{'1.1': 2}], 'v1', mock_supabase)
+    self.assertTrue(refinements[0]['insert'])
+
+  def test_dispatch_hands_the_refinements_to_refine(self):
+    refine = MagicMock()
+    writer = MagicMock()
+    refinements = [{'response_id': 'a', 'digest': 'da'}]
+    listener.dispatch_refinement(refine, refinements, self.models, 'db', writer)
+    refine.assert_called_once_with(listener.refine_response_batch, refinements, self.models, 'db',
+                                   writer)
+
+  def test_dispatch_failure_leaves_the_rows_provisional(self):
+    """A refine that raises is logged, and its responses are no longer tracked as provisional."""
+    listener._provisional.update({'a': 'da', 'b': 'newer'})  # pylint: disable=protected-access
+    refinements = [{'response_id': 'a', 'digest': 'da'}, {'response_id': 'b', 'digest': 'db'}]
+    with patch.object(listener.error_log, 'exception') as mock_log:
+      listener.dispatch_refinement(MagicMock(side_effect=RuntimeError('full')), refinements,
+                                   self.models, MagicMock())
+    mock_log.assert_called_once()
+    self.assertEqual(listener._provisional, {'b': 'newer'})  # pylint: disable=protected-access
+
+
+class TestEventJournalHooks(unittest.TestCase):
+  """Unit tests for the event journal hooks in listener.py"""
+
+  def setUp(self):
+    listener._last_scored.clear()  # pylint: disable=protected-access
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.journal = listener.EventJournal(os.path.join(tmp.name, 'events.sqlite3'))
+    self.addCleanup(self.journal.close)
+    self.models = _models()
+
+  def _payload(self, response_id, text='good'):
+    response = {'kf1': {'1.1': {'text': [text], '1.1.1': True}}}
+    return {'data': {'record': {'response_id': response_id, 'response': {'response': response}}}}
+
+  @patch('listener.svm_infer_many', return_value=[{'1.1': 1}])
+  @patch('listener.deberta_infer_many', return_value=[{'1.1': 1}])
+  def test_scored_response_is_marked_handled(self, mock_deberta, mock_svm):
+    """Writing a response's results should complete its journal entry, but not a newer payload's."""
+    old, new = self._payload('a'), self._payload('a', 'better')
+    listener.journal_event(self.journal, 'form_responses', 'insert', 'a', new,
+                           listener.event_digest(new))
+    listener.handle_response_batch([('insert', old)], self.models, MagicMock(),
+                                   journal=self.journal)
+    self.assertEqual(self.journal.pending_keys('form_responses'), {'a'})
+    listener.handle_response_batch([('update', new)], self.models, MagicMock(),
+                                   journal=self.journal)
+    self.assertEqual(self.journal.pending_keys('form_responses'), set())
+
+
+class TestEventDispatch(unittest.TestCase):
+  """Unit tests for the realtime callback dispatch helpers in listener.py"""
+
+  def test_shed_response_event_is_logged_with_response_id(self):
+    """A form response the batcher refuses should be logged with its response_id."""
+    batcher = MagicMock()
+    batcher.submit.return_value = False
+    payload = {'data': {'record': {'response_id': 'r1'}}}
+    with patch.object(listener.error_log, 'error') as mock_error:
+      listener.submit_response_event(batcher, 'insert', payload)
+    batcher.submit.assert_called_once_with(('insert', payload), lane='new')
+    self.assertIn('r1', mock_error.call_args[0][0])
+
+  def test_report_event_is_queued_for_a_worker(self):
+    """Report events should be handed to the report queue, not run on the callback."""
+    reports = MagicMock()
+    reports.submit.return_value = True
+    payload = {'data': {'record': {'id': 7}}}
+    with patch.object(listener.error_log, 'error') as mock_error:
+      listener.submit_report_event(reports, listener.handle_new_report, payload, 'gemini',
+                                   'supabase')
+    reports.submit.assert_called_once_with(listener.handle_new_report, payload, 'gemini',
+                                           'supabase', lane='new')
+    mock_error.assert_not_called()
+
+  def test_updates_and_regenerations_go_to_lower_priority_lanes(self):
+    """Edits queue behind new submissions, and report regenerations behind new reports."""
+    batcher, reports = MagicMock(), MagicMock()
+    payload = {'data': {'record': {'response_id': 'r1', 'id': 7}}}
+    listener.submit_response_event(batcher, 'update', payload)
+    listener.submit_report_event(reports, listener.handle_updated_report, payload, 'gemini',
+                                 'supabase')
+    self.assertEqual(batcher.submit.call_args.kwargs['lane'], 'update')
+    self.assertEqual(reports.submit.call_args.kwargs['lane'], 'regenerate')
+    self.assertEqual(listener.event_response_id(('update', payload)), 'r1')
+
+  def test_realtime_subscriptions_journal_and_queue_each_event(self):
+    """Each channel's callback journals its event in the given journal and queues it."""
+    queues = MagicMock()
+    journal = MagicMock()
+    subscriptions = listener.realtime_subscriptions(queues, 'gemini', 'db', journal)
+    self.assertEqual([s[:3] for s in subscriptions],
+                     [('form_responses_insert', 'INSERT', 'form_responses'),
+                      ('form_responses_update', 'UPDATE', 'form_responses'),
+                      ('student_reports_insert', 'INSERT', 'student_reports'),
+                      ('student_reports_update', 'UPDATE', 'student_reports')])
+    payload = {'data': {'record': {'response_id': 'r1', 'id': 7}}}
+    for _, _, _, callback in subscriptions[:3]:
+      callback(payload)
+    self.assertEqual([c.args[:3] for c in journal.record.call_args_list],
+                     [('form_responses', 'insert', 'r1'), ('form_responses', 'update', 'r1'),
+                      ('student_reports', 'insert', 7)])
+    queues.batcher.submit.assert_called_once_with(('insert', payload), lane='new')
+    queues.response_updates.submit.assert_called_once_with(payload)
+    queues.reports.submit.assert_called_once_with(listener.handle_new_report, payload, 'gemini',
+                                                  'db', journal, lane='new')
+
+  def test_subscription_state_callback_calls_on_rejoin_from_the_second_join(self):
+    """The first join is the subscription itself; later joins follow a reconnect."""
+    on_rejoin = MagicMock()
+    callback = listener.subscription_state_callback('form_responses_insert', on_rejoin)
+    callback('SUBSCRIBED')
+    on_rejoin.assert_not_called()
+    with patch.object(listener.error_log, 'error') as mock_error:
+      callback('CHANNEL_ERROR', 'timeout')
+    self.assertIn('timeout', mock_error.call_args[0][0])
+    callback('SUBSCRIBED')
+    on_rejoin.assert_called_once()
+
+  def test_required_env_raises_when_no_alias_is_set(self):
+    with patch.dict('listener.os.environ', {'SECOND': 'value'}, clear=True):
+      self.assertEqual(listener.required_env('FIRST', 'SECOND'), 'value')
+      with patch.object(listener.error_log, 'error'), \
+           self.assertRaisesRegex(ValueError, 'FIRST or THIRD environment variable is not set'):
+        listener.required_env('FIRST', 'THIRD')
+
+  def test_merged_report_updates_keep_the_first_old_record(self):
+    """A reset to the placeholder followed by another edit should still regenerate the report."""
+    reset = {'data': {'record': {'id': 7, 'llm_feedback': listener.GENERATING_PLACEHOLDER},
+                      'old_record': {'llm_feedback': 'old feedback'}}}
+    touch = {'data': {
+      'record': {'id': 7, 'llm_feedback': listener.GENERATING_PLACEHOLDER, 'title': 'new'},
+      'old_record': {'llm_feedback': listener.GENERATING_PLACEHOLDER}}}
+    merged = listener.merge_report_updates(reset, touch)
+    self.assertEqual(merged['data']['record']['title'], 'new')
+    with patch('listener.handle_new_report') as mock_new:
+      listener.handle_updated_report(merged, 'gemini', 'supabase')
+    mock_new.assert_called_once()
+
+
+class TestHandleNewReport(unittest.TestCase):
+  """Unit tests for handle_new_report() in listener.py"""
+
+  def setUp(self):
+    patcher = patch('report_data.REPORT_DATA_TIMEOUT_S', 0.2)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def _make_supabase_with_data(self, kf_avg_data):
+    mock_supabase = MagicMock()
+    mock_row = MagicMock()
+    mock_row.data = {'kf_avg_data': kf_avg_data}
+    (mock_supabase.table.return_value
+     .select.return_value
+     .eq.return_value
+     .single.return_value
+     .execute.return_value) = mock_row
+    return mock_supabase
+
+  def test_empty_kf_avg_data_writes_no_assessment_message(self):
+    """handle_new_report should write a "no data" llm_feedback message when kf_avg_data is None."""
+    mock_supabase = self._make_supabase_with_data(kf_avg_data=None)
+    listener.handle_new_report({'data': {'record': {'id': 'rpt-1'}}}, MagicMock(), mock_supabase)
+
+    update_calls = [str(c) for c in mock_supabase.table().update.call_args_list]
+    self.assertTrue(any('No assessment' in c for c in update_calls))
+
+  @patch('listener.generate_report_summary', side_effect=RuntimeError('API down'))
+  def test_exception_writes_error_message_to_llm_feedback(self, mock_summary):
+    """handle_new_report should catch exceptions and write an error string to llm_feedback."""
+    mock_supabase = self._make_supabase_with_data(kf_avg_data={'1.1': 2.0})
+    listener.handle_new_report({'data': {'record': {'id': 'rpt-2'}}}, MagicMock(), mock_supabase)
+
+    update_calls = [str(c) for c in mock_supabase.table().update.call_args_list]
+    self.assertTrue(any('_error' in c for c in update_calls))
+
+  @patch('listener.generate_report_summary', return_value='{"1.1": "good"}')
+  def test_successful_summary_written_to_llm_feedback(self, mock_summary):
+    """handle_new_report should persist successful Gemini feedback as-is."""
+    mock_supabase = self._make_supabase_with_data(kf_avg_data={'1.1': 2.0})
+    listener.handle_new_report({'data': {'record': {'id': 'rpt-ok'}}}, MagicMock(), mock_supabase)
+
+    update_calls = mock_supabase.table().update.call_args_list
+    self.assertTrue(any('{"1.1": "good"}' in str(call) for call in update_calls))
+
+  @patch('listener.generate_report_summary', return_value='Error generating feedback: timeout')
+  def test_summary_error_string_is_mapped_to_error_json(self, mock_summary):
+    """handle_new_report should wrap generator error strings in stored _error JSON."""
+    mock_supabase = self._make_supabase_with_data(kf_avg_data={'1.1': 2.0})
+    listener.handle_new_report({'data': {'record': {'id': 'rpt-err'}}}, MagicMock(), mock_supabase)
+
+    update_calls = mock_supabase.table().update.call_args_list
+    self.assertTrue(any('_error' in str(call) for call in update_calls))
+
+  def test_exception_maps_503_to_friendly_message(self):
+    """503-like exceptions should be converted to the temporary-unavailable message."""
+    mock_supabase = self._make_supabase_with_data(kf_avg_data={'1.1': 2.0})
+    with patch('listener.generate_report_summary', side_effect=RuntimeError('503 high demand')):
+      listener.handle_new_report({'data': {'record': {'id': 'rpt-503'}}}, MagicMock(),
+                                 mock_supabase)
+
+    update_calls = mock_supabase.table().update.call_args_list
+    self.assertTrue(any('temporarily unavailable' in str(call) for call in update_calls))
+
+  def test_exception_maps_429_to_friendly_message(self):
+    mock_supabase = self._make_supabase_with_data(kf_avg_data={'1.1': 2.0})
+    with patch('listener.generate_report_summary',
+               side_effect=RuntimeError('429 RESOURCE_EXHAUSTED')):
+      listener.handle_new_report({'data': {'record': {'id': 'rpt-429'}}}, MagicMock(),
+                                 mock_supabase)
+    update_calls = mock_supabase.table().update.call_args_list
+    self.assertTrue(any('usage limit was reached' in str(call) for call in update_calls))
+
+  def test_exception_maps_401_to_friendly_message(self):
+    mock_supabase = self._make_supabase_with_data(kf_avg_data={'1.1': 2.0})
+    with patch('listener.generate_report_summary', side_effect=RuntimeError('401 API_KEY invalid')):
+      listener.handle_new_report({'data': {'record': {'id': 'rpt-401'}}}, MagicMock(),
+                                 mock_supabase)
+    update_calls = mock_supabase.table().update.call_args_list
+    self.assertTrue(any('authentication error' in str(call) for call in update_calls))
+
+  @patch('listener.generate_report_summary', return_value='{"1.1": "good"}')
+  def test_kf_avg_data_in_the_payload_is_used_without_reading_the_row(self, mock_summary):
+    """When the realtime record already carries kf_avg_data the row should not be read back."""
+    mock_supabase = MagicMock()
+    payload = {'data': {'record': {'id': 'rpt-p', 'kf_avg_data': {'1.1': 2.0}}}}
+    listener.handle_new_report(payload, MagicMock(), mock_supabase)
+    mock_supabase.table().select.assert_not_called()
+    mock_summary.assert_called_once_with({'1.1': 2.0}, unittest.mock.ANY)
+
+
+if __name__ == '__main__':
+  unittest.main()
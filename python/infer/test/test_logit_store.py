@@ -0,0 +1,114 @@
+"""Unit tests for logit_store.py.
+
+These tests use a real SQLite database in a temporary directory; no model
+files or network access are needed.
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+import logit_store
+
+
+class TestLogitStore(unittest.TestCase):
+  """Tests for logit_store.LogitStore."""
+
+  def setUp(self):
+    self._tmp = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self._tmp.name, 'store', 'logits.sqlite3')
+
+  def tearDown(self):
+    self._tmp.cleanup()
+
+  def test_rows_round_trip_and_count_hits_and_misses(self):
+    store = logit_store.LogitStore(self.path, 'v1')
+    store.put_many(['a', 'b'], np.array([[1.0, 2.0], [3.0, 4.0]]))
+    rows = store.get_many(['b', 'missing', 'a'])
+
+    np.testing.assert_array_equal(rows[0], [3.0, 4.0])
+    self.assertIsNone(rows[1])
+    np.testing.assert_array_equal(rows[2], [1.0, 2.0])
+    self.assertEqual((store.hits, store.misses), (2, 1))
+    store.close()
+
+  def test_rows_survive_reopen_and_are_visible_to_other_connections(self):
+    writer = logit_store.LogitStore(self.path, 'v1')
+    reader = logit_store.LogitStore(self.path, 'v1')
+    writer.put_many(['a'], np.array([[0.5, 0.25]]))
+    np.testing.assert_array_equal(reader.get_many(['a'])[0], [0.5, 0.25])
+    writer.close()
+    reader.close()
+
+    reopened = logit_store.LogitStore(self.path, 'v1')
+    self.assertEqual(len(reopened), 1)
+    reopened.close()
+
+  def test_least_recently_used_rows_are_evicted_past_max_rows(self):
+    store = logit_store.LogitStore(self.path, 'v1', max_rows=2)
+    store.put_many(['a'], np.zeros((1, 2)))
+    store.put_many(['b'], np.zeros((1, 2)))
+    store.get_many(['a'])
+    store.put_many(['c'], np.zeros((1, 2)))
+
+    self.assertEqual([row is not None for row in store.get_many(['a', 'b', 'c'])],
+                     [True, False, True])
+    self.assertEqual(store.evictions, 1)
+    store.close()
+
+  def last_used(self, key):
+    conn = sqlite3.connect(self.path)
+    try:
+      return conn.execute('SELECT last_used FROM logits WHERE key = ?', (key,)).fetchone()[0]
+    finally:
+      conn.close()
+
+  def test_lookups_buffer_recency_until_a_batch_is_due(self):
+    """Hits should not write until touch_rows of them have collected, then write them in one go."""
+    store = logit_store.LogitStore(self.path, 'v1', touch_rows=2, touch_s=3600)
+    store.put_many(['a', 'b'], np.zeros((2, 2)))
+    before = self.last_used('a')
+    store.get_many(['a'])
+    self.assertEqual(self.last_used('a'), before)
+    store.get_many(['b', 'missing'])
+    self.assertGreater(self.last_used('a'), before)
+    self.assertGreater(self.last_used('b'), before)
+    store.close()
+
+  def test_buffered_recency_is_written_on_close(self):
+    store = logit_store.LogitStore(self.path, 'v1', touch_rows=100, touch_s=3600)
+    store.put_many(['a'], np.zeros((1, 2)))
+    before = self.last_used('a')
+    store.get_many(['a'])
+    store.close()
+    self.assertGreater(self.last_used('a'), before)
+
+  def test_writes_below_the_limit_do_not_count_the_table(self):
+    """Only the open counts rows while the running estimate stays under max_rows."""
+    with patch.object(logit_store.LogitStore, '_count', autospec=True, return_value=0) as count:
+      store = logit_store.LogitStore(self.path, 'v1', max_rows=100)
+      for i in range(10):
+        store.put_many([f'k{i}'], np.zeros((1, 2)))
+      self.assertEqual(count.call_count, 1)
+    store.close()
+
+  def test_eviction_goes_below_the_limit_so_the_next_count_is_deferred(self):
+    store = logit_store.LogitStore(self.path, 'v1', max_rows=200)
+    store.put_many([f'k{i:03d}' for i in range(201)], np.zeros((201, 2)))
+    self.assertEqual((len(store), store.evictions), (198, 3))
+    store.close()
+
+  def test_empty_lookups_and_writes_are_no_ops(self):
+    store = logit_store.LogitStore(self.path, 'v1')
+    self.assertEqual(store.get_many([]), [])
+    store.put_many([], np.zeros((0, 2)))
+    self.assertEqual(len(store), 0)
+    store.close()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,76 @@
+"""Unit tests for model_reload.py."""
+
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from inference import LogitCache
+import model_reload
+
+
+class TestReloadModels(unittest.TestCase):
+  """Unit tests for reload_models()."""
+
+  def setUp(self):
+    patchers = [patch('model_reload.open_logit_store', return_value=None),
+                patch('model_reload.warm_up_models', return_value={'deberta': 0.0, 'svm': 0.0})]
+    _, self.mock_warm_up = [patcher.start() for patcher in patchers]
+    for patcher in patchers:
+      self.addCleanup(patcher.stop)
+    self.live = model_reload.LiveModels(
+      model_reload.ModelSet('deberta-a', LogitCache('d1'), 'svm-a', 's1'))
+
+  def reload(self, deberta_version, svm_version):
+    with patch('model_reload.deberta_model_version', return_value=deberta_version), \
+         patch('model_reload.svm_model_version', return_value=svm_version), \
+         patch('model_reload.load_deberta_model', return_value='deberta-b') as mock_deberta, \
+         patch('model_reload.load_svm_scorer', return_value='svm-b') as mock_svm:
+      swapped = model_reload.reload_models(self.live)
+    return swapped, mock_deberta, mock_svm
+
+  def test_unchanged_version_is_not_reloaded(self):
+    """Nothing is loaded or swapped when the files on disk are the version already serving."""
+    swapped, mock_deberta, mock_svm = self.reload('d1', 's1')
+    self.assertFalse(swapped)
+    mock_deberta.assert_not_called()
+    mock_svm.assert_not_called()
+    self.assertEqual(self.live.swaps, 0)
+
+  def test_new_svm_version_swaps_in_and_keeps_deberta(self):
+    """Only the changed model is loaded; the old set stays intact for in-flight batches."""
+    old = self.live.current
+    swapped, mock_deberta, mock_svm = self.reload('d1', 's2')
+    self.assertTrue(swapped)
+    mock_deberta.assert_not_called()
+    mock_svm.assert_called_once()
+    self.assertEqual((self.live.current.deberta, self.live.current.svm), ('deberta-a', 'svm-b'))
+    self.assertIs(self.live.current.logit_cache, old.logit_cache)
+    self.assertEqual(self.live.current.version, 'deberta-d1+svm-s2')
+    self.assertEqual((old.deberta, old.svm, old.version),
+                     ('deberta-a', 'svm-a', 'deberta-d1+svm-s1'))
+    # The live DeBERTa model is reused as is and must not be warmed up alongside live batches.
+    self.mock_warm_up.assert_called_once_with(None, 'svm-b')
+
+  def test_new_deberta_version_gets_a_new_logit_cache(self):
+    """Logits from the old checkpoint must not be served for the new one."""
+    self.reload('d2', 's1')
+    self.assertEqual(self.live.current.deberta, 'deberta-b')
+    self.assertEqual(self.live.current.logit_cache.model_version, 'd2')
+    self.mock_warm_up.assert_called_once_with('deberta-b', None)
+
+  def test_old_pool_is_closed_after_the_grace_period(self):
+    """With inference workers, the new set gets its own pool and the old one is retired."""
+    old_pool, new_pool, closed = MagicMock(), MagicMock(), threading.Event()
+    old_pool.close.side_effect = closed.set
+    self.live.swap(model_reload.ModelSet('deberta-a', LogitCache('d1'), 'svm-a', 's1', old_pool))
+    with patch('model_reload.INFERENCE_WORKERS', 1), \
+         patch('model_reload.POOL_RETIRE_GRACE_S', 0.01), \
+         patch('model_reload.start_inference_pool', return_value=new_pool):
+      self.reload('d1', 's2')
+    self.assertIs(self.live.current.pool, new_pool)
+    self.assertTrue(closed.wait(5))
+    new_pool.close.assert_not_called()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,99 @@
+"""Unit tests for model_watch.py."""
+
+from pathlib import Path
+import tempfile
+import threading
+import time
+import unittest
+
+from model_watch import Inotify, wait_for_files
+
+
+def _inotify_available() -> bool:
+  try:
+    Inotify().close()
+  except OSError:
+    return False
+  return True
+
+
+class TestWaitForFiles(unittest.TestCase):
+  """Unit tests for wait_for_files(), run with polling and (where available) inotify."""
+
+  use_inotify = False
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.dir = Path(tmp.name) / 'models'
+
+  def ready(self):
+    weights = self.dir / 'model.bin'
+    return [weights] if weights.exists() else None
+
+  def wait(self, **kwargs):
+    kwargs.setdefault('timeout_s', 5)
+    kwargs.setdefault('stable_s', 0.2)
+    return wait_for_files(self.ready, [self.dir], poll_interval_s=0.05,
+                          use_inotify=self.use_inotify, **kwargs)
+
+  def test_detects_file_written_after_the_wait_starts(self):
+    """A model copied in while waiting is picked up soon after it stops changing."""
+    def copy():
+      time.sleep(0.1)
+      self.dir.mkdir()
+      (self.dir / 'model.bin').write_bytes(b'weights')
+    threading.Thread(target=copy).start()
+    t0 = time.monotonic()
+    self.assertEqual(self.wait(), [self.dir / 'model.bin'])
+    self.assertLess(time.monotonic() - t0, 2)
+
+  def test_waits_until_a_growing_file_is_stable(self):
+    """A file that is still being written is not reported until it stops growing."""
+    self.dir.mkdir()
+    path = self.dir / 'model.bin'
+    path.write_bytes(b'')
+    done = threading.Event()
+
+    def grow():
+      for _ in range(6):
+        with open(path, 'ab') as f:
+          f.write(b'x' * 1024)
+        time.sleep(0.1)
+      done.set()
+    threading.Thread(target=grow).start()
+    self.wait()
+    self.assertTrue(done.is_set())
+    self.assertEqual(path.stat().st_size, 6 * 1024)
+
+  def test_empty_list_is_ready_immediately(self):
+    """A ready() result of [] means nothing needs a quiet period."""
+    t0 = time.monotonic()
+    self.assertEqual(wait_for_files(lambda: [], [self.dir], timeout_s=5, stable_s=10,
+                                    use_inotify=self.use_inotify), [])
+    self.assertLess(time.monotonic() - t0, 1)
+
+  def test_raises_timeout_error_when_files_never_appear(self):
+    """wait_for_files gives up with TimeoutError once timeout_s passes."""
+    with self.assertRaises(TimeoutError):
+      self.wait(timeout_s=0.2)
+
+  def test_raises_interrupted_error_once_stop_is_set(self):
+    """Setting stop ends the wait within a poll interval, long before the timeout."""
+    stop = threading.Event()
+    threading.Timer(0.1, stop.set).start()
+    t0 = time.monotonic()
+    with self.assertRaises(InterruptedError):
+      self.wait(timeout_s=30, stop=stop)
+    self.assertLess(time.monotonic() - t0, 2)
+
+
+@unittest.skipUnless(_inotify_available(), 'inotify is not available')
+class TestWaitForFilesInotify(TestWaitForFiles):
+  """The same cases, woken by inotify events instead of polling."""
+
+  use_inotify = True
+
+
+if __name__ == '__main__':
+  unittest.main()
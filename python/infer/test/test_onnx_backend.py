@@ -0,0 +1,73 @@
+# pylint: disable=unused-argument
+
+"""Unit tests for onnx_backend.py.
+
+The export, quantization and ONNX Runtime session are mocked, so neither torch
+nor onnxruntime needs to be installed.
+"""
+
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+import onnx_backend
+
+
+class TestOnnxModelFile(unittest.TestCase):
+  """Unit tests for onnx_model_file()."""
+
+  @patch('onnx_backend.remove_stale_artifacts')
+  @patch('onnx_backend.export_deberta_onnx')
+  @patch('onnx_backend.os.path.exists', return_value=False)
+  def test_missing_graph_is_exported_once_keyed_by_fingerprint(self, mock_exists, mock_export,
+                                                               mock_remove_stale):
+    """A missing fp32 graph is exported next to the model and older fingerprints are removed."""
+    path = onnx_backend.onnx_model_file('models/deberta', 'abc123', quantize=False)
+
+    self.assertTrue(path.endswith(os.path.join('deberta-onnx', 'model-abc123.onnx')))
+    mock_export.assert_called_once_with('models/deberta', path)
+    mock_remove_stale.assert_called_once_with(os.path.dirname(path), 'abc123')
+
+  @patch('onnx_backend.export_deberta_onnx')
+  @patch('onnx_backend.os.path.exists', return_value=True)
+  def test_cached_export_is_reused(self, mock_exists, mock_export):
+    onnx_backend.onnx_model_file('models/deberta', 'abc123', quantize=False)
+    mock_export.assert_not_called()
+
+  @patch('onnx_backend.QuantType')
+  @patch('onnx_backend.ort_quantize_dynamic')
+  @patch('onnx_backend.os.replace')
+  @patch('onnx_backend.os.path.exists', side_effect=lambda path: not path.endswith('-int8.onnx'))
+  def test_int8_quantizes_the_cached_fp32_export(self, mock_exists, mock_replace, mock_quantize,
+                                                 mock_quant_type):
+    """quantize=True should quantize the fp32 export into a cached -int8 graph."""
+    path = onnx_backend.onnx_model_file('models/deberta', 'abc123', quantize=True)
+
+    fp32_path = onnx_backend.onnx_export_path('models/deberta', 'abc123')
+    int8_path = onnx_backend.onnx_export_path('models/deberta', 'abc123', quantized=True)
+    self.assertEqual(path, int8_path)
+    self.assertEqual(mock_quantize.call_args[0][0], fp32_path)
+    mock_replace.assert_called_once_with(f'{int8_path}.tmp', int8_path)
+
+
+class TestOnnxSequenceClassifier(unittest.TestCase):
+  """Unit tests for the ONNX Runtime model wrapper."""
+
+  def test_feeds_only_graph_inputs_as_int64_and_returns_logits(self):
+    classifier = onnx_backend.OnnxSequenceClassifier.__new__(onnx_backend.OnnxSequenceClassifier)
+    classifier.session = MagicMock()
+    classifier.session.run.return_value = [np.array([[0.1, 0.9]], dtype=np.float32)]
+    classifier.input_names = ['input_ids', 'attention_mask']
+
+    out = classifier(input_ids=[[1, 2]], attention_mask=[[1, 1]], token_type_ids=[[0, 0]])
+
+    feeds = classifier.session.run.call_args[0][1]
+    self.assertEqual(set(feeds), {'input_ids', 'attention_mask'})
+    self.assertEqual(feeds['input_ids'].dtype, np.int64)
+    self.assertIs(out.logits, classifier.session.run.return_value[0])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,58 @@
+"""Unit tests for quantization_parity.py helper functions.
+
+These tests cover CSV reading and the parity summary; they do not load any
+model files.
+"""
+
+import os
+import tempfile
+import unittest
+
+import quantization_parity
+
+
+class TestReadLabeledCsv(unittest.TestCase):
+  """Tests for quantization_parity.read_labeled_csv()."""
+
+  def setUp(self):
+    fd, self.path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+      f.write('text,label\n"Good job, keep it up",3\n,2\nNeeds more practice,1.0\n'
+              'No label,\nAppropriate,0\n')
+
+  def tearDown(self):
+    os.remove(self.path)
+
+  def test_skips_rows_without_text_or_label(self):
+    texts, labels = quantization_parity.read_labeled_csv(self.path)
+    self.assertEqual(texts, ['Good job, keep it up', 'Needs more practice', 'Appropriate'])
+    self.assertEqual(labels, [3, 1, 0])
+
+  def test_limit_caps_the_number_of_rows(self):
+    texts, labels = quantization_parity.read_labeled_csv(self.path, limit=2)
+    self.assertEqual(len(texts), 2)
+    self.assertEqual(len(labels), 2)
+
+
+class TestCompare(unittest.TestCase):
+  """Tests for quantization_parity.compare()."""
+
+  def test_reports_agreement_accuracies_and_delta(self):
+    summary = quantization_parity.compare(labels=[0, 1, 2, 3], fp32=[0, 1, 2, 0], int8=[0, 1, 1, 0])
+    self.assertEqual(summary['agreement'], 0.75)
+    self.assertEqual(summary['fp32_accuracy'], 0.75)
+    self.assertEqual(summary['int8_accuracy'], 0.5)
+    self.assertEqual(summary['accuracy_delta'], -0.25)
+
+
+class TestRssMb(unittest.TestCase):
+  """Tests for quantization_parity.rss_mb()."""
+
+  def test_returns_positive_current_and_peak(self):
+    current, peak = quantization_parity.rss_mb()
+    self.assertGreater(current, 0)
+    self.assertGreaterEqual(peak, current)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,54 @@
+"""Unit tests for report_data.py."""
+
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import report_data
+
+
+class TestWaitForReportData(unittest.TestCase):
+  """Unit tests for wait_for_report_data() and observe_report_update()."""
+
+  def _make_supabase_with_data(self, kf_avg_data):
+    mock_supabase = MagicMock()
+    (mock_supabase.table.return_value.select.return_value.eq.return_value.single.return_value
+     .execute.return_value) = MagicMock(data={'kf_avg_data': kf_avg_data})
+    return mock_supabase
+
+  def test_wait_polls_until_the_data_is_filled_in(self):
+    """The row should be re-read with backoff until generate_report has filled kf_avg_data."""
+    mock_supabase = MagicMock()
+    rows = [MagicMock(data={'kf_avg_data': None}), MagicMock(data={'kf_avg_data': {'1.1': 1.0}})]
+    (mock_supabase.table.return_value.select.return_value.eq.return_value.single.return_value
+     .execute.side_effect) = rows
+    with patch('report_data.REPORT_DATA_POLL_MS', 1):
+      data = report_data.wait_for_report_data(mock_supabase, 'rpt-w', timeout_s=5)
+    self.assertEqual(data, {'1.1': 1.0})
+    self.assertNotIn('rpt-w', report_data._report_waiters)  # pylint: disable=protected-access
+
+  def test_realtime_update_ends_the_wait(self):
+    """An UPDATE carrying kf_avg_data should wake the waiting worker before its next read."""
+    mock_supabase = self._make_supabase_with_data(kf_avg_data=None)
+    update = {'data': {'record': {'id': 'rpt-u', 'kf_avg_data': {'1.1': 3.0}}}}
+    timer = threading.Timer(0.05, report_data.observe_report_update, [update])
+    timer.start()
+    with patch('report_data.REPORT_DATA_POLL_MS', 5000), \
+         patch('report_data.REPORT_DATA_MAX_POLL_MS', 5000):
+      started = time.monotonic()
+      data = report_data.wait_for_report_data(mock_supabase, 'rpt-u', timeout_s=5)
+    self.assertEqual(data, {'1.1': 3.0})
+    self.assertLess(time.monotonic() - started, 2)
+
+  def test_gives_up_after_the_timeout(self):
+    """None is returned once REPORT_DATA_TIMEOUT_S passes without the data being filled in."""
+    mock_supabase = self._make_supabase_with_data(kf_avg_data=None)
+    with patch('report_data.REPORT_DATA_TIMEOUT_S', 0.05), \
+         patch('report_data.REPORT_DATA_POLL_MS', 10):
+      self.assertIsNone(report_data.wait_for_report_data(mock_supabase, 'rpt-t'))
+    self.assertNotIn('rpt-t', report_data._report_waiters)  # pylint: disable=protected-access
+
+
+if __name__ == '__main__':
+  unittest.main()
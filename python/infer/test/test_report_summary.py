@@ -0,0 +1,125 @@
+# pylint: disable=protected-access
+
+"""Unit tests for report_summary.py.
+
+The Gemini client is a mock, so no API key or network access is needed.
+"""
+
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+import report_summary
+
+
+class TestGenerateReportSummary(unittest.TestCase):
+  """Unit tests for generate_report_summary() in report_summary.py"""
+
+  def setUp(self):
+    # Only the request config is built from google-genai's types, so the package is not needed.
+    patcher = patch('report_summary.genai_types')
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_strips_markdown_codeblock_before_parsing(self):
+    """generate_report_summary should strip ```json...``` fences and return valid JSON."""
+    mock_gemini = MagicMock()
+    mock_response = MagicMock()
+    mock_response.text = '```json\n{"1.1": "good performance"}\n```'
+    mock_gemini.models.generate_content.return_value = mock_response
+
+    result = report_summary.generate_report_summary({'1.1': 2.0}, mock_gemini)
+    parsed = json.loads(result)
+    self.assertIn('1.1', parsed)
+
+  def test_retries_three_times_on_invalid_json_then_returns_error(self):
+    """generate_report_summary should retry 3 times on bad JSON and return an error string."""
+    mock_gemini = MagicMock()
+    mock_response = MagicMock()
+    mock_response.text = 'not valid json {{{'
+    mock_gemini.models.generate_content.return_value = mock_response
+
+    result = report_summary.generate_report_summary({'1.1': 1.0}, mock_gemini)
+    self.assertIn('Error', result)
+    self.assertEqual(
+      mock_gemini.models.generate_content.call_count,
+      3 * len(report_summary._GEMINI_MODELS),
+    )
+
+  @patch('report_summary._try_gemini_model', side_effect=[None, '{"1.1": "fallback ok"}'])
+  def test_falls_back_to_next_model_when_first_model_fails(self, mock_try_model):
+    """generate_report_summary should try the next Gemini model after a failed model."""
+    result = report_summary.generate_report_summary({'1.1': 1.0}, MagicMock())
+    self.assertEqual(json.loads(result), {'1.1': 'fallback ok'})
+    self.assertEqual(mock_try_model.call_count, 2)
+
+
+class TestGeminiHelpers(unittest.TestCase):
+  """Unit tests for the private Gemini helpers in report_summary.py."""
+
+  def test_parse_gemini_text_extracts_outer_json_from_wrapped_text(self):
+    raw = 'intro text\n```json\n{"1.1": "good"}\n```\noutro'
+    self.assertEqual(report_summary._parse_gemini_text(raw), '{"1.1": "good"}')
+
+  @patch('report_summary.time.sleep')
+  def test_handle_gemini_error_sleeps_for_rate_limit(self, mock_sleep):
+    error = RuntimeError('429 RESOURCE_EXHAUSTED')
+    report_summary._handle_gemini_error(error, 'gemini-2.5-flash', 1)
+    mock_sleep.assert_called_once_with(30)
+
+  @patch('report_summary.time.sleep')
+  def test_handle_gemini_error_sleeps_for_unavailable_signal(self, mock_sleep):
+    report_summary._handle_gemini_error(RuntimeError('503 high demand'), 'gemini-2.5-flash', 1)
+    mock_sleep.assert_called_once_with(6)
+
+  def test_handle_gemini_error_reraises_unknown_errors(self):
+    with self.assertRaises(RuntimeError):
+      report_summary._handle_gemini_error(RuntimeError('unexpected boom'), 'gemini-2.5-flash', 0)
+
+  def test_try_gemini_model_retries_empty_and_invalid_before_success(self):
+    gemini = MagicMock()
+    gemini.models.generate_content.side_effect = [
+      MagicMock(text=''),
+      MagicMock(text='not-json'),
+      MagicMock(text='{"1.1": "ok"}'),
+    ]
+
+    result = report_summary._try_gemini_model(gemini, 'gemini-2.5-flash', 'query', MagicMock())
+
+    self.assertEqual(json.loads(result), {'1.1': 'ok'})
+    self.assertEqual(gemini.models.generate_content.call_count, 3)
+
+  def test_try_gemini_model_returns_none_after_three_empty_responses(self):
+    gemini = MagicMock()
+    gemini.models.generate_content.side_effect = [
+      MagicMock(text=''),
+      MagicMock(text=''),
+      MagicMock(text=''),
+    ]
+
+    result = report_summary._try_gemini_model(gemini, 'gemini-2.5-flash', 'query', MagicMock())
+
+    self.assertIsNone(result)
+    self.assertEqual(gemini.models.generate_content.call_count, 3)
+
+  @patch('report_summary._handle_gemini_error')
+  def test_try_gemini_model_routes_exceptions_to_error_handler(self, mock_handle_error):
+    gemini = MagicMock()
+    gemini.models.generate_content.side_effect = RuntimeError('temporary failure')
+
+    result = report_summary._try_gemini_model(gemini, 'gemini-2.5-flash', 'query', MagicMock())
+
+    self.assertIsNone(result)
+    self.assertEqual(mock_handle_error.call_count, 3)
+
+  def test_report_error_message_names_the_failure_kind(self):
+    """Each Gemini failure kind gets its own message; anything else gets the generic one."""
+    cases = [('503 high demand', 'high demand'), ('429 RESOURCE_EXHAUSTED', 'usage limit'),
+             ('401 API_KEY invalid', 'authentication error'), ('boom', 'contact support if')]
+    for error, expected in cases:
+      with self.subTest(error=error):
+        self.assertIn(expected, report_summary.report_error_message(RuntimeError(error)))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,224 @@
+"""Unit tests for rescore.py.
+
+Scoring is replaced by a fake batch scorer and Supabase by an in-memory table,
+so no model files or network access are needed.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# test_benchmark.py stubs ``inference`` when it is collected first; rescore needs the real module.
+if 'inference' in sys.modules and not hasattr(sys.modules['inference'], 'LogitCache'):
+  del sys.modules['inference']
+
+import rescore  # noqa: E402
+from result_writer import ResultWriter  # noqa: E402
+
+
+class _Query:
+  """PostgREST query stand-in over an in-memory table, supporting the calls rescore makes."""
+
+  def __init__(self, db, table):
+    self.db = db
+    self.table = table
+    self.rows = list(db.tables[table].values())
+    self.columns = None
+    self.limit_n = None
+    self.upserted = None
+
+  def select(self, columns):
+    self.columns = [c.strip() for c in columns.split(',')]
+    return self
+
+  def gt(self, column, value):
+    self.rows = [r for r in self.rows if r[column] > value]
+    return self
+
+  def in_(self, column, values):
+    self.rows = [r for r in self.rows if r[column] in values]
+    return self
+
+  def order(self, column):
+    self.rows.sort(key=lambda r: r[column])
+    return self
+
+  def limit(self, n):
+    self.limit_n = n
+    return self
+
+  def upsert(self, rows, on_conflict=None):
+    self.upserted = rows if isinstance(rows, list) else [rows]
+    return self
+
+  def execute(self):
+    if self.upserted is not None:
+      if self.db.down:
+        raise RuntimeError('upsert failed')
+      self.db.upserts.append(len(self.upserted))
+      for row in self.upserted:
+        self.db.tables[self.table][row['response_id']] = row
+      return type('Response', (), {'data': self.upserted})()
+    rows = self.rows[:self.limit_n] if self.limit_n is not None else self.rows
+    return type('Response', (), {'data': [{c: r.get(c) for c in self.columns} for r in rows]})()
+
+
+class _Supabase:
+
+  def __init__(self, responses, results=()):
+    self.tables = {'form_responses': {r['response_id']: r for r in responses},
+                   'form_results': {r['response_id']: r for r in results}}
+    self.upserts = []
+    self.down = False
+
+  def table(self, name):
+    return _Query(self, name)
+
+
+def _response(i, text='x'):
+  response = {'kf': {'k1': {'text': [text], 'a': True}}}
+  return {'response_id': f'r{i:02d}', 'response': {'response': response}}
+
+
+def _infer(calls):
+  """Return a batch scorer recording batch sizes; DeBERTa scores 1 (2 for 'hi'), the SVM 3."""
+
+  def infer(deberta_inputs, svm_inputs):
+    calls.append(len(deberta_inputs))
+    return ([{kf: 2 if texts == ['hi'] else 1 for kf, texts in d.items()} for d in deberta_inputs],
+            [{kf: 3 for kf in s} for s in svm_inputs])
+
+  return infer
+
+
+class _RescoreTest(unittest.TestCase):
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.checkpoint = os.path.join(tmp.name, 'checkpoint.json')
+    self.executor = ThreadPoolExecutor(2)
+    self.addCleanup(self.executor.shutdown)
+    self.calls = []
+
+  def args(self, **overrides):
+    values = {'page_size': 4, 'batch_size': 2, 'workers': 2, 'limit': None,
+              'checkpoint': self.checkpoint, 'resume': False, 'force': False, 'dry_run': False,
+              'show': 10, **overrides}
+    return argparse.Namespace(**values)
+
+  def run_rescore(self, db, version='v2', **overrides):
+    writer = (None if overrides.get('dry_run')
+              else ResultWriter(db, max_rows=10 ** 9, max_delay_s=3600.0))
+    try:
+      return rescore.rescore(db, _infer(self.calls), version, self.args(**overrides), writer)
+    finally:
+      if writer is not None:
+        writer.close(5)
+
+
+class TestScoreRecords(_RescoreTest):
+  """Tests for rescore.score_records()."""
+
+  def test_scores_in_batches_with_the_listener_weighting(self):
+    """Records are scored batch_size at a time and combined 25/75; unreadable ones are skipped."""
+    records = [_response(0), {'response_id': 'bad', 'response': None}, _response(1), _response(2)]
+    stats = rescore.RescoreStats()
+    scored = rescore.score_records(records, _infer(self.calls), 2, self.executor, stats)
+    self.assertEqual(scored, [('r00', {'k1': 2.5}), ('r01', {'k1': 2.5}), ('r02', {'k1': 2.5})])
+    self.assertEqual(sorted(self.calls), [1, 2])
+    self.assertEqual(stats.unreadable, 1)
+
+
+class TestDiffResults(unittest.TestCase):
+  """Tests for rescore.diff_results()."""
+
+  def test_reports_changed_added_and_removed_key_functions(self):
+    changes = rescore.diff_results({'a': 1.0, 'b': 2.0, 'c': 1.5}, {'a': 1.0, 'b': 2.5, 'd': 3.0})
+    self.assertEqual(changes, {'b': (2.0, 2.5), 'c': (1.5, None), 'd': (None, 3.0)})
+    self.assertEqual(rescore.diff_results(None, {}), {})
+
+
+class TestRescore(_RescoreTest):
+  """Tests for rescore.rescore()."""
+
+  def test_writes_every_response_in_bulk_and_checkpoints(self):
+    """All pages are scored and upserted once per page; the checkpoint records the last response."""
+    db = _Supabase([_response(i) for i in range(10)])
+    stats = self.run_rescore(db)
+    self.assertEqual((stats.scanned, stats.scored, stats.written), (10, 10, 10))
+    self.assertEqual(db.upserts, [4, 4, 2])
+    self.assertEqual(db.tables['form_results']['r09'],
+                     {'response_id': 'r09', 'results': {'k1': 2.5}})
+    with open(self.checkpoint, encoding='utf-8') as f:
+      self.assertEqual({k: v for k, v in json.load(f).items() if k != 'updated_at'},
+                       {'cursor': 'r09', 'model_version': 'v2', 'scanned': 10})
+    self.assertIn('rows/s', str(stats))
+
+  def test_skips_responses_already_at_the_current_version_unless_forced(self):
+    """With RECORD_MODEL_VERSION on, rows already at this version are skipped unless forced."""
+    db = _Supabase([_response(i) for i in range(3)],
+                   [{'response_id': 'r01', 'results': {'k1': 9.0}, 'model_version': 'v2'}])
+    with (patch('rescore.RECORD_MODEL_VERSION', True),
+          patch('response_scoring.RECORD_MODEL_VERSION', True)):
+      stats = self.run_rescore(db)
+      self.assertEqual((stats.current, stats.written), (1, 2))
+      self.assertEqual(db.tables['form_results']['r01']['results'], {'k1': 9.0})
+      self.assertEqual(db.tables['form_results']['r00']['model_version'], 'v2')
+      stats = self.run_rescore(db, force=True)
+    self.assertEqual((stats.current, stats.written), (0, 3))
+    self.assertEqual(db.tables['form_results']['r01']['results'], {'k1': 2.5})
+
+  def test_without_the_model_version_column_every_response_is_rescored(self):
+    """With RECORD_MODEL_VERSION off, nothing counts as current and model_version is never read."""
+    db = _Supabase([_response(i) for i in range(3)],
+                   [{'response_id': 'r01', 'results': {'k1': 9.0}}])
+    with patch('rescore.existing_results') as mock_existing:
+      stats = self.run_rescore(db)
+    mock_existing.assert_not_called()
+    self.assertEqual((stats.current, stats.written), (0, 3))
+    self.assertEqual(db.tables['form_results']['r01'],
+                     {'response_id': 'r01', 'results': {'k1': 2.5}})
+
+  def test_resume_continues_after_the_checkpoint_for_the_same_models(self):
+    """A resumed run starts after the saved cursor; a checkpoint from other models is ignored."""
+    db = _Supabase([_response(i) for i in range(10)])
+    self.run_rescore(db, limit=5)
+    self.assertEqual(sorted(db.tables['form_results']), [f'r{i:02d}' for i in range(5)])
+
+    db.tables['form_results'].clear()
+    stats = self.run_rescore(db, resume=True)
+    self.assertEqual(sorted(db.tables['form_results']), [f'r{i:02d}' for i in range(5, 10)])
+    with open(self.checkpoint, encoding='utf-8') as f:
+      self.assertEqual(json.load(f)['scanned'], 10)
+    self.assertEqual(stats.scanned, 5)
+
+    stats = self.run_rescore(db, 'v3', resume=True)
+    self.assertEqual(stats.scanned, 10)
+
+  def test_failed_write_stops_without_advancing_the_checkpoint(self):
+    db = _Supabase([_response(i) for i in range(6)])
+    db.down = True
+    with patch('rescore.time.sleep'), self.assertRaises(RuntimeError):
+      self.run_rescore(db)
+    self.assertFalse(os.path.exists(self.checkpoint))
+
+  def test_dry_run_reports_changes_and_writes_nothing(self):
+    db = _Supabase([_response(0), _response(1, 'hi'), _response(2)],
+                   [{'response_id': 'r00', 'results': {'k1': 2.5}, 'model_version': 'v1'},
+                    {'response_id': 'r01', 'results': {'k1': 2.5}, 'model_version': 'v1'}])
+    stats = self.run_rescore(db, dry_run=True)
+    self.assertEqual((stats.unchanged, stats.changed, stats.new, stats.written), (1, 1, 1, 0))
+    self.assertEqual(stats.examples, [('r01', {'k1': (2.5, 2.75)})])
+    self.assertEqual(stats.kf_changes, {'k1': 1})
+    self.assertEqual(db.upserts, [])
+    self.assertFalse(os.path.exists(self.checkpoint))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,43 @@
+"""Unit tests for response_scoring.py."""
+
+import unittest
+from unittest.mock import patch
+
+import response_scoring
+
+
+class TestResponseScoring(unittest.TestCase):
+  """Unit tests for the scoring helpers shared by the listener and rescore.py."""
+
+  def test_get_env_returns_first_non_empty_alias(self):
+    with patch.dict('response_scoring.os.environ', {'SECOND': 'value'}, clear=True):
+      self.assertEqual(response_scoring.get_env('FIRST', 'SECOND'), 'value')
+
+  def test_get_env_returns_empty_string_when_missing(self):
+    with patch.dict('response_scoring.os.environ', {}, clear=True):
+      self.assertEqual(response_scoring.get_env('A', 'B'), '')
+
+  def test_flatten_response_splits_text_from_svm_features(self):
+    """Texts go to DeBERTa and every other answer, in order, to the SVMs, keyed by key function."""
+    response = {'kf1': {'1.1': {'text': ['good'], '1.1.1': True, '1.1.2': False}},
+                'kf2': {'2.1': {'text': ['fine'], '2.1.1': False}}}
+    deberta_inputs, svm_inputs = response_scoring.flatten_response(response)
+    self.assertEqual(deberta_inputs, {'1.1': ['good'], '2.1': ['fine']})
+    self.assertEqual(svm_inputs, {'1.1': [True, False], '2.1': [False]})
+
+  def test_weighted_average_is_deberta_025_plus_svm_075(self):
+    self.assertAlmostEqual(response_scoring.weighted_average(deberta=0, svm=2), 1.5)
+
+  def test_result_row_only_carries_the_optional_columns_when_enabled(self):
+    """model_version needs RECORD_MODEL_VERSION; provisional is left out unless given."""
+    with patch('response_scoring.RECORD_MODEL_VERSION', False):
+      self.assertEqual(response_scoring.result_row('r1', {'1.1': 1.0}, 'v1'),
+                       {'response_id': 'r1', 'results': {'1.1': 1.0}})
+    with patch('response_scoring.RECORD_MODEL_VERSION', True):
+      self.assertEqual(response_scoring.result_row('r1', {}, '', provisional=True),
+                       {'response_id': 'r1', 'results': {}, 'model_version': None,
+                        'provisional': True})
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,153 @@
+"""Unit tests for result_writer.py."""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from result_writer import ResultWriter
+
+
+class _Table:
+  """form_results stand-in that records upserts and fails on demand."""
+
+  def __init__(self):
+    self.rows = {}
+    self.calls = []
+    self.down = False
+    self.bad = set()
+    self._pending = None
+
+  def upsert(self, rows, on_conflict=None):
+    self._pending = rows if isinstance(rows, list) else [rows]
+    return self
+
+  def execute(self):
+    rows, self._pending = self._pending, None
+    self.calls.append(len(rows))
+    if self.down or any(row['response_id'] in self.bad for row in rows):
+      raise RuntimeError('upsert failed')
+    for row in rows:
+      self.rows[row['response_id']] = row
+
+
+class _Supabase:
+
+  def __init__(self):
+    self.form_results = _Table()
+
+  def table(self, name):
+    return self.form_results
+
+
+def _row(response_id, score=1, **extra):
+  return {'response_id': response_id, 'score': score, **extra}
+
+
+class TestResultWriter(unittest.TestCase):
+  """Tests for result_writer.ResultWriter."""
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.spill = os.path.join(tmp.name, 'spill', 'form-results.jsonl')
+    self.supabase = _Supabase()
+    self.table = self.supabase.form_results
+
+  def writer(self, **kwargs):
+    kwargs = {'max_rows': 1000, 'max_delay_s': 3600, 'spill_path': self.spill, **kwargs}
+    writer = ResultWriter(self.supabase, **kwargs)
+    self.addCleanup(writer.close, 5)
+    return writer
+
+  def spilled(self):
+    with open(self.spill, encoding='utf-8') as f:
+      return [json.loads(line)['response_id'] for line in f]
+
+  def test_rows_are_written_in_one_bulk_upsert(self):
+    """Rows added by separate calls should reach the table in a single request."""
+    writer = self.writer()
+    writer.add([_row('a'), _row('b')])
+    writer.add([_row('c')])
+    self.assertEqual(self.spilled(), ['a', 'b', 'c'])
+    writer.flush()
+    self.assertEqual(self.table.calls, [3])
+    self.assertEqual(sorted(self.table.rows), ['a', 'b', 'c'])
+    self.assertEqual((writer.pending(), writer.rows_written), (0, 3))
+    self.assertEqual(self.spilled(), [])
+    self.assertIn('3 rows', str(writer))
+
+  def test_latest_row_per_response_wins(self):
+    """A provisional and a final row for one response collapse to the final one."""
+    writer = self.writer()
+    writer.add([_row('a', 1, provisional=True)])
+    writer.add([_row('a', 2, provisional=False)])
+    writer.flush()
+    self.assertEqual(self.table.calls, [1])
+    self.assertEqual(self.table.rows['a']['score'], 2)
+
+  def test_rows_with_different_columns_are_upserted_separately(self):
+    """PostgREST needs uniform columns per bulk request, so mixed rows are grouped."""
+    writer = self.writer()
+    writer.add([_row('a'), _row('b', provisional=True), _row('c')])
+    writer.flush()
+    self.assertEqual(sorted(self.table.calls), [1, 2])
+
+  def test_a_bad_row_does_not_hold_back_the_rest(self):
+    """A failed bulk upsert is retried row by row; the failing row is dropped after max_attempts."""
+    writer = self.writer(max_attempts=2)
+    self.table.bad = {'b'}
+    writer.add([_row('a'), _row('b'), _row('c')])
+    writer.flush()
+    self.assertEqual(sorted(self.table.rows), ['a', 'c'])
+    self.assertEqual((writer.pending(), writer.retried), (1, 3))
+    self.assertEqual(self.spilled(), ['b'])
+
+    writer.add([_row('d')])
+    writer.flush()
+    self.assertIn('d', self.table.rows)
+    self.assertEqual((writer.pending(), writer.dropped), (0, 1))
+
+  def test_outage_keeps_rows_and_backs_off(self):
+    """When nothing can be written no row is charged an attempt, and the next flush waits."""
+    writer = self.writer(max_attempts=1)
+    self.table.down = True
+    writer.add([_row('a')])
+    writer.flush()
+    writer.flush()
+    self.assertEqual((writer.pending(), writer.dropped), (1, 0))
+    self.assertGreater(writer._retry_at, time.monotonic())
+
+    self.table.down = False
+    writer.flush()
+    self.assertIn('a', self.table.rows)
+    self.assertEqual(writer._backoff_s, 0.0)
+
+  def test_spilled_rows_are_recovered_after_a_crash(self):
+    """A new writer on the same spill file writes the rows the previous one never flushed."""
+    os.makedirs(os.path.dirname(self.spill))
+    with open(self.spill, 'w', encoding='utf-8') as f:
+      f.write(json.dumps(_row('a')) + '\n' + '{"response_id": "b", "sco')
+    writer = self.writer()
+    self.assertEqual(writer.pending(), 1)
+    writer.flush()
+    self.assertEqual(sorted(self.table.rows), ['a'])
+
+  def test_flusher_thread_flushes_on_row_count_and_close(self):
+    """The flusher thread writes once max_rows are buffered, and close flushes the remainder."""
+    writer = self.writer(max_rows=2)
+    writer.add([_row('a'), _row('b')])
+    deadline = time.monotonic() + 5
+    while len(self.table.rows) < 2 and time.monotonic() < deadline:
+      time.sleep(0.01)
+    self.assertEqual(sorted(self.table.rows), ['a', 'b'])
+    writer.add([_row('c')])
+    writer.close(5)
+    self.assertIn('c', self.table.rows)
+    with self.assertRaises(RuntimeError):
+      writer.add([_row('d')])
+
+
+if __name__ == '__main__':
+  unittest.main()
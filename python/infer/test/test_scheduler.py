@@ -0,0 +1,193 @@
+"""Unit tests for scheduler.py."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import unittest
+
+import scheduler
+
+
+class TestMicroBatcher(unittest.IsolatedAsyncioTestCase):
+  """Tests for scheduler.MicroBatcher."""
+
+  async def test_items_inside_the_window_share_a_batch(self):
+    batches = []
+    batcher = scheduler.MicroBatcher(batches.append, window_s=0.05, max_batch=10)
+    task = asyncio.create_task(batcher.run())
+    for i in range(3):
+      batcher.submit(i)
+    await asyncio.sleep(0.1)
+    batcher.submit(3)
+    await asyncio.sleep(0.1)
+    task.cancel()
+    self.assertEqual(batches, [[0, 1, 2], [3]])
+    self.assertEqual((batcher.batches, batcher.items, batcher.largest_batch), (2, 4, 3))
+
+  async def test_full_batch_closes_before_the_window(self):
+    batcher = scheduler.MicroBatcher(lambda batch: None, window_s=10, max_batch=2)
+    for i in range(5):
+      batcher.submit(i)
+    self.assertEqual(await asyncio.wait_for(batcher.next_batch(), 1), [0, 1])
+    self.assertEqual(batcher.pending(), 3)
+
+  async def test_handler_errors_do_not_stop_the_loop(self):
+    seen = []
+
+    async def handle(batch):
+      seen.append(batch)
+      if len(seen) == 1:
+        raise RuntimeError('boom')
+
+    batcher = scheduler.MicroBatcher(handle, window_s=0.01)
+    task = asyncio.create_task(batcher.run())
+    with self.assertLogs('error', level='ERROR'):
+      batcher.submit('a')
+      await asyncio.sleep(0.05)
+    batcher.submit('b')
+    await asyncio.sleep(0.05)
+    task.cancel()
+    self.assertEqual(seen, [['a'], ['b']])
+
+  async def test_full_queue_sheds_submissions(self):
+    batcher = scheduler.MicroBatcher(lambda batch: None, maxsize=2)
+    self.assertEqual([batcher.submit(i) for i in range(3)], [True, True, False])
+    self.assertEqual((batcher.pending(), batcher.dropped), (2, 1))
+
+  async def test_batches_fill_from_the_highest_priority_lane(self):
+    batcher = scheduler.MicroBatcher(lambda batch: None, window_s=0, max_batch=3,
+                                     lanes=[scheduler.Lane('new'), scheduler.Lane('update')])
+    for i in range(3):
+      batcher.submit(f'u{i}', lane='update')
+    batcher.submit('n0', lane='new')
+    self.assertEqual(await asyncio.wait_for(batcher.next_batch(), 1), ['n0', 'u0', 'u1'])
+    self.assertEqual((batcher.pending('new'), batcher.pending('update')), (0, 1))
+    self.assertGreater(batcher.latency()['update']['p95'], 0)
+    self.assertIn('update 1 queued', str(batcher))
+
+  async def test_overloaded_lane_coalesces_items_with_the_same_key(self):
+    lane = scheduler.Lane('update', latency_budget_s=0.01, key=lambda item: item[0])
+    batcher = scheduler.MicroBatcher(lambda batch: None, window_s=0, lanes=[lane])
+    batcher.submit(('a', 1))
+    batcher.submit(('a', 2))
+    self.assertFalse(batcher.overloaded())
+    await asyncio.sleep(0.02)
+    self.assertTrue(batcher.overloaded())
+    batcher.submit(('a', 3))
+    batcher.submit(('b', 1))
+    self.assertEqual(await asyncio.wait_for(batcher.next_batch(), 1),
+                     [('a', 3), ('a', 2), ('b', 1)])
+    self.assertEqual(batcher.coalesced, 1)
+
+
+class TestWorkQueue(unittest.IsolatedAsyncioTestCase):
+  """Tests for scheduler.WorkQueue."""
+
+  async def test_jobs_run_off_the_event_loop(self):
+    threads = []
+    queue = scheduler.WorkQueue('test', ThreadPoolExecutor(1))
+    tasks = queue.start()
+    queue.submit(lambda: threads.append(threading.current_thread()))
+    await asyncio.wait_for(queue.join(), 1)
+    for task in tasks:
+      task.cancel()
+    self.assertIsNot(threads[0], threading.main_thread())
+    self.assertEqual(queue.processed, 1)
+
+  async def test_slow_job_does_not_hold_up_other_workers(self):
+    finished = []
+    queue = scheduler.WorkQueue('test', ThreadPoolExecutor(2), workers=2)
+    tasks = queue.start()
+    queue.submit(lambda: (time.sleep(0.3), finished.append('slow')))
+    queue.submit(lambda: finished.append('fast'))
+    await asyncio.sleep(0.1)
+    self.assertEqual(finished, ['fast'])
+    await asyncio.wait_for(queue.join(), 1)
+    for task in tasks:
+      task.cancel()
+
+  async def test_submit_sheds_when_full_and_put_waits_for_room(self):
+    queue = scheduler.WorkQueue('test', maxsize=1)
+    self.assertTrue(queue.submit(print))
+    self.assertFalse(queue.submit(print))
+    self.assertEqual((queue.depth(), queue.dropped), (1, 1))
+    put = asyncio.create_task(queue.put(print))
+    await asyncio.sleep(0.01)
+    self.assertFalse(put.done())
+    tasks = queue.start()
+    await asyncio.wait_for(put, 1)
+    await asyncio.wait_for(queue.join(), 1)
+    for task in tasks:
+      task.cancel()
+
+  async def test_lane_limit_keeps_workers_free_for_higher_priority_jobs(self):
+    started = []
+    release = threading.Event()
+    queue = scheduler.WorkQueue('test', ThreadPoolExecutor(2), workers=2,
+                                lanes=[scheduler.Lane('new'),
+                                       scheduler.Lane('regenerate', limit=1)])
+    tasks = queue.start()
+    for i in range(2):
+      queue.submit(lambda i=i: (started.append(f'r{i}'), release.wait(1)), lane='regenerate')
+    await asyncio.sleep(0.05)
+    queue.submit(lambda: started.append('n0'), lane='new')
+    await asyncio.sleep(0.05)
+    self.assertEqual(started, ['r0', 'n0'])
+    release.set()
+    await asyncio.wait_for(queue.join(), 1)
+    for task in tasks:
+      task.cancel()
+    self.assertEqual(started, ['r0', 'n0', 'r1'])
+    self.assertEqual(queue.depth('regenerate'), 0)
+
+  async def test_failed_jobs_are_counted_and_logged(self):
+    queue = scheduler.WorkQueue('test')
+    tasks = queue.start()
+    with self.assertLogs('error', level='ERROR'):
+      queue.submit(lambda: 1 / 0)
+      await asyncio.wait_for(queue.join(), 1)
+    for task in tasks:
+      task.cancel()
+    self.assertEqual((queue.processed, queue.failed), (0, 1))
+
+
+class TestDebouncer(unittest.IsolatedAsyncioTestCase):
+  """Tests for scheduler.Debouncer."""
+
+  async def test_burst_for_one_key_is_forwarded_once_with_the_latest_item(self):
+    forwarded = []
+    debouncer = scheduler.Debouncer(forwarded.append, key=lambda item: item[0], quiet_s=0.05,
+                                    max_delay_s=1)
+    for item in [('a', 1), ('b', 1), ('a', 2), ('a', 3)]:
+      debouncer.submit(item)
+      await asyncio.sleep(0.01)
+    self.assertEqual(forwarded, [])
+    await asyncio.sleep(0.1)
+    self.assertEqual(sorted(forwarded), [('a', 3), ('b', 1)])
+    self.assertEqual((debouncer.received, debouncer.forwarded, debouncer.coalesced), (4, 2, 2))
+    self.assertIn('2 coalesced', str(debouncer))
+
+  async def test_key_that_never_goes_quiet_is_flushed_after_the_max_delay(self):
+    forwarded = []
+    debouncer = scheduler.Debouncer(forwarded.append, key=lambda item: 'k', quiet_s=0.05,
+                                    max_delay_s=0.1, merge=lambda old, new: old + new)
+    for i in range(8):
+      debouncer.submit([i])
+      await asyncio.sleep(0.02)
+    self.assertEqual(len(forwarded), 1)
+    self.assertEqual(forwarded[0][:3], [0, 1, 2])
+    await asyncio.sleep(0.1)
+    self.assertEqual(sum(len(items) for items in forwarded), 8)
+
+  async def test_zero_quiet_window_forwards_immediately(self):
+    forwarded = []
+    debouncer = scheduler.Debouncer(forwarded.append, key=lambda item: 'k', quiet_s=0,
+                                    max_delay_s=0)
+    debouncer.submit(1)
+    debouncer.submit(2)
+    self.assertEqual((forwarded, debouncer.pending()), ([1, 2], 0))
+
+
+if __name__ == '__main__':
+  unittest.main()
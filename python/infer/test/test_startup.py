@@ -0,0 +1,110 @@
+"""Unit tests for startup.py."""
+
+import hashlib
+import json
+from pathlib import Path
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import startup
+
+
+class _ModelDirsTest(unittest.TestCase):
+  """Points DEBERTA_MODEL_PATH and SVM_MODELS_PATH at empty temporary directories."""
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.deberta_dir = Path(tmp.name) / 'deberta'
+    self.svm_dir = Path(tmp.name) / 'svm-models'
+    for name, value in (('DEBERTA_MODEL_PATH', self.deberta_dir),
+                        ('SVM_MODELS_PATH', self.svm_dir)):
+      patcher = patch(f'startup.{name}', value)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+
+class TestWaitForModels(_ModelDirsTest):
+  """Unit tests for wait_for_models() and the readiness checks it combines."""
+
+  @patch('startup.wait_for_files', side_effect=TimeoutError('not ready'))
+  def test_raises_timeout_error_when_models_never_appear(self, mock_wait):
+    """wait_for_models should raise TimeoutError once the deadline passes with no models found."""
+    with self.assertRaises(TimeoutError):
+      startup.wait_for_models(timeout_minutes=1)
+    self.assertEqual(mock_wait.call_args.kwargs['timeout_s'], 60)
+
+  def test_returns_once_both_models_are_present(self):
+    """wait_for_models should return once the DeBERTa weights and pickled SVMs are on disk."""
+    self.deberta_dir.mkdir()
+    (self.deberta_dir / 'model.safetensors').write_bytes(b'w')
+    self.svm_dir.mkdir()
+    (self.svm_dir / 'mcq_kf1_1.pkl').write_bytes(b'm')
+    startup.wait_for_models(timeout_minutes=1)
+
+  def test_waits_only_for_the_requested_model(self):
+    """With svm=False, missing SVM models should not hold up the DeBERTa wait."""
+    self.deberta_dir.mkdir()
+    (self.deberta_dir / 'model.safetensors').write_bytes(b'w')
+    with patch('startup.svm_files_ready') as mock_svm_ready:
+      startup.wait_for_models(timeout_minutes=1, svm=False)
+    mock_svm_ready.assert_not_called()
+
+  def test_svm_bundle_is_ready_only_when_its_hash_matches(self):
+    """A verified bundle needs no quiet period; a partially copied one is not ready yet."""
+    self.svm_dir.mkdir()
+    (self.svm_dir / 'svm-models.npz').write_bytes(b'bundle')
+    manifest = {'file': 'svm-models.npz', 'sha256': hashlib.sha256(b'bundle').hexdigest()}
+    (self.svm_dir / 'svm-models.json').write_text(json.dumps(manifest), encoding='utf-8')
+    self.assertEqual(startup.svm_files_ready(), [])
+    (self.svm_dir / 'svm-models.npz').write_bytes(b'bund')
+    self.assertIsNone(startup.svm_files_ready())
+
+  def test_deberta_files_missing_until_weights_exist(self):
+    """The DeBERTa directory is not ready until model.safetensors exists; then every file counts."""
+    self.deberta_dir.mkdir()
+    (self.deberta_dir / 'config.json').write_text('{}', encoding='utf-8')
+    self.assertIsNone(startup.deberta_files_ready())
+    (self.deberta_dir / 'model.safetensors').write_bytes(b'w')
+    self.assertEqual([f.name for f in startup.deberta_files_ready()],
+                     ['config.json', 'model.safetensors'])
+
+
+class TestPrepareSvm(_ModelDirsTest):
+  """Unit tests for prepare_svm()."""
+
+  def prepare(self):
+    with patch('startup.download_svm_models', side_effect=RuntimeError('storage down')), \
+         patch('startup.wait_for_models'), \
+         patch('startup.svm_model_version', return_value='s1'), \
+         patch('startup.load_svm_scorer', return_value='svm'), \
+         patch('startup.warm_up_svm'), \
+         patch.object(startup.error_log, 'error'):
+      return startup.prepare_svm(None, startup.StartupTimeline())
+
+  def test_failed_sync_starts_with_the_local_models(self):
+    """A sync failure is only logged when SVM models are already on disk."""
+    self.svm_dir.mkdir()
+    (self.svm_dir / 'mcq_kf1_1.pkl').write_bytes(b'm')
+    self.assertEqual(self.prepare(), ('svm', 's1'))
+
+  def test_failed_sync_without_local_models_raises(self):
+    with self.assertRaisesRegex(RuntimeError, 'storage down'):
+      self.prepare()
+
+
+class TestStartupTimeline(unittest.TestCase):
+  """Unit tests for StartupTimeline."""
+
+  def test_timeline_records_phases_in_start_order(self):
+    """Phases are recorded as they finish but listed in the order they started."""
+    timeline = startup.StartupTimeline()
+    with timeline.phase('outer'):
+      timeline.mark('inner')
+    self.assertEqual([name for name, _, _ in timeline.phases], ['inner', 'outer'])
+    self.assertLess(str(timeline).index('outer'), str(timeline).index('inner'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,109 @@
+"""Unit tests for svm_engine.py.
+
+The parity tests fit small scikit-learn SVMs and are skipped when
+scikit-learn is not installed.
+"""
+
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+import unittest
+
+import numpy as np
+
+import svm_engine
+
+try:
+  from sklearn import svm
+  # test/test.py replaces scikit-learn with a marker stub when it is collected first.
+  _SKLEARN_AVAILABLE = hasattr(svm.SVC, 'fit')
+except ImportError:
+  _SKLEARN_AVAILABLE = False
+
+
+def _fake_svc(coef, intercept, classes):
+  return SimpleNamespace(kernel='linear', coef_=np.array(coef, dtype=float),
+                         intercept_=np.array(intercept, dtype=float), classes_=np.array(classes))
+
+
+class TestLinearSvmEngine(unittest.TestCase):
+  """Tests for svm_engine.LinearSvmEngine."""
+
+  def test_kf_ids_map_to_and_from_model_names(self):
+    self.assertEqual(svm_engine.model_name_from_kf('1.1'), 'mcq_kf1_1')
+    self.assertEqual(svm_engine.kf_from_model_name('mcq_kf12_3'), '12.3')
+
+  def test_one_vs_one_votes_pick_the_winning_class(self):
+    # Pairs (0,1), (0,2), (1,2): feature 0 pushes towards the first class of each pair.
+    models = {'mcq_kf1_1': _fake_svc([[1, 0], [1, 0], [0, 1]], [-0.5, -0.5, -0.5], [0, 1, 2])}
+    engine = svm_engine.LinearSvmEngine.from_models(models)
+    self.assertEqual(engine.predict({'1.1': [1, 0]}), {'1.1': 0})
+    self.assertEqual(engine.predict({'1.1': [0, 1]}), {'1.1': 1})
+    self.assertEqual(engine.predict({'1.1': [0, 0]}), {'1.1': 2})
+
+  def test_models_with_different_shapes_score_together(self):
+    models = {
+        'mcq_kf1_1': _fake_svc([[1.0]], [-0.5], [1, 3]),
+        'mcq_kf2_1': _fake_svc([[1, 0, 0], [0, 1, 0], [0, 0, 1]], [0, 0, 0], [0, 1, 2]),
+    }
+    engine = svm_engine.LinearSvmEngine.from_models(models)
+    result = engine.predict_many([{'1.1': [1], '2.1': [0, 0, 1]}, {'1.1': [0]}])
+    self.assertEqual(result, [{'1.1': 3, '2.1': 1}, {'1.1': 1}])
+
+  def test_wrong_feature_count_raises_value_error(self):
+    engine = svm_engine.LinearSvmEngine.from_models(
+      {'mcq_kf1_1': _fake_svc([[1.0, 1.0]], [0], [0, 1])})
+    with self.assertRaises(ValueError):
+      engine.predict({'1.1': [True]})
+
+  def test_non_linear_models_are_rejected(self):
+    model = _fake_svc([[1.0]], [0], [0, 1])
+    model.kernel = 'rbf'
+    with self.assertRaises(ValueError):
+      svm_engine.LinearSvmEngine.from_models({'mcq_kf1_1': model})
+
+  def test_bundle_round_trips_models_and_feature_names(self):
+    with tempfile.TemporaryDirectory() as folder:
+      path = os.path.join(folder, svm_engine.SVM_BUNDLE_FILE)
+      np.savez(path, **{'mcq_kf1_1.coef': np.array([[1.0, -1.0]]),
+                        'mcq_kf1_1.intercept': np.array([0.0]),
+                        'mcq_kf1_1.classes': np.array([0, 2]),
+                        'mcq_kf1_1.features': np.array(['yes', 'no'])})
+      manifest = {'format': svm_engine.SVM_BUNDLE_FORMAT,
+                  'format_version': svm_engine.SVM_BUNDLE_VERSION,
+                  'file': svm_engine.SVM_BUNDLE_FILE, 'sha256': svm_engine.file_sha256(path),
+                  'models': ['mcq_kf1_1']}
+      with open(os.path.join(folder, svm_engine.SVM_BUNDLE_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+      engine = svm_engine.LinearSvmEngine.from_bundle(folder)
+
+      self.assertEqual(engine.predict({'1.1': [True, False]}), {'1.1': 2})
+      self.assertEqual(engine.feature_names, {'1.1': ['yes', 'no']})
+      self.assertEqual(engine.version, manifest['sha256'])
+
+      manifest['sha256'] = '0' * 64
+      with open(os.path.join(folder, svm_engine.SVM_BUNDLE_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+      with self.assertRaises(ValueError):
+        svm_engine.LinearSvmEngine.from_bundle(folder)
+
+  @unittest.skipUnless(_SKLEARN_AVAILABLE, 'scikit-learn is not installed')
+  def test_matches_sklearn_predict(self):
+    rng = np.random.default_rng(0)
+    models = {}
+    for k, (n_features, n_classes) in enumerate([(5, 4), (3, 2), (8, 3)]):
+      x = rng.integers(0, 2, (120, n_features)).astype(bool)
+      y = rng.integers(0, n_classes, 120)
+      models[f'mcq_kf{k + 1}_1'] = svm.SVC(kernel='linear', C=1.0).fit(x, y)
+    engine = svm_engine.LinearSvmEngine.from_models(models)
+
+    for name, model in models.items():
+      x = rng.integers(0, 2, (500, model.coef_.shape[1])).astype(bool)
+      kf = svm_engine.kf_from_model_name(name)
+      predicted = engine.predict_rows([kf] * len(x), x.tolist())
+      np.testing.assert_array_equal(predicted, model.predict(x))
+
+
+if __name__ == '__main__':
+  unittest.main()
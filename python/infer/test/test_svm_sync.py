@@ -0,0 +1,157 @@
+"""Unit tests for svm_sync.py."""
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from artifact_cache import ARTIFACT_MANIFEST, ArtifactCache
+from svm_engine import SVM_BUNDLE_FORMAT, SVM_BUNDLE_VERSION
+from svm_sync import sync_svm_models
+
+
+def _bundle(name='mcq_kf1_1'):
+  """Return the bytes of a one-model SVM bundle, the way svm/util.py writes it."""
+  buffer = io.BytesIO()
+  np.savez(buffer, **{f'{name}.coef': np.ones((1, 2)), f'{name}.intercept': np.zeros(1),
+                      f'{name}.classes': np.array([0, 1]),
+                      f'{name}.features': np.array(['a', 'b'])})
+  return buffer.getvalue()
+
+
+class _Bucket:
+  """In-memory svm-models bucket whose listing carries Storage-style metadata."""
+
+  def __init__(self, objects):
+    self.objects = dict(objects)
+    self.downloads = []
+    self.updated = dict.fromkeys(objects, '2026-01-01T00:00:00Z')
+
+  def put(self, name, data):
+    self.objects[name] = data
+    self.updated[name] = '2026-02-01T00:00:00Z'
+
+  def list(self, options=None):
+    folder = {'name': 'archive', 'id': None, 'updated_at': None, 'metadata': None}
+    return [folder] + [{'name': name, 'id': name, 'updated_at': self.updated[name],
+                        'metadata': {'eTag': f'"{hashlib.md5(data).hexdigest()}"',
+                                     'size': len(data)}}
+                       for name, data in self.objects.items()]
+
+  def download(self, name):
+    self.downloads.append(name)
+    return self.objects[name]
+
+
+class TestSyncSvmModels(unittest.TestCase):
+  """Tests for svm_sync.sync_svm_models."""
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.cache = ArtifactCache(os.path.join(tmp.name, 'cache'))
+    self.local = os.path.join(tmp.name, 'svm')
+    self.bucket = _Bucket({'kf1.pkl': b'one', 'kf2.pkl': b'two'})
+    self.supabase = MagicMock()
+    self.supabase.storage.from_.return_value = self.bucket
+
+  def sync(self):
+    return sync_svm_models(self.supabase, self.local, self.cache, workers=2)
+
+  def read(self, name):
+    with open(os.path.join(self.local, name), 'rb') as f:
+      return f.read()
+
+  def test_unchanged_bucket_downloads_nothing(self):
+    """A second sync against the same listing reuses every object and leaves the files untouched."""
+    first = self.sync()
+    self.assertEqual((first.downloaded, first.downloaded_bytes, first.installed), (2, 6, 2))
+    mtime = os.stat(os.path.join(self.local, 'kf1.pkl')).st_mtime_ns
+
+    second = self.sync()
+    self.assertEqual((second.downloaded, second.unchanged, second.unchanged_bytes), (0, 2, 6))
+    self.assertFalse(second.changed)
+    self.assertEqual(len(self.bucket.downloads), 2)
+    self.assertEqual(os.stat(os.path.join(self.local, 'kf1.pkl')).st_mtime_ns, mtime)
+    self.assertIn('2 unchanged', str(second))
+
+  def test_only_changed_objects_are_downloaded(self):
+    """A retrained model should be the only download, and should replace the local copy."""
+    self.sync()
+    self.bucket.put('kf2.pkl', b'two-retrained')
+    stats = self.sync()
+    self.assertEqual(self.bucket.downloads[2:], ['kf2.pkl'])
+    self.assertEqual((stats.downloaded, stats.unchanged, stats.installed), (1, 1, 1))
+    self.assertEqual(self.read('kf2.pkl'), b'two-retrained')
+
+  def test_objects_missing_from_the_cache_are_downloaded_again(self):
+    """An index entry whose cached object is gone must not be trusted."""
+    self.sync()
+    digest = hashlib.sha256(b'one').hexdigest()
+    os.chmod(self.cache.path(digest), 0o644)
+    os.remove(self.cache.path(digest))
+    self.assertEqual(self.sync().downloaded, 1)
+    self.assertEqual(self.bucket.downloads[2:], ['kf1.pkl'])
+
+  def test_stale_local_files_are_removed(self):
+    """Models deleted from the bucket, and stray files, disappear from the local directory."""
+    self.sync()
+    with open(os.path.join(self.local, 'old.pkl'), 'wb') as f:
+      f.write(b'old')
+    del self.bucket.objects['kf2.pkl']
+    stats = self.sync()
+    self.assertEqual(stats.removed, 2)
+    self.assertEqual(sorted(os.listdir(self.local)), [ARTIFACT_MANIFEST, 'kf1.pkl'])
+
+  def put_bundle(self, blob):
+    manifest = {'format': SVM_BUNDLE_FORMAT, 'format_version': SVM_BUNDLE_VERSION,
+                'file': 'svm-models.npz', 'sha256': hashlib.sha256(blob).hexdigest(),
+                'models': ['mcq_kf1_1']}
+    self.bucket.put('svm-models.npz', blob)
+    self.bucket.put('svm-models.json', json.dumps(manifest).encode())
+
+  def test_bundle_replaces_pickles(self):
+    """Once the bucket holds a loadable bundle, only it and its manifest are synced; pickles go."""
+    self.sync()
+    self.put_bundle(_bundle())
+    stats = self.sync()
+    self.assertEqual(sorted(self.bucket.downloads[2:]), ['svm-models.json', 'svm-models.npz'])
+    self.assertEqual(stats.removed, 2)
+    self.assertEqual(sorted(os.listdir(self.local)),
+                     [ARTIFACT_MANIFEST, 'svm-models.json', 'svm-models.npz'])
+    self.assertEqual(os.listdir(self.cache.staging_dir('svm-models')), [])
+
+  def test_bundle_that_does_not_load_keeps_the_pickles(self):
+    """A bundle whose hash matches but which does not load is skipped in favour of the pickles."""
+    self.sync()
+    self.put_bundle(b'not an npz')
+    self.bucket.put('kf2.pkl', b'two v2')
+    stats = self.sync()
+    self.assertEqual(stats.removed, 0)
+    self.assertEqual(sorted(os.listdir(self.local)), [ARTIFACT_MANIFEST, 'kf1.pkl', 'kf2.pkl'])
+    self.assertEqual(self.read('kf2.pkl'), b'two v2')
+
+  def test_bundle_that_does_not_load_without_pickles_fails(self):
+    self.sync()
+    self.put_bundle(b'not an npz')
+    del self.bucket.objects['kf1.pkl'], self.bucket.objects['kf2.pkl']
+    with self.assertRaises(ValueError):
+      self.sync()
+    self.assertEqual(self.read('kf1.pkl'), b'one')
+
+  def test_empty_bucket_keeps_local_models(self):
+    """An empty listing should fail rather than delete every local model."""
+    self.sync()
+    self.bucket.objects.clear()
+    with self.assertRaises(RuntimeError):
+      self.sync()
+    self.assertEqual(self.read('kf1.pkl'), b'one')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,152 @@
+"""Unit tests for worker_pool.py."""
+
+import os
+import sys
+import time
+import types
+import unittest
+
+import numpy as np
+
+# test_benchmark.py stubs ``inference`` when it is collected first; the pool needs the real module.
+if 'inference' in sys.modules and not hasattr(sys.modules['inference'], 'LogitCache'):
+  del sys.modules['inference']
+
+from svm_engine import LinearSvmEngine  # noqa: E402
+import worker_pool  # noqa: E402
+
+try:
+  import torch
+  # test/test.py replaces torch with a stub when it is collected first.
+  _TORCH_AVAILABLE = hasattr(torch, 'nn')
+except ImportError:
+  _TORCH_AVAILABLE = False
+
+
+class _Tokenizer:
+  """Whitespace tokenizer exposing the __call__/pad surface deberta_logits relies on."""
+
+  def __call__(self, texts, **kwargs):
+    input_ids = [[1] * len(text.split()) for text in texts]
+    return {'input_ids': input_ids, 'attention_mask': [list(ids) for ids in input_ids]}
+
+  def pad(self, features, **kwargs):
+    width = max(len(ids) for ids in features['input_ids'])
+    return {name: [row + [0] * (width - len(row)) for row in rows]
+            for name, rows in features.items()}
+
+
+class _Model:
+  """Scores one-word texts as class 0 and longer texts as class 1; 'crash' kills the worker."""
+
+  # Fed plain lists, so the workers never need torch, which test/test.py only stubs in this process.
+  tensor_type = 'np'
+
+  def __call__(self, input_ids, attention_mask):
+    lengths = [len(ids) - ids.count(0) for ids in input_ids]
+    if 99 in lengths:
+      os._exit(3)
+    return types.SimpleNamespace(
+      logits=np.array([[1.0, 0.0] if n == 1 else [0.0, 1.0] for n in lengths]))
+
+
+if _TORCH_AVAILABLE:
+  class _TorchModel(torch.nn.Module):
+    """Scores every text with its bias parameter, so in-place weight changes show in the results."""
+
+    tensor_type = 'np'
+
+    def __init__(self):
+      super().__init__()
+      self.bias = torch.nn.Parameter(torch.tensor([1.0, 0.0]), requires_grad=False)
+
+    def forward(self, input_ids, attention_mask):
+      return types.SimpleNamespace(logits=self.bias.expand(len(input_ids), 2).numpy())
+
+
+def _engine() -> LinearSvmEngine:
+  return LinearSvmEngine.from_arrays(
+    {'mcq_kf1_1': (np.array([[1.0, -1.0]]), np.array([0.0]), np.array([0, 2]))})
+
+
+class TestInferencePool(unittest.TestCase):
+  """Tests for worker_pool.InferencePool."""
+
+  def setUp(self):
+    self.pool = worker_pool.InferencePool((_Tokenizer(), _Model()), _engine(), 'v1', workers=2,
+                                          threads_per_worker=1, warm_up=False)
+    self.addCleanup(self.pool.close)
+    self.pool.wait_ready(timeout_s=10)
+
+  def test_scores_batches_in_the_workers(self):
+    """Results should come back from the workers, not the calling process."""
+    deberta, svm = self.pool.infer_many([{'1.1': ['good']}, {'1.1': ['very good']}],
+                                        [{'1.1': [True, False]}, {'1.1': [False, True]}],
+                                        timeout_s=10)
+    self.assertEqual(deberta, [{'1.1': 0}, {'1.1': 1}])
+    self.assertEqual(svm, [{'1.1': 2}, {'1.1': 0}])
+    self.assertEqual(self.pool.jobs, 1)
+    self.assertTrue(all(p.pid != os.getpid() for p in self.pool.processes))
+
+  def test_failed_job_raises_in_the_caller(self):
+    """An exception inside a worker should surface from infer_many without killing the worker."""
+    with self.assertRaises(RuntimeError):
+      self.pool.infer_many([{'1.1': ['ok']}], [{'9.9': [True]}], timeout_s=10)
+    self.assertEqual(self.pool.failed, 1)
+    _, svm = self.pool.infer_many([{'1.1': ['ok']}], [{'1.1': [True, False]}], timeout_s=10)
+    self.assertEqual(svm, [{'1.1': 2}])
+
+  def test_dead_worker_fails_its_job_and_is_restarted(self):
+    """A worker that dies mid-job should fail the job, then be replaced by a fresh fork."""
+    with self.assertRaises(RuntimeError):
+      self.pool.infer_many([{'1.1': [' '.join(['x'] * 99)]}], [{}], timeout_s=10)
+    self.pool.wait_ready(timeout_s=10)
+    self.assertEqual(self.pool.restarts, 1)
+    self.assertEqual(self.pool.infer_many([{'1.1': ['ok']}], [{}], timeout_s=10)[0], [{'1.1': 0}])
+
+  def test_closed_pool_rejects_jobs_and_workers_exit(self):
+    """After close, new jobs are refused and the workers exit on their own."""
+    self.pool.close()
+    with self.assertRaises(RuntimeError):
+      self.pool.infer_many([{}], [{}])
+    deadline = time.monotonic() + 10
+    while any(p.is_alive() for p in self.pool.processes) and time.monotonic() < deadline:
+      time.sleep(0.05)
+    self.assertFalse(any(p.is_alive() for p in self.pool.processes))
+
+  def test_reports_memory_per_worker(self):
+    """str(pool) should list each worker's memory."""
+    memory = self.pool.memory()
+    self.assertEqual([m['pid'] for m in memory], [p.pid for p in self.pool.processes])
+    if os.path.exists(f'/proc/{os.getpid()}/smaps_rollup'):
+      self.assertGreater(memory[0]['rss'], 0)
+    self.assertIn('2 workers x 1 threads', str(self.pool))
+
+
+@unittest.skipUnless(_TORCH_AVAILABLE, 'torch is not installed')
+class TestSharedWeights(unittest.TestCase):
+  """Tests for how worker_pool.InferencePool hands PyTorch weights to the workers."""
+
+  def test_workers_read_the_parents_weights_in_place(self):
+    """The weights move into shared memory, so the workers see the parent's tensors, not copies."""
+    model = _TorchModel()
+    pool = worker_pool.InferencePool((_Tokenizer(), model), _engine(), 'v1', workers=1,
+                                     threads_per_worker=1, warm_up=False)
+    self.addCleanup(pool.close)
+    pool.wait_ready(timeout_s=30)
+    self.assertTrue(model.bias.is_shared())
+    self.assertEqual(pool.infer_many([{'1.1': ['a']}], [{}], timeout_s=10)[0], [{'1.1': 0}])
+    with torch.no_grad():
+      model.bias.copy_(torch.tensor([0.0, 1.0]))
+    self.assertEqual(pool.infer_many([{'1.1': ['b']}], [{}], timeout_s=10)[0], [{'1.1': 1}])
+
+
+class TestProcessMemory(unittest.TestCase):
+  """Tests for worker_pool.process_memory."""
+
+  def test_missing_process_returns_empty(self):
+    self.assertEqual(worker_pool.process_memory(-1), {})
+
+
+if __name__ == '__main__':
+  unittest.main()
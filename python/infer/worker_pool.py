@@ -0,0 +1,284 @@
+"""Pool of inference worker processes sharing the parent's model weights.
+
+Tokenization and post-processing hold the GIL, so one listener process only
+scores on a slice of a multi-core machine. ``InferencePool`` starts worker
+processes once the parent has loaded the models. The listener is multi-threaded
+by then (realtime, scoring, the model watcher), and forking such a process can
+leave a child holding a lock that no thread will ever release. Workers are
+therefore started through multiprocessing's ``forkserver``: a clean,
+single-threaded server process that has only imported this module forks each
+worker, including restarts and the pools built on hot reload. The models reach
+a worker as its process arguments. Before starting workers, the parent moves
+the PyTorch weights into shared memory, so the tensors are passed as handles to
+that one mapping instead of being copied. Each worker caps its intra-op threads
+so that ``workers * threads`` does not oversubscribe the cores.
+
+Scoring jobs go to the workers over a multiprocessing queue. Whichever worker is
+free takes the next job, and ``infer_many`` blocks its calling thread until the
+result comes back. ONNX Runtime sessions cannot be sent to another process, so
+with the ``onnx`` backend each worker opens its own session on the cached graph.
+"""
+
+from concurrent.futures import Future
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+
+from inference import LogitCache, deberta_infer_many, svm_infer_many, warm_up_deberta, warm_up_svm
+from logit_store import LogitStore
+from onnx_backend import OnnxSequenceClassifier
+
+# 0 scores in the listener process itself; N > 0 starts N inference workers.
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', '0'))
+# Intra-op threads per worker; 0 splits the machine's cores evenly between the workers.
+INFERENCE_THREADS_PER_WORKER = int(os.environ.get('INFERENCE_THREADS_PER_WORKER', '0'))
+
+app_log = logging.getLogger('app')
+error_log = logging.getLogger('error')
+
+
+def _context():
+  """
+  Return the multiprocessing context workers are started with.
+
+  The forkserver is itself started by fork+exec, so it never inherits the
+  listener's threads; it only imports this module before it forks workers.
+  """
+  ctx = mp.get_context('forkserver')
+  ctx.set_forkserver_preload([__name__])
+  return ctx
+
+
+def process_memory(pid: int) -> dict[str, float]:
+  """
+  Return the resident, proportional, and private memory of a process in MiB.
+
+  PSS splits each shared page between the processes mapping it, so summing PSS
+  over the parent and its workers gives their real combined footprint. Returns
+  an empty dict where ``/proc/<pid>/smaps_rollup`` is unavailable.
+  """
+  fields: dict[str, float] = {}
+  try:
+    with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as f:
+      for line in f:
+        name, _, value = line.partition(':')
+        if name in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+          fields[name] = int(value.split()[0]) / 1024
+  except (OSError, ValueError):
+    return {}
+  return {'rss': fields.get('Rss', 0.0), 'pss': fields.get('Pss', 0.0),
+          'private': fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0)}
+
+
+def _set_threads(threads: int) -> None:
+  """Cap this process's PyTorch intra-op threads, without importing torch if nothing has yet."""
+  torch = sys.modules.get('torch')
+  if torch is not None and hasattr(torch, 'set_num_threads'):
+    torch.set_num_threads(threads)
+
+
+def _worker_main(index: int, threads: int, state: dict, tasks, results) -> None:
+  """Serve scoring jobs from ``tasks`` until a ``None`` sentinel arrives."""
+  _set_threads(threads)
+  tokenizer, model = state['deberta']
+  if state['onnx_path']:
+    model = OnnxSequenceClassifier(state['onnx_path'], intra_op_threads=threads)
+  deberta_model, svm_models = (tokenizer, model), state['svm']
+  # The parent's cache and SQLite connection cannot cross processes, so each worker opens its own.
+  store = LogitStore(state['store_path'], state['version']) if state['store_path'] else None
+  cache = LogitCache(state['version'], store=store)
+  if state['warm_up']:
+    warm_up_deberta(deberta_model)
+    warm_up_svm(svm_models)
+  results.put(('ready', index, None))
+
+  while True:
+    job = tasks.get()
+    if job is None:
+      break
+    job_id, deberta_inputs, svm_inputs = job
+    try:
+      out = (deberta_infer_many(deberta_model, deberta_inputs, cache=cache),
+             svm_infer_many(svm_models, svm_inputs))
+    except Exception as e:
+      results.put((job_id, index, f'{type(e).__name__}: {e}'))
+    else:
+      results.put((job_id, index, out))
+
+
+class InferencePool:
+  """
+  Worker processes, started by the forkserver, scoring with models the parent has already loaded.
+
+  Args:
+    deberta_model: Tuple of (tokenizer, model) loaded in the parent.
+    svm_models: A compiled ``LinearSvmEngine``, or a mapping of model names to SVM classifiers.
+    deberta_version: Version string for the workers' logit caches.
+    workers: Number of worker processes.
+    threads_per_worker: Intra-op threads per worker; 0 divides ``os.cpu_count()`` between the
+      workers.
+    store_path: Persistent logit store shared by the workers; empty disables it.
+    warm_up: Run the model warm-up in every worker before it reports ready.
+  """
+
+  def __init__(  # pylint: disable=too-many-arguments
+      self,
+      deberta_model: tuple,
+      svm_models,
+      deberta_version: str,
+      *,
+      workers: int = INFERENCE_WORKERS,
+      threads_per_worker: int = INFERENCE_THREADS_PER_WORKER,
+      store_path: str = '',
+      warm_up: bool = True,
+  ):
+    if workers < 1:
+      raise ValueError('An inference pool needs at least one worker.')
+    self.workers = workers
+    self.threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    self.jobs = 0
+    self.failed = 0
+    self.restarts = 0
+    tokenizer, model = deberta_model
+    onnx_path = model.onnx_path if isinstance(model, OnnxSequenceClassifier) else ''
+    self._state = {'deberta': (tokenizer, None if onnx_path else model), 'onnx_path': onnx_path,
+                   'svm': svm_models, 'version': deberta_version, 'store_path': store_path,
+                   'warm_up': warm_up}
+    self._ctx = _context()
+    self._tasks = self._ctx.Queue()
+    self._results = self._ctx.Queue()
+    self._pending: dict[int, Future] = {}
+    self._ids = itertools.count()
+    self._lock = threading.Lock()
+    self._ready: set[int] = set()
+    self._ready_changed = threading.Condition(self._lock)
+    self._closed = False
+
+    if hasattr(model, 'share_memory'):
+      # Importing torch.multiprocessing registers the reducers that send shared tensors as handles.
+      import torch.multiprocessing  # pylint: disable=import-outside-toplevel,unused-import
+      model.share_memory()
+    # Workers would otherwise start threaded tokenization and warn about it.
+    os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+    self.processes = [self._start(i) for i in range(workers)]
+    self._collector = threading.Thread(target=self._collect, name='inference-pool', daemon=True)
+    self._collector.start()
+
+  def _start(self, index: int):
+    process = self._ctx.Process(target=_worker_main,
+                                args=(index, self.threads, self._state, self._tasks, self._results),
+                                name=f'inference-{index}', daemon=True)
+    process.start()
+    return process
+
+  def wait_ready(self, timeout_s: float | None = None) -> None:
+    """
+    Block until every worker has finished its warm-up.
+
+    Raises:
+      TimeoutError: If some worker is not ready within ``timeout_s``.
+    """
+    with self._ready_changed:
+      if not self._ready_changed.wait_for(lambda: len(self._ready) == self.workers, timeout_s):
+        raise TimeoutError(f'{self.workers - len(self._ready)} of {self.workers} inference workers '
+                           f'not ready after {timeout_s}s')
+
+  def infer_many(
+      self,
+      deberta_inputs: list[dict[str, list[str]]],
+      svm_inputs: list[dict[str, list]],
+      timeout_s: float | None = None,
+  ) -> tuple[list[dict], list[dict]]:
+    """
+    Score a batch of responses on the next free worker.
+
+    Returns:
+      The ``deberta_infer_many`` and ``svm_infer_many`` results for the batch.
+
+    Raises:
+      RuntimeError: If the pool is closed, the job failed, or its worker died.
+      TimeoutError: If no result arrives within ``timeout_s``.
+    """
+    future: Future = Future()
+    with self._lock:
+      if self._closed:
+        raise RuntimeError('Inference pool is closed.')
+      job_id = next(self._ids)
+      self._pending[job_id] = future
+    self._tasks.put((job_id, deberta_inputs, svm_inputs))
+    return future.result(timeout_s)
+
+  def _collect(self) -> None:
+    """Resolve job futures from worker results, and restart any worker that dies."""
+    last_check = time.monotonic()
+    while True:
+      if time.monotonic() - last_check >= 1.0:
+        last_check = time.monotonic()
+        if self._check_workers():
+          return
+      try:
+        job_id, index, out = self._results.get(timeout=1.0)
+      except queue.Empty:
+        continue
+      if job_id == 'ready':
+        with self._ready_changed:
+          self._ready.add(index)
+          self._ready_changed.notify_all()
+        continue
+      with self._lock:
+        future = self._pending.pop(job_id, None)
+        self.jobs += 1
+        if isinstance(out, str):
+          self.failed += 1
+      if future is None:
+        continue
+      if isinstance(out, str):
+        future.set_exception(RuntimeError(f'Inference worker {index} failed: {out}'))
+      else:
+        future.set_result(out)
+
+  def _check_workers(self) -> bool:
+    """Restart dead workers. Returns True once the pool is closed and every worker has exited."""
+    with self._lock:
+      closed = self._closed
+    if closed:
+      return not any(p.is_alive() for p in self.processes)
+    for i, process in enumerate(self.processes):
+      if process.is_alive():
+        continue
+      # The dead worker's job is unknown, so all in-flight jobs fail; callers then score locally.
+      with self._lock:
+        pending, self._pending = self._pending, {}
+        self._ready.discard(i)
+      error_log.error(f'Inference worker {i} (pid {process.pid}) exited with code '
+                      f'{process.exitcode}; restarting it and failing {len(pending)} '
+                      f'in-flight jobs.')
+      for future in pending.values():
+        future.set_exception(RuntimeError(f'Inference worker {i} died.'))
+      self.restarts += 1
+      self.processes[i] = self._start(i)
+    return False
+
+  def close(self) -> None:
+    """Stop accepting jobs and let each worker exit once the jobs already queued are done."""
+    with self._lock:
+      if self._closed:
+        return
+      self._closed = True
+    for _ in self.processes:
+      self._tasks.put(None)
+
+  def memory(self) -> list[dict[str, float]]:
+    """Return ``process_memory`` for each worker, with its ``pid`` added."""
+    return [{'pid': p.pid, **process_memory(p.pid)} for p in self.processes]
+
+  def __str__(self) -> str:
+    workers = ', '.join(f'{m["pid"]}: RSS {m.get("rss", 0):.0f} / PSS {m.get("pss", 0):.0f} / '
+                        f'private {m.get("private", 0):.0f} MiB' for m in self.memory())
+    return (f'{self.workers} workers x {self.threads} threads, {len(self._ready)} ready, '
+            f'{self.jobs} jobs, {self.failed} failed, {self.restarts} restarts; {workers}')
@@ -2,6 +2,10 @@
 
 '''Test cases for the SVM folder.'''
 
+import hashlib
+import os
+import pickle
+import tempfile
 import unittest
 from unittest.mock import call, patch, MagicMock
 
@@ -162,6 +166,38 @@ class TestUtil(unittest.TestCase):
     mock_supabase.storage.from_.assert_called_once_with("svm-models")
     mock_supabase.storage.from_().update.assert_called_once()
 
+  def test_write_bundle_stores_arrays_and_manifest(self):
+    """Test write_bundle writes every model's arrays and a manifest with the bundle hash."""
+    x = np.array([[0, 0], [0, 1], [1, 0], [1, 1]] * 5)
+    model = SVC(kernel='linear').fit(x, [0, 1, 1, 2] * 5)
+
+    with tempfile.TemporaryDirectory() as folder:
+      manifest = util.write_bundle({'mcq_kf1_1': model}, {'mcq_kf1_1': ['a', 'b']}, folder)
+      with open(os.path.join(folder, util.SVM_BUNDLE_FILE), 'rb') as f:
+        self.assertEqual(manifest['sha256'], hashlib.sha256(f.read()).hexdigest())
+      with np.load(os.path.join(folder, util.SVM_BUNDLE_FILE), allow_pickle=False) as bundle:
+        np.testing.assert_array_equal(bundle['mcq_kf1_1.coef'], model.coef_)
+        self.assertEqual(bundle['mcq_kf1_1.features'].tolist(), ['a', 'b'])
+    self.assertEqual(manifest['models'], ['mcq_kf1_1'])
+
+  def test_download_models_skips_the_given_models(self):
+    """Test download_models unpickles every .pkl in the bucket except the skipped ones."""
+    mock_supabase = MagicMock()
+    bucket = mock_supabase.storage.from_.return_value
+    bucket.list.return_value = [{'name': 'kf1.pkl'}, {'name': 'kf2.pkl'},
+                                {'name': util.SVM_BUNDLE_MANIFEST}]
+    bucket.download.side_effect = lambda name: pickle.dumps(name)
+
+    models = util.download_models(bucketname='svm-models', supabase=mock_supabase, skip={'kf2'})
+
+    self.assertEqual(models, {'kf1': 'kf1.pkl'})
+    bucket.download.assert_called_once_with('kf1.pkl')
+
+  def test_write_bundle_rejects_non_linear_models(self):
+    """Test write_bundle refuses models it cannot represent as hyperplanes."""
+    with self.assertRaises(ValueError):
+      util.write_bundle({'mcq_kf1_1': SVC(kernel='rbf')}, foldername=tempfile.gettempdir())
+
 
 class TestTrainSVM(unittest.TestCase):
   '''Test cases for train_svm function in train module.'''
@@ -205,13 +241,15 @@ class TestMainTrain(unittest.TestCase):
   @patch("train.fetch_data")
   @patch("train.glob.glob", return_value=["data/mock.csv"])
   @patch("train.pd.read_csv")
+  @patch("train.download_models")
+  @patch("train.export_upload_bundle")
   @patch("train.export_upload_model")
   @patch("train.os.environ.get")
   @patch("train.os.path.exists", return_value=False)
   @patch("train.os.makedirs")
   def test_main_success(
-      self, mock_makedirs, mock_exists, mock_environ_get, mock_export,
-      mock_read_csv, mock_glob, mock_fetch, mock_create_client, mock_dotenv
+      self, mock_makedirs, mock_exists, mock_environ_get, mock_export, mock_export_bundle,
+      mock_download, mock_read_csv, mock_glob, mock_fetch, mock_create_client, mock_dotenv
   ):
     """Test the main function in train module runs successfully."""
     mock_environ_get.side_effect = lambda key, default=None: "mock"  # Mock env vars
@@ -220,6 +258,8 @@ class TestMainTrain(unittest.TestCase):
         'feature2': np.random.rand(25),
         'label': [0, 1] * 12 + [0]
     })
+    previous = MagicMock()
+    mock_download.return_value = {'other': previous}
 
     class Args:
       '''Mock command-line arguments for the main function.'''
@@ -233,6 +273,13 @@ class TestMainTrain(unittest.TestCase):
 
     mock_fetch.assert_called_once()
     mock_export.assert_called_once()
+    mock_export_bundle.assert_called_once()
+    self.assertEqual(mock_export_bundle.call_args.kwargs['feature_names'],
+                     {'mock': ['feature1', 'feature2']})
+    # Models not retrained this run still go into the bundle.
+    self.assertEqual(mock_download.call_args.kwargs['skip'].keys(), {'mock'})
+    self.assertEqual(sorted(mock_export_bundle.call_args.kwargs['models']), ['mock', 'other'])
+    self.assertIs(mock_export_bundle.call_args.kwargs['models']['other'], previous)
 
 
 if __name__ == "__main__":
@@ -19,7 +19,7 @@ import pandas as pd
 from supabase import Client, create_client
 
 from fetch_data import fetch_data
-from util import export_upload_model, log, percent_bar
+from util import download_models, export_upload_bundle, export_upload_model, log, percent_bar
 
 
 def main(args) -> None:
@@ -63,6 +63,8 @@ def main(args) -> None:
     os.makedirs('models')
 
   accuracies = {}
+  models = {}
+  feature_names = {}
 
   for kf, df in data.items():
     if df.empty:
@@ -76,6 +78,8 @@ def main(args) -> None:
                                 verbose=args.verbose)
     if model is not None:
       accuracies[kf] = accuracy
+      models[kf] = model
+      feature_names[kf] = [str(c) for c in df.columns[:-1]]
       # Save the trained model to a file
       export_upload_model(
           model=model,
@@ -85,6 +89,22 @@ def main(args) -> None:
           supabase=supabase
       )
 
+  if models:
+    # The listener loads the bundle in place of every per-KF pickle, so it must also
+    # hold the models that were not retrained this run.
+    previous = download_models(bucketname='svm-models', supabase=supabase, skip=models)
+    for kf in previous:
+      if kf in data:
+        feature_names[kf] = [str(c) for c in data[kf].columns[:-1]]
+    # One file holding every model, loaded by the listener in place of the per-KF pickles.
+    export_upload_bundle(
+        models={**previous, **models},
+        feature_names=feature_names,
+        foldername='models',
+        bucketname='svm-models',
+        supabase=supabase
+    )
+
   if accuracies:
     print("Average accuracy across all models: "
           f"{percent_bar(sum(accuracies.values()) / len(accuracies), 45)}")
@@ -2,12 +2,22 @@
 Utility functions for SVM model training and exporting.
 '''
 
+from datetime import datetime, timezone
+import hashlib
+import json
 import os
 import pickle
 
+import numpy as np
 from sklearn.svm import SVC
 from supabase import Client
 
+# Keep in sync with python/infer/svm_engine.py, which reads the bundle.
+SVM_BUNDLE_FORMAT = 'svm-linear-ovo'
+SVM_BUNDLE_VERSION = 1
+SVM_BUNDLE_FILE = 'svm-models.npz'
+SVM_BUNDLE_MANIFEST = 'svm-models.json'
+
 
 def percent_bar(percent: float, width: int) -> str:
   '''
@@ -93,3 +103,127 @@ def export_upload_model(
 
   with open(model_path, 'rb') as f:
     supabase.storage.from_(bucketname).update(f"{kf}.pkl", f)
+
+
+def download_models(
+    bucketname='svm-models',
+    supabase: Client = None,
+    skip=()
+) -> dict[str, SVC]:
+  """
+  Downloads and unpickles the per-key-function models already in a bucket.
+
+  :param bucketname: The name of the bucket holding the ``.pkl`` models (default is 'svm-models').
+  :type bucketname: str
+  :param supabase: The Supabase client to download with.
+  :type supabase: Client
+  :param skip: Model names not to download, e.g. the ones just trained.
+  :type skip: Iterable[str]
+  :return: The models keyed by model name (e.g. ``mcq_kf1_1``).
+  :rtype: dict[str, SVC]
+  """
+  if supabase is None:
+    raise ValueError("Supabase client is not initialized. Cannot download the models.")
+
+  bucket = supabase.storage.from_(bucketname)
+  models = {}
+  for obj in bucket.list(options={'limit': 10000}):
+    kf = obj.get('name', '').removesuffix('.pkl')
+    if obj.get('name', '').endswith('.pkl') and kf not in skip:
+      models[kf] = pickle.loads(bucket.download(obj['name']))
+  return models
+
+
+def write_bundle(
+    models: dict[str, SVC],
+    feature_names: dict[str, list[str]] | None = None,
+    foldername='models',
+) -> dict:
+  """
+  Writes every linear SVM model into one ``.npz`` bundle plus a JSON manifest.
+
+  The bundle holds each model's ``coef_``, ``intercept_``, ``classes_`` and
+  feature names as plain arrays (no pickles), keyed ``<kf>.coef`` and so on.
+  The manifest records the format version, the model names, and the bundle's
+  SHA-256 so readers can verify it.
+
+  :param models: Trained linear-kernel SVM models keyed by model name (e.g. ``mcq_kf1_1``).
+  :type models: dict[str, SVC]
+  :param feature_names: Optional feature (MCQ option) names per model name.
+  :type feature_names: dict[str, list[str]]
+  :param foldername: The local folder to write the bundle to (default is 'models').
+  :type foldername: str
+  :return: The manifest that was written.
+  :rtype: dict
+  :raises ValueError: If there are no models or a model does not use a linear kernel.
+  """
+  if not models:
+    raise ValueError("No models to bundle.")
+
+  arrays = {}
+  for kf, model in sorted(models.items()):
+    if model.kernel != 'linear':
+      raise ValueError(f"Model {kf} uses a '{model.kernel}' kernel; "
+                       "only linear models can be bundled.")
+    coef = model.coef_.toarray() if hasattr(model.coef_, 'toarray') else model.coef_
+    arrays[f"{kf}.coef"] = np.asarray(coef, dtype=np.float64)
+    arrays[f"{kf}.intercept"] = np.asarray(model.intercept_, dtype=np.float64)
+    arrays[f"{kf}.classes"] = np.asarray(model.classes_)
+    arrays[f"{kf}.features"] = np.asarray((feature_names or {}).get(kf, []), dtype=str)
+
+  os.makedirs(foldername, exist_ok=True)
+  bundle_path = os.path.join(foldername, SVM_BUNDLE_FILE)
+  # Uncompressed so the listener reads each array straight out of the file.
+  np.savez(bundle_path, **arrays)
+
+  digest = hashlib.sha256()
+  with open(bundle_path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+      digest.update(chunk)
+
+  manifest = {
+      'format': SVM_BUNDLE_FORMAT,
+      'format_version': SVM_BUNDLE_VERSION,
+      'file': SVM_BUNDLE_FILE,
+      'sha256': digest.hexdigest(),
+      'models': sorted(models),
+      'created_at': datetime.now(timezone.utc).isoformat(),
+  }
+  with open(os.path.join(foldername, SVM_BUNDLE_MANIFEST), 'w', encoding='utf-8') as f:
+    json.dump(manifest, f, indent=2)
+  return manifest
+
+
+def export_upload_bundle(
+    models: dict[str, SVC],
+    feature_names: dict[str, list[str]] | None = None,
+    foldername='models',
+    bucketname='svm-models',
+    supabase: Client = None
+) -> None:
+  """
+  Writes the SVM bundle and uploads it to a specified bucket.
+
+  The bundle is uploaded before its manifest, so a reader that finds the new
+  manifest always finds the bundle it describes.
+
+  :param models: Trained linear-kernel SVM models keyed by model name (e.g. ``mcq_kf1_1``).
+  :type models: dict[str, SVC]
+  :param feature_names: Optional feature (MCQ option) names per model name.
+  :type feature_names: dict[str, list[str]]
+  :param foldername: The local folder to write the bundle to (default is 'models').
+  :type foldername: str
+  :param bucketname: The name of the bucket to upload the bundle to (default is 'svm-models').
+  :type bucketname: str
+  """
+  if supabase is None:
+    raise ValueError("Supabase client is not initialized. Cannot upload the bundle.")
+
+  print(f"Exporting {len(models)} models as a bundle to {foldername}...", end=" ")
+  manifest = write_bundle(models, feature_names, foldername)
+
+  print(f"Uploading bundle {manifest['sha256'][:12]} to bucket '{bucketname}'...")
+  bucket = supabase.storage.from_(bucketname)
+  for filename in (SVM_BUNDLE_FILE, SVM_BUNDLE_MANIFEST):
+    with open(os.path.join(foldername, filename), 'rb') as f:
+      bucket.upload(filename, f, {'upsert': 'true'})